@@ -1 +1 @@
-pyinstaller --noconfirm --onefile --windowed  --icon=icon.ico --add-data "icon.ico;." Schedule_Manager.py
\ No newline at end of file
+pyinstaller --noconfirm --onefile --windowed  --icon=icon.ico --add-data "icon.ico;." --add-data "holidays_cn.csv;." Schedule_Manager.py
\ No newline at end of file
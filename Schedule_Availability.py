@@ -0,0 +1,249 @@
+"""员工请假、不可用和偏好时段的区间索引（不依赖 PyQt）
+
+每个员工的时段按开始时间排序并合并重叠/相邻的部分，保存为两个有序数组（开始分钟、结束分钟）。
+合并后的区间互不重叠，开始和结束都单调递增，"某员工在 [开始, 结束) 内是否请假"只需一次二分查找。
+时间统一换算为分钟数（date.toordinal() * 1440 + 当天分钟），跨零点的班次不需要特殊处理。
+索引按月分页：查询某天时只加载与该月（多加一天，容纳跨夜班次）相交的时段，缓存最近用到的月份，
+因此多年、数千名员工的请假历史不会一次读入；数据库中的修改计数变化时丢弃全部缓存。
+"""
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from Schedule_Reports import shift_span
+
+DAY_MINUTES = 1440
+LEAVE, UNAVAILABLE, PREFERRED = "请假", "不可用", "偏好"
+KINDS = (LEAVE, UNAVAILABLE, PREFERRED)
+BLOCKING_KINDS = (LEAVE, UNAVAILABLE)   # 这两类时段内不能排班
+
+
+def to_minute(text, days=None):
+    """'2025-03-03 08:30' 或 '2025-03-03' -> 分钟数；days 为日期文本 -> 分钟数的缓存（批量换算时使用）"""
+    if days is None:
+        day = date.fromisoformat(text[:10]).toordinal() * DAY_MINUTES
+    else:
+        day = days.get(text[:10])
+        if day is None:
+            day = days[text[:10]] = date.fromisoformat(text[:10]).toordinal() * DAY_MINUTES
+    if len(text) > 10:
+        hour, minute = text[11:16].split(":")
+        day += int(hour) * 60 + int(minute)
+    return day
+
+
+def minute_text(minute):
+    day, minute = divmod(minute, DAY_MINUTES)
+    return f"{date.fromordinal(day).isoformat()} {minute // 60:02d}:{minute % 60:02d}"
+
+
+class IntervalSet:
+    """合并后的有序区间 [starts[i], ends[i])，kinds[i] 为第一个并入的时段类型"""
+    __slots__ = ("starts", "ends", "kinds")
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.kinds = []
+
+    def add(self, start, end, kind):
+        """按开始时间递增的顺序追加，与最后一个区间重叠或相邻时合并"""
+        if self.ends and start <= self.ends[-1]:
+            if end > self.ends[-1]:
+                self.ends[-1] = end
+            return
+        self.starts.append(start)
+        self.ends.append(end)
+        self.kinds.append(kind)
+
+    def find(self, start, end):
+        """与 [start, end) 相交的区间下标，没有时返回 None"""
+        index = bisect_left(self.starts, end) - 1
+        if index >= 0 and self.ends[index] > start:
+            return index
+        return None
+
+    def overlapping(self, start, end):
+        """与 [start, end) 相交的全部区间 [(开始, 结束, 类型)]"""
+        index = bisect_right(self.ends, start)
+        result = []
+        while index < len(self.starts) and self.starts[index] < end:
+            result.append((self.starts[index], self.ends[index], self.kinds[index]))
+            index += 1
+        return result
+
+    def __len__(self):
+        return len(self.starts)
+
+
+class AvailabilityPage:
+    """某月的合并区间：blocked/preferred 为 姓名 -> IntervalSet，范围为 [start, end) 分钟"""
+    __slots__ = ("start", "end", "blocked", "preferred")
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.blocked = {}
+        self.preferred = {}
+
+
+class AvailabilityIndex:
+    """按员工合并的请假/不可用区间和偏好区间，按月加载"""
+    MAX_PAGES = 24   # 缓存的月份数
+
+    def __init__(self, store):
+        self.store = store
+        self.shifts = {}
+        self.windows = {}   # (日期, 班次) -> (开始分钟, 结束分钟)
+        self.pages = OrderedDict()   # (年, 月) -> AvailabilityPage
+        self.counter = None
+        self.load()
+
+    def load(self):
+        self.counter = self.store.availability_counter()
+        self.shifts = {name: (start, end) for name, start, end in self.store.get_shifts()}
+        self.windows.clear()
+        self.pages.clear()
+
+    def refresh(self):
+        """数据库中的时段有修改（本窗口、其他窗口或命令行）时丢弃缓存，返回是否丢弃"""
+        if self.store.availability_counter() == self.counter:
+            return False
+        self.load()
+        return True
+
+    def page(self, day):
+        """day 所在月份的区间，未加载时查询数据库"""
+        key = (day.year, day.month)
+        page = self.pages.get(key)
+        if page is not None:
+            self.pages.move_to_end(key)
+            return page
+        first = day.replace(day=1)
+        # 多加载下个月第一天，月末的跨夜班次也能在本页查到
+        last = (first + timedelta(days=32)).replace(day=2)
+        page = AvailabilityPage(first.toordinal() * DAY_MINUTES, last.toordinal() * DAY_MINUTES)
+        pending = {}
+        days = {}
+        for name, kind, start_at, end_at in self.store.availability_intervals(
+                f"{first.isoformat()} 00:00", f"{last.isoformat()} 00:00"):
+            try:
+                start, end = to_minute(start_at, days), to_minute(end_at, days)
+            except (TypeError, ValueError):
+                continue
+            if end > start:
+                pending.setdefault((name, kind in BLOCKING_KINDS), []).append((start, end, kind))
+        for (name, blocking), intervals in pending.items():
+            # 数据库按文本排序，"08:00" 与 "8:00" 等写法可能不一致，这里按分钟重新排序
+            intervals.sort()
+            interval_set = IntervalSet()
+            for start, end, kind in intervals:
+                interval_set.add(start, end, kind)
+            (page.blocked if blocking else page.preferred)[name] = interval_set
+        self.pages[key] = page
+        while len(self.pages) > self.MAX_PAGES:
+            self.pages.popitem(last=False)
+        return page
+
+    def shift_window(self, work_date, shift_type):
+        """某天某班次占用的分钟范围；没有时间段的班次按整天计算"""
+        key = (work_date, shift_type)
+        window = self.windows.get(key)
+        if window is None:
+            base = date.fromisoformat(work_date).toordinal() * DAY_MINUTES
+            span = shift_span(shift_type, self.shifts)
+            window = (base, base + DAY_MINUTES) if span is None else (base + span[0], base + span[1])
+            if len(self.windows) > 10000:
+                self.windows.clear()
+            self.windows[key] = window
+        return window
+
+    def lookup(self, name, work_date, shift_type, preferred=False):
+        """(IntervalSet, 下标)：员工在该班次时间内相交的区间，没有时下标为 None"""
+        start, end = self.shift_window(work_date, shift_type)
+        page = self.page(date.fromordinal(start // DAY_MINUTES))
+        interval_set = (page.preferred if preferred else page.blocked).get(name)
+        if interval_set is None:
+            return None, None
+        return interval_set, interval_set.find(start, end)
+
+    def conflict(self, name, work_date, shift_type):
+        """员工在该班次时间内的请假/不可用类型，空闲时返回 None"""
+        interval_set, index = self.lookup(name, work_date, shift_type)
+        return None if index is None else interval_set.kinds[index]
+
+    def conflict_range(self, name, work_date, shift_type):
+        """冲突的合并区间 (开始, 结束) 文本，用于提示"""
+        interval_set, index = self.lookup(name, work_date, shift_type)
+        if index is None:
+            return None
+        return minute_text(interval_set.starts[index]), minute_text(interval_set.ends[index])
+
+    def is_preferred(self, name, work_date, shift_type):
+        return self.lookup(name, work_date, shift_type, preferred=True)[1] is not None
+
+    def free_employees(self, names, work_date, shift_type):
+        """names 中在该班次时间内空闲的员工，设置了偏好时段的排在前面"""
+        start, end = self.shift_window(work_date, shift_type)
+        page = self.page(date.fromordinal(start // DAY_MINUTES))
+        free = []
+        for name in names:
+            interval_set = page.blocked.get(name)
+            if interval_set is None or interval_set.find(start, end) is None:
+                free.append(name)
+        preferred = [name for name in free
+                     if name in page.preferred and page.preferred[name].find(start, end) is not None]
+        preferred_names = set(preferred)
+        return preferred + [name for name in free if name not in preferred_names]
+
+    def blocked_intervals(self, name, start, end):
+        """员工在分钟范围 [start, end) 内的请假/不可用区间 [(开始, 结束, 类型)]，可跨多个月"""
+        clipped = []
+        day = date.fromordinal(start // DAY_MINUTES)
+        while day.toordinal() * DAY_MINUTES < end:
+            page = self.page(day)
+            interval_set = page.blocked.get(name)
+            if interval_set is not None:
+                low, high = max(start, page.start), min(end, page.end)
+                clipped.extend((max(low, first), min(high, last), kind)
+                               for first, last, kind in interval_set.overlapping(low, high))
+            day = (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+        # 相邻两页重叠一天，裁剪后重新合并
+        merged = IntervalSet()
+        for first, last, kind in sorted(clipped):
+            merged.add(first, last, kind)
+        return list(zip(merged.starts, merged.ends, merged.kinds))
+
+    def conflicts(self, rows):
+        """排班行 (姓名, 部门, 职位, 日期, 班次, ...) 中与请假/不可用冲突的: [(行, 类型)]"""
+        found = []
+        for row in rows:
+            try:
+                kind = self.conflict(row[0], row[3], row[4])
+            except ValueError:
+                continue
+            if kind:
+                found.append((row, kind))
+        return found
+
+
+def availability_conflicts(store, start_date="0000-01-01", end_date="9999-12-31", limit=None):
+    """日期范围内与请假/不可用时段冲突的排班: [(id, 姓名, 日期, 班次, 类型)]"""
+    index = AvailabilityIndex(store)
+    found = []
+    for record_id, name, _, _, work_date, shift_type, _ in store.iter_schedules(start_date, end_date):
+        try:
+            kind = index.conflict(name, work_date, shift_type)
+        except ValueError:
+            continue
+        if kind:
+            found.append((record_id, name, work_date, shift_type, kind))
+            if limit and len(found) >= limit:
+                break
+    return found
+
+
+def whole_days(start_date, end_date):
+    """整天的时段：[start_date 00:00, end_date 次日 00:00)"""
+    end = date.fromisoformat(end_date) + timedelta(days=1)
+    return f"{start_date} 00:00", f"{end.isoformat()} 00:00"
@@ -0,0 +1,443 @@
+"""排班表性能测试：合成排班数据库 + 无界面计时真实代码路径
+
+用法:
+    python Schedule_Bench.py [--sizes 10k,100k,1m] [--repeat 5] [--output bench_results.json]
+                             [--baseline 基准.json] [--tolerance 0.2] [--work-dir bench_data]
+
+生成的数据库按规模缓存在工作目录中（user_bench_<规模>.db），--regenerate 可强制重新生成。
+界面代码通过 QT_QPA_PLATFORM=offscreen 无窗口运行。指定 --baseline 时与基准结果比较，
+中位数变慢超过容差的项目视为性能回退，返回码为1。
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+from datetime import date, timedelta
+
+from Schedule_Store import UserManager, ScheduleStore
+
+# 部门及其人数占比
+DEPARTMENT_WEIGHTS = [
+    ("销售部", 22), ("技术部", 20), ("客服部", 18), ("市场部", 12),
+    ("生产部", 10), ("仓储部", 7), ("人事部", 6), ("财务部", 5),
+]
+POSITION_WEIGHTS = [("专员", 60), ("助理", 15), ("主管", 20), ("经理", 5)]
+# 班次名称及出现占比（与默认班次对应）
+SHIFT_WEIGHTS = [("早班", 35), ("中班", 25), ("晚班", 15), ("全天班", 15), ("早班(模糊)", 5), ("晚班(模糊)", 5)]
+REMARKS = ["调班", "加班", "培训", "替班"]
+SURNAMES = "王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈姚卢姜崔钟谭陆汪范金石廖贾夏韦付方白邹孟熊秦邱江尹薛闫段雷侯龙史陶黎贺顾毛郝龚邵万钱严武戴莫孔向汤"
+GIVEN_CHARS = "伟芳娜秀英敏静丽强磊军洋勇艳杰娟涛明超兰霞平刚华建国文辉鹏飞玉萍红燕宇浩然欣怡梓涵子轩思远佳琪雨嘉晨博睿"
+WORK_PROBABILITY = {True: 0.35, False: 0.75}   # 周末/工作日的出勤概率
+INSERT_BATCH = 50000
+
+
+def parse_size(text):
+    """解析 10k / 1m / 250000 这样的规模"""
+    text = text.strip().lower()
+    factor = {"k": 1000, "m": 1000000}.get(text[-1:], 1)
+    return int(float(text[:-1] if factor > 1 else text) * factor)
+
+
+def size_label(rows):
+    if rows >= 1000000 and rows % 1000000 == 0:
+        return f"{rows // 1000000}m"
+    if rows >= 1000 and rows % 1000 == 0:
+        return f"{rows // 1000}k"
+    return str(rows)
+
+
+def make_employees(rng, count):
+    """生成不重名的员工：(姓名, 部门, 职位)"""
+    departments = [name for name, _ in DEPARTMENT_WEIGHTS]
+    dept_weights = [weight for _, weight in DEPARTMENT_WEIGHTS]
+    positions = [name for name, _ in POSITION_WEIGHTS]
+    position_weights = [weight for _, weight in POSITION_WEIGHTS]
+    names = set()
+    employees = []
+    while len(employees) < count:
+        name = rng.choice(SURNAMES) + "".join(rng.choice(GIVEN_CHARS) for _ in range(rng.choice((1, 2, 2))))
+        if name in names:
+            if len(names) > len(SURNAMES) * len(GIVEN_CHARS):
+                name += str(len(employees))
+            else:
+                continue
+        names.add(name)
+        employees.append((name, rng.choices(departments, dept_weights)[0], rng.choices(positions, position_weights)[0]))
+    return employees
+
+
+def iter_roster_rows(rng, employees, shift_labels, start_date, total):
+    """按天生成排班行，直到达到目标行数"""
+    shift_names = [name for name, _ in SHIFT_WEIGHTS]
+    shift_weights = [weight for _, weight in SHIFT_WEIGHTS]
+    produced = 0
+    day = start_date
+    while produced < total:
+        weekend = day.weekday() >= 5
+        probability = WORK_PROBABILITY[weekend]
+        date_str = day.isoformat()
+        for name, department, position in employees:
+            if rng.random() >= probability:
+                continue
+            shift = shift_labels[rng.choices(shift_names, shift_weights)[0]]
+            remarks = rng.choice(REMARKS) if rng.random() < 0.05 else ""
+            yield (name, department, position, date_str, shift, remarks)
+            produced += 1
+            if produced >= total:
+                return
+        day += timedelta(days=1)
+
+
+def generate_roster_db(db_file, rows, seed=42):
+    """生成包含 rows 条排班的合成数据库，返回描述数据分布的元数据"""
+    if os.path.exists(db_file):
+        os.remove(db_file)
+    rng = random.Random(seed)
+    # 员工数随规模增长（最多5000人），时间跨度由行数决定
+    employee_count = min(5000, max(30, rows // 400))
+    employees = make_employees(rng, employee_count)
+    days_needed = rows / (employee_count * (5 * WORK_PROBABILITY[False] + 2 * WORK_PROBABILITY[True]) / 7)
+    start_date = date(2025, 1, 1) - timedelta(days=int(days_needed // 2))
+
+    store = ScheduleStore(db_file)
+    try:
+        store.init_db()
+        cursor = store.cursor
+        for name, _ in DEPARTMENT_WEIGHTS:
+            cursor.execute("INSERT OR IGNORE INTO departments (name) VALUES (?)", (name,))
+        shift_labels = {}
+        for shift_name, start_time, end_time in store.get_shifts():
+            shift_labels[shift_name] = f"{shift_name} ({start_time}-{end_time})"
+        # 批量写入时暂时去掉 schedules 上的触发器和索引，写完后由 init_db 重建
+        cursor.execute("SELECT type, name FROM sqlite_master WHERE type IN ('trigger', 'index') "
+                       "AND tbl_name = 'schedules' AND sql IS NOT NULL")
+        for kind, name in cursor.fetchall():
+            cursor.execute(f"DROP {kind.upper()} {name}")
+        store.conn.commit()
+        cursor.execute("PRAGMA synchronous = OFF")
+
+        batch = []
+        last_date = None
+        for row in iter_roster_rows(rng, employees, shift_labels, start_date, rows):
+            batch.append(row)
+            if len(batch) >= INSERT_BATCH:
+                last_date = batch[-1][3]
+                cursor.executemany('''
+                    INSERT INTO schedules (employee_name, department, position, work_date, shift_type, remarks)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', batch)
+                batch = []
+        if batch:
+            last_date = batch[-1][3]
+            cursor.executemany('''
+                INSERT INTO schedules (employee_name, department, position, work_date, shift_type, remarks)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', batch)
+        store.conn.commit()
+        cursor.execute("PRAGMA synchronous = FULL")
+        store.init_db()
+        # 触发器被去掉期间新增的员工补登记到颜色表，并重新统计人次计数（与触发器的效果相同）
+        cursor.execute("INSERT OR IGNORE INTO employee_colors (employee_name, color_index) "
+                       "SELECT DISTINCT employee_name, -1 FROM schedules")
+        store.rebuild_staffing_counts()
+        cursor.execute("ANALYZE")
+        store.conn.commit()
+    finally:
+        store.close()
+
+    sample_day = start_date + (date.fromisoformat(last_date) - start_date) / 2
+    return {
+        "rows": rows,
+        "seed": seed,
+        "schema_version": ScheduleStore.SCHEMA_VERSION,
+        "employees": employee_count,
+        "first_date": start_date.isoformat(),
+        "last_date": last_date,
+        "sample_date": sample_day.isoformat(),
+        "search_text": employees[0][0][0],
+        "department": DEPARTMENT_WEIGHTS[0][0],
+    }
+
+
+def prepare_database(rows, seed=42, regenerate=False):
+    """准备（或复用缓存的）某个规模的测试数据库并注册测试用户，返回 (用户名, 数据库文件, 元数据)"""
+    username = f"bench_{size_label(rows)}"
+    db_file = f"user_{username}.db"
+    meta_file = db_file + ".json"
+    UserManager.init_users_db()
+    if UserManager.get_db_file(username) is None:
+        UserManager.create_user(username)
+    meta = None
+    if not regenerate and os.path.exists(db_file) and os.path.exists(meta_file):
+        with open(meta_file, encoding="utf-8") as f:
+            meta = json.load(f)
+        if (meta.get("rows"), meta.get("seed"), meta.get("schema_version")) != (rows, seed, ScheduleStore.SCHEMA_VERSION):
+            meta = None
+    if meta is None:
+        print(f"生成 {rows} 行测试数据...", file=sys.stderr)
+        started = time.perf_counter()
+        meta = generate_roster_db(db_file, rows, seed)
+        meta["generate_seconds"] = round(time.perf_counter() - started, 2)
+        with open(meta_file, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+    return username, db_file, meta
+
+
+def measure(func, repeat, setup=None):
+    """重复执行 func，返回每次耗时(毫秒)"""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - started) * 1000)
+    return times
+
+
+def summarize(times):
+    return {
+        "median_ms": round(statistics.median(times), 3),
+        "min_ms": round(min(times), 3),
+        "runs": len(times),
+    }
+
+
+def run_benchmarks(username, db_file, meta, repeat):
+    """计时登录、主窗口、月历、列表、单日加载、对话框、导入和比较数据库等真实代码路径"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QDate
+    import Schedule_Manager
+    import Schedule_CLI
+    from Schedule_Perf import monitor
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    sample = QDate.fromString(meta["sample_date"], "yyyy-MM-dd")
+    month_start = QDate(sample.year(), sample.month(), 1)
+    month_end = QDate(sample.year(), sample.month(), sample.daysInMonth())
+    results = {}
+
+    def login():
+        found = UserManager.authenticate(username)
+        store = ScheduleStore(found)
+        store.init_db()
+        store.close()
+    results["login"] = measure(login, repeat)
+
+    first_paint = []
+    view_ready = []
+    # 从默认视图开始计时，不受上次运行保存的视图状态影响
+    UserManager.save_view_state(username, {})
+
+    def open_window():
+        # 显示窗口并处理事件，直到窗口框架绘制完成且首个视图已加载
+        window = Schedule_Manager.ScheduleManager(username, db_file)
+        window.current_date = sample   # 打开有数据的月份
+        window.show()
+        deadline = time.perf_counter() + 30
+        while not window.initial_view_ready and time.perf_counter() < deadline:
+            app.processEvents()
+        first_paint.append(monitor.last_span_ms("first_paint"))
+        view_ready.append(monitor.last_span_ms("view_ready"))
+        window.change_timer.stop()
+        window.hide()
+        window.sessions.close_all()
+        window.deleteLater()
+    results["window_init"] = measure(open_window, repeat)
+    results["first_paint"] = first_paint
+    results["view_ready"] = view_ready
+
+    window = Schedule_Manager.ScheduleManager(username, db_file)
+    window.change_timer.stop()
+    # 窗口不显示，直接完成启动后的首次加载
+    window.render_initial_view()
+    window.current_date = sample
+
+    def calendar():
+        window.update_calendar_view()
+        app.processEvents()
+    results["update_calendar_view"] = measure(calendar, repeat)
+
+    results["load_day_schedules"] = measure(
+        lambda: window.load_day_schedules(window.calendar_table, 0, 0, sample), repeat
+    )
+
+    window.toggle_view()
+    for widget in (window.search_input, window.start_date_edit, window.end_date_edit):
+        widget.blockSignals(True)
+    window.start_date_edit.setDate(month_start)
+    window.end_date_edit.setDate(month_end)
+    window.search_input.setText("")
+    results["load_data"] = measure(window.load_data, repeat)
+    window.search_input.setText(meta["search_text"])
+    results["load_data_search"] = measure(window.load_data, repeat)
+    window.search_input.setText("")
+
+    def open_dialog():
+        dialog = Schedule_Manager.ScheduleDialog(window)
+        dialog.deleteLater()
+    results["dialog_open"] = measure(open_dialog, repeat)
+
+    # 切换用户：在测试用户和一个空用户之间来回切换，连接已缓存，并恢复各自的视图状态
+    other_user = "bench_switch"
+    if UserManager.get_db_file(other_user) is None:
+        UserManager.create_user(other_user)
+    UserManager.save_view_state(other_user, {})
+    targets = [(other_user, UserManager.get_db_file(other_user)), (username, db_file)]
+    switches = []
+
+    def switch_user():
+        window.save_view_state()
+        window.current_user, window.user_db_file = targets[len(switches) % 2]
+        switches.append(window.current_user)
+        window.activate_user()
+        app.processEvents()
+    switch_user()   # 第一次打开空用户的数据库不计入
+    results["switch_user"] = measure(switch_user, repeat * 2)
+    window.sessions.close_all()
+    window.deleteLater()
+    app.processEvents()
+
+    # 导入：生成一个CSV，通过命令行导入后再整体撤销，保持数据库不变
+    import csv
+    csv_file = db_file + ".import.csv"
+    rng = random.Random(7)
+    with open(csv_file, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(ScheduleStore.COLUMNS)
+        for i in range(5000):
+            day = sample.addDays(rng.randrange(28)).toString("yyyy-MM-dd")
+            writer.writerow((f"导入员工{i % 200}", "技术部", "专员", day, "早班 (08:00-16:00)", ""))
+    store = ScheduleStore(db_file)
+    undo_times = []
+
+    def undo_import():
+        started = time.perf_counter()
+        store.journal.undo()
+        undo_times.append((time.perf_counter() - started) * 1000)
+
+    def do_import():
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        try:
+            Schedule_CLI.main(["import", "--db", db_file, csv_file])
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    try:
+        times = []
+        for _ in range(repeat):
+            times.extend(measure(do_import, 1))
+            undo_import()
+        results["import_5000"] = times
+        results["undo_import_5000"] = undo_times
+    finally:
+        store.close()
+        os.remove(csv_file)
+
+    # 比较数据库：与备份比较（两边每天的哈希都已缓存），备份之后新增了 100 条排班
+    from Schedule_Diff import diff_databases
+    store = ScheduleStore(db_file)
+    backup_file = None
+    try:
+        store.day_hashes()   # 第一次计算全部日期的哈希不计入
+        backup_file = store.backup(os.path.dirname(os.path.abspath(db_file)), kind="bench")
+        store.add_schedules([(f"比较员工{i}", "技术部", "专员", sample.addDays(i % 28).toString("yyyy-MM-dd"),
+                              "早班 (08:00-16:00)", "") for i in range(100)], "比较测试")
+        other = ScheduleStore(backup_file, read_only=True)
+        try:
+            results["diff_backup"] = measure(lambda: diff_databases(store, other), repeat)
+        finally:
+            other.close()
+        store.journal.undo()
+    finally:
+        store.close()
+        if backup_file:
+            os.remove(backup_file)
+    return {name: summarize(times) for name, times in results.items()}
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """与基准结果比较，返回 [(规模, 项目, 基准ms, 当前ms, 比例, 是否回退)]"""
+    rows = []
+    for size, metrics in results.items():
+        base_metrics = baseline.get("results", {}).get(size, {})
+        for name, current in metrics.items():
+            base = base_metrics.get(name)
+            if not base or not base.get("median_ms"):
+                continue
+            ratio = current["median_ms"] / base["median_ms"]
+            # 小于1毫秒的差异视为噪声
+            regressed = ratio > 1 + tolerance and current["median_ms"] - base["median_ms"] > 1
+            rows.append((size, name, base["median_ms"], current["median_ms"], round(ratio, 3), regressed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="排班表性能测试")
+    parser.add_argument("--sizes", default="10k,100k", help="逗号分隔的数据规模，例如 10k,100k,1m,10m")
+    parser.add_argument("--repeat", type=int, default=5, help="每项重复次数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--work-dir", default="bench_data", help="测试数据库和用户库所在目录")
+    parser.add_argument("--output", default="bench_results.json", help="结果文件（相对于工作目录）")
+    parser.add_argument("--baseline", help="基准结果文件，用于发现性能回退")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的变慢比例")
+    parser.add_argument("--regenerate", action="store_true", help="重新生成测试数据库")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    os.chdir(args.work_dir)
+    import sqlite3
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "datasets": {},
+        "results": {},
+    }
+    for size in args.sizes.split(","):
+        rows = parse_size(size)
+        label = size_label(rows)
+        username, db_file, meta = prepare_database(rows, args.seed, args.regenerate)
+        report["datasets"][label] = meta
+        print(f"[{label}] 计时中...", file=sys.stderr)
+        report["results"][label] = run_benchmarks(username, db_file, meta, args.repeat)
+        for name, summary in report["results"][label].items():
+            print(f"[{label}] {name:<22} 中位数 {summary['median_ms']:>10.2f} ms  最小 {summary['min_ms']:>10.2f} ms")
+
+    exit_code = 0
+    if baseline:
+        comparison = compare_with_baseline(report["results"], baseline, args.tolerance)
+        report["comparison"] = [
+            dict(zip(("size", "name", "baseline_ms", "current_ms", "ratio", "regressed"), row)) for row in comparison
+        ]
+        print("\n与基准比较:")
+        for size, name, base_ms, current_ms, ratio, regressed in comparison:
+            flag = "  <-- 回退" if regressed else ""
+            print(f"[{size}] {name:<22} {base_ms:>10.2f} -> {current_ms:>10.2f} ms  x{ratio:.2f}{flag}")
+        if any(row[-1] for row in comparison):
+            exit_code = 1
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {os.path.join(args.work_dir, args.output)}", file=sys.stderr)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
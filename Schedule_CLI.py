@@ -0,0 +1,756 @@
+"""排班表命令行工具（不导入 PyQt，适合定时任务和批处理）
+
+用法:
+    python -m Schedule_CLI import  --user 用户名 排班.csv
+    python -m Schedule_CLI export  --user 用户名 [--start 2025-01-01] [--end 2025-01-31] [--day-type 节假日] [-o 输出.csv]
+    python -m Schedule_CLI stats   --user 用户名 [--json]
+    python -m Schedule_CLI validate --user 用户名
+    python -m Schedule_CLI backup  --user 用户名 [--type auto]
+    python -m Schedule_CLI migrate --all
+    python -m Schedule_CLI archive --user 用户名 --before 2025 | --year 2023 | --restore 2023 | --list
+    python -m Schedule_CLI template copy --user 用户名 --from-start 2025-03-03 --from-end 2025-03-09 --to-start 2025-03-10 [--to-end 2025-03-31]
+    python -m Schedule_CLI template save|apply|list|delete [模板名] --user 用户名 [...]
+    python -m Schedule_CLI rules add --user 用户名 --department 技术部 --shift 早班 --weekdays 01234 --min 3 [--day-type 工作日]
+    python -m Schedule_CLI rules list|check|delete [规则ID] --user 用户名 [--start 2025-01-01 --end 2025-12-31]
+    python -m Schedule_CLI leave add 张三 --user 用户名 --start 2025-03-03 [--end 2025-03-05] [--kind 请假|不可用|偏好]
+    python -m Schedule_CLI leave free --user 用户名 --start 2025-03-03 --shift 早班 [--department 技术部]
+    python -m Schedule_CLI calendar show --user 用户名 --start 2025-10-01 --end 2025-10-31 [--day-type 工作日]
+    python -m Schedule_CLI calendar load [节假日.csv] --user 用户名
+    python -m Schedule_CLI remind list|watch --user 用户名 [--lead 15] [--hours 24] [--department 技术部] [--exec 命令]
+    python -m Schedule_CLI sync export --user 用户名 -o 变更.schedule-changes [--since 计数]
+    python -m Schedule_CLI sync import 变更.schedule-changes --user 用户名 [--dry-run] [--theirs]
+    python -m Schedule_CLI sync status|fork --user 用户名
+    python -m Schedule_CLI diff 对方.db --user 用户名 [--start 2025-01-01 --end 2025-12-31] [--kind 不同] [--merge]
+    python -m Schedule_CLI report  --user 用户名 --start 2025-01 --end 2025-06 [--workers 8] -o 报表目录
+    python -m Schedule_CLI federate --all | --users 张三,李四 | --db a.db --db b.db [--stats] [-o 汇总.csv]
+    python -m Schedule_CLI user add 用户名 [--password 密码]
+
+也可以用 --db 直接指定数据库文件代替 --user。
+"""
+import sys
+import argparse
+
+from Schedule_Calendar import DAY_TYPES
+from Schedule_Diff import KINDS
+from Schedule_Store import UserManager, ScheduleStore
+
+# 导入/导出文件的列名（兼容列表视图的中文表头）
+CSV_HEADERS = {
+    "employee_name": "employee_name", "员工姓名": "employee_name",
+    "department": "department", "部门": "department",
+    "position": "position", "职位": "position",
+    "work_date": "work_date", "工作日期": "work_date",
+    "shift_type": "shift_type", "班次类型": "shift_type",
+    "remarks": "remarks", "备注": "remarks",
+}
+
+
+class CliError(Exception):
+    """命令行参数或输入数据错误"""
+
+
+def resolve_db_file(args):
+    """根据 --db 或 --user/--password 确定数据库文件"""
+    if args.db:
+        return args.db
+    if not args.user:
+        raise CliError("请使用 --user 或 --db 指定数据库")
+    UserManager.init_users_db()
+    db_file = UserManager.authenticate(args.user, args.password)
+    if not db_file:
+        raise CliError("用户名或密码错误")
+    return db_file
+
+
+def open_store(args):
+    store = ScheduleStore(resolve_db_file(args))
+    # 表结构已是当前版本时不做任何写入，保证只读命令启动足够快
+    store.ensure_schema()
+    return store
+
+
+def write_output(args, text):
+    if args.output:
+        with open(args.output, "w", encoding="utf-8-sig" if args.output.endswith(".csv") else "utf-8",
+                  newline="") as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+
+
+# ---------- 子命令 ----------
+
+def cmd_import(args):
+    import csv
+    from datetime import date
+
+    rows = []
+    errors = []
+    with open(args.file, encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        columns = {header: CSV_HEADERS[header.strip()] for header in reader.fieldnames or []
+                   if header.strip() in CSV_HEADERS}
+        missing = {"employee_name", "department", "work_date", "shift_type"} - set(columns.values())
+        if missing:
+            raise CliError(f"CSV 缺少列: {', '.join(sorted(missing))}")
+        for line_no, record in enumerate(reader, start=2):
+            values = {column: (record.get(header) or "").strip() for header, column in columns.items()}
+            row = tuple(values.get(column, "") for column in ScheduleStore.COLUMNS)
+            if not row[0] or not row[1] or not row[4]:
+                errors.append(f"第{line_no}行: 姓名、部门、班次不能为空")
+                continue
+            try:
+                date.fromisoformat(row[3])
+            except ValueError:
+                errors.append(f"第{line_no}行: 日期格式应为 yyyy-MM-dd: {row[3]}")
+                continue
+            rows.append(row)
+
+    for error in errors[:20]:
+        print(error, file=sys.stderr)
+    if errors:
+        print(f"共 {len(errors)} 行无效", file=sys.stderr)
+        if not args.skip_invalid:
+            return 1
+    if args.dry_run:
+        print(f"校验通过 {len(rows)} 行（未写入）")
+        return 0
+
+    store = open_store(args)
+    try:
+        count = store.add_schedules(rows, f"导入 {len(rows)} 条排班")
+    finally:
+        store.close()
+    print(f"已导入 {count} 条排班记录")
+    return 0
+
+
+def write_records(args, columns, records):
+    if args.format == "json":
+        import json
+        text = json.dumps([dict(zip(columns, record)) for record in records], ensure_ascii=False, indent=2) + "\n"
+    else:
+        import io
+        import csv
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        writer.writerows(records)
+        text = buffer.getvalue()
+    write_output(args, text)
+    if args.output:
+        print(f"已导出 {len(records)} 条排班记录到 {args.output}")
+
+
+def cmd_export(args):
+    store = open_store(args)
+    try:
+        records = store.list_schedules(args.start, args.end, args.search, args.department, day_type=args.day_type)
+    finally:
+        store.close()
+    write_records(args, ("id",) + ScheduleStore.COLUMNS, records)
+    return 0
+
+
+def print_stats(args, stats):
+    if args.json:
+        import json
+        print(json.dumps(stats, ensure_ascii=False, indent=2))
+        return 0
+    print(f"排班记录: {stats['total']}")
+    print(f"日期范围: {stats['first_date'] or '-'} ~ {stats['last_date'] or '-'}")
+    print(f"员工人数: {stats['employees']}")
+    if "by_source" in stats:
+        print("按来源:")
+        for name, count in stats["by_source"]:
+            print(f"  {name}: {count}")
+    print("按部门:")
+    for name, count in stats["by_department"]:
+        print(f"  {name}: {count}")
+    print("按班次:")
+    for name, count in stats["by_shift"]:
+        print(f"  {name}: {count}")
+    if "by_day_type" in stats:
+        print("按日期类型:")
+        for name, count in stats["by_day_type"]:
+            print(f"  {name}: {count}")
+    return 0
+
+
+def cmd_stats(args):
+    store = open_store(args)
+    try:
+        stats = store.get_statistics(args.start, args.end)
+    finally:
+        store.close()
+    return print_stats(args, stats)
+
+
+def cmd_federate(args):
+    import os
+    from Schedule_Federation import FederatedStore
+
+    if args.db:
+        store = FederatedStore([(os.path.splitext(os.path.basename(db_file))[0], db_file) for db_file in args.db])
+    elif args.all or args.users:
+        UserManager.init_users_db()
+        store = FederatedStore.for_users([name.strip() for name in args.users.split(",")] if args.users else None)
+    else:
+        raise CliError("请使用 --all、--users 或 --db 指定要汇总的数据库")
+    try:
+        if args.stats:
+            stats = store.get_statistics(args.start, args.end)
+        else:
+            records = store.list_schedules(args.start, args.end, args.search, args.department)
+    finally:
+        store.close()
+    for db_file in store.missing:
+        print(f"跳过不存在的数据库: {db_file}", file=sys.stderr)
+    if args.stats:
+        return print_stats(args, stats)
+    write_records(args, ("source", "id") + ScheduleStore.COLUMNS, records)
+    return 0
+
+
+def cmd_validate(args):
+    store = open_store(args)
+    try:
+        problems = store.validate()
+    finally:
+        store.close()
+
+    if not problems:
+        print("未发现问题")
+        return 0
+    for name, count, samples in problems:
+        print(f"{name}: {count}")
+        for sample in samples:
+            print(f"  {sample}")
+    return 1
+
+
+def cmd_backup(args):
+    store = open_store(args)
+    try:
+        path = store.backup(args.backup_dir, args.type)
+    finally:
+        store.close()
+    print(f"已备份到 {path}")
+    if args.type == "auto":
+        for removed in ScheduleStore.prune_backups(store.db_file, args.backup_dir, "auto", args.keep_days):
+            print(f"已删除过期备份 {removed}")
+    return 0
+
+
+def cmd_migrate(args):
+    if args.all:
+        UserManager.init_users_db()
+        db_files = [UserManager.get_db_file(username) for username in UserManager.list_users()]
+    else:
+        db_files = [resolve_db_file(args)]
+    for db_file in db_files:
+        store = ScheduleStore(db_file)
+        try:
+            old_version, new_version = store.migrate()
+        finally:
+            store.close()
+        print(f"{db_file}: 版本 {old_version} -> {new_version}")
+    return 0
+
+
+def cmd_archive(args):
+    from datetime import date
+
+    store = open_store(args)
+    try:
+        if args.list:
+            for year, file_name, row_count, archived_at in store.archives.list():
+                print(f"{year}: {row_count} 条  {file_name}  (归档于 {archived_at[:19]})")
+            return 0
+        if args.restore:
+            for year in args.restore:
+                print(f"{year}: 已恢复 {store.archives.restore(year)} 条排班记录到主库")
+            return 0
+        if args.year:
+            years = sorted(set(args.year))
+        elif args.before:
+            years = store.archives.candidate_years(min(args.before, date.today().year))
+        else:
+            raise CliError("请指定 --year、--before、--restore 或 --list")
+        moved = 0
+        for year in years:
+            count = store.archives.archive(year)
+            if count:
+                moved += count
+                print(f"{year}: 已归档 {count} 条排班记录")
+        if moved and not args.no_vacuum:
+            store.compact()
+            print("已整理主库文件")
+    finally:
+        store.close()
+    return 0
+
+
+def cmd_report(args):
+    from Schedule_Reports import ReportBatch, month_range
+
+    try:
+        months = month_range(args.start, args.end or args.start)
+    except ValueError:
+        raise CliError("月份格式应为 yyyy-MM")
+    if not months:
+        raise CliError("结束月份早于开始月份")
+    departments = [name.strip() for name in args.departments.split(",") if name.strip()] if args.departments else None
+    batch = ReportBatch(resolve_db_file(args), months, args.output, departments, args.workers)
+
+    def progress(done, total):
+        print(f"\r{done}/{total}", end="", file=sys.stderr, flush=True)
+
+    result = batch.run(None if args.quiet else progress)
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(f"已生成 {result['tasks']} 份部门月报（{result['workers']} 个进程，用时 {result['seconds']} 秒，"
+          f"任务累计 {result['task_ms'] / 1000:.3f} 秒）")
+    print(f"输出目录: {args.output}")
+    return 0
+
+
+def cmd_template(args):
+    employees = [name.strip() for name in args.employees.split(",") if name.strip()] if args.employees else None
+    store = open_store(args)
+    try:
+        if args.action == "list":
+            for name, period_days, row_count, created_at in store.list_templates():
+                print(f"{name}: {period_days} 天, {row_count} 条  (保存于 {created_at})")
+            return 0
+        if args.action in ("save", "apply", "delete") and not args.name:
+            raise CliError("请指定模板名称")
+        if args.action in ("save", "copy") and not (args.from_start and args.from_end):
+            raise CliError("请使用 --from-start 和 --from-end 指定来源范围")
+        if args.action in ("apply", "copy") and not args.to_start:
+            raise CliError("请使用 --to-start 指定目标开始日期")
+        if args.action == "save":
+            count = store.save_template(args.name, args.from_start, args.from_end, args.department, employees)
+            print(f"模板 {args.name} 已保存（{count} 条排班）")
+        elif args.action == "delete":
+            if not store.delete_template(args.name):
+                raise CliError(f"模板不存在: {args.name}")
+            print(f"模板 {args.name} 已删除")
+        elif args.action == "apply":
+            try:
+                count = store.apply_template(args.name, args.to_start, args.to_end, args.replace)
+            except KeyError:
+                raise CliError(f"模板不存在: {args.name}")
+            print(f"已添加 {count} 条排班")
+        else:
+            count = store.copy_schedules(args.from_start, args.from_end, args.to_start, args.to_end,
+                                         args.department, employees, args.replace)
+            print(f"已添加 {count} 条排班")
+    finally:
+        store.close()
+    return 0
+
+
+def cmd_rules(args):
+    from datetime import date
+    from Schedule_Rules import StaffingChecker, StaffingRule
+
+    store = open_store(args)
+    try:
+        if args.action == "list":
+            for row in store.get_staffing_rules():
+                rule = StaffingRule(*row)
+                print(f"{rule.id}: {rule.describe()}" + (f"  ({rule.note})" if rule.note else ""))
+            return 0
+        if args.action == "add":
+            if not args.department or (args.min is None and args.max is None):
+                raise CliError("请使用 --department 和 --min/--max 指定规则")
+            rule_id = store.add_staffing_rule(args.department, args.shift, args.weekdays, args.min, args.max, args.note,
+                                              args.day_type)
+            print(f"已添加规则 {rule_id}")
+            return 0
+        if args.action == "delete":
+            if args.rule_id is None:
+                raise CliError("请指定规则ID")
+            if not store.delete_staffing_rule(args.rule_id):
+                raise CliError(f"规则不存在: {args.rule_id}")
+            print(f"规则 {args.rule_id} 已删除")
+            return 0
+        # 默认检查今年
+        year = date.today().year
+        violations = StaffingChecker(store).check(args.start or f"{year:04d}-01-01", args.end or f"{year:04d}-12-31")
+    finally:
+        store.close()
+    for date_str in sorted(violations):
+        for violation in violations[date_str]:
+            print(f"{date_str}  {violation.message}")
+    return 1 if violations else 0
+
+
+def cmd_leave(args):
+    from datetime import date, timedelta
+    from Schedule_Availability import AvailabilityIndex, whole_days
+
+    store = open_store(args)
+    try:
+        if args.action == "add":
+            if not (args.name and args.start):
+                raise CliError("请指定员工姓名和 --start")
+            if len(args.start) <= 10 and (not args.end or len(args.end) <= 10):
+                # 只有日期时按整天计算，结束日期包含在内
+                start_at, end_at = whole_days(args.start, args.end or args.start)
+            else:
+                start_at, end_at = args.start, args.end or ""
+            if end_at <= start_at:
+                raise CliError("结束时间必须晚于开始时间")
+            entry_id = store.add_availability(args.name, args.kind, start_at, end_at, args.note)
+            print(f"已添加 {entry_id}: {args.name} {args.kind} {start_at} 至 {end_at}")
+        elif args.action == "list":
+            start = args.start or "0000-01-01"
+            end = args.end or "9999-12-31"
+            for entry_id, name, kind, start_at, end_at, note in store.list_availability(
+                    start[:10] + " 00:00", end[:10] + " 24:00", args.name or ""):
+                print(f"{entry_id}: {name} {kind} {start_at} 至 {end_at}" + (f"  ({note})" if note else ""))
+        elif args.action == "delete":
+            if not args.name or not args.name.isdigit():
+                raise CliError("请指定要删除的ID")
+            if not store.delete_availability(int(args.name)):
+                raise CliError(f"不存在: {args.name}")
+            print(f"已删除 {args.name}")
+        else:
+            if not (args.start and args.shift):
+                raise CliError("请使用 --start 指定日期，--shift 指定班次")
+            work_date = args.start[:10]
+            # 候选员工：该部门（或全部）最近60天排过班的员工
+            recent_start = (date.fromisoformat(work_date) - timedelta(days=60)).isoformat()
+            names = store.get_range_employees(recent_start, work_date, args.department)
+            for name in AvailabilityIndex(store).free_employees(names, work_date, args.shift):
+                print(name)
+    finally:
+        store.close()
+    return 0
+
+
+def cmd_calendar(args):
+    from datetime import date
+    from Schedule_Rules import WEEKDAY_NAMES
+
+    store = open_store(args)
+    try:
+        if args.action == "load":
+            # 不指定文件时恢复使用随程序发布的节假日文件
+            days = store.sync_holidays(args.file, bundled=not args.file)
+            print(f"已加载 {days} 个节假日/调休日期")
+            return 0
+        year = date.today().year
+        infos = store.get_date_dim(args.start or f"{year:04d}-01-01", args.end or f"{year:04d}-12-31")
+    finally:
+        store.close()
+    if args.day_type:
+        infos = [info for info in infos if info.matches(args.day_type)]
+    for info in infos:
+        kind = "工作日" if info.is_workday else "休息日"
+        print(f"{info.work_date}  周{WEEKDAY_NAMES[info.weekday]}  第{info.iso_week:02d}周  {kind}  {info.badge}".rstrip())
+    print(f"共 {len(infos)} 天，其中工作日 {sum(info.is_workday for info in infos)} 天")
+    return 0
+
+
+def cmd_remind(args):
+    import os
+    import subprocess
+    import time
+    from Schedule_Reminders import ReminderQueue, group_text
+
+    store = open_store(args)
+    try:
+        queue = ReminderQueue(store, args.lead, args.department)
+        queue.reload()
+        if args.action == "list":
+            for reminder in queue.upcoming(args.hours):
+                print(reminder.describe())
+            return 0
+
+        def notify(reminders):
+            text = group_text(reminders)
+            print(f"[{time.strftime('%H:%M')}] {len(reminders)} 个班次即将开始\n{text}", flush=True)
+            if args.exec:
+                # 提醒内容通过环境变量传给外部命令（例如发送消息的脚本）
+                env = dict(os.environ, REMINDER_COUNT=str(len(reminders)), REMINDER_TEXT=text)
+                subprocess.run(args.exec, shell=True, env=env)
+
+        queue.add_listener(notify)
+        print(f"已加载 {len(queue)} 个班次提醒，提前 {args.lead} 分钟，按 Ctrl+C 退出", flush=True)
+        data_version = store.data_version()
+        try:
+            while True:
+                # 睡到下一条提醒；期间每隔几秒检查一次其他程序的修改（PRAGMA data_version 代价极低）
+                time.sleep(max(1, min(queue.seconds_until_next(), args.poll)))
+                version = store.data_version()
+                if version != data_version:
+                    data_version = version
+                    queue.sync()
+                queue.due()
+        except KeyboardInterrupt:
+            return 0
+    finally:
+        store.close()
+
+
+def cmd_sync(args):
+    from Schedule_Sync import write_changeset, read_changeset, describe_changeset
+
+    store = open_store(args)
+    try:
+        if args.action == "status":
+            print(f"本库站点ID: {store.sync_site()}，变更计数: {store.change_counter()}")
+            for site_id, received_seq, acked_seq, synced_at in store.list_sync_peers():
+                print(f"  {site_id}: 已导入对方 {received_seq}，对方已确认本库 {acked_seq}，上次导入 {synced_at}")
+            return 0
+        if args.action == "fork":
+            print(f"已分出新的站点ID: {store.fork_sync_site()}（复制整个目录得到的数据库在开始同步前执行）")
+            return 0
+        if args.action == "export":
+            if not args.output:
+                raise CliError("请使用 -o 指定变更集文件")
+            changeset = store.export_changes(args.since)
+            size = write_changeset(args.output, changeset)
+            print(f"{describe_changeset(changeset)}\n已写入 {args.output}（{size / 1024:.1f} KB）")
+            return 0
+        if not args.file:
+            raise CliError("请指定要导入的变更集文件")
+        try:
+            changeset = read_changeset(args.file)
+            print(describe_changeset(changeset))
+            result = store.apply_changes(changeset, take_theirs=args.theirs, dry_run=args.dry_run)
+        except ValueError as e:
+            raise CliError(str(e))
+    finally:
+        store.close()
+    if result.gap:
+        print("注意: 对方这次导出的起点晚于上次导入的位置，中间的变更可能缺失，请让对方用 --since 重新导出")
+    for conflict in result.conflicts:
+        print(f"冲突: {conflict.describe()}")
+    print(("预览" if args.dry_run else "已导入") + f": {result.summary()}")
+    return 1 if result.conflicts and not args.theirs else 0
+
+
+def cmd_diff(args):
+    import os
+    from Schedule_Diff import diff_databases
+    from Schedule_Store import ConcurrentEditError
+
+    if not os.path.exists(args.file):
+        raise CliError(f"找不到数据库文件: {args.file}")
+    store = open_store(args)
+    try:
+        if os.path.samefile(store.db_file, args.file):
+            raise CliError("不能和本数据库自身比较")
+        other = ScheduleStore(args.file, read_only=True)
+        try:
+            result = diff_databases(store, other, args.start, args.end)
+        finally:
+            other.close()
+        entries = [entry for entry in result.entries if not args.kind or entry.kind in args.kind]
+        for entry in entries[:args.limit]:
+            print(entry.describe())
+        if len(entries) > args.limit:
+            print(f"... 共 {len(entries)} 处不同")
+        print(result.summary())
+        if not args.merge or not entries:
+            return 1 if entries else 0
+        try:
+            added, updated, deleted, skipped = store.merge_cells(entries, f"合并 {os.path.basename(args.file)} 的排班")
+        except ConcurrentEditError as e:
+            raise CliError(str(e))
+        print(f"已合并 {len(entries) - skipped} 格：添加 {added}，修改 {updated}，删除 {deleted}"
+              + (f"，已归档年份跳过 {skipped}" if skipped else ""))
+        return 0
+    finally:
+        store.close()
+
+
+def cmd_user(args):
+    UserManager.init_users_db()
+    if args.action == "list":
+        for username in UserManager.list_users():
+            print(username)
+        return 0
+    if not args.username:
+        raise CliError("请指定用户名")
+    if args.action == "add":
+        UserManager.create_user(args.username, args.password)
+        store = ScheduleStore(UserManager.get_db_file(args.username))
+        try:
+            store.init_db()
+        finally:
+            store.close()
+        print(f"已创建用户 {args.username}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m Schedule_CLI", description="排班表命令行工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    db_options = argparse.ArgumentParser(add_help=False)
+    db_options.add_argument("--user", help="用户名")
+    db_options.add_argument("--password", default="", help="密码")
+    db_options.add_argument("--db", help="直接指定数据库文件")
+
+    range_options = argparse.ArgumentParser(add_help=False)
+    range_options.add_argument("--start", default="0000-01-01", help="开始日期 yyyy-MM-dd")
+    range_options.add_argument("--end", default="9999-12-31", help="结束日期 yyyy-MM-dd")
+
+    p = sub.add_parser("import", parents=[db_options], help="从CSV导入排班")
+    p.add_argument("file", help="CSV文件（表头为英文字段名或列表视图中文表头）")
+    p.add_argument("--dry-run", action="store_true", help="只校验不写入")
+    p.add_argument("--skip-invalid", action="store_true", help="跳过无效行继续导入")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("export", parents=[db_options, range_options], help="导出排班")
+    p.add_argument("--search", default="", help="按姓名或部门搜索")
+    p.add_argument("--department", default="", help="部门")
+    p.add_argument("--day-type", choices=DAY_TYPES, default="", help="只导出工作日/休息日/节假日的排班")
+    p.add_argument("--format", choices=("csv", "json"), default="csv")
+    p.add_argument("-o", "--output", help="输出文件，默认输出到屏幕")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("stats", parents=[db_options, range_options], help="排班统计")
+    p.add_argument("--json", action="store_true", help="以JSON输出")
+    p.set_defaults(func=cmd_stats)
+
+    p = sub.add_parser("validate", parents=[db_options], help="检查数据问题（有问题时返回码为1）")
+    p.set_defaults(func=cmd_validate)
+
+    p = sub.add_parser("backup", parents=[db_options], help="备份数据库")
+    p.add_argument("--backup-dir", default="backups")
+    p.add_argument("--type", choices=("manual", "auto"), default="manual", help="备份类型")
+    p.add_argument("--keep-days", type=int, default=30, help="自动备份保留天数")
+    p.set_defaults(func=cmd_backup)
+
+    p = sub.add_parser("migrate", parents=[db_options], help="升级数据库表结构")
+    p.add_argument("--all", action="store_true", help="升级所有用户的数据库")
+    p.set_defaults(func=cmd_migrate)
+
+    p = sub.add_parser("archive", parents=[db_options], help="把已结束年份的排班移到只读归档库")
+    p.add_argument("--year", type=int, action="append", help="归档指定年份（可重复）")
+    p.add_argument("--before", type=int, help="归档早于该年份的全部排班")
+    p.add_argument("--restore", type=int, action="append", help="把归档的年份移回主库（可重复）")
+    p.add_argument("--list", action="store_true", help="列出已归档的年份")
+    p.add_argument("--no-vacuum", action="store_true", help="归档后不整理主库文件")
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser("report", parents=[db_options], help="按部门和月份并行生成月度报表")
+    p.add_argument("--start", required=True, help="开始月份 yyyy-MM")
+    p.add_argument("--end", help="结束月份 yyyy-MM，默认与开始月份相同")
+    p.add_argument("--departments", help="部门，逗号分隔，默认为期间出现过的全部部门")
+    p.add_argument("--workers", type=int, help="进程数，默认为CPU核数")
+    p.add_argument("-o", "--output", default="reports", help="输出目录")
+    p.add_argument("--quiet", action="store_true", help="不显示进度")
+    p.set_defaults(func=cmd_report)
+
+    p = sub.add_parser("template", parents=[db_options], help="复制一段排班到其他日期，或保存/应用命名模板")
+    p.add_argument("action", choices=("copy", "save", "apply", "list", "delete"))
+    p.add_argument("name", nargs="?", help="模板名称")
+    p.add_argument("--from-start", help="来源开始日期 yyyy-MM-dd")
+    p.add_argument("--from-end", help="来源结束日期 yyyy-MM-dd")
+    p.add_argument("--to-start", help="目标开始日期 yyyy-MM-dd")
+    p.add_argument("--to-end", help="目标结束日期，默认与来源等长；更长时按来源周期重复")
+    p.add_argument("--department", default="", help="只复制该部门")
+    p.add_argument("--employees", help="只复制这些员工，逗号分隔")
+    p.add_argument("--replace", action="store_true", help="先删除目标范围内同部门/员工的排班")
+    p.set_defaults(func=cmd_template)
+
+    p = sub.add_parser("rules", parents=[db_options], help="人数规则（check 有不满足的规则时返回码为1）")
+    p.add_argument("action", choices=("list", "add", "delete", "check"))
+    p.add_argument("rule_id", nargs="?", type=int, help="要删除的规则ID")
+    p.add_argument("--department", help="部门")
+    p.add_argument("--shift", default="", help="班次名，默认统计全部班次")
+    p.add_argument("--weekdays", default="0123456", help="星期几，0=周一，例如 01234 表示周一至周五")
+    p.add_argument("--min", type=int, help="最少人次")
+    p.add_argument("--max", type=int, help="最多人次")
+    p.add_argument("--note", default="", help="说明")
+    p.add_argument("--day-type", choices=DAY_TYPES, default="", help="只在该类型的日期检查（调休上班日算工作日）")
+    p.add_argument("--start", help="检查的开始日期 yyyy-MM-dd，默认为今年1月1日")
+    p.add_argument("--end", help="检查的结束日期 yyyy-MM-dd，默认为今年12月31日")
+    p.set_defaults(func=cmd_rules)
+
+    p = sub.add_parser("leave", parents=[db_options], help="请假、不可用和偏好时段；free 列出某天某班次空闲的员工")
+    p.add_argument("action", choices=("add", "list", "delete", "free"))
+    p.add_argument("name", nargs="?", help="员工姓名（delete 时为ID）")
+    p.add_argument("--kind", choices=("请假", "不可用", "偏好"), default="请假")
+    p.add_argument("--start", help="开始日期 yyyy-MM-dd 或时间 'yyyy-MM-dd HH:MM'")
+    p.add_argument("--end", help="结束日期（含）或时间（不含），默认与开始日期相同")
+    p.add_argument("--shift", help="free: 班次，例如 早班")
+    p.add_argument("--department", default="", help="free: 只列出该部门最近排过班的员工")
+    p.add_argument("--note", default="", help="说明")
+    p.set_defaults(func=cmd_leave)
+
+    p = sub.add_parser("calendar", parents=[db_options], help="工作日历：show 列出日期类型和节假日，load 加载节假日文件")
+    p.add_argument("action", choices=("show", "load"))
+    p.add_argument("file", nargs="?", help="load: 节假日CSV（date,kind,name），不指定时恢复随程序发布的文件")
+    p.add_argument("--start", help="show: 开始日期 yyyy-MM-dd，默认为今年1月1日")
+    p.add_argument("--end", help="show: 结束日期 yyyy-MM-dd，默认为今年12月31日")
+    p.add_argument("--day-type", choices=DAY_TYPES, help="show: 只列出该类型的日期")
+    p.set_defaults(func=cmd_calendar)
+
+    p = sub.add_parser("remind", parents=[db_options], help="班次开始前提醒：list 列出接下来的提醒，watch 持续运行并在到期时通知")
+    p.add_argument("action", choices=("list", "watch"))
+    p.add_argument("--lead", type=int, default=15, help="提前提醒的分钟数")
+    p.add_argument("--hours", type=int, default=24, help="list: 列出多少小时内开始的班次")
+    p.add_argument("--department", default="", help="只提醒该部门")
+    p.add_argument("--exec", help="watch: 提醒时执行的命令，内容在环境变量 REMINDER_TEXT 中")
+    p.add_argument("--poll", type=int, default=5, help="watch: 检查其他程序修改的间隔秒数")
+    p.set_defaults(func=cmd_remind)
+
+    p = sub.add_parser("sync", parents=[db_options], help="离线同步：导出/导入行级变更集（导入有冲突时返回码为1）")
+    p.add_argument("action", choices=("export", "import", "status", "fork"))
+    p.add_argument("file", nargs="?", help="import: 变更集文件")
+    p.add_argument("-o", "--output", help="export: 变更集文件")
+    p.add_argument("--since", type=int, help="export: 从该变更计数之后导出，默认为对方已确认导入的位置")
+    p.add_argument("--dry-run", action="store_true", help="import: 只比较不写入")
+    p.add_argument("--theirs", action="store_true", help="import: 冲突时使用对方的修改（默认保留本地）")
+    p.set_defaults(func=cmd_sync)
+
+    p = sub.add_parser("diff", parents=[db_options, range_options],
+                       help="按天比较另一个数据库（或备份）的排班，可把不同之处合并到本库（有不同且未合并时返回码为1）")
+    p.add_argument("file", help="对方的数据库文件")
+    p.add_argument("--kind", action="append", choices=KINDS, help="只列出/合并这类不同（可重复）")
+    p.add_argument("--limit", type=int, default=50, help="最多列出的格子数")
+    p.add_argument("--merge", action="store_true", help="把列出的不同之处改为对方的内容（一个可撤销操作）")
+    p.set_defaults(func=cmd_diff)
+
+    p = sub.add_parser("federate", parents=[range_options], help="汇总查询多个用户的排班（只读）")
+    p.add_argument("--all", action="store_true", help="所有用户")
+    p.add_argument("--users", help="用户名，逗号分隔")
+    p.add_argument("--db", action="append", help="数据库文件（可重复）")
+    p.add_argument("--search", default="", help="按姓名或部门搜索")
+    p.add_argument("--department", default="", help="部门")
+    p.add_argument("--stats", action="store_true", help="输出统计而不是排班记录")
+    p.add_argument("--json", action="store_true", help="统计以JSON输出")
+    p.add_argument("--format", choices=("csv", "json"), default="csv")
+    p.add_argument("-o", "--output", help="输出文件，默认输出到屏幕")
+    p.set_defaults(func=cmd_federate)
+
+    p = sub.add_parser("user", help="用户管理")
+    p.add_argument("action", choices=("add", "list"))
+    p.add_argument("username", nargs="?")
+    p.add_argument("--password", default="")
+    p.set_defaults(func=cmd_user)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except CliError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    except Exception as e:
+        print(f"错误: {str(e)}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
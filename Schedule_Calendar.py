@@ -0,0 +1,107 @@
+"""日期维度（工作日历）和法定节假日数据（不依赖 PyQt）
+
+每个数据库的 date_dim 表为每一天预先保存星期、ISO周、月份以及法定节假日、调休上班和是否工作日，
+月历、人数规则、列表筛选和统计直接按日期关联，不再逐行计算。节假日来自随程序发布的
+holidays_cn.csv（日期,类型,名称；类型 休=放假，班=调休上班），文件更新后打开数据库时自动刷新标记。
+"""
+import csv
+import os
+import sys
+import zlib
+from datetime import date, timedelta
+
+HOLIDAY_FILE = "holidays_cn.csv"
+HOLIDAY, ADJUSTED_WORKDAY = "休", "班"
+# 列表筛选和人数规则的日期类型：休息日包括周末和节假日
+WORKDAY, RESTDAY, STATUTORY = "工作日", "休息日", "节假日"
+DAY_TYPES = (WORKDAY, RESTDAY, STATUTORY)
+FIRST_YEAR, LAST_YEAR = 1900, 2100   # 日期维度的年份上下限
+
+DATE_DIM_COLUMNS = ("work_date", "day_number", "year", "month", "day", "weekday", "iso_year", "iso_week",
+                    "is_weekend", "is_holiday", "is_adjusted_workday", "is_workday", "holiday_name")
+
+
+def data_path(file_name):
+    """随程序发布的数据文件：打包后在 PyInstaller 的解压目录，否则在源码目录"""
+    base = getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base, file_name)
+
+
+def load_holidays(path=None):
+    """读取节假日文件，返回 ({日期: (类型, 名称)}, 校验值)；文件不存在时返回空数据"""
+    path = path or data_path(HOLIDAY_FILE)
+    if not os.path.exists(path):
+        return {}, ""
+    with open(path, "rb") as f:
+        content = f.read()
+    holidays = {}
+    lines = [line for line in content.decode("utf-8-sig").splitlines() if line.strip() and not line.startswith("#")]
+    for row in csv.DictReader(lines):
+        try:
+            work_date = date.fromisoformat(row["date"].strip()).isoformat()
+        except (KeyError, AttributeError, ValueError):
+            continue
+        kind = (row.get("kind") or "").strip()
+        if kind in (HOLIDAY, ADJUSTED_WORKDAY):
+            holidays[work_date] = (kind, (row.get("name") or "").strip())
+    return holidays, f"{zlib.crc32(content):08x}"
+
+
+def date_dim_rows(first_year, last_year, holidays):
+    """[first_year, last_year] 每一天的日期维度行，列顺序同 DATE_DIM_COLUMNS"""
+    day = date(first_year, 1, 1)
+    last = date(last_year, 12, 31)
+    while day <= last:
+        work_date = day.isoformat()
+        kind, name = holidays.get(work_date, ("", ""))
+        weekday = day.weekday()
+        is_weekend = weekday >= 5
+        is_holiday = kind == HOLIDAY
+        is_adjusted = kind == ADJUSTED_WORKDAY
+        iso_year, iso_week, _ = day.isocalendar()
+        yield (work_date, day.toordinal(), day.year, day.month, day.day, weekday, iso_year, iso_week,
+               int(is_weekend), int(is_holiday), int(is_adjusted),
+               int(is_adjusted or not (is_weekend or is_holiday)), name)
+        day += timedelta(days=1)
+
+
+def day_type_condition(day_type, alias="date_dim"):
+    """日期类型对应的 date_dim 条件，不限时返回空字符串"""
+    return {
+        WORKDAY: f"{alias}.is_workday = 1",
+        RESTDAY: f"{alias}.is_workday = 0",
+        STATUTORY: f"{alias}.is_holiday = 1",
+    }.get(day_type, "")
+
+
+class DayInfo:
+    """date_dim 中的一天"""
+    __slots__ = ("work_date", "weekday", "iso_week", "is_holiday", "is_adjusted_workday", "is_workday", "holiday_name")
+
+    def __init__(self, work_date, weekday, iso_week, is_holiday, is_adjusted_workday, is_workday, holiday_name):
+        self.work_date = work_date
+        self.weekday = weekday
+        self.iso_week = iso_week
+        self.is_holiday = bool(is_holiday)
+        self.is_adjusted_workday = bool(is_adjusted_workday)
+        self.is_workday = bool(is_workday)
+        self.holiday_name = holiday_name
+
+    def matches(self, day_type):
+        """是否属于日期类型（空字符串表示不限）"""
+        if day_type == WORKDAY:
+            return self.is_workday
+        if day_type == RESTDAY:
+            return not self.is_workday
+        if day_type == STATUTORY:
+            return self.is_holiday
+        return True
+
+    @property
+    def badge(self):
+        """月历中的标记：节假日显示"休 名称"，调休上班显示"班"""
+        if self.is_holiday:
+            return f"{HOLIDAY} {self.holiday_name}".strip()
+        if self.is_adjusted_workday:
+            return ADJUSTED_WORKDAY
+        return ""
@@ -0,0 +1,254 @@
+"""视图层使用的紧凑排班存储（不依赖 PyQt）
+
+一段日期范围内的排班按列保存在 array 中：日期为天序号（date.toordinal()），姓名、部门、职位、
+班次和备注为字符串池中的编号，每行约占30字节。月历、列表和月缓存共用同一份数据，
+调用方通过 ScheduleRecord 按属性读取，不需要为每行生成元组。
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import date
+
+
+class StringPool:
+    """字符串驻留池：相同的字符串只保存一份，用整数编号引用"""
+    __slots__ = ("strings", "ids")
+
+    def __init__(self):
+        self.strings = []
+        self.ids = {}
+
+    def intern(self, text):
+        string_id = self.ids.get(text)
+        if string_id is None:
+            string_id = self.ids[text] = len(self.strings)
+            self.strings.append(text)
+        return string_id
+
+    def __getitem__(self, string_id):
+        return self.strings[string_id]
+
+    def __len__(self):
+        return len(self.strings)
+
+
+def make_pools():
+    """每个文本列一个字符串池；同一用户的所有 DayStore 共用，编号在会话内保持稳定"""
+    return {column: StringPool() for column in DayStore.TEXT_COLUMNS}
+
+
+class ScheduleRecord:
+    """DayStore 中一行的只读视图"""
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def _text(self, column):
+        store = self._store
+        return store.pools[column][store.columns[column][self._index]]
+
+    @property
+    def id(self):
+        return self._store.ids[self._index]
+
+    @property
+    def day(self):
+        return self._store.days[self._index]
+
+    @property
+    def work_date(self):
+        return self._store.date_text(self._index)
+
+    @property
+    def employee_name(self):
+        return self._text("employee_name")
+
+    @property
+    def department(self):
+        return self._text("department")
+
+    @property
+    def position(self):
+        return self._text("position")
+
+    @property
+    def shift_type(self):
+        return self._text("shift_type")
+
+    @property
+    def remarks(self):
+        return self._text("remarks")
+
+    @property
+    def name_id(self):
+        """姓名在字符串池中的编号"""
+        return self._store.columns["employee_name"][self._index]
+
+    def as_tuple(self):
+        """与 list_schedules 相同的元组: (id, 姓名, 部门, 职位, 日期, 班次, 备注)"""
+        return self._store.row(self._index)
+
+
+class DayStore:
+    """按列保存的排班记录；按 work_date 排序加载时支持按天二分查找"""
+    TEXT_COLUMNS = ("employee_name", "department", "position", "shift_type", "remarks")
+    INVALID_DAY = -1   # 日期格式错误的记录，原文保存在 bad_dates 中
+
+    def __init__(self, pools=None):
+        self.pools = pools if pools is not None else make_pools()
+        self.ids = array("q")
+        self.days = array("i")
+        self.columns = {column: array("i") for column in self.TEXT_COLUMNS}
+        self.bad_dates = {}
+        self.positions = None   # 记录ID -> 位置，第一次 find 时建立，删除行后重建
+
+    @classmethod
+    def load(cls, store, start_date, end_date, search_text="", department="", pools=None, day_type=""):
+        """从 ScheduleStore 逐行读取（不生成结果列表）"""
+        day_store = cls(pools)
+        day_store.extend(store.iter_schedules(start_date, end_date, search_text, department, day_type=day_type or ""))
+        return day_store
+
+    def _day_number(self, work_date):
+        try:
+            return date.fromisoformat(work_date).toordinal()
+        except (TypeError, ValueError):
+            return self.INVALID_DAY
+
+    def append(self, row):
+        """追加一行 (id, 姓名, 部门, 职位, 日期, 班次, 备注)"""
+        record_id, name, department, position, work_date, shift_type, remarks = row
+        day = self._day_number(work_date)
+        if day == self.INVALID_DAY:
+            self.bad_dates[len(self.ids)] = work_date
+        if self.positions is not None:
+            self.positions[record_id] = len(self.ids)
+        self.ids.append(record_id)
+        self.days.append(day)
+        for column, value in zip(self.TEXT_COLUMNS, (name, department, position, shift_type, remarks)):
+            self.columns[column].append(self.pools[column].intern(value))
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def set_row(self, index, row):
+        """原位替换一行（不保持日期顺序，只用于列表视图的增量刷新）"""
+        record_id, name, department, position, work_date, shift_type, remarks = row
+        day = self._day_number(work_date)
+        self.bad_dates.pop(index, None)
+        if day == self.INVALID_DAY:
+            self.bad_dates[index] = work_date
+        if self.positions is not None:
+            self.positions.pop(self.ids[index], None)
+            self.positions[record_id] = index
+        self.ids[index] = record_id
+        self.days[index] = day
+        for column, value in zip(self.TEXT_COLUMNS, (name, department, position, shift_type, remarks)):
+            self.columns[column][index] = self.pools[column].intern(value)
+
+    def remove(self, index):
+        self.positions = None
+        del self.ids[index]
+        del self.days[index]
+        for values in self.columns.values():
+            del values[index]
+        if self.bad_dates:
+            self.bad_dates = {i - (i > index): text for i, text in self.bad_dates.items() if i != index}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.ids)
+        if not 0 <= index < len(self.ids):
+            raise IndexError(index)
+        return ScheduleRecord(self, index)
+
+    def __iter__(self):
+        for index in range(len(self.ids)):
+            yield ScheduleRecord(self, index)
+
+    def text(self, column, index):
+        return self.pools[column][self.columns[column][index]]
+
+    def date_text(self, index):
+        day = self.days[index]
+        if day == self.INVALID_DAY:
+            return self.bad_dates[index]
+        return date.fromordinal(day).isoformat()
+
+    def row(self, index):
+        """与 list_schedules 相同的元组"""
+        return (self.ids[index], self.text("employee_name", index), self.text("department", index),
+                self.text("position", index), self.date_text(index), self.text("shift_type", index),
+                self.text("remarks", index))
+
+    def find(self, record_id):
+        """记录在存储中的位置，不存在时返回 None"""
+        if self.positions is None:
+            self.positions = {value: index for index, value in enumerate(self.ids)}
+        return self.positions.get(record_id)
+
+    def day_range(self, day):
+        """某天（date 或天序号）的行范围 range(lo, hi)，要求按日期排序加载"""
+        if isinstance(day, date):
+            day = day.toordinal()
+        if self.bad_dates:
+            # 格式错误的日期按文本排序，天序号不再有序
+            return [index for index, value in enumerate(self.days) if value == day]
+        return range(bisect_left(self.days, day), bisect_right(self.days, day))
+
+    def records_on(self, day):
+        return [ScheduleRecord(self, index) for index in self.day_range(day)]
+
+
+class MonthCache:
+    """按月缓存 DayStore（LRU），根据变更日志只丢弃被修改过的月份"""
+    MAX_MONTHS = 6
+
+    def __init__(self, store, pools=None, max_months=None):
+        self.store = store
+        self.pools = pools if pools is not None else make_pools()
+        self.max_months = max_months or self.MAX_MONTHS
+        self.months = OrderedDict()
+        self.seq = store.change_counter()
+
+    def get(self, year, month):
+        """某个月的 DayStore，按 work_date, department, employee_name 排序"""
+        self.sync()
+        key = (year, month)
+        day_store = self.months.pop(key, None)
+        if day_store is None:
+            prefix = f"{year:04d}-{month:02d}-"
+            day_store = DayStore.load(self.store, prefix + "01", prefix + "31", pools=self.pools)
+        self.months[key] = day_store
+        while len(self.months) > self.max_months:
+            self.months.popitem(last=False)
+        return day_store
+
+    def sync(self):
+        """读取上次以来的变更，丢弃受影响月份的缓存"""
+        counter, changes = self.store.changes_since(self.seq)
+        if changes is None:
+            self.months.clear()
+        else:
+            self.invalidate(date_str for _, new_date, old_date in changes for date_str in (new_date, old_date))
+        self.seq = counter
+
+    def invalidate(self, date_strs):
+        for date_str in date_strs:
+            if not date_str:
+                continue
+            try:
+                key = (int(date_str[:4]), int(date_str[5:7]))
+            except ValueError:
+                self.months.clear()
+                return
+            self.months.pop(key, None)
+
+    def clear(self):
+        self.months.clear()
@@ -0,0 +1,119 @@
+"""比较和合并两个排班数据库（不依赖 PyQt）
+
+两个库按天比较内容哈希（当天排班数 + 各行内容 CRC32 之和，与行的顺序和本地ID无关），哈希相同的月份和日期
+直接跳过，只读取哈希不同的日期的排班逐格比较。每天的哈希缓存在数据库的 day_hashes 表中，按变更日志只重新计算
+修改过的日期；备份文件连同缓存一起复制，因此与备份比较、或两位排班员各自修改过的副本之间比较通常只需几秒。
+比较的单位是"某员工某天"的全部排班（与矩阵视图的一格相同），合并时把选中的格子改为对方的内容。
+"""
+import time
+import zlib
+
+ADDED, REMOVED, CHANGED = "仅对方有", "仅本库有", "不同"
+KINDS = (ADDED, REMOVED, CHANGED)
+
+# 一行排班参与哈希的内容（日期是分组键，不计入）
+ROW_TEXT_SQL = ("employee_name || char(31) || department || char(31) || position || char(31) || shift_type "
+                "|| char(31) || ifnull(remarks, '')")
+ROW_SEPARATOR = b"\x1e"
+HASH_MASK = (1 << 62) - 1   # 保持在 SQLite INTEGER 范围内
+
+
+def day_hash(text):
+    """group_concat(ROW_TEXT_SQL, char(30)) 的结果 -> 当天的内容哈希"""
+    return sum(map(zlib.crc32, text.encode("utf-8").split(ROW_SEPARATOR))) & HASH_MASK
+
+
+def month_hashes(day_hashes):
+    """{日期: (排班数, 哈希)} -> {月份: (排班数, 哈希)}"""
+    months = {}
+    for work_date, (count, value) in day_hashes.items():
+        month_count, month_value = months.get(work_date[:7], (0, 0))
+        months[work_date[:7]] = (month_count + count, (month_value + value) & HASH_MASK)
+    return months
+
+
+class DiffEntry:
+    """某员工某天在两个库中的排班；local/other 为排序后的 [(部门, 职位, 班次, 备注)]"""
+    __slots__ = ("work_date", "employee_name", "local", "other")
+
+    def __init__(self, work_date, employee_name, local, other):
+        self.work_date = work_date
+        self.employee_name = employee_name
+        self.local = local
+        self.other = other
+
+    @property
+    def kind(self):
+        if not self.local:
+            return ADDED
+        if not self.other:
+            return REMOVED
+        return CHANGED
+
+    @staticmethod
+    def cell_text(rows):
+        return "；".join(f"{department}/{position} {shift_type}" + (f"（{remarks}）" if remarks else "")
+                        for department, position, shift_type, remarks in rows) or "-"
+
+    def describe(self):
+        return f"{self.work_date} {self.employee_name} {self.kind}: 本库 {self.cell_text(self.local)} → 对方 {self.cell_text(self.other)}"
+
+
+class DiffResult:
+    """比较结果和各层跳过的范围"""
+
+    def __init__(self):
+        self.months = 0          # 两边出现过的月份数
+        self.same_months = 0     # 哈希相同、直接跳过的月份
+        self.days = 0            # 哈希不同的月份中的天数
+        self.same_days = 0       # 其中哈希相同、跳过的天数
+        self.rows_compared = 0   # 逐格比较时读取的排班行数
+        self.entries = []        # [DiffEntry]，按日期和姓名排序
+        self.seconds = 0.0
+
+    def count(self, kind):
+        return sum(1 for entry in self.entries if entry.kind == kind)
+
+    def summary(self):
+        if not self.entries:
+            return f"两个数据库的排班相同（比较 {self.months} 个月，用时 {self.seconds:.2f} 秒）"
+        counts = "，".join(f"{kind} {self.count(kind)}" for kind in KINDS)
+        return (f"{counts}；{self.months} 个月中 {self.same_months} 个月相同，其余 {self.days} 天中 "
+                f"{self.same_days} 天相同，逐格比较 {self.rows_compared} 行，用时 {self.seconds:.2f} 秒")
+
+
+def _cells(rows):
+    """[(id, 姓名, 部门, 职位, 日期, 班次, 备注)] -> {(日期, 姓名): 排序后的 [(部门, 职位, 班次, 备注)]}"""
+    cells = {}
+    for _, name, department, position, work_date, shift_type, remarks in rows:
+        cells.setdefault((work_date, name), []).append((department, position, shift_type, remarks or ""))
+    for content in cells.values():
+        content.sort()
+    return cells
+
+
+def diff_databases(store, other, start_date="0000-01-01", end_date="9999-12-31"):
+    """比较 store（本库）和 other（对方，可以是只读连接）日期范围内的排班，返回 DiffResult"""
+    started = time.perf_counter()
+    result = DiffResult()
+    local_days = {day: value for day, value in store.day_hashes().items() if start_date <= day <= end_date}
+    other_days = {day: value for day, value in other.day_hashes().items() if start_date <= day <= end_date}
+    local_months, other_months = month_hashes(local_days), month_hashes(other_days)
+    result.months = len(local_months.keys() | other_months.keys())
+    changed_months = {month for month in local_months.keys() | other_months.keys()
+                      if local_months.get(month) != other_months.get(month)}
+    result.same_months = result.months - len(changed_months)
+    days = [day for day in sorted(local_days.keys() | other_days.keys()) if day[:7] in changed_months]
+    result.days = len(days)
+    days = [day for day in days if local_days.get(day) != other_days.get(day)]
+    result.same_days = result.days - len(days)
+
+    local_rows, other_rows = store.rows_on_dates(days), other.rows_on_dates(days)
+    result.rows_compared = len(local_rows) + len(other_rows)
+    local_cells, other_cells = _cells(local_rows), _cells(other_rows)
+    for key in sorted(local_cells.keys() | other_cells.keys()):
+        local, theirs = local_cells.get(key, []), other_cells.get(key, [])
+        if local != theirs:
+            result.entries.append(DiffEntry(key[0], key[1], local, theirs))
+    result.seconds = time.perf_counter() - started
+    return result
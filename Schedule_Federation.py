@@ -0,0 +1,177 @@
+"""多个用户排班库的联合只读查询（不依赖 PyQt）
+
+一个内存连接按批 ATTACH 各用户库（只读），每批用一条 UNION ALL 语句查询，结果带来源标签；
+数据源超过 SQLite 挂载上限时轮换挂载下一批，各批按排序键归并。用户库已归档的年份
+作为同一来源的附加数据源，按日期范围加入后续批次。
+"""
+import os
+import heapq
+import sqlite3
+from collections import deque, Counter
+
+from Schedule_Perf import monitor, TimedConnection
+from Schedule_Store import UserManager, read_only_uri
+
+
+class FederatedStore:
+    """联合查询多个用户库，每行第一列为来源标签"""
+    MAX_ATTACHED = 10   # SQLite 默认的挂载上限；主连接是内存库，名额全部用于数据源
+
+    def __init__(self, sources):
+        """sources: [(标签, 数据库文件)]"""
+        self.sources = list(sources)
+        self.missing = []   # 不存在的数据库文件（例如从未登录过的用户）
+        # uri=True：数据源以只读 URI 挂载，不依赖 SQLite 编译时是否开启 SQLITE_USE_URI
+        self.conn = sqlite3.connect("file::memory:", uri=True, factory=TimedConnection)
+        monitor.attach(self.conn)
+        self.cursor = self.conn.cursor()
+
+    @classmethod
+    def for_users(cls, usernames=None):
+        """按用户名（默认全部用户）创建，标签为用户名"""
+        files = UserManager.list_user_files()
+        return cls([(username, db_file) for username, db_file, _ in files
+                    if usernames is None or username in usernames])
+
+    def close(self):
+        self.conn.close()
+
+    def _batches(self, start_date="0000-01-01", end_date="9999-12-31"):
+        """逐批挂载数据源，返回 [(挂载名, 标签)]；下一批开始前卸载上一批"""
+        pending = deque((label, db_file, False) for label, db_file in self.sources)
+        self.missing = []
+        while pending:
+            batch = []
+            try:
+                while pending and len(batch) < self.MAX_ATTACHED:
+                    label, db_file, is_archive = pending.popleft()
+                    if not os.path.exists(db_file):
+                        self.missing.append(db_file)
+                        continue
+                    alias = f"source_{len(batch)}"
+                    self.cursor.execute(f"ATTACH DATABASE ? AS {alias}", (read_only_uri(db_file),))
+                    batch.append((alias, label))
+                    if not is_archive:
+                        for path in self._archive_files(alias, db_file, start_date, end_date):
+                            pending.append((label, path, True))
+                # 从未初始化的库没有排班表，不参与查询
+                sources = [(alias, label) for alias, label in batch if self._has_schedules(alias)]
+                if sources:
+                    yield sources
+            finally:
+                for alias, _ in batch:
+                    self.cursor.execute(f"DETACH DATABASE {alias}")
+
+    def _has_schedules(self, alias):
+        self.cursor.execute(f"SELECT 1 FROM {alias}.sqlite_master WHERE type = 'table' AND name = 'schedules'")
+        return self.cursor.fetchone() is not None
+
+    def _archive_files(self, alias, db_file, start_date, end_date):
+        """某个用户库与日期范围相交的归档文件"""
+        self.cursor.execute(f"SELECT 1 FROM {alias}.sqlite_master WHERE type = 'table' AND name = 'archives'")
+        if self.cursor.fetchone() is None:
+            return []
+        first_year = int(start_date[:4]) if start_date[:4].isdigit() else 0
+        last_year = int(end_date[:4]) if end_date[:4].isdigit() else 9999
+        self.cursor.execute(
+            f"SELECT file_name FROM {alias}.archives WHERE year BETWEEN ? AND ? ORDER BY year",
+            (first_year, last_year)
+        )
+        folder = os.path.dirname(os.path.abspath(db_file))
+        return [os.path.join(folder, file_name) for (file_name,) in self.cursor.fetchall()]
+
+    @staticmethod
+    def _union(sources, columns, where, params, order_by=""):
+        """同一查询在本批各数据源上执行并 UNION ALL 合并，第一列为来源标签"""
+        parts = [f"SELECT ? AS source, {columns} FROM {alias}.schedules WHERE {where}" for alias, _ in sources]
+        query = "\n UNION ALL ".join(parts)
+        if order_by:
+            query += f" ORDER BY {order_by}"
+        all_params = []
+        for _, label in sources:
+            all_params.append(label)
+            all_params.extend(params)
+        return query, all_params
+
+    def _merged(self, start_date, end_date, columns, where, params, order_by, key):
+        """逐批查询，各批结果按 key 归并"""
+        results = []
+        for sources in self._batches(start_date, end_date):
+            self.cursor.execute(*self._union(sources, columns, where, params, order_by))
+            results.append(self.cursor.fetchall())
+        if len(results) == 1:
+            return results[0]
+        return list(heapq.merge(*results, key=key))
+
+    # ---------- 查询 ----------
+
+    def list_schedules(self, start_date, end_date, search_text="", department=""):
+        """列表/搜索: (来源, id, 姓名, 部门, 职位, 日期, 班次, 备注)，按日期、部门、姓名排序"""
+        where = "work_date BETWEEN ? AND ?"
+        params = [start_date, end_date]
+        if search_text:
+            where += " AND (employee_name LIKE ? OR department LIKE ?)"
+            params.extend([f"%{search_text}%", f"%{search_text}%"])
+        if department:
+            where += " AND department = ?"
+            params.append(department)
+        return self._merged(start_date, end_date,
+                            "id, employee_name, department, position, work_date, shift_type, remarks",
+                            where, params, "work_date, department, employee_name",
+                            key=lambda row: (row[5], row[3], row[2]))
+
+    def get_day_schedules(self, date_str):
+        """某一天的排班: (来源, id, 姓名, 部门, 班次)"""
+        return self._merged(date_str, date_str, "id, employee_name, department, shift_type",
+                            "work_date = ?", [date_str], "department, employee_name",
+                            key=lambda row: (row[3], row[2]))
+
+    def get_day_counts(self, start_date, end_date):
+        """月历用的每日人数 {日期: Counter({来源: 人数})}"""
+        days = {}
+        for sources in self._batches(start_date, end_date):
+            rows, params = self._union(sources, "work_date", "work_date BETWEEN ? AND ?", [start_date, end_date])
+            self.cursor.execute(f"SELECT work_date, source, COUNT(*) FROM ({rows}) GROUP BY work_date, source",
+                                params)
+            for work_date, label, count in self.cursor.fetchall():
+                days.setdefault(work_date, Counter())[label] += count
+        return days
+
+    def get_used_departments(self):
+        """所有数据源中出现过的部门"""
+        departments = set()
+        for sources in self._batches():
+            rows, params = self._union(sources, "department", "1", [])
+            self.cursor.execute(f"SELECT DISTINCT department FROM ({rows})", params)
+            departments.update(row[0] for row in self.cursor.fetchall())
+        return sorted(departments)
+
+    def get_statistics(self, start_date="0000-01-01", end_date="9999-12-31"):
+        """联合统计：总数、日期范围、员工数，以及按来源、部门和班次的分布"""
+        total = 0
+        dates = []
+        employees = set()
+        counts = {"source": Counter(), "department": Counter(), "shift_type": Counter()}
+        for sources in self._batches(start_date, end_date):
+            rows, params = self._union(sources, "employee_name, department, work_date, shift_type",
+                                       "work_date BETWEEN ? AND ?", [start_date, end_date])
+            self.cursor.execute(f"SELECT COUNT(*), MIN(work_date), MAX(work_date) FROM ({rows})", params)
+            count, first_date, last_date = self.cursor.fetchone()
+            if not count:
+                continue
+            total += count
+            dates.extend((first_date, last_date))
+            self.cursor.execute(f"SELECT DISTINCT employee_name FROM ({rows})", params)
+            employees.update(row[0] for row in self.cursor.fetchall())
+            for column, counter in counts.items():
+                self.cursor.execute(f"SELECT {column}, COUNT(*) FROM ({rows}) GROUP BY {column}", params)
+                counter.update(dict(self.cursor.fetchall()))
+        return {
+            "total": total,
+            "first_date": min(dates) if dates else None,
+            "last_date": max(dates) if dates else None,
+            "employees": len(employees),
+            "by_source": counts["source"].most_common(),
+            "by_department": counts["department"].most_common(),
+            "by_shift": counts["shift_type"].most_common(),
+        }
@@ -1,15 +1,33 @@
 import sys
 import os
+import time
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QTableView, QPushButton, QLabel, QLineEdit, QDateEdit, 
                              QComboBox, QMessageBox, QHeaderView, QFormLayout, QDialog,
                              QTimeEdit, QDialogButtonBox, QMenu, QTableWidget, QTableWidgetItem,
-                             QCheckBox)
-from PyQt5.QtGui import QIcon, QStandardItemModel, QStandardItem, QColor
-from PyQt5.QtCore import Qt, QDate, QTime
-import sqlite3
+                             QCheckBox, QAction, QFileDialog, QListWidget, QListWidgetItem,
+                             QTabWidget, QTextEdit, QInputDialog, QSpinBox, QProgressDialog,
+                             QAbstractItemDelegate, QAbstractScrollArea, QToolTip, QDockWidget,
+                             QCompleter, QDateTimeEdit, QSystemTrayIcon)
+from PyQt5.QtGui import QIcon, QColor, QKeySequence, QBrush, QPainter, QPen
+from PyQt5.QtCore import (Qt, QDate, QTime, QTimer, QAbstractTableModel, QModelIndex, pyqtSignal,
+                          QEvent, QPointF, QRectF, QStringListModel, QDateTime)
 from sqlite3 import Error
-from datetime import datetime
+from datetime import datetime, timedelta
+from Schedule_Store import UserManager, ScheduleStore, SessionCache, ConcurrentEditError, bulk_schedule_rows
+from Schedule_Perf import monitor
+from Schedule_DayStore import DayStore, MonthCache, make_pools
+from Schedule_Federation import FederatedStore
+from Schedule_Reports import ReportBatch, month_range
+from Schedule_Render import CalendarExport
+from Schedule_Matrix import ShiftCodes, ShiftMatrix, CellWriteQueue
+from Schedule_Timeline import TimelineData, assign_lanes, DAY_MINUTES
+from Schedule_Rules import StaffingChecker, weekdays_text
+from Schedule_Availability import AvailabilityIndex, KINDS, DAY_MINUTES as AVAILABILITY_DAY_MINUTES, minute_text
+from Schedule_Reminders import ReminderQueue, group_text
+from Schedule_Calendar import DAY_TYPES
+from Schedule_Sync import FILE_SUFFIX as SYNC_FILE_SUFFIX, write_changeset, read_changeset, describe_changeset
+from Schedule_Diff import KINDS as DIFF_KINDS, DiffEntry, diff_databases
 
 class ProjectInfo:
     """项目信息元数据（集中管理所有项目相关信息）"""
@@ -72,157 +90,492 @@ class MacaronColors:
     CARAMEL_CREAM = QColor(240, 230, 221) # 焦糖奶霜
 
 
-class UserManager:
-    """用户管理类"""
-    USERS_DB = 'users.db'
-    CONFIG_FILE = 'user_config.ini'
-    
-    @classmethod
-    def init_users_db(cls):
-        """初始化用户数据库"""
-        try:
-            conn = sqlite3.connect(cls.USERS_DB)
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT NOT NULL UNIQUE,
-                    password TEXT DEFAULT '',
-                    db_file TEXT NOT NULL UNIQUE,
-                    last_login TEXT,
-                    has_password BOOLEAN DEFAULT FALSE
-                )
-            ''')
-            conn.commit()
-            conn.close()
-        except Error as e:
-            print(f"[DEBUG] 无法初始化用户数据库: {str(e)}")
-            raise Exception(f"无法初始化用户数据库: {str(e)}")
+class ScheduleTableModel(QAbstractTableModel):
+    """列表视图模型：直接读取 DayStore，不为每个单元格创建 Qt 对象"""
+    HEADERS = ["ID", "员工姓名", "部门", "职位", "工作日期", "班次类型", "备注"]
+    COLOR_COLUMNS = (1, 2, 3)  # 姓名、部门、职位列显示员工颜色
 
-    @classmethod
-    def create_user(cls, username, password=''):
-        """创建新用户"""
-        try:
-            db_file = f"user_{username}.db"
-            conn = sqlite3.connect(db_file)
-            conn.close()
-            
-            conn = sqlite3.connect(cls.USERS_DB)
-            cursor = conn.cursor()
-            has_password = bool(password)  # 判断是否有密码
-            cursor.execute(
-                "INSERT INTO users (username, password, db_file, has_password) VALUES (?, ?, ?, ?)",
-                (username, password, db_file, has_password)
-            )
-            conn.commit()
-            return True
-        except Error as e:
-            raise Exception(f"无法创建用户: {str(e)}")
-        finally:
-            if 'conn' in locals():
-                conn.close()
+    def __init__(self, color_for, parent=None):
+        super().__init__(parent)
+        self.color_for = color_for   # 姓名编号 -> QColor
+        self.day_store = DayStore()
 
-    @classmethod
-    def authenticate(cls, username, password=''):
-        """验证用户登录"""
-        try:
-            conn = sqlite3.connect(cls.USERS_DB)
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT db_file, has_password, password FROM users WHERE username=?",
-                (username,)
-            )
-            result = cursor.fetchone()
-            
-            if not result:
-                return None
-                
-            db_file, has_password, stored_password = result
-            
-            # 如果有密码但未提供密码，或密码不匹配
-            if has_password and (not password or stored_password != password):
-                return None
-                
-            # 更新最后登录时间
-            cursor.execute(
-                "UPDATE users SET last_login=? WHERE username=?",
-                (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), username)
-            )
-            conn.commit()
-            return db_file  # 返回数据库文件路径
-            
-        except Error as e:
-            raise Exception(f"认证失败: {str(e)}")
-        finally:
-            if 'conn' in locals():
-                conn.close()
+    def set_store(self, day_store):
+        self.beginResetModel()
+        self.day_store = day_store
+        self.endResetModel()
 
-    @classmethod
-    def delete_user(cls, username):
-        """删除用户及其数据库文件"""
-        try:
-            # 先获取用户的数据库文件路径
-            conn = sqlite3.connect(cls.USERS_DB)
-            cursor = conn.cursor()
-            cursor.execute("SELECT db_file FROM users WHERE username=?", (username,))
-            result = cursor.fetchone()
-            
-            if not result:
-                return False
-                
-            db_file = result[0]
-            
-            # 从用户表中删除记录
-            cursor.execute("DELETE FROM users WHERE username=?", (username,))
-            conn.commit()
-            
-            # 删除用户数据库文件
-            if os.path.exists(db_file):
-                os.remove(db_file)
-                
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.day_store)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, col = index.row(), index.column()
+        if role == Qt.DisplayRole:
+            value = self.day_store.row(row)[col]
+            return "" if value is None else str(value)
+        if role == Qt.BackgroundRole and col in self.COLOR_COLUMNS:
+            return self.color_for(self.day_store.columns["employee_name"][row])
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def record(self, row):
+        return self.day_store[row]
+
+    def replace_row(self, row, values):
+        self.day_store.set_row(row, values)
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.HEADERS) - 1))
+
+    def remove_row(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.day_store.remove(row)
+        self.endRemoveRows()
+
+
+class FederatedTableModel(QAbstractTableModel):
+    """汇总查询结果模型：行为 (来源, id, 姓名, 部门, 职位, 日期, 班次, 备注)"""
+    HEADERS = ["来源", "ID", "员工姓名", "部门", "职位", "工作日期", "班次类型", "备注"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self.rows = rows
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if index.isValid() and role == Qt.DisplayRole:
+            value = self.rows[index.row()][index.column()]
+            return "" if value is None else str(value)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+
+class ShiftMatrixModel(QAbstractTableModel):
+    """班次矩阵模型：行为员工、列为日期，只为可见单元格读取 ShiftMatrix，修改写入 CellWriteQueue"""
+    WEEKDAY_NAMES = ("一", "二", "三", "四", "五", "六", "日")
+    PENDING_COLOR = QColor(255, 236, 179)   # 尚未保存的单元格
+    WEEKEND_COLOR = QColor(248, 248, 248)
+    pendingChanged = pyqtSignal(int)        # 待保存的单元格数
+    invalidInput = pyqtSignal(str)
+
+    def __init__(self, matrix, queue, codes, parent=None):
+        super().__init__(parent)
+        self.matrix = matrix
+        self.queue = queue
+        self.codes = codes
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.matrix.employees)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.matrix.day_count
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, day = index.row(), index.column()
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return self.matrix.text(row, day)
+        if role == Qt.BackgroundRole:
+            if self.queue.is_pending(self.matrix.employees[row], self.matrix.date_str(day)):
+                return self.PENDING_COLOR
+            if self.matrix.weekday(day) >= 5:
+                return self.WEEKEND_COLOR
+        elif role == Qt.ToolTipRole:
+            return "\n".join(self.matrix.shifts(row, day)) or None
+        elif role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal:
+            if role == Qt.DisplayRole:
+                return f"{section + 1}\n{self.WEEKDAY_NAMES[self.matrix.weekday(section)]}"
+            if role == Qt.ForegroundRole and self.matrix.weekday(section) >= 5:
+                return QColor(255, 0, 0)
+        elif role == Qt.DisplayRole:
+            return self.matrix.employees[section]
+        return None
+
+    def flags(self, index):
+        return super().flags(index) | Qt.ItemIsEditable
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.EditRole or not index.isValid():
+            return False
+        return self.set_cells([(index.row(), index.column(), value)]) > 0
+
+    def set_cells(self, cells, raw=False):
+        """批量设置单元格 [(行, 列, 输入文本)]，返回修改的单元格数；无法识别的代码跳过并提示
+
+        raw 为 True 时文本是完整的班次（填充时复制已有单元格），不再按代码解析。
+        """
+        changed = []
+        unknown = set()
+        for row, day, text in cells:
+            if not (0 <= row < self.rowCount() and 0 <= day < self.columnCount()):
+                continue
+            shift_type = text if raw else self.codes.resolve(str(text))
+            if shift_type is None:
+                unknown.add(str(text).strip())
+                continue
+            if self.matrix.shifts(row, day) == ([shift_type] if shift_type else []):
+                continue
+            name = self.matrix.employees[row]
+            self.matrix.set(row, day, shift_type)
+            self.queue.put(name, self.matrix.date_str(day), shift_type, self.matrix.positions.get(name, ""))
+            changed.append((row, day))
+        if changed:
+            rows = [row for row, _ in changed]
+            days = [day for _, day in changed]
+            self.dataChanged.emit(self.index(min(rows), min(days)), self.index(max(rows), max(days)))
+            self.pendingChanged.emit(len(self.queue))
+        if unknown:
+            self.invalidInput.emit(f"无法识别的班次: {'、'.join(sorted(unknown))}")
+        return len(changed)
+
+    def add_employee(self, name, position=""):
+        """添加员工行，返回行号"""
+        row = self.matrix.rows.get(name)
+        if row is None:
+            self.beginInsertRows(QModelIndex(), len(self.matrix.employees), len(self.matrix.employees))
+            row = self.matrix.add_employee(name, position)
+            self.endInsertRows()
+        return row
+
+    def saved(self):
+        """写回完成后清除待保存标记"""
+        if self.rowCount() and self.columnCount():
+            self.dataChanged.emit(self.index(0, 0), self.index(self.rowCount() - 1, self.columnCount() - 1),
+                                  [Qt.BackgroundRole])
+        self.pendingChanged.emit(len(self.queue))
+
+
+class ShiftMatrixView(QTableView):
+    """电子表格式的键盘操作：直接输入班次代码，回车后移到右侧单元格；
+    Delete 清除，Ctrl+R 向右填充，Ctrl+D 向下填充，Ctrl+C/Ctrl+V 复制粘贴（制表符分隔，可与 Excel 互通）"""
+
+    def keyPressEvent(self, event):
+        if self.state() != QTableView.EditingState:
+            if event.key() in (Qt.Key_Delete, Qt.Key_Backspace):
+                self.model().set_cells([(index.row(), index.column(), "") for index in self.selectedIndexes()])
+                return
+            if event.modifiers() & Qt.ControlModifier:
+                if event.key() == Qt.Key_R:
+                    self.fill(horizontal=True)
+                    return
+                if event.key() == Qt.Key_D:
+                    self.fill(horizontal=False)
+                    return
+                if event.matches(QKeySequence.Copy):
+                    self.copy_selection()
+                    return
+                if event.matches(QKeySequence.Paste):
+                    self.paste()
+                    return
+        super().keyPressEvent(event)
+
+    def closeEditor(self, editor, hint):
+        # 回车确认后像电子表格一样移到下一天
+        super().closeEditor(editor, hint)
+        if hint == QAbstractItemDelegate.SubmitModelCache:
+            current = self.currentIndex()
+            next_index = self.model().index(current.row(), current.column() + 1)
+            if next_index.isValid():
+                self.setCurrentIndex(next_index)
+
+    def fill(self, horizontal):
+        """用选中区域每行最左（或每列最上）的单元格填充该行（列）的其他选中单元格"""
+        model = self.model()
+        groups = {}
+        for index in self.selectedIndexes():
+            key = index.row() if horizontal else index.column()
+            groups.setdefault(key, []).append(index)
+        cells = []
+        for indexes in groups.values():
+            indexes.sort(key=lambda index: index.column() if horizontal else index.row())
+            source = model.matrix.shifts(indexes[0].row(), indexes[0].column())
+            text = source[0] if source else ""
+            cells.extend((index.row(), index.column(), text) for index in indexes[1:])
+        model.set_cells(cells, raw=True)
+
+    def copy_selection(self):
+        indexes = self.selectedIndexes()
+        if not indexes:
+            return
+        rows = sorted({index.row() for index in indexes})
+        cols = sorted({index.column() for index in indexes})
+        selected = {(index.row(), index.column()) for index in indexes}
+        model = self.model()
+        lines = ["\t".join(model.matrix.text(row, col) if (row, col) in selected else "" for col in cols)
+                 for row in rows]
+        QApplication.clipboard().setText("\n".join(lines))
+
+    def paste(self):
+        """从当前单元格开始粘贴制表符/换行分隔的班次代码；只有一个值时填充整个选中区域"""
+        text = QApplication.clipboard().text().rstrip("\r\n")
+        current = self.currentIndex()
+        if not text or not current.isValid():
+            return
+        grid = [line.split("\t") for line in text.replace("\r\n", "\n").split("\n")]
+        if len(grid) == 1 and len(grid[0]) == 1:
+            cells = [(index.row(), index.column(), grid[0][0]) for index in self.selectedIndexes()]
+        else:
+            cells = [(current.row() + r, current.column() + c, value)
+                     for r, line in enumerate(grid) for c, value in enumerate(line)]
+        self.model().set_cells(cells)
+
+
+class TimelineView(QAbstractScrollArea):
+    """时间轴（甘特图）：行为员工，横轴为时间；只为可见的员工行和时间窗口查询、绘制班次"""
+    NAME_WIDTH = 110
+    HEADER_HEIGHT = 38
+    ROW_HEIGHT = 22
+    GRID_STEPS = (15, 30, 60, 120, 180, 360, 720, 1440)   # 网格线间隔(分钟)，按缩放选择
+    WEEKDAY_NAMES = ("一", "二", "三", "四", "五", "六", "日")
+    recordActivated = pyqtSignal(int)    # 双击班次
+
+    def __init__(self, brush_for, parent=None):
+        super().__init__(parent)
+        self.brush_for = brush_for        # 姓名 -> QBrush
+        self.data = None
+        self.availability = None          # AvailabilityIndex，请假/不可用时段画成斜线底纹
+        self.hour_width = 60              # 每小时的像素数
+        self.painted = []                 # 最近一次绘制的 (矩形, 班次)，用于提示和双击
+        self.setMouseTracking(True)
+        self.horizontalScrollBar().setSingleStep(30)
+        self.verticalScrollBar().setSingleStep(self.ROW_HEIGHT)
+
+    def set_data(self, data, hour_width=None):
+        self.data = data
+        if hour_width:
+            self.hour_width = hour_width
+        self.update_scrollbars()
+        self.viewport().update()
+
+    @property
+    def minute_width(self):
+        return self.hour_width / 60
+
+    def update_scrollbars(self):
+        if self.data is None:
+            return
+        width = self.viewport().width() - self.NAME_WIDTH
+        height = self.viewport().height() - self.HEADER_HEIGHT
+        total_width = int(self.data.total_minutes * self.minute_width)
+        total_height = len(self.data.employees) * self.ROW_HEIGHT
+        self.horizontalScrollBar().setRange(0, max(0, total_width - width))
+        self.horizontalScrollBar().setPageStep(max(1, width))
+        self.verticalScrollBar().setRange(0, max(0, total_height - height))
+        self.verticalScrollBar().setPageStep(max(1, height))
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_scrollbars()
+
+    def scrollContentsBy(self, dx, dy):
+        self.viewport().update()
+
+    def wheelEvent(self, event):
+        if not event.modifiers() & Qt.ControlModifier:
+            super().wheelEvent(event)
+            return
+        # Ctrl+滚轮缩放，保持鼠标所在时刻不动
+        x = event.pos().x() - self.NAME_WIDTH
+        minute = (self.horizontalScrollBar().value() + max(0, x)) / self.minute_width
+        factor = 1.25 if event.angleDelta().y() > 0 else 0.8
+        self.hour_width = min(480, max(8, self.hour_width * factor))
+        self.update_scrollbars()
+        self.horizontalScrollBar().setValue(int(minute * self.minute_width - max(0, x)))
+        self.viewport().update()
+
+    def visible_window(self):
+        """可见的 (首行, 末行+1, 开始分钟, 结束分钟)"""
+        viewport = self.viewport()
+        top = self.verticalScrollBar().value()
+        left = self.horizontalScrollBar().value()
+        first_row = top // self.ROW_HEIGHT
+        last_row = (top + viewport.height() - self.HEADER_HEIGHT) // self.ROW_HEIGHT + 1
+        start_minute = int(left / self.minute_width)
+        end_minute = int((left + viewport.width() - self.NAME_WIDTH) / self.minute_width) + 1
+        return first_row, last_row, start_minute, end_minute
+
+    def minute_x(self, minute):
+        return self.NAME_WIDTH + minute * self.minute_width - self.horizontalScrollBar().value()
+
+    def row_y(self, row):
+        return self.HEADER_HEIGHT + row * self.ROW_HEIGHT - self.verticalScrollBar().value()
+
+    def paintEvent(self, event):
+        painter = QPainter(self.viewport())
+        viewport = self.viewport().rect()
+        painter.fillRect(viewport, Qt.white)
+        self.painted = []
+        if self.data is None:
+            return
+        data = self.data
+        first_row, last_row, start_minute, end_minute = self.visible_window()
+        last_row = min(last_row, len(data.employees))
+        body = QRectF(self.NAME_WIDTH, self.HEADER_HEIGHT,
+                      viewport.width() - self.NAME_WIDTH, viewport.height() - self.HEADER_HEIGHT)
+        metrics = painter.fontMetrics()
+        label_width = metrics.horizontalAdvance("00:00") + 8
+        step = next((step for step in self.GRID_STEPS if step * self.minute_width >= label_width), DAY_MINUTES)
+
+        # 周末底色、隔行底色和网格线
+        painter.save()
+        painter.setClipRect(body)
+        for day in range(max(0, start_minute // DAY_MINUTES), min(data.days, end_minute // DAY_MINUTES + 1)):
+            if (data.start_date + timedelta(days=day)).weekday() >= 5:
+                x1, x2 = self.minute_x(day * DAY_MINUTES), self.minute_x((day + 1) * DAY_MINUTES)
+                painter.fillRect(QRectF(x1, body.top(), x2 - x1, body.height()), QColor(252, 244, 244))
+        for row in range(first_row, last_row):
+            if row % 2:
+                painter.fillRect(QRectF(body.left(), self.row_y(row), body.width(), self.ROW_HEIGHT), QColor(0, 0, 0, 10))
+        for minute in range(start_minute - start_minute % step, min(end_minute, data.total_minutes) + 1, step):
+            painter.setPen(QColor(150, 150, 150) if minute % DAY_MINUTES == 0 else QColor(225, 225, 225))
+            x = self.minute_x(minute)
+            painter.drawLine(QPointF(x, body.top()), QPointF(x, body.bottom()))
+        if self.availability is not None:
+            # 索引中的分钟从公元元年起算，换算到时间轴开始日期
+            offset = data.start_date.toordinal() * AVAILABILITY_DAY_MINUTES
+            leave_brush = QBrush(QColor(198, 40, 40, 90), Qt.BDiagPattern)
+            for row in range(first_row, last_row):
+                for start, end, _ in self.availability.blocked_intervals(
+                        data.employees[row], offset + start_minute, offset + end_minute):
+                    x1, x2 = self.minute_x(start - offset), self.minute_x(end - offset)
+                    painter.fillRect(QRectF(x1, self.row_y(row), x2 - x1, self.ROW_HEIGHT), leave_brush)
+
+        # 班次条：没有时间段的班次画成整天的虚线框，有时间段的班次在同一员工内重叠时分泳道显示
+        bars = data.bars(first_row, last_row, start_minute, end_minute)
+        bars.sort(key=lambda bar: bar.timed)
+        lanes = assign_lanes([bar for bar in bars if bar.timed])
+        for bar in bars:
+            lane, lane_count = lanes.get(id(bar), (0, 1))
+            lane_height = (self.ROW_HEIGHT - 4) / lane_count
+            x1, x2 = self.minute_x(bar.start), self.minute_x(bar.end)
+            rect = QRectF(x1, self.row_y(bar.row) + 2 + lane * lane_height, max(2.0, x2 - x1), lane_height)
+            if bar.timed:
+                painter.setPen(QColor(120, 120, 120))
+                painter.setBrush(self.brush_for(data.employees[bar.row]))
+            else:
+                painter.setPen(QPen(QColor(170, 170, 170), 1, Qt.DashLine))
+                painter.setBrush(Qt.NoBrush)
+            painter.drawRect(rect)
+            self.painted.append((rect, bar))
+            label = bar.name
+            if bar.timed:
+                label += f" {bar.start % DAY_MINUTES // 60:02d}:{bar.start % 60:02d}-{bar.end % DAY_MINUTES // 60:02d}:{bar.end % 60:02d}"
+            text_rect = rect.intersected(body).adjusted(3, 0, -2, 0)
+            if text_rect.width() > 16:
+                painter.setPen(Qt.black)
+                painter.drawText(text_rect, Qt.AlignVCenter | Qt.AlignLeft,
+                                 metrics.elidedText(label, Qt.ElideRight, int(text_rect.width())))
+
+        # 当前时间
+        now = datetime.now()
+        now_minute = (now.date() - data.start_date).days * DAY_MINUTES + now.hour * 60 + now.minute
+        if 0 <= now_minute < data.total_minutes:
+            painter.setPen(QPen(QColor(220, 0, 0), 1.5))
+            x = self.minute_x(now_minute)
+            painter.drawLine(QPointF(x, body.top()), QPointF(x, body.bottom()))
+        painter.restore()
+
+        # 表头：日期和时刻
+        painter.fillRect(QRectF(0, 0, viewport.width(), self.HEADER_HEIGHT), QColor(240, 240, 240))
+        painter.save()
+        painter.setClipRect(QRectF(self.NAME_WIDTH, 0, body.width(), self.HEADER_HEIGHT))
+        half = self.HEADER_HEIGHT / 2
+        for day in range(max(0, start_minute // DAY_MINUTES), min(data.days, end_minute // DAY_MINUTES + 1)):
+            day_date = data.start_date + timedelta(days=day)
+            x1, x2 = self.minute_x(day * DAY_MINUTES), self.minute_x((day + 1) * DAY_MINUTES)
+            painter.setPen(Qt.red if day_date.weekday() >= 5 else Qt.black)
+            # 日期标题在可见范围内居左，滚动时保持可见
+            title_rect = QRectF(max(x1, self.NAME_WIDTH) + 4, 0, x2 - max(x1, self.NAME_WIDTH) - 8, half)
+            title = f"{day_date.strftime('%Y-%m-%d')} 周{self.WEEKDAY_NAMES[day_date.weekday()]}"
+            painter.drawText(title_rect, Qt.AlignVCenter | Qt.AlignLeft,
+                             metrics.elidedText(title, Qt.ElideRight, max(0, int(title_rect.width()))))
+        painter.setPen(Qt.darkGray)
+        for minute in range(start_minute - start_minute % step, min(end_minute, data.total_minutes), step):
+            x = self.minute_x(minute)
+            painter.drawText(QRectF(x + 2, half, step * self.minute_width - 2, half), Qt.AlignVCenter | Qt.AlignLeft,
+                             f"{minute % DAY_MINUTES // 60:02d}:{minute % 60:02d}")
+        painter.restore()
+
+        # 员工名列
+        painter.fillRect(QRectF(0, self.HEADER_HEIGHT, self.NAME_WIDTH, body.height()), QColor(248, 248, 248))
+        painter.save()
+        painter.setClipRect(QRectF(0, self.HEADER_HEIGHT, self.NAME_WIDTH, body.height()))
+        painter.setPen(Qt.black)
+        for row in range(first_row, last_row):
+            painter.drawText(QRectF(6, self.row_y(row), self.NAME_WIDTH - 8, self.ROW_HEIGHT), Qt.AlignVCenter | Qt.AlignLeft,
+                             metrics.elidedText(data.employees[row], Qt.ElideRight, self.NAME_WIDTH - 8))
+        painter.restore()
+        painter.setPen(QColor(180, 180, 180))
+        painter.drawLine(self.NAME_WIDTH, 0, self.NAME_WIDTH, viewport.height())
+        painter.drawLine(0, self.HEADER_HEIGHT, viewport.width(), self.HEADER_HEIGHT)
+
+    def bar_at(self, pos):
+        for rect, bar in reversed(self.painted):
+            if rect.contains(QPointF(pos)):
+                return bar
+        return None
+
+    def viewportEvent(self, event):
+        if event.type() == QEvent.ToolTip:
+            bar = self.bar_at(event.pos())
+            if bar is not None:
+                QToolTip.showText(event.globalPos(),
+                                  f"{self.data.employees[bar.row]}（{bar.department}）\n{bar.work_date} {bar.shift_type}",
+                                  self.viewport())
+            else:
+                QToolTip.hideText()
             return True
-        except Error as e:
-            raise Exception(f"无法删除用户: {str(e)}")
-        finally:
-            if 'conn' in locals():
-                conn.close()
+        return super().viewportEvent(event)
 
-    @classmethod
-    def save_login_config(cls, username, password='', remember=False):
-        """保存登录配置"""
-        import configparser
-        config = configparser.ConfigParser()
-        # 总是保存用户名
-        config['LOGIN'] = {
-            'username': username,
-            'password': password if remember else '',
-            'remember': 'True' if remember else 'False'
-        }
-        
-        with open(cls.CONFIG_FILE, 'w') as configfile:
-            config.write(configfile)
-    
-    @classmethod
-    def load_login_config(cls):
-        """读取登录配置"""
-        import configparser
-        import os
-        config = configparser.ConfigParser()
-        if not os.path.exists(cls.CONFIG_FILE):
-            return None, None, False
-            
-        config.read(cls.CONFIG_FILE)
-        if 'LOGIN' in config:
-            return (
-                config['LOGIN'].get('username', ''),
-                config['LOGIN'].get('password', ''),
-                config['LOGIN'].getboolean('remember', False)
-            )
-        return None, None, False
+    def mouseDoubleClickEvent(self, event):
+        bar = self.bar_at(event.pos())
+        if bar is not None:
+            self.recordActivated.emit(bar.record_id)
 
 
 class ScheduleManager(QMainWindow):
-    def __init__(self):
+    CHANGE_POLL_INTERVAL = 1000  # 外部修改检测间隔(毫秒)
+    REMINDER_LEAD = 15           # 默认提前提醒的分钟数
+    # 切换用户时随用户变化的属性（登录对话框和 init_db 设置），切换失败时恢复
+    SESSION_ATTRS = ("current_user", "user_db_file", "store", "journal", "string_pools", "month_cache",
+                     "employee_colors", "name_palette", "staffing", "violations", "day_infos", "availability",
+                     "reminders", "last_data_version", "last_change_seq")
+    # 员工颜色调色板；数据库中保存的是这里的下标，只能在末尾追加
+    COLOR_LIST = [
+        MacaronColors.SAKURA_PINK, MacaronColors.SKY_BLUE, MacaronColors.MINT_GREEN,
+        MacaronColors.LEMON_YELLOW, MacaronColors.LAVENDER, MacaronColors.PEACH_ORANGE,
+        MacaronColors.ROSE_PINK, MacaronColors.LILAC_MIST, MacaronColors.APPLE_GREEN,
+        MacaronColors.BUTTER_CREAM, MacaronColors.TARO_PURPLE, MacaronColors.CARAMEL_CREAM
+    ]
+
+    def __init__(self, username=None, db_file=None):
         super().__init__()
         # 初始化用户数据库
         try:
@@ -230,10 +583,21 @@ class ScheduleManager(QMainWindow):
         except Exception as e:
             QMessageBox.critical(None, "初始化错误", str(e))
             sys.exit(1)
+        # 最近使用的用户数据库连接，切换用户时复用
+        self.sessions = SessionCache()
             
-        # 显示登录对话框
-        if not self.show_login_dialog():
+        if username and db_file:
+            # 已通过其他方式登录（例如性能测试），跳过登录对话框
+            self.current_user = username
+            self.user_db_file = db_file
+        elif not self.show_login_dialog():
+            # 显示登录对话框
             sys.exit(0)
+        self.color_brushes = [QBrush(color) for color in self.COLOR_LIST]
+        # 首次绘制计时从登录完成开始
+        self.startup_started = time.perf_counter()
+        self.first_paint_pending = True
+        self.initial_view_ready = False
             
         self.setWindowTitle(f"{ProjectInfo.NAME} {ProjectInfo.VERSION} - 当前用户: {self.current_user}")
         self.setWindowIcon(QIcon('icon.ico'))
@@ -242,18 +606,10 @@ class ScheduleManager(QMainWindow):
         # 初始化数据库
         self.init_db()
 
-        self.name_color_map = {}  # 存储姓名到颜色的映射
-        self.color_list = [
-            MacaronColors.SAKURA_PINK, MacaronColors.SKY_BLUE, MacaronColors.MINT_GREEN,
-            MacaronColors.LEMON_YELLOW, MacaronColors.LAVENDER, MacaronColors.PEACH_ORANGE,
-            MacaronColors.ROSE_PINK, MacaronColors.LILAC_MIST, MacaronColors.APPLE_GREEN,
-            MacaronColors.BUTTER_CREAM, MacaronColors.TARO_PURPLE, MacaronColors.CARAMEL_CREAM
-        ]        
-        # 创建UI
+        # 创建UI（月历和列表数据延迟加载，窗口框架先显示）
         self.init_ui()
-        
-        # 加载数据
-        self.load_data()
+        self.restore_view_state()
+        self.start_reminders()
 
     def show_login_dialog(self):
         """显示登录对话框"""
@@ -328,21 +684,16 @@ class ScheduleManager(QMainWindow):
     def load_registered_users(self):
         """加载已注册用户到下拉列表"""
         try:
-            conn = sqlite3.connect(UserManager.USERS_DB)
-            cursor = conn.cursor()
-            cursor.execute("SELECT username FROM users ORDER BY username")
-            users = cursor.fetchall()
+            users = UserManager.list_users()
             
             self.username_combo.clear()
             for user in users:
-                self.username_combo.addItem(user[0])
+                self.username_combo.addItem(user)
                 
-        except Error as e:
+        except Exception as e:
             print(f"加载用户列表失败: {str(e)}")
-        finally:
-            if 'conn' in locals():
-                conn.close()
 
+    @monitor.timed("login")
     def handle_login(self, dialog):
         """处理登录"""
         username = self.username_combo.currentText().strip()
@@ -446,19 +797,11 @@ class ScheduleManager(QMainWindow):
         # 用户名选择
         username_combo = QComboBox()
         try:
-            conn = sqlite3.connect(UserManager.USERS_DB)
-            cursor = conn.cursor()
-            cursor.execute("SELECT username FROM users ORDER BY username")
-            users = cursor.fetchall()
-            
-            for user in users:
-                username_combo.addItem(user[0])
-        except Error as e:
-            QMessageBox.critical(dialog, "错误", f"无法加载用户列表: {str(e)}")
+            for user in UserManager.list_users():
+                username_combo.addItem(user)
+        except Exception as e:
+            QMessageBox.critical(dialog, "错误", str(e))
             return
-        finally:
-            if 'conn' in locals():
-                conn.close()
         
         layout.addRow("选择用户:", username_combo)
         
@@ -486,19 +829,15 @@ class ScheduleManager(QMainWindow):
             
         try:
             # 验证密码
-            conn = sqlite3.connect(UserManager.USERS_DB)
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT password FROM users WHERE username=?",
-                (username,)
-            )
-            result = cursor.fetchone()
+            stored_password = UserManager.get_password(username)
             
-            if not result:
+            if stored_password is None:
                 QMessageBox.warning(dialog, "错误", "用户不存在")
                 return
-                
-            stored_password = result[0]
+            
+            if username == getattr(self, "current_user", None):
+                QMessageBox.warning(dialog, "错误", "不能删除当前登录的用户")
+                return
             
             # 如果有密码但未提供密码，或密码不匹配
             if stored_password and (not password or stored_password != password):
@@ -513,6 +852,10 @@ class ScheduleManager(QMainWindow):
             )
             
             if reply == QMessageBox.Yes:
+                # 先关闭缓存的连接，否则数据库文件无法删除
+                db_file = UserManager.get_db_file(username)
+                if db_file:
+                    self.sessions.discard(db_file)
                 if UserManager.delete_user(username):
                     QMessageBox.information(dialog, "成功", "用户已删除")
                     dialog.accept()
@@ -525,70 +868,31 @@ class ScheduleManager(QMainWindow):
             QMessageBox.critical(dialog, "错误", f"删除用户时出错: {str(e)}")
 
 
+    @monitor.timed("init_db")
     def init_db(self):
         """初始化数据库 - 修改为使用用户特定的数据库文件"""
         try:
-            # 使用用户特定的数据库文件
-            self.conn = sqlite3.connect(self.user_db_file)
-            self.cursor = self.conn.cursor()
-            
-            # 创建部门表
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS departments (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL UNIQUE
-                )
-            ''')
-            
-            # 插入默认部门
-            default_depts = ["销售部", "技术部", "人事部", "财务部", "市场部", "客服部"]
-            for dept in default_depts:
-                try:
-                    self.cursor.execute("INSERT OR IGNORE INTO departments (name) VALUES (?)", (dept,))
-                except Error as e:
-                    print(f"插入部门 {dept} 时出错: {str(e)}")
-            
-            # 创建排班表
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS schedules (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    employee_name TEXT NOT NULL,
-                    department TEXT NOT NULL,
-                    position TEXT NOT NULL,
-                    work_date TEXT NOT NULL,
-                    shift_type TEXT NOT NULL,
-                    remarks TEXT,
-                    FOREIGN KEY(department) REFERENCES departments(name)
-                )
-            ''')
-            
-            # 创建自定义班次表
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS custom_shifts (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    shift_name TEXT NOT NULL,
-                    start_time TEXT NOT NULL,
-                    end_time TEXT NOT NULL,
-                    UNIQUE(shift_name)
-                )
-            ''')
-            
-            # 插入默认班次
-            default_shifts = [
-                ("早班", "08:00", "16:00"),
-                ("中班", "16:00", "24:00"),
-                ("晚班", "00:00", "08:00"),
-                ("全天班", "08:00", "20:00"),
-                ("早班(模糊)", "", ""),
-                ("晚班(模糊)", "", "")
-            ]
-            for shift in default_shifts:
-                try:
-                    self.cursor.execute("INSERT OR IGNORE INTO custom_shifts (shift_name, start_time, end_time) VALUES (?, ?, ?)", shift)
-                except Error as e:
-                    print(f"插入班次 {shift[0]} 时出错: {str(e)}")
-            
-            self.conn.commit()
+            # 使用用户特定的数据库文件；最近用过的连接直接复用，表结构已是最新时不做建表
+            self.store = self.sessions.open(self.user_db_file)
+            self.journal = self.store.journal
+            # 月历按月缓存紧凑的排班数据；姓名等字符串在本用户的会话内共用
+            self.string_pools = make_pools()
+            self.month_cache = MonthCache(self.store, self.string_pools)
+            # 登录时一次性读取全部员工颜色；name_palette 按姓名池编号保存颜色下标
+            self.employee_colors = self.store.employee_colors(len(self.COLOR_LIST))
+            self.name_palette = bytearray()
+            # 人数规则按触发器维护的人次计数检查；violations 为当前月份 {日期: [Violation]}
+            self.staffing = StaffingChecker(self.store)
+            self.violations = {}
+            # 当前月份每天的日期维度（星期、节假日、调休），{日期: DayInfo}
+            self.day_infos = {}
+            # 请假/可用性区间索引，第一次使用时加载
+            self.availability = None
+            # 班次提醒队列，恢复视图状态后按用户设置启动（见 start_reminders）
+            self.reminders = None
+            # 多窗口变更检测的基准
+            self.last_data_version = self.store.data_version()
+            self.last_change_seq = self.store.change_counter()
         except Error as e:
             QMessageBox.critical(self, "数据库错误", f"无法初始化数据库:\n{str(e)}")
             raise
@@ -632,12 +936,65 @@ class ScheduleManager(QMainWindow):
         self.view_toggle_btn.clicked.connect(self.toggle_view)
         top_bar_layout.addWidget(self.view_toggle_btn)
         
+        # 撤销/重做按钮
+        self.undo_btn = QPushButton("↶ 撤销")
+        self.undo_btn.setShortcut(QKeySequence.Undo)
+        self.undo_btn.clicked.connect(self.undo_change)
+        top_bar_layout.addWidget(self.undo_btn)
+        
+        self.redo_btn = QPushButton("↷ 重做")
+        self.redo_btn.setShortcut(QKeySequence.Redo)
+        self.redo_btn.clicked.connect(self.redo_change)
+        top_bar_layout.addWidget(self.redo_btn)
+        
+        self.timeline_btn = QPushButton("时间轴")
+        self.timeline_btn.clicked.connect(lambda: self.show_timeline())
+        top_bar_layout.addWidget(self.timeline_btn)
+        
+        self.matrix_btn = QPushButton("矩阵编辑")
+        self.matrix_btn.clicked.connect(self.show_matrix_editor)
+        top_bar_layout.addWidget(self.matrix_btn)
+        
+        self.report_btn = QPushButton("月度报表")
+        self.report_btn.clicked.connect(self.show_report_dialog)
+        top_bar_layout.addWidget(self.report_btn)
+        
+        self.calendar_export_btn = QPushButton("导出月历")
+        self.calendar_export_btn.clicked.connect(self.show_calendar_export_dialog)
+        top_bar_layout.addWidget(self.calendar_export_btn)
+        
+        self.reminder_btn = QPushButton("班次提醒")
+        self.reminder_btn.clicked.connect(self.show_reminder_dialog)
+        top_bar_layout.addWidget(self.reminder_btn)
+        
+        self.availability_btn = QPushButton("请假/可用性")
+        self.availability_btn.clicked.connect(self.show_availability_dialog)
+        top_bar_layout.addWidget(self.availability_btn)
+        
+        self.rules_btn = QPushButton("人数规则")
+        self.rules_btn.clicked.connect(self.show_rules_dialog)
+        top_bar_layout.addWidget(self.rules_btn)
+        
+        self.federated_btn = QPushButton("汇总查询")
+        self.federated_btn.clicked.connect(self.show_federated_dialog)
+        top_bar_layout.addWidget(self.federated_btn)
+        
+        self.sync_btn = QPushButton("离线同步")
+        self.sync_btn.clicked.connect(self.show_sync_dialog)
+        top_bar_layout.addWidget(self.sync_btn)
+        
+        self.diff_btn = QPushButton("比较数据库")
+        self.diff_btn.clicked.connect(self.show_diff_dialog)
+        top_bar_layout.addWidget(self.diff_btn)
+        
         self.switch_user_btn = QPushButton(f"切换用户 ({self.current_user})")
         self.switch_user_btn.clicked.connect(self.switch_user)
         top_bar_layout.addWidget(self.switch_user_btn)
 
         # 当前视图状态
         self.is_calendar_view = True
+        self.view_state = {}       # 当前用户保存的视图状态
+        self.pending_scroll = {}   # 视图加载后要恢复的滚动位置
         
         # 日历视图容器
         self.calendar_container = QWidget()
@@ -652,16 +1009,152 @@ class ScheduleManager(QMainWindow):
         main_layout.addWidget(self.list_container)
         self.list_container.hide()
         
-        # 初始化列表视图
-        self.init_list_view()
+        # 列表视图在第一次切换时才创建（见 ensure_list_view）
+        self.list_view_ready = False
         
-        # 设置当前月份
+        # 设置当前月份；视图在窗口框架第一次绘制后再加载（见 paintEvent）
         self.current_date = QDate.currentDate()
-        self.update_calendar_view()
+        self.month_label.setText(f"{self.current_date.year()}年{self.current_date.month()}月")
+        self.calendar_table = None
+        
+        # 人数规则检查结果面板
+        self.violation_list = QListWidget()
+        self.violation_list.itemDoubleClicked.connect(
+            lambda item: self.show_timeline(QDate.fromString(item.data(Qt.UserRole), "yyyy-MM-dd")))
+        self.violation_dock = QDockWidget("人数规则检查", self)
+        self.violation_dock.setObjectName("violation_dock")
+        self.violation_dock.setWidget(self.violation_list)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.violation_dock)
+        self.violation_dock.setVisible(bool(self.staffing.rules))
         
         # 状态栏
         self.statusBar().showMessage("就绪")
+        self.update_undo_buttons()
+        self.init_perf_overlay()
+        
+        # 定时检测其他窗口/程序对同一数据库的修改
+        self.change_timer = QTimer(self)
+        self.change_timer.setInterval(self.CHANGE_POLL_INTERVAL)
+        self.change_timer.timeout.connect(self.check_external_changes)
+        self.change_timer.start()
+        
+        # 班次提醒：单次定时器只在下一条提醒到期时唤醒
+        self.reminder_timer = QTimer(self)
+        self.reminder_timer.setSingleShot(True)
+        self.reminder_timer.timeout.connect(self.fire_reminders)
+        self.tray_icon = None
+
+
+    def name_color(self, name_id):
+        """按姓名在字符串池中的编号取预先生成的画刷"""
+        if name_id >= len(self.name_palette):
+            self.extend_name_palette()
+        return self.color_brushes[self.name_palette[name_id]]
+
+    def extend_name_palette(self):
+        """为字符串池中新出现的姓名查出颜色下标（登录后新增的员工在这里分配并保存）"""
+        names = self.string_pools["employee_name"].strings[len(self.name_palette):]
+        missing = [name for name in names if name not in self.employee_colors]
+        if missing:
+            try:
+                self.employee_colors.update(self.store.employee_colors(len(self.COLOR_LIST), missing))
+            except Error as e:
+                print(f"[DEBUG] 无法保存员工颜色: {str(e)}")
+        self.name_palette.extend(self.employee_colors.get(name, 0) for name in names)
+
+    def render_initial_view(self):
+        """启动后首次加载视图：恢复为上次的视图模式（期间已翻页或切换视图时跳过）"""
+        if self.calendar_table is None and self.is_calendar_view:
+            if self.view_state.get("view") == "list":
+                self.toggle_view()
+            else:
+                self.update_calendar_view()
+        self.initial_view_ready = True
+        monitor.record_span("view_ready", (time.perf_counter() - self.startup_started) * 1000)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.first_paint_pending:
+            self.first_paint_pending = False
+            monitor.record_span("first_paint", (time.perf_counter() - self.startup_started) * 1000)
+            QTimer.singleShot(0, self.render_initial_view)
 
+    def ensure_list_view(self):
+        """第一次需要列表视图时创建控件并加载部门过滤列表"""
+        if not self.list_view_ready:
+            self.init_list_view()
+            self.list_view_ready = True
+            self.apply_list_filters()
+
+    def save_view_state(self):
+        """保存当前用户的月份、视图模式、筛选条件和滚动位置"""
+        state = dict(self.view_state)
+        state["month"] = self.current_date.toString("yyyy-MM")
+        state["view"] = "calendar" if self.is_calendar_view else "list"
+        if self.calendar_table is not None:
+            state["calendar_scroll"] = self.calendar_table.verticalScrollBar().value()
+        if self.list_view_ready:
+            state["search"] = self.search_input.text()
+            state["start_date"] = self.start_date_edit.date().toString("yyyy-MM-dd")
+            state["end_date"] = self.end_date_edit.date().toString("yyyy-MM-dd")
+            state["department"] = self.dept_filter.currentData() or ""
+            state["day_type"] = self.day_type_filter.currentData() or ""
+            state["list_scroll"] = self.table_view.verticalScrollBar().value()
+        self.view_state = state
+        try:
+            UserManager.save_view_state(self.current_user, state)
+        except OSError as e:
+            print(f"[DEBUG] 无法保存视图状态: {str(e)}")
+
+    def restore_view_state(self):
+        """恢复当前用户上次的月份、视图模式、筛选条件和滚动位置"""
+        self.view_state = UserManager.load_view_state(self.current_user)
+        state = self.view_state
+        month = QDate.fromString(state.get("month", ""), "yyyy-MM")
+        self.current_date = month if month.isValid() else QDate.currentDate()
+        self.month_label.setText(f"{self.current_date.year()}年{self.current_date.month()}月")
+        self.pending_scroll = {
+            key: int(state[key]) for key in ("calendar_scroll", "list_scroll") if state.get(key, "").isdigit()
+        }
+        if self.list_view_ready:
+            self.apply_list_filters(reload_departments=True)
+        if not self.initial_view_ready:
+            # 启动时等窗口框架首次绘制后再加载（见 render_initial_view）
+            return
+        
+        if (state.get("view") == "list") == self.is_calendar_view:
+            # 切换视图时会加载目标视图
+            self.toggle_view()
+        else:
+            self.refresh_view()
+
+    def apply_list_filters(self, reload_departments=False):
+        """把保存的筛选条件填入列表视图控件（不触发加载）"""
+        state = self.view_state
+        widgets = (self.search_input, self.start_date_edit, self.end_date_edit, self.dept_filter, self.day_type_filter)
+        for widget in widgets:
+            widget.blockSignals(True)
+        if reload_departments:
+            # 切换用户后部门列表来自新的数据库
+            self.dept_filter.clear()
+            self.dept_filter.addItem("所有部门", "")
+            self.load_departments()
+        self.search_input.setText(state.get("search", ""))
+        # 没有保存过的用户使用默认范围（前后各一个月）
+        for widget, key, months in ((self.start_date_edit, "start_date", -1), (self.end_date_edit, "end_date", 1)):
+            date = QDate.fromString(state.get(key, ""), "yyyy-MM-dd")
+            widget.setDate(date if date.isValid() else QDate.currentDate().addMonths(months))
+        self.dept_filter.setCurrentIndex(max(self.dept_filter.findData(state.get("department", "")), 0))
+        self.day_type_filter.setCurrentIndex(max(self.day_type_filter.findData(state.get("day_type", "")), 0))
+        for widget in widgets:
+            widget.blockSignals(False)
+
+    def apply_pending_scroll(self, key, view):
+        """视图加载完成后恢复保存的滚动位置（只恢复一次）"""
+        value = self.pending_scroll.pop(key, None)
+        if value is not None:
+            # 等布局算出滚动范围后再设置
+            QTimer.singleShot(0, lambda: view.verticalScrollBar().setValue(value))
 
     def prev_month(self):
         """切换到上个月"""
@@ -673,6 +1166,215 @@ class ScheduleManager(QMainWindow):
         self.current_date = self.current_date.addMonths(1)
         self.update_calendar_view()
         
+    def init_perf_overlay(self):
+        """状态栏性能浮层（Ctrl+Shift+P 开关）和性能报告导出（Ctrl+Shift+D）"""
+        self.perf_label = QLabel()
+        self.perf_label.setStyleSheet("color: gray;")
+        self.statusBar().addPermanentWidget(self.perf_label)
+        self.perf_label.hide()
+        
+        self.perf_timer = QTimer(self)
+        self.perf_timer.setInterval(500)
+        self.perf_timer.timeout.connect(self.update_perf_overlay)
+        
+        toggle_action = QAction("性能浮层", self)
+        toggle_action.setShortcut(QKeySequence("Ctrl+Shift+P"))
+        toggle_action.triggered.connect(self.toggle_perf_overlay)
+        self.addAction(toggle_action)
+        
+        dump_action = QAction("导出性能报告", self)
+        dump_action.setShortcut(QKeySequence("Ctrl+Shift+D"))
+        dump_action.triggered.connect(self.dump_perf_report)
+        self.addAction(dump_action)
+        
+        if monitor.sql_enabled:
+            self.toggle_perf_overlay()
+
+    def toggle_perf_overlay(self):
+        """开关性能浮层；浮层打开期间同时开启SQL跟踪（包括缓存中其他用户的连接）"""
+        visible = not self.perf_label.isVisible()
+        monitor.set_sql_enabled(visible, [store.conn for store in self.sessions.stores.values()])
+        self.perf_label.setVisible(visible)
+        if visible:
+            self.update_perf_overlay()
+            self.perf_timer.start()
+        else:
+            self.perf_timer.stop()
+
+    def update_perf_overlay(self):
+        """刷新状态栏中的最近耗时"""
+        parts = []
+        for name, title in (("update_calendar_view", "月历"), ("load_data", "列表"), ("ScheduleDialog", "对话框")):
+            ms = monitor.last_span_ms(name)
+            if ms is not None:
+                parts.append(f"{title} {ms:.1f}ms")
+        summary = monitor.summary()
+        parts.append(f"SQL {summary['sql_count']}条/{summary['sql_ms']:.1f}ms")
+        parts.append(f"慢操作 {summary['slow']}")
+        self.perf_label.setText(" | ".join(parts))
+
+    def dump_perf_report(self):
+        """把性能数据导出为JSON文件，便于反馈问题"""
+        default_name = f"perf_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        path, _ = QFileDialog.getSaveFileName(self, "导出性能报告", default_name, "JSON 文件 (*.json)")
+        if not path:
+            return
+        try:
+            monitor.dump(path, {
+                "app": ProjectInfo.get_header(),
+                "user_db": self.user_db_file,
+                "schema_version": self.store.schema_version(),
+            })
+            self.statusBar().showMessage(f"性能报告已保存到 {path}")
+        except (OSError, Error) as e:
+            QMessageBox.critical(self, "错误", f"无法保存性能报告:\n{str(e)}")
+
+    def refresh_view(self):
+        """刷新当前视图"""
+        if self.is_calendar_view:
+            self.update_calendar_view()
+        else:
+            self.check_violations()
+            self.load_data()
+        self.update_undo_buttons()
+        try:
+            # 整个视图已重新加载，之前的变更无需再增量刷新
+            self.last_change_seq = self.store.change_counter()
+        except Error as e:
+            print(f"[DEBUG] 无法读取变更计数: {str(e)}")
+        self.sync_reminders()
+
+    def check_external_changes(self):
+        """检测其他连接提交的修改，只刷新受影响的日期或行"""
+        try:
+            data_version = self.store.data_version()
+            if data_version == self.last_data_version:
+                return
+            self.last_data_version = data_version
+        except Error as e:
+            print(f"[DEBUG] 检测外部修改失败: {str(e)}")
+            return
+        refreshed = self.refresh_changes()
+        if refreshed is None:
+            self.statusBar().showMessage("检测到其他用户的修改，已刷新数据")
+        elif refreshed:
+            self.statusBar().showMessage(f"检测到其他用户的修改，已刷新 {refreshed} 处")
+
+    def refresh_changes(self):
+        """按变更日志增量刷新上次以来修改过的日期或行，返回刷新的处数（整体刷新时返回 None）"""
+        try:
+            counter, changes = self.store.changes_since(self.last_change_seq)
+            self.last_change_seq = counter
+        except Error as e:
+            print(f"[DEBUG] 读取变更日志失败: {str(e)}")
+            return 0
+        
+        if changes is None:
+            # 变更日志已被裁剪，只能整体刷新
+            self.refresh_view()
+            return None
+        if not changes:
+            return 0
+        
+        date_strs = {date for _, new_date, old_date in changes for date in (new_date, old_date) if date}
+        self.update_violations(date_strs)
+        self.sync_reminders()
+        if self.is_calendar_view:
+            refreshed = self.refresh_calendar_dates(date_strs)
+        else:
+            refreshed = self.refresh_list_rows({row_id for row_id, _, _ in changes})
+        self.update_undo_buttons()
+        return refreshed
+
+    def refresh_calendar_dates(self, date_strs):
+        """只重新加载当前月份中受影响日期的单元格，返回刷新的单元格数"""
+        if self.calendar_table is None:
+            # 首次渲染尚未完成，渲染时会读取最新数据
+            return 0
+        month_prefix = self.current_date.toString("yyyy-MM-")
+        dates = [QDate.fromString(date_str, "yyyy-MM-dd") for date_str in sorted(date_strs)
+                 if date_str.startswith(month_prefix)]
+        dates = [date for date in dates if date.isValid()]
+        if not dates:
+            return 0
+        # 整月只读取一次（缓存失效时一次查询），各单元格共用，不在每个单元格中检查变更和查询
+        try:
+            month_store = self.month_cache.get(self.current_date.year(), self.current_date.month())
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法加载排班数据:\n{str(e)}")
+            return 0
+        for date in dates:
+            row = (self.calendar_start_day + date.day() - 1) // 7
+            self.load_day_schedules(self.calendar_table, row, date.dayOfWeek() % 7, date, month_store)
+        return len(dates)
+
+    def refresh_list_rows(self, row_ids):
+        """只更新列表中受影响的行；出现新的匹配记录时整体重新加载"""
+        try:
+            records = self.store.list_schedules(
+                self.start_date_edit.date().toString("yyyy-MM-dd"),
+                self.end_date_edit.date().toString("yyyy-MM-dd"),
+                self.search_input.text().strip(),
+                self.dept_filter.currentData(),
+                row_ids=sorted(row_ids),
+                day_type=self.day_type_filter.currentData()
+            )
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法加载排班数据:\n{str(e)}")
+            return 0
+        matched = {record[0]: record for record in records}
+        refreshed = 0
+        for record_id in row_ids:
+            row = self.model.day_store.find(record_id)
+            if row is None:
+                continue
+            record = matched.pop(record_id, None)
+            if record is None:
+                self.model.remove_row(row)
+            else:
+                self.model.replace_row(row, record)
+            refreshed += 1
+        if matched:
+            # 新增或移入筛选范围的记录需要按排序位置插入
+            self.load_data()
+            refreshed += len(matched)
+        return refreshed
+
+    def update_undo_buttons(self):
+        """根据变更日志更新撤销/重做按钮状态"""
+        try:
+            undo_label = self.journal.undo_label()
+            redo_label = self.journal.redo_label()
+        except Error as e:
+            print(f"[DEBUG] 无法读取变更日志: {str(e)}")
+            undo_label = redo_label = None
+        self.undo_btn.setEnabled(undo_label is not None)
+        self.undo_btn.setToolTip(f"撤销: {undo_label}" if undo_label else "没有可撤销的操作")
+        self.redo_btn.setEnabled(redo_label is not None)
+        self.redo_btn.setToolTip(f"重做: {redo_label}" if redo_label else "没有可重做的操作")
+
+    def undo_change(self):
+        """撤销最近一次排班操作"""
+        try:
+            label = self.journal.undo()
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法撤销操作:\n{str(e)}")
+            return
+        if label:
+            self.refresh_view()
+            self.statusBar().showMessage(f"已撤销: {label}")
+
+    def redo_change(self):
+        """重做最近一次被撤销的排班操作"""
+        try:
+            label = self.journal.redo()
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法重做操作:\n{str(e)}")
+            return
+        if label:
+            self.refresh_view()
+            self.statusBar().showMessage(f"已重做: {label}")
+
     def toggle_view(self):
         """切换视图模式"""
         self.is_calendar_view = not self.is_calendar_view
@@ -683,11 +1385,13 @@ class ScheduleManager(QMainWindow):
             self.view_toggle_btn.setText("切换为列表视图")
             self.update_calendar_view()
         else:
+            self.ensure_list_view()
             self.calendar_container.hide()
             self.list_container.show()
             self.view_toggle_btn.setText("切换为月历视图")
             self.load_data()
 
+    @monitor.timed("update_calendar_view")
     def update_calendar_view(self):
         """更新月历视图"""
         # 清除旧视图
@@ -699,6 +1403,7 @@ class ScheduleManager(QMainWindow):
         
         # 创建日历表格
         calendar_table = QTableWidget()
+        self.calendar_table = calendar_table
         calendar_table.setEditTriggers(QTableWidget.NoEditTriggers)
         calendar_table.setSelectionMode(QTableWidget.NoSelection)
         
@@ -740,53 +1445,49 @@ class ScheduleManager(QMainWindow):
         month_days = self.current_date.daysInMonth()
         first_day = QDate(self.current_date.year(), self.current_date.month(), 1)
         start_day = first_day.dayOfWeek() % 7  # Qt的周日是7，我们调整为0
+        self.calendar_start_day = start_day
         
         # 计算需要的行数
         rows = ((start_day + month_days - 1) // 7) + 1
         calendar_table.setRowCount(rows)
         
-        # 预先加载本月所有排班数据以确定颜色分配
-        start_date = QDate(self.current_date.year(), self.current_date.month(), 1)
-        end_date = QDate(self.current_date.year(), self.current_date.month(), month_days)
-        
+        # 一次查询读取整月排班（按月缓存）
         try:
-            self.cursor.execute('''
-                SELECT DISTINCT employee_name 
-                FROM schedules 
-                WHERE work_date BETWEEN ? AND ?
-                ORDER BY employee_name
-            ''', (start_date.toString("yyyy-MM-dd"), end_date.toString("yyyy-MM-dd")))
-            employees = self.cursor.fetchall()
-            
-            # 为每个员工分配颜色
-            for emp in employees:
-                name = emp[0]
-                if name not in self.name_color_map:
-                    color_idx = len(self.name_color_map) % len(self.color_list)
-                    self.name_color_map[name] = self.color_list[color_idx]
+            month_store = self.month_cache.get(self.current_date.year(), self.current_date.month())
         except Error as e:
-            QMessageBox.critical(self, "数据库错误", f"无法加载员工列表:\n{str(e)}")
+            QMessageBox.critical(self, "数据库错误", f"无法加载排班数据:\n{str(e)}")
             return
+        self.check_violations()
+        # 星期、法定节假日和调休上班取自日期维度表，一次查询整月
+        try:
+            self.day_infos = {info.work_date: info for info in self.store.get_date_dim(
+                first_day.toString("yyyy-MM-dd"), first_day.addDays(month_days - 1).toString("yyyy-MM-dd"))}
+        except Error as e:
+            print(f"[DEBUG] 无法读取日期维度: {str(e)}")
+            self.day_infos = {}
         
         # 填充日期
         for day in range(1, month_days + 1):
             date = QDate(self.current_date.year(), self.current_date.month(), day)
-            day_of_week = date.dayOfWeek() % 7
+            info = self.day_infos.get(date.toString("yyyy-MM-dd"))
+            day_of_week = (info.weekday + 1) % 7 if info else date.dayOfWeek() % 7  # 周日为0
             row = (start_day + day - 1) // 7
             
-            # 创建日期单元格
-            date_item = QTableWidgetItem(str(day))
+            # 创建日期单元格（节假日和调休上班在日期后标注）
+            date_item = QTableWidgetItem(f"{day}  {info.badge}" if info and info.badge else str(day))
             date_item.setData(Qt.UserRole, date)  # 存储日期对象
             date_item.setTextAlignment(Qt.AlignTop | Qt.AlignLeft)
             
-            # 设置周末颜色
-            if day_of_week == 0 or day_of_week == 6:  # 周日(0)或周六(6)
+            # 休息日（周末和法定节假日，调休上班的周末除外）显示为红色，节假日加浅红背景
+            if (not info.is_workday) if info else day_of_week in (0, 6):
                 date_item.setForeground(QColor(255, 0, 0))  # 红色
+            if info and info.is_holiday:
+                date_item.setBackground(QColor(255, 235, 238))
         
             calendar_table.setItem(row, day_of_week, date_item)
             
             # 加载当天的排班数据
-            self.load_day_schedules(calendar_table, row, day_of_week, date)
+            self.load_day_schedules(calendar_table, row, day_of_week, date, month_store)
         
         # 调整列宽和行高
         calendar_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
@@ -797,50 +1498,53 @@ class ScheduleManager(QMainWindow):
             calendar_table.setRowHeight(row, 100)  # 固定行高
 
         self.calendar_layout.addWidget(calendar_table)
+        self.apply_pending_scroll("calendar_scroll", calendar_table)
 
 
-    def load_day_schedules(self, table, row, col, date):
-        """加载某一天的排班数据"""
+    def load_day_schedules(self, table, row, col, date, month_store=None):
+        """加载某一天的排班数据（month_store 为该月的 DayStore，未提供时从月缓存读取）"""
         try:
             date_str = date.toString("yyyy-MM-dd")
-            self.cursor.execute('''
-                SELECT employee_name, department, shift_type 
-                FROM schedules 
-                WHERE work_date = ?
-                ORDER BY department, employee_name
-            ''', (date_str,))
-            schedules = self.cursor.fetchall()
+            if month_store is None:
+                month_store = self.month_cache.get(date.year(), date.month())
+            schedules = month_store.records_on(date.toPyDate())
+            violations = self.violations.get(date_str, [])
             
-            if not schedules:
+            if not schedules and not violations:
+                table.removeCellWidget(row, col)
                 return
                 
             # 创建显示内容的文本
             content = QLabel()
-            text = f"<div style='font-weight:bold;'>{date.day()}</div>"  # 第一行：日期（加粗显示）
+            info = self.day_infos.get(date_str)
+            badge = ""
+            if info and info.badge:
+                badge = f" <span style='color:{'#c62828' if info.is_holiday else '#616161'};'>{info.badge}</span>"
+            text = f"<div style='font-weight:bold;'>{date.day()}{badge}</div>"  # 第一行：日期（加粗显示）和节假日
+            # 不满足人数规则时在日期下方标红
+            for violation in violations:
+                text += f"<div style='color:#c62828;'>⚠ {violation.message}</div>"
             
             for schedule in schedules:
-                name, dept, shift = schedule
-                # 为每个姓名分配颜色（如果尚未分配）
-                if name not in self.name_color_map:
-                    color_idx = len(self.name_color_map) % len(self.color_list)
-                    self.name_color_map[name] = self.color_list[color_idx]
-                
                 # 第二行：人名（带部门）
-                text += f"<div>{name}({dept})</div>"
+                text += f"<div>{schedule.employee_name}({schedule.department})</div>"
                 # 第三行：班次
-                text += f"<div>{shift}</div>"
+                text += f"<div>{schedule.shift_type}</div>"
             
             content.setText(text.strip())
             content.setAlignment(Qt.AlignTop | Qt.AlignLeft)
             content.setMargin(5)
             
             # 设置背景色 - 使用第一个员工的颜色
-            first_name = schedules[0][0]
+            background = self.name_color(schedules[0].name_id).color().name() if schedules else "#ffffff"
             content.setStyleSheet(f"""
-                background-color: {self.name_color_map[first_name].name()};
+                background-color: {background};
                 padding: 5px;
                 border-radius: 3px;
+                {"border: 2px solid #c62828;" if violations else ""}
             """)
+            if violations:
+                content.setToolTip("\n".join(violation.rule.describe() for violation in violations))
 
             # 设置单元格属性
             content.setProperty("date", date_str)  # 存储日期信息
@@ -862,29 +1566,38 @@ class ScheduleManager(QMainWindow):
         # 搜索框
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("输入员工姓名或部门搜索...")
-        self.search_input.textChanged.connect(self.load_data)
+        # load_data 带计时装饰器，PyQt 不会自动丢弃信号参数，需用 lambda 连接
+        self.search_input.textChanged.connect(lambda: self.load_data())
         filter_layout.addWidget(self.search_input)
         
         # 日期过滤
         filter_layout.addWidget(QLabel("开始日期:"))
         self.start_date_edit = QDateEdit(QDate.currentDate().addMonths(-1))
         self.start_date_edit.setCalendarPopup(True)
-        self.start_date_edit.dateChanged.connect(self.load_data)
+        self.start_date_edit.dateChanged.connect(lambda: self.load_data())
         filter_layout.addWidget(self.start_date_edit)
         
         filter_layout.addWidget(QLabel("结束日期:"))
         self.end_date_edit = QDateEdit(QDate.currentDate().addMonths(1))
         self.end_date_edit.setCalendarPopup(True)
-        self.end_date_edit.dateChanged.connect(self.load_data)
+        self.end_date_edit.dateChanged.connect(lambda: self.load_data())
         filter_layout.addWidget(self.end_date_edit)
         
         # 部门过滤
         self.dept_filter = QComboBox()
         self.dept_filter.addItem("所有部门", "")
         self.load_departments()
-        self.dept_filter.currentIndexChanged.connect(self.load_data)
+        self.dept_filter.currentIndexChanged.connect(lambda: self.load_data())
         filter_layout.addWidget(self.dept_filter)
         
+        # 日期类型过滤（按日期维度表中的法定节假日和调休）
+        self.day_type_filter = QComboBox()
+        self.day_type_filter.addItem("所有日期", "")
+        for day_type in DAY_TYPES:
+            self.day_type_filter.addItem(day_type, day_type)
+        self.day_type_filter.currentIndexChanged.connect(lambda: self.load_data())
+        filter_layout.addWidget(self.day_type_filter)
+        
         # 表格视图
         self.table_view = QTableView()
         self.table_view.setSelectionBehavior(QTableView.SelectRows)
@@ -892,8 +1605,7 @@ class ScheduleManager(QMainWindow):
         self.table_view.doubleClicked.connect(self.edit_record)
         
         # 设置表格模型
-        self.model = QStandardItemModel()
-        self.model.setHorizontalHeaderLabels(["ID", "员工姓名", "部门", "职位", "工作日期", "班次类型", "备注"])
+        self.model = ScheduleTableModel(self.name_color, self)
         self.table_view.setModel(self.model)
         
         # 调整列宽
@@ -911,6 +1623,16 @@ class ScheduleManager(QMainWindow):
         self.add_btn.clicked.connect(self.add_record)
         button_layout.addWidget(self.add_btn)
         
+        # 批量排班按钮
+        self.bulk_add_btn = QPushButton("批量排班")
+        self.bulk_add_btn.clicked.connect(lambda: self.add_bulk_records())
+        button_layout.addWidget(self.bulk_add_btn)
+        
+        # 排班模板按钮
+        self.template_btn = QPushButton("排班模板")
+        self.template_btn.clicked.connect(lambda: self.show_template_dialog())
+        button_layout.addWidget(self.template_btn)
+        
         # 编辑按钮
         self.edit_btn = QPushButton("编辑排班")
         self.edit_btn.clicked.connect(self.edit_record)
@@ -923,7 +1645,7 @@ class ScheduleManager(QMainWindow):
         
         # 刷新按钮
         self.refresh_btn = QPushButton("刷新数据")
-        self.refresh_btn.clicked.connect(self.load_data)
+        self.refresh_btn.clicked.connect(lambda: self.load_data())
         button_layout.addWidget(self.refresh_btn)
 
     def show_calendar_context_menu(self, pos):
@@ -945,16 +1667,16 @@ class ScheduleManager(QMainWindow):
                     # 添加排班
                     add_action = menu.addAction("添加排班")
                     add_action.triggered.connect(lambda: self.add_calendar_record(date_str))
+                    bulk_action = menu.addAction("批量排班")
+                    bulk_action.triggered.connect(lambda: self.add_bulk_records(date))
+                    template_action = menu.addAction("从模板复制到此日...")
+                    template_action.triggered.connect(lambda: self.show_template_dialog(date))
+                    timeline_action = menu.addAction("查看当天时间轴")
+                    timeline_action.triggered.connect(lambda: self.show_timeline(date))
                     
                     # 编辑/删除排班
                     try:
-                        self.cursor.execute('''
-                            SELECT id, employee_name, department, shift_type 
-                            FROM schedules 
-                            WHERE work_date = ?
-                            ORDER BY department, employee_name
-                        ''', (date_str,))
-                        schedules = self.cursor.fetchall()
+                        schedules = self.store.get_day_schedules(date_str)
                         
                         if schedules:
                             # 添加分隔线
@@ -980,7 +1702,7 @@ class ScheduleManager(QMainWindow):
                     # 添加刷新选项
                     menu.addSeparator()
                     refresh_action = menu.addAction("刷新数据")
-                    refresh_action.triggered.connect(self.update_calendar_view)
+                    refresh_action.triggered.connect(lambda: self.update_calendar_view())
                     
                     # 显示菜单
                     menu.exec_(table.viewport().mapToGlobal(pos))
@@ -997,55 +1719,234 @@ class ScheduleManager(QMainWindow):
                 ScheduleDialog.last_department = data[1]  # 部门是第二个元素
                 ScheduleDialog.last_shift_type = data[4]  # 班次类型是第五个元素
                 
-                self.cursor.execute('''
-                    INSERT INTO schedules 
-                    (employee_name, department, position, work_date, shift_type, remarks)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', data)
-                self.conn.commit()
+                self.store.add_schedule(data)
                 self.update_calendar_view()
+                self.update_undo_buttons()
                 self.statusBar().showMessage("排班记录添加成功")
             except Error as e:
                 QMessageBox.critical(self, "数据库错误", f"无法添加排班记录:\n{str(e)}")
 
-    def edit_calendar_record(self, record_id):
-        """在月历视图中编辑排班记录"""
+    def add_bulk_records(self, start_date=None):
+        """批量排班：多名员工 × 日期范围（按星期筛选），一个事务写入，只刷新一次视图"""
+        dialog = BulkScheduleDialog(self, start_date)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        rows = dialog.get_rows()
         try:
-            self.cursor.execute("SELECT * FROM schedules WHERE id = ?", (record_id,))
-            record = self.cursor.fetchone()
-            
-            if record:
-                dialog = ScheduleDialog(self, is_edit_mode=True)  # 设置为编辑模式
-                dialog.set_data(record[1:])  # 跳过ID字段
-                
-                if dialog.exec_() == QDialog.Accepted:
-                    data = dialog.get_data()
-                    # 更新最后选择的部门和班次类型
-                    ScheduleDialog.last_department = data[1]  # 部门是第二个元素
-                    ScheduleDialog.last_shift_type = data[4]  # 班次类型是第五个元素
-                    
-                    # 添加ID到数据末尾用于WHERE条件
-                    data = data + (record_id,)
-                    self.cursor.execute('''
-                        UPDATE schedules 
-                        SET employee_name=?, department=?, position=?, work_date=?, shift_type=?, remarks=?
-                        WHERE id=?
-                    ''', data)
-                    self.conn.commit()
-                    self.update_calendar_view()
-                    self.statusBar().showMessage("排班记录更新成功")
+            added = self.store.add_schedules(rows, dialog.label(), skip_existing=True)
         except Error as e:
-            QMessageBox.critical(self, "数据库错误", f"无法编辑排班记录:\n{str(e)}")
+            QMessageBox.critical(self, "数据库错误", f"无法批量添加排班:\n{str(e)}")
+            return
+        ScheduleDialog.last_department = dialog.department.currentText().strip()
+        ScheduleDialog.last_shift_type = dialog.shift_type.currentText().strip()
+        self.refresh_view()
+        message = f"已批量添加 {added} 条排班"
+        if added < len(rows):
+            message += f"，跳过 {len(rows) - added} 条已有的排班"
+        self.statusBar().showMessage(message)
 
+    def availability_index(self):
+        """请假/可用性区间索引（第一次使用时加载，时段有修改时重新加载）；读取失败时返回 None"""
+        try:
+            if self.availability is None:
+                self.availability = AvailabilityIndex(self.store)
+            else:
+                self.availability.refresh()
+        except Error as e:
+            print(f"[DEBUG] 无法加载请假数据: {str(e)}")
+            return None
+        return self.availability
 
-    def delete_calendar_record(self, record_id):
-        """在月历视图中删除排班记录"""
+    def start_reminders(self):
+        """按当前用户的设置（保存在视图状态中）创建提醒队列并定时"""
+        state = self.view_state
+        lead = int(state["reminder_lead"]) if state.get("reminder_lead", "").isdigit() else self.REMINDER_LEAD
+        self.reminders = ReminderQueue(self.store, lead, state.get("reminder_department", ""))
+        self.reminders.add_listener(self.notify_reminders)
+        self.reminder_timer.stop()
+        if state.get("reminders", "on") != "on":
+            return
         try:
-            self.cursor.execute("SELECT employee_name, work_date FROM schedules WHERE id = ?", (record_id,))
-            record = self.cursor.fetchone()
+            self.reminders.reload()
+        except Error as e:
+            print(f"[DEBUG] 无法加载班次提醒: {str(e)}")
+            return
+        self.schedule_reminder()
+
+    def reminders_enabled(self):
+        return self.reminders is not None and self.view_state.get("reminders", "on") == "on"
+
+    def schedule_reminder(self):
+        """在下一条提醒到期时唤醒（最长半小时，届时加载后面的日期并校正系统时间变化）"""
+        self.reminder_timer.start(self.reminders.seconds_until_next() * 1000 + 200)
+
+    def sync_reminders(self):
+        """排班或班次时间修改后增量更新提醒队列"""
+        if not self.reminders_enabled():
+            return
+        try:
+            self.reminders.sync()
+        except Error as e:
+            print(f"[DEBUG] 无法更新班次提醒: {str(e)}")
+            return
+        self.schedule_reminder()
+
+    def fire_reminders(self):
+        if not self.reminders_enabled():
+            return
+        try:
+            self.reminders.sync()
+            self.reminders.due()
+        except Error as e:
+            print(f"[DEBUG] 班次提醒失败: {str(e)}")
+        self.schedule_reminder()
+
+    def notify_reminders(self, reminders):
+        """到期的提醒：系统托盘通知（不支持时只在状态栏显示）"""
+        title = f"{len(reminders)} 个班次即将开始"
+        if QSystemTrayIcon.isSystemTrayAvailable():
+            if self.tray_icon is None:
+                self.tray_icon = QSystemTrayIcon(QIcon('icon.ico'), self)
+                self.tray_icon.setToolTip(ProjectInfo.NAME)
+                self.tray_icon.messageClicked.connect(self.show_reminder_dialog)
+            self.tray_icon.show()
+            self.tray_icon.showMessage(title, group_text(reminders), QSystemTrayIcon.Information, 10000)
+        QApplication.alert(self)
+        self.statusBar().showMessage(f"{title}: {group_text(reminders, limit=3).replace(chr(10), '；')}")
+
+    def show_reminder_dialog(self):
+        """班次提醒设置和接下来24小时的提醒"""
+        dialog = ReminderDialog(self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        self.view_state["reminders"] = "on" if dialog.enabled.isChecked() else "off"
+        self.view_state["reminder_lead"] = str(dialog.lead.value())
+        self.view_state["reminder_department"] = dialog.department.currentData() or ""
+        self.save_view_state()
+        self.start_reminders()
+        self.statusBar().showMessage(
+            f"班次提醒已开启，提前 {dialog.lead.value()} 分钟" if dialog.enabled.isChecked() else "班次提醒已关闭")
+
+    def show_sync_dialog(self):
+        """与其他电脑交换排班变更集"""
+        dialog = SyncDialog(self)
+        dialog.exec_()
+        if dialog.imported:
+            self.refresh_changes()
+
+    def show_diff_dialog(self):
+        """与备份或其他排班员的数据库比较，把选中的不同之处合并到本库"""
+        dialog = DiffDialog(self)
+        dialog.exec_()
+        if dialog.merged:
+            self.refresh_changes()
+
+    def show_availability_dialog(self):
+        """管理请假、不可用和偏好时段"""
+        AvailabilityDialog(self).exec_()
+        self.refresh_view()
+
+    def check_violations(self):
+        """按人次计数检查当前月份的人数规则，更新检查结果面板"""
+        first = QDate(self.current_date.year(), self.current_date.month(), 1)
+        try:
+            self.violations = self.staffing.check(first.toString("yyyy-MM-dd"),
+                                                  first.addDays(first.daysInMonth() - 1).toString("yyyy-MM-dd"))
+        except Error as e:
+            print(f"[DEBUG] 检查人数规则失败: {str(e)}")
+            self.violations = {}
+        self.update_violation_panel()
+
+    def update_violations(self, date_strs):
+        """只重新检查被修改的日期（当前月份以外的日期不显示，跳过）"""
+        month_prefix = self.current_date.toString("yyyy-MM-")
+        date_strs = [date_str for date_str in date_strs if date_str.startswith(month_prefix)]
+        if not date_strs or not self.staffing.rules:
+            return
+        try:
+            for date_str, violations in self.staffing.check_dates(date_strs).items():
+                if violations:
+                    self.violations[date_str] = violations
+                else:
+                    self.violations.pop(date_str, None)
+        except Error as e:
+            print(f"[DEBUG] 检查人数规则失败: {str(e)}")
+            return
+        self.update_violation_panel()
+
+    def update_violation_panel(self):
+        self.violation_list.clear()
+        for date_str in sorted(self.violations):
+            for violation in self.violations[date_str]:
+                item = QListWidgetItem(f"{date_str[5:]}  {violation.message}")
+                item.setData(Qt.UserRole, date_str)
+                item.setToolTip(violation.rule.describe())
+                self.violation_list.addItem(item)
+        count = self.violation_list.count()
+        self.violation_dock.setWindowTitle(f"人数规则检查（{count} 处不满足）" if count else "人数规则检查（全部满足）")
+
+    def show_rules_dialog(self):
+        """管理人数规则"""
+        StaffingRulesDialog(self).exec_()
+        try:
+            self.staffing.reload_rules()
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法加载人数规则:\n{str(e)}")
+            return
+        self.violation_dock.setVisible(bool(self.staffing.rules))
+        self.refresh_view()
+
+    def show_timeline(self, start_date=None):
+        """按小时查看某天或某周的班次时间轴"""
+        TimelineDialog(self, start_date).exec_()
+        self.refresh_changes()
+
+    def show_matrix_editor(self):
+        """员工×日期矩阵中快速录入班次，修改定时合并提交"""
+        MatrixEditorDialog(self).exec_()
+        self.refresh_changes()
+
+    def show_template_dialog(self, target_date=None):
+        """复制一段排班到其他日期，或保存/应用命名模板"""
+        TemplateDialog(self, target_date).exec_()
+
+    def edit_calendar_record(self, record_id):
+        """在月历视图中编辑排班记录"""
+        try:
+            record = self.store.get_schedule(record_id)
+            
+            if record:
+                dialog = ScheduleDialog(self, is_edit_mode=True)  # 设置为编辑模式
+                dialog.set_data(record[1:])  # 跳过ID字段
+                
+                if dialog.exec_() == QDialog.Accepted:
+                    data = dialog.get_data()
+                    # 更新最后选择的部门和班次类型
+                    ScheduleDialog.last_department = data[1]  # 部门是第二个元素
+                    ScheduleDialog.last_shift_type = data[4]  # 班次类型是第五个元素
+                    
+                    try:
+                        self.store.update_schedule(record_id, data, expected_version=record[7])
+                    except ConcurrentEditError:
+                        QMessageBox.warning(self, "修改冲突", "该排班记录已被其他用户修改，已重新加载最新数据，请重新编辑")
+                        self.update_calendar_view()
+                        return
+                    self.update_calendar_view()
+                    self.update_undo_buttons()
+                    self.statusBar().showMessage("排班记录更新成功")
+            else:
+                self.show_archived_record(record_id)
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法编辑排班记录:\n{str(e)}")
+
+
+    def delete_calendar_record(self, record_id):
+        """在月历视图中删除排班记录"""
+        try:
+            record = self.store.get_schedule(record_id)
             
             if record:
-                name, date = record
+                name, date = record[1], record[4]
                 reply = QMessageBox.question(
                     self, "确认删除",
                     f"确定要删除 {name} 在 {date} 的排班记录吗?",
@@ -1053,13 +1954,21 @@ class ScheduleManager(QMainWindow):
                 )
                 
                 if reply == QMessageBox.Yes:
-                    self.cursor.execute("DELETE FROM schedules WHERE id = ?", (record_id,))
-                    self.conn.commit()
+                    self.store.delete_schedule(record_id)
                     self.update_calendar_view()
-                    self.statusBar().showMessage("排班记录删除成功")
+                    self.update_undo_buttons()
+                    self.statusBar().showMessage("排班记录删除成功(可撤销)")
+            else:
+                self.show_archived_record(record_id)
         except Error as e:
             QMessageBox.critical(self, "数据库错误", f"无法删除排班记录:\n{str(e)}")
 
+    def show_archived_record(self, record_id, work_date=None):
+        """主库中找不到的记录如果属于已归档的年份，提示归档数据只读"""
+        year = self.store.archives.find_record(record_id, work_date)
+        if year is not None:
+            QMessageBox.information(self, "提示", f"该排班记录属于已归档的 {year} 年，归档数据只读")
+
     def handle_calendar_double_click(self, index):
         """处理月历视图的双击事件"""
         table = self.sender()
@@ -1075,13 +1984,7 @@ class ScheduleManager(QMainWindow):
         
         # 检查该日期是否有排班记录
         try:
-            self.cursor.execute('''
-                SELECT id, employee_name, department, shift_type 
-                FROM schedules 
-                WHERE work_date = ?
-                ORDER BY department, employee_name
-            ''', (date_str,))
-            schedules = self.cursor.fetchall()
+            schedules = self.store.get_day_schedules(date_str)
             
             if schedules:
                 # 如果有记录，弹出编辑窗口（编辑第一条记录）
@@ -1098,13 +2001,12 @@ class ScheduleManager(QMainWindow):
     def load_departments(self):
         """加载部门列表"""
         try:
-            self.cursor.execute("SELECT DISTINCT department FROM schedules ORDER BY department")
-            departments = self.cursor.fetchall()
-            for dept in departments:
-                self.dept_filter.addItem(dept[0], dept[0])
+            for dept in self.store.get_used_departments():
+                self.dept_filter.addItem(dept, dept)
         except Error as e:
             QMessageBox.critical(self, "数据库错误", f"无法加载部门列表:\n{str(e)}")
     
+    @monitor.timed("load_data")
     def load_data(self):
         """加载排班数据(列表视图)"""
         if self.is_calendar_view:
@@ -1117,55 +2019,14 @@ class ScheduleManager(QMainWindow):
             end_date = self.end_date_edit.date().toString("yyyy-MM-dd")
             dept_filter = self.dept_filter.currentData()
             
-            # 构建查询
-            query = '''
-                SELECT id, employee_name, department, position, work_date, shift_type, remarks 
-                FROM schedules 
-                WHERE work_date BETWEEN ? AND ?
-            '''
-            params = [start_date, end_date]
-            
-            # 添加搜索条件
-            if search_text:
-                query += " AND (employee_name LIKE ? OR department LIKE ?)"
-                params.extend([f"%{search_text}%", f"%{search_text}%"])
-            
-            # 添加部门过滤
-            if dept_filter:
-                query += " AND department = ?"
-                params.append(dept_filter)
-            
-            query += " ORDER BY work_date, department, employee_name"
-            
-            self.cursor.execute(query, params)
-            records = self.cursor.fetchall()
-            
-            # 更新模型
-            self.model.setRowCount(0)
-        
-            # 重置颜色映射（可选，如果希望每次加载都重新分配颜色）
-            # self.name_color_map = {}
-            
-            for row_num, row_data in enumerate(records):
-                self.model.insertRow(row_num)
-                employee_name = str(row_data[1])  # 员工姓名在索引1的位置
-                
-                # 为每个姓名分配颜色（如果尚未分配）
-                if employee_name not in self.name_color_map:
-                    color_idx = len(self.name_color_map) % len(self.color_list)
-                    self.name_color_map[employee_name] = self.color_list[color_idx]
+            records = DayStore.load(self.store, start_date, end_date, search_text, dept_filter,
+                                    pools=self.string_pools, day_type=self.day_type_filter.currentData())
             
-                for col_num, col_data in enumerate(row_data):
-                    item = QStandardItem(str(col_data))
-                    item.setEditable(False)
-
-                    # 设置背景色
-                    if col_num in [1, 2, 3]:  # 姓名、部门、职位列
-                        item.setBackground(self.name_color_map[employee_name])
-                    
-                    self.model.setItem(row_num, col_num, item)
+            # 更新模型（单元格内容和颜色由模型按需读取）
+            self.model.set_store(records)
             
             self.statusBar().showMessage(f"共加载 {len(records)} 条排班记录")
+            self.apply_pending_scroll("list_scroll", self.table_view)
         except Error as e:
             QMessageBox.critical(self, "数据库错误", f"无法加载排班数据:\n{str(e)}")
     
@@ -1179,16 +2040,8 @@ class ScheduleManager(QMainWindow):
                 ScheduleDialog.last_department = data[1]  # 部门是第二个元素
                 ScheduleDialog.last_shift_type = data[4]  # 班次类型是第五个元素
                 
-                self.cursor.execute('''
-                    INSERT INTO schedules 
-                    (employee_name, department, position, work_date, shift_type, remarks)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', data)
-                self.conn.commit()
-                if self.is_calendar_view:
-                    self.update_calendar_view()
-                else:
-                    self.load_data()
+                self.store.add_schedule(data)
+                self.refresh_view()
                 self.statusBar().showMessage("排班记录添加成功")
             except Error as e:
                 QMessageBox.critical(self, "数据库错误", f"无法添加排班记录:\n{str(e)}")
@@ -1206,11 +2059,11 @@ class ScheduleManager(QMainWindow):
             return
         
         row = selected[0].row()
-        record_id = self.model.item(row, 0).text()
+        record = self.model.record(row)
+        record_id, work_date = record.id, record.work_date
         
         try:
-            self.cursor.execute("SELECT * FROM schedules WHERE id = ?", (record_id,))
-            record = self.cursor.fetchone()
+            record = self.store.get_schedule(record_id)
             
             if record:
                 dialog = ScheduleDialog(self, is_edit_mode=True)  # 设置为编辑模式
@@ -1221,16 +2074,17 @@ class ScheduleManager(QMainWindow):
                     ScheduleDialog.last_department = data[1]  # 部门是第二个元素
                     ScheduleDialog.last_shift_type = data[4]  # 班次类型是第五个元素
                     
-                    # 添加ID到数据末尾用于WHERE条件
-                    data = data + (record_id,)
-                    self.cursor.execute('''
-                        UPDATE schedules 
-                        SET employee_name=?, department=?, position=?, work_date=?, shift_type=?, remarks=?
-                        WHERE id=?
-                    ''', data)
-                    self.conn.commit()
+                    try:
+                        self.store.update_schedule(record_id, data, expected_version=record[7])
+                    except ConcurrentEditError:
+                        QMessageBox.warning(self, "修改冲突", "该排班记录已被其他用户修改，已重新加载最新数据，请重新编辑")
+                        self.load_data()
+                        return
                     self.load_data()
+                    self.update_undo_buttons()
                     self.statusBar().showMessage("排班记录更新成功")
+            else:
+                self.show_archived_record(record_id, work_date)
         except Error as e:
             QMessageBox.critical(self, "数据库错误", f"无法编辑排班记录:\n{str(e)}")
 
@@ -1246,10 +2100,8 @@ class ScheduleManager(QMainWindow):
             QMessageBox.warning(self, "警告", "请先选择要删除的排班记录")
             return
         
-        row = selected[0].row()
-        record_id = self.model.item(row, 0).text()
-        employee_name = self.model.item(row, 1).text()
-        work_date = self.model.item(row, 4).text()
+        record = self.model.record(selected[0].row())
+        record_id, employee_name, work_date = record.id, record.employee_name, record.work_date
         
         reply = QMessageBox.question(
             self, "确认删除",
@@ -1259,18 +2111,105 @@ class ScheduleManager(QMainWindow):
         
         if reply == QMessageBox.Yes:
             try:
-                self.cursor.execute("DELETE FROM schedules WHERE id = ?", (record_id,))
-                self.conn.commit()
+                if not self.store.delete_schedule(record_id):
+                    self.show_archived_record(record_id, work_date)
+                    return
                 self.load_data()
-                self.statusBar().showMessage("排班记录删除成功")
+                self.update_undo_buttons()
+                self.statusBar().showMessage("排班记录删除成功(可撤销)")
             except Error as e:
                 QMessageBox.critical(self, "数据库错误", f"无法删除排班记录:\n{str(e)}")
 
 
 
+    def show_report_dialog(self):
+        """按部门和月份批量生成月度报表"""
+        dialog = ReportDialog(self)
+        if dialog.exec_() == QDialog.Accepted:
+            self.run_batch(dialog.make_batch(), "月度报表", "正在生成月度报表...",
+                           "已取消生成报表（已完成的部门月报仍保留在输出目录）", self.report_batch_finished)
+
+    def report_batch_finished(self, batch, result):
+        QMessageBox.information(
+            self, "月度报表",
+            f"已生成 {result['tasks']} 份部门月报（{result['workers']} 个进程，用时 {result['seconds']} 秒）\n"
+            f"输出目录: {os.path.abspath(batch.output_dir)}"
+        )
+
+    def show_calendar_export_dialog(self):
+        """把月历导出为 PDF 或 PNG（离屏绘制，不影响当前视图）"""
+        dialog = CalendarExportDialog(self)
+        if dialog.exec_() == QDialog.Accepted:
+            try:
+                export = dialog.make_export()
+            except Error as e:
+                QMessageBox.critical(self, "数据库错误", f"无法读取员工颜色:\n{str(e)}")
+                return
+            self.run_batch(export, "导出月历", "正在导出月历...", "已取消导出月历", self.calendar_export_finished)
+
+    def calendar_export_finished(self, export, result):
+        QMessageBox.information(
+            self, "导出月历",
+            f"已导出 {result['pages']} 页月历（{result['workers']} 个线程，用时 {result['seconds']} 秒）\n"
+            f"输出: {os.path.abspath(export.output)}"
+        )
+
+    def run_batch(self, batch, title, label, cancelled_message, finished):
+        """后台执行批量任务（月度报表、导出月历），进度对话框可取消；界面在等待期间保持响应
+
+        batch 提供 start / progress / cancel / finish，完成后调用 finished(batch, 结果)。
+        """
+        try:
+            total = batch.start()
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"无法开始{title}:\n{str(e)}")
+            return
+        progress = QProgressDialog(label, "取消", 0, total, self)
+        progress.setWindowTitle(title)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(0)
+        progress.canceled.connect(batch.cancel)
+        self.batch_task = (batch, title, cancelled_message, finished)
+        self.batch_progress = progress
+        self.batch_timer = QTimer(self)
+        self.batch_timer.setInterval(100)
+        self.batch_timer.timeout.connect(self.poll_batch)
+        self.batch_timer.start()
+
+    def poll_batch(self):
+        batch, title, cancelled_message, finished = self.batch_task
+        done, total = batch.progress()
+        if batch.cancelled:
+            self.batch_timer.stop()
+            self.statusBar().showMessage(cancelled_message)
+            return
+        self.batch_progress.setValue(done)
+        if done < total:
+            return
+        self.batch_timer.stop()
+        self.batch_progress.canceled.disconnect()
+        self.batch_progress.close()
+        try:
+            result = batch.finish()
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"{title}失败:\n{str(e)}")
+            return
+        finished(batch, result)
+
+    def show_federated_dialog(self):
+        """汇总查看多个用户的排班"""
+        try:
+            FederatedDialog(self).exec_()
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"无法打开汇总查询:\n{str(e)}")
+
     def closeEvent(self, event):
-        """关闭窗口时关闭数据库连接"""
-        self.conn.close()
+        """关闭窗口时保存视图状态并关闭数据库连接"""
+        self.save_view_state()
+        self.reminder_timer.stop()
+        if self.tray_icon is not None:
+            self.tray_icon.hide()
+        self.sessions.close_all()
         event.accept()
 
     def switch_user(self):
@@ -1282,30 +2221,43 @@ class ScheduleManager(QMainWindow):
         )
         
         if reply == QMessageBox.Yes:
-            # 关闭当前数据库连接
-            self.conn.close()
+            # 保存当前用户的视图状态，连接保留在缓存中
+            self.save_view_state()
             
-            # 显示登录对话框
+            # 显示登录对话框（取消时继续使用当前用户）
+            previous = {name: getattr(self, name) for name in self.SESSION_ATTRS}
             if self.show_login_dialog():
-                # 重新初始化数据库
-                self.init_db()
-                
-                # 重新加载数据
-                if self.is_calendar_view:
-                    self.update_calendar_view()
-                else:
-                    self.load_data()
-                
-                # 更新窗口标题和按钮文本
-                self.setWindowTitle(f"{ProjectInfo.NAME} {ProjectInfo.VERSION} - 当前用户: {self.current_user}")
-                self.switch_user_btn.setText(f"切换用户 ({self.current_user})")
-                self.statusBar().showMessage(f"已切换到用户: {self.current_user}")
+                try:
+                    self.activate_user()
+                except Error:
+                    # init_db 已提示错误；恢复原来的用户和连接，窗口继续显示原来的数据（不在槽函数中抛出）
+                    failed_user = self.current_user
+                    for name, value in previous.items():
+                        setattr(self, name, value)
+                    self.statusBar().showMessage(f"无法切换到用户 {failed_user}，继续使用用户: {self.current_user}")
+
+    @monitor.timed("switch_user")
+    def activate_user(self):
+        """登录成功后切换到 self.current_user 的数据库并恢复其视图状态"""
+        self.init_db()
+        # 缓存的连接按打开时的开关设置了SQL跟踪，按当前开关重新设置
+        monitor.attach(self.store.conn)
+        self.restore_view_state()
+        self.start_reminders()
+        
+        # 更新窗口标题和按钮文本
+        self.setWindowTitle(f"{ProjectInfo.NAME} {ProjectInfo.VERSION} - 当前用户: {self.current_user}")
+        self.switch_user_btn.setText(f"切换用户 ({self.current_user})")
+        self.violation_dock.setVisible(bool(self.staffing.rules))
+        self.update_undo_buttons()
+        self.statusBar().showMessage(f"已切换到用户: {self.current_user}")
 
 class ScheduleDialog(QDialog):
     """排班记录编辑对话框"""
     last_department = ""  # 类变量存储最后选择的部门
     last_shift_type = ""  # 类变量存储最后选择的班次类型
     
+    @monitor.timed("ScheduleDialog")
     def __init__(self, parent=None, is_edit_mode=False):
         super().__init__(parent)
         self.is_edit_mode = is_edit_mode
@@ -1317,18 +2269,28 @@ class ScheduleDialog(QDialog):
         layout = QFormLayout()
         self.setLayout(layout)
         
-        # 员工姓名
+        # 员工姓名：下拉提示当天该班次空闲的员工，请假/不可用时在下方提示
         self.employee_name = QLineEdit()
+        self.employee_name.setPlaceholderText("输入姓名，提示当天该班次空闲的员工")
+        self.free_model = QStringListModel(self)
+        completer = QCompleter(self.free_model, self)
+        completer.setCaseSensitivity(Qt.CaseInsensitive)
+        completer.setFilterMode(Qt.MatchContains)
+        self.employee_name.setCompleter(completer)
         layout.addRow("员工姓名:", self.employee_name)
+        self.availability_label = QLabel()
+        layout.addRow("", self.availability_label)
+        self.availability = parent.availability_index() if hasattr(parent, "availability_index") else None
+        self.known_employees = []
         
         # 部门
         self.department = QComboBox()
         self.department.setEditable(True)
         
         try:
-            parent.cursor.execute("SELECT name FROM departments ORDER BY name")
-            depts = parent.cursor.fetchall()
-            self.department.addItems([dept[0] for dept in depts])
+            if self.availability is not None:
+                self.known_employees = parent.store.get_employee_names()
+            self.department.addItems(parent.store.get_departments())
             
             # 如果不是编辑模式，使用最后选择的部门
             if not self.is_edit_mode and ScheduleDialog.last_department:
@@ -1361,9 +2323,7 @@ class ScheduleDialog(QDialog):
         self.shift_type.setEditable(True)
         
         try:
-            parent.cursor.execute("SELECT shift_name || ' (' || start_time || '-' || end_time || ')' FROM custom_shifts ORDER BY shift_name")
-            shifts = parent.cursor.fetchall()
-            self.shift_type.addItems([shift[0] for shift in shifts])
+            self.shift_type.addItems(parent.store.get_shift_labels())
         
             # 设置最后选择的班次类型
             if ScheduleDialog.last_shift_type:
@@ -1396,6 +2356,11 @@ class ScheduleDialog(QDialog):
         # 备注
         self.remarks = QLineEdit()
         layout.addRow("备注:", self.remarks)
+
+        self.work_date.dateChanged.connect(self.update_free_employees)
+        self.shift_type.currentTextChanged.connect(self.update_free_employees)
+        self.employee_name.textChanged.connect(self.update_availability_hint)
+        self.update_free_employees()
         
         # 按钮
         button_layout = QHBoxLayout()
@@ -1433,8 +2398,7 @@ class ScheduleDialog(QDialog):
         if dialog.exec_() == QDialog.Accepted and self.new_dept.text().strip():
             new_dept = self.new_dept.text().strip()
             try:
-                self.parent().cursor.execute("INSERT OR IGNORE INTO departments (name) VALUES (?)", (new_dept,))
-                self.parent().conn.commit()
+                self.parent().store.add_department(new_dept)
                 self.department.addItem(new_dept)
                 self.department.setCurrentText(new_dept)
             except Error as e:
@@ -1489,11 +2453,7 @@ class ScheduleDialog(QDialog):
             
             try:
                 # 保存到数据库
-                self.parent().cursor.execute(
-                    "INSERT OR REPLACE INTO custom_shifts (shift_name, start_time, end_time) VALUES (?, ?, ?)",
-                    (shift_name, start_time, end_time)
-                )
-                self.parent().conn.commit()
+                self.parent().store.save_shift(shift_name, start_time, end_time)
                 
                 # 更新下拉框
                 shift_text = f"{shift_name} ({start_time}-{end_time})" if start_time and end_time else shift_name
@@ -1503,6 +2463,62 @@ class ScheduleDialog(QDialog):
             except Error as e:
                 QMessageBox.critical(self, "数据库错误", f"无法保存自定义班次:\n{str(e)}")
 
+    def update_free_employees(self):
+        """按所选日期和班次更新姓名提示列表（有偏好时段的员工排在前面）"""
+        if self.availability is None:
+            return
+        try:
+            free = self.availability.free_employees(
+                self.known_employees, self.work_date.date().toString("yyyy-MM-dd"), self.shift_type.currentText())
+        except (Error, ValueError) as e:
+            print(f"[DEBUG] 无法查询空闲员工: {str(e)}")
+            return
+        self.free_model.setStringList(free)
+        self.update_availability_hint()
+
+    def availability_conflict(self):
+        """当前员工在所选班次时间内的请假/不可用: (类型, 开始, 结束)，没有冲突时返回 None"""
+        name = self.employee_name.text().strip()
+        if self.availability is None or not name:
+            return None
+        work_date = self.work_date.date().toString("yyyy-MM-dd")
+        shift_type = self.shift_type.currentText()
+        try:
+            kind = self.availability.conflict(name, work_date, shift_type)
+            if kind is None:
+                return None
+            return (kind,) + self.availability.conflict_range(name, work_date, shift_type)
+        except (Error, ValueError):
+            return None
+
+    def update_availability_hint(self):
+        conflict = self.availability_conflict()
+        name = self.employee_name.text().strip()
+        if conflict:
+            kind, start, end = conflict
+            self.availability_label.setText(f"⚠ {kind}：{start} 至 {end}")
+            self.availability_label.setStyleSheet("color: #c62828;")
+        elif name and self.availability is not None and self.availability.is_preferred(
+                name, self.work_date.date().toString("yyyy-MM-dd"), self.shift_type.currentText()):
+            self.availability_label.setText("✓ 在该员工的偏好时段内")
+            self.availability_label.setStyleSheet("color: #2e7d32;")
+        else:
+            self.availability_label.setText(f"空闲员工 {self.free_model.rowCount()} 人" if self.availability else "")
+            self.availability_label.setStyleSheet("color: gray;")
+
+    def accept(self):
+        """员工在该班次时间内请假或不可用时先确认"""
+        conflict = self.availability_conflict()
+        if conflict:
+            reply = QMessageBox.question(
+                self, "请假冲突",
+                f"{self.employee_name.text().strip()} 在该班次时间内{conflict[0]}（{conflict[1]} 至 {conflict[2]}），仍然排班?",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+            )
+            if reply != QMessageBox.Yes:
+                return
+        super().accept()
+
     def get_data(self):
         """获取表单数据"""
         return (
@@ -1540,7 +2556,1654 @@ class ScheduleDialog(QDialog):
             ScheduleDialog.last_department = data[1]
             ScheduleDialog.last_shift_type = data[4]
 
+class BulkScheduleDialog(QDialog):
+    """批量排班：选择员工、日期范围和星期，同一部门、职位和班次"""
+    WEEKDAY_NAMES = ("周一", "周二", "周三", "周四", "周五", "周六", "周日")
+
+    def __init__(self, parent, start_date=None):
+        super().__init__(parent)
+        self.setWindowTitle("批量排班")
+        self.setWindowIcon(QIcon('icon.ico'))
+        self.resize(460, 560)
+
+        layout = QFormLayout(self)
+
+        # 员工（已有员工勾选，新员工在下方输入）
+        self.employee_filter = QLineEdit()
+        self.employee_filter.setPlaceholderText("筛选员工")
+        self.employee_filter.textChanged.connect(self.filter_employees)
+        layout.addRow("员工:", self.employee_filter)
+        self.employee_list = QListWidget()
+        try:
+            for name in parent.store.get_employee_names():
+                item = QListWidgetItem(name)
+                item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+                item.setCheckState(Qt.Unchecked)
+                self.employee_list.addItem(item)
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法加载员工列表:\n{str(e)}")
+        self.employee_list.itemChanged.connect(self.update_preview)
+        layout.addRow("", self.employee_list)
+        self.new_employees = QLineEdit()
+        self.new_employees.setPlaceholderText("多个姓名用逗号或空格分隔")
+        self.new_employees.textChanged.connect(self.update_preview)
+        layout.addRow("其他员工:", self.new_employees)
+
+        self.department = QComboBox()
+        self.department.setEditable(True)
+        try:
+            self.department.addItems(parent.store.get_departments())
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法加载部门列表:\n{str(e)}")
+        if ScheduleDialog.last_department:
+            self.department.setCurrentText(ScheduleDialog.last_department)
+        layout.addRow("部门:", self.department)
+
+        self.position = QLineEdit()
+        layout.addRow("职位:", self.position)
+
+        self.shift_type = QComboBox()
+        self.shift_type.setEditable(True)
+        try:
+            self.shift_type.addItems(parent.store.get_shift_labels())
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法加载班次列表:\n{str(e)}")
+        if ScheduleDialog.last_shift_type:
+            self.shift_type.setCurrentText(ScheduleDialog.last_shift_type)
+        layout.addRow("班次类型:", self.shift_type)
+
+        # 日期范围，默认为所选日期（或当前月份第一天）到月底
+        start = start_date or QDate(parent.current_date.year(), parent.current_date.month(), 1)
+        self.start_date = QDateEdit(start)
+        self.start_date.setCalendarPopup(True)
+        self.start_date.dateChanged.connect(self.update_preview)
+        layout.addRow("开始日期:", self.start_date)
+        self.end_date = QDateEdit(QDate(start.year(), start.month(), start.daysInMonth()))
+        self.end_date.setCalendarPopup(True)
+        self.end_date.dateChanged.connect(self.update_preview)
+        layout.addRow("结束日期:", self.end_date)
+
+        weekday_layout = QHBoxLayout()
+        self.weekday_checks = []
+        for weekday, label in enumerate(self.WEEKDAY_NAMES):
+            check = QCheckBox(label)
+            check.setChecked(weekday < 5)
+            check.toggled.connect(self.update_preview)
+            weekday_layout.addWidget(check)
+            self.weekday_checks.append(check)
+        layout.addRow("星期:", weekday_layout)
+        self.store = parent.store
+        self.workday_dates = {}   # (开始, 结束) -> 工作日集合
+        self.use_workdays = QCheckBox("按工作日历（跳过法定节假日，含调休上班日）")
+        self.use_workdays.toggled.connect(self.toggle_workdays)
+        layout.addRow("", self.use_workdays)
+
+        self.remarks = QLineEdit()
+        layout.addRow("备注:", self.remarks)
+
+        self.availability = parent.availability_index()
+        self.skip_unavailable = QCheckBox("跳过请假/不可用的员工和日期")
+        self.skip_unavailable.setChecked(True)
+        self.skip_unavailable.toggled.connect(self.update_preview)
+        self.shift_type.currentTextChanged.connect(self.update_preview)
+        layout.addRow("", self.skip_unavailable)
+
+        self.preview_label = QLabel()
+        layout.addRow("", self.preview_label)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        button_box.button(QDialogButtonBox.Ok).setText("添加")
+        button_box.button(QDialogButtonBox.Cancel).setText("取消")
+        button_box.accepted.connect(self.validate_and_accept)
+        button_box.rejected.connect(self.reject)
+        layout.addRow(button_box)
+        self.update_preview()
+
+    def filter_employees(self, text):
+        text = text.strip()
+        for i in range(self.employee_list.count()):
+            item = self.employee_list.item(i)
+            item.setHidden(bool(text) and text not in item.text())
+
+    def selected_employees(self):
+        names = [self.employee_list.item(i).text() for i in range(self.employee_list.count())
+                 if self.employee_list.item(i).checkState() == Qt.Checked]
+        names.extend(self.new_employees.text().replace("，", ",").replace(",", " ").split())
+        return sorted(set(names))
+
+    def selected_weekdays(self):
+        """勾选的星期（0=周一，与 date.weekday() 一致）"""
+        return [weekday for weekday, check in enumerate(self.weekday_checks) if check.isChecked()]
+
+    def toggle_workdays(self, checked):
+        # 按工作日历时星期由日历决定
+        for check in self.weekday_checks:
+            check.setEnabled(not checked)
+        self.update_preview()
+
+    def selected_dates(self):
+        """按工作日历时范围内的工作日（日期文本集合），否则为 None"""
+        if not self.use_workdays.isChecked():
+            return None
+        key = (self.start_date.date().toString("yyyy-MM-dd"), self.end_date.date().toString("yyyy-MM-dd"))
+        if key not in self.workday_dates:
+            try:
+                self.workday_dates[key] = set(self.store.get_workdays(*key))
+            except Error as e:
+                QMessageBox.critical(self, "数据库错误", f"无法读取工作日历:\n{str(e)}")
+                self.workday_dates[key] = set()
+        return self.workday_dates[key]
+
+    def all_rows(self):
+        return bulk_schedule_rows(
+            self.selected_employees(), self.start_date.date().toPyDate(), self.end_date.date().toPyDate(),
+            self.selected_weekdays(), self.department.currentText().strip(), self.position.text().strip(),
+            self.shift_type.currentText().strip(), self.remarks.text().strip(), self.selected_dates()
+        )
+
+    def unavailable_rows(self, rows):
+        """与请假/不可用时段冲突的行"""
+        if self.availability is None or not self.skip_unavailable.isChecked():
+            return []
+        return [row for row, _ in self.availability.conflicts(rows)]
+
+    def get_rows(self):
+        rows = self.all_rows()
+        skipped = set(map(id, self.unavailable_rows(rows)))
+        return [row for row in rows if id(row) not in skipped]
+
+    def label(self):
+        """撤销记录中显示的操作名称"""
+        return (f"批量排班 {len(self.selected_employees())} 人 "
+                f"{self.start_date.date().toString('yyyy-MM-dd')} ~ {self.end_date.date().toString('yyyy-MM-dd')}")
+
+    def update_preview(self):
+        start, end = self.start_date.date(), self.end_date.date()
+        dates = self.selected_dates()
+        if dates is not None:
+            days = len(dates)
+        else:
+            weekdays = self.selected_weekdays()
+            days = sum(1 for offset in range(max(0, start.daysTo(end) + 1))
+                       if start.addDays(offset).dayOfWeek() - 1 in weekdays)
+        text = f"将生成 {len(self.selected_employees()) * days} 条排班（已有的相同排班会跳过）"
+        if self.availability is not None and self.skip_unavailable.isChecked() and days:
+            skipped = len(self.unavailable_rows(self.all_rows()))
+            if skipped:
+                text = f"将生成 {len(self.selected_employees()) * days - skipped} 条排班，跳过 {skipped} 条请假/不可用"
+                text += "（已有的相同排班也会跳过）"
+        self.preview_label.setText(text)
+
+    def validate_and_accept(self):
+        if not self.selected_employees():
+            QMessageBox.warning(self, "警告", "请至少选择一名员工")
+            return
+        if self.end_date.date() < self.start_date.date():
+            QMessageBox.warning(self, "警告", "结束日期不能早于开始日期")
+            return
+        if not self.department.currentText().strip() or not self.shift_type.currentText().strip():
+            QMessageBox.warning(self, "警告", "请填写部门和班次类型")
+            return
+        if not self.get_rows():
+            QMessageBox.warning(self, "警告", "日期范围内没有符合所选星期的日期")
+            return
+        self.accept()
+
+
+class MatrixEditorDialog(QDialog):
+    """矩阵编辑：某部门一个月的 员工×日期 班次表，修改进入写回队列，定时合并为一个事务提交"""
+    FLUSH_INTERVAL = 2000   # 写回间隔(毫秒)
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setWindowTitle("矩阵编辑")
+        self.setWindowIcon(QIcon('icon.ico'))
+        self.resize(1100, 600)
+        self.manager = parent
+        self.store = parent.store
+        self.model = None
+        self.queue = None
+        self.loaded = None   # 当前显示的 (月份, 部门)
+
+        layout = QVBoxLayout(self)
+        top_layout = QHBoxLayout()
+        self.month_edit = QDateEdit(QDate(parent.current_date.year(), parent.current_date.month(), 1))
+        self.month_edit.setDisplayFormat("yyyy-MM")
+        top_layout.addWidget(QLabel("月份:"))
+        top_layout.addWidget(self.month_edit)
+        self.dept_combo = QComboBox()
+        try:
+            self.dept_combo.addItems(self.store.get_departments())
+            self.codes = ShiftCodes(self.store.get_shift_labels())
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法加载部门和班次:\n{str(e)}")
+            self.codes = ShiftCodes([])
+        if ScheduleDialog.last_department:
+            self.dept_combo.setCurrentText(ScheduleDialog.last_department)
+        top_layout.addWidget(QLabel("部门:"))
+        top_layout.addWidget(self.dept_combo)
+        add_btn = QPushButton("添加员工")
+        add_btn.clicked.connect(self.add_employee)
+        top_layout.addWidget(add_btn)
+        reload_btn = QPushButton("重新加载")
+        reload_btn.clicked.connect(self.load_matrix)
+        top_layout.addWidget(reload_btn)
+        top_layout.addStretch()
+        self.pending_label = QLabel()
+        top_layout.addWidget(self.pending_label)
+        save_btn = QPushButton("立即保存")
+        save_btn.clicked.connect(self.flush_pending)
+        top_layout.addWidget(save_btn)
+        layout.addLayout(top_layout)
+
+        layout.addWidget(QLabel(
+            f"输入班次代码 {self.codes.legend()}（也可输入班次名或首字），回车后移到下一天；"
+            "Delete 清除，Ctrl+R/Ctrl+D 向右/向下填充，Ctrl+C/Ctrl+V 复制粘贴"
+        ))
+        self.table = ShiftMatrixView()
+        self.table.setSelectionMode(QTableView.ExtendedSelection)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.horizontalHeader().setMinimumSectionSize(36)
+        layout.addWidget(self.table)
+
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setInterval(self.FLUSH_INTERVAL)
+        self.flush_timer.timeout.connect(self.flush_pending)
+        self.flush_timer.start()
+
+        self.load_matrix()
+        self.month_edit.dateChanged.connect(self.load_matrix)
+        self.dept_combo.currentIndexChanged.connect(self.load_matrix)
+
+    def load_matrix(self):
+        """切换月份/部门或重新加载前先提交待保存的修改"""
+        if not self.confirm_flush():
+            self.restore_selection()
+            return
+        month = self.month_edit.date()
+        department = self.dept_combo.currentText()
+        try:
+            matrix = ShiftMatrix.load(self.store, month.year(), month.month(), department)
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法加载排班数据:\n{str(e)}")
+            self.restore_selection()
+            return
+        self.loaded = (month, department)
+        self.queue = CellWriteQueue(self.store, department)
+        self.model = ShiftMatrixModel(matrix, self.queue, self.codes, self.table)
+        self.model.pendingChanged.connect(self.update_pending_label)
+        self.model.invalidInput.connect(self.pending_label.setText)
+        self.table.setModel(self.model)
+        self.update_pending_label(0)
+
+    def restore_selection(self):
+        """未切换时把月份和部门恢复为当前显示的矩阵，避免之后的修改看起来属于别的月份或部门"""
+        if self.loaded is None:
+            return
+        month, department = self.loaded
+        for widget in (self.month_edit, self.dept_combo):
+            widget.blockSignals(True)
+        self.month_edit.setDate(month)
+        self.dept_combo.setCurrentText(department)
+        for widget in (self.month_edit, self.dept_combo):
+            widget.blockSignals(False)
+
+    def add_employee(self):
+        name, ok = QInputDialog.getText(self, "添加员工", "员工姓名:")
+        name = name.strip()
+        if ok and name and self.model is not None:
+            row = self.model.add_employee(name)
+            self.table.setCurrentIndex(self.model.index(row, 0))
+
+    def update_pending_label(self, count):
+        if count:
+            self.pending_label.setText(f"● 待保存 {count} 个单元格")
+            self.pending_label.setStyleSheet("color: #d08000;")
+        else:
+            self.pending_label.setText("全部已保存")
+            self.pending_label.setStyleSheet("color: #2e7d32;")
+
+    def flush_pending(self):
+        """提交写回队列，返回是否成功（失败时修改保留在队列中，下次定时重试）"""
+        if self.queue is None or not len(self.queue):
+            return True
+        try:
+            added, updated, deleted = self.queue.flush()
+        except Error as e:
+            self.pending_label.setText(f"● 保存失败，将自动重试: {str(e)}")
+            self.pending_label.setStyleSheet("color: #c62828;")
+            return False
+        self.model.saved()
+        self.manager.refresh_changes()
+        if not len(self.queue):
+            self.pending_label.setText(f"全部已保存（添加 {added}，修改 {updated}，删除 {deleted}）")
+        return True
+
+    def confirm_flush(self):
+        """提交待保存的修改；失败时询问是否放弃"""
+        if self.flush_pending():
+            return True
+        reply = QMessageBox.question(
+            self, "保存失败",
+            f"有 {len(self.queue)} 个单元格的修改无法保存，是否放弃这些修改?",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        return reply == QMessageBox.Yes
+
+    def reject(self):
+        if self.confirm_flush():
+            self.flush_timer.stop()
+            super().reject()
+
+
+class TimelineDialog(QDialog):
+    """按小时显示某天或某周的时间轴，查看班次在一天内的重叠情况"""
+    HOUR_WIDTHS = {"日": 60, "周": 16}   # 默认缩放（每小时像素）
+
+    def __init__(self, parent, start_date=None):
+        super().__init__(parent)
+        self.setWindowTitle("时间轴")
+        self.setWindowIcon(QIcon('icon.ico'))
+        self.resize(1100, 650)
+        self.manager = parent
+        self.store = parent.store
+
+        layout = QVBoxLayout(self)
+        top_layout = QHBoxLayout()
+        prev_btn = QPushButton("<")
+        prev_btn.clicked.connect(lambda: self.step(-1))
+        top_layout.addWidget(prev_btn)
+        self.date_edit = QDateEdit(start_date or QDate.currentDate())
+        self.date_edit.setDisplayFormat("yyyy-MM-dd")
+        self.date_edit.setCalendarPopup(True)
+        top_layout.addWidget(self.date_edit)
+        next_btn = QPushButton(">")
+        next_btn.clicked.connect(lambda: self.step(1))
+        top_layout.addWidget(next_btn)
+        today_btn = QPushButton("今天")
+        today_btn.clicked.connect(lambda: self.date_edit.setDate(QDate.currentDate()))
+        top_layout.addWidget(today_btn)
+        self.mode_combo = QComboBox()
+        self.mode_combo.addItems(list(self.HOUR_WIDTHS))
+        top_layout.addWidget(QLabel("范围:"))
+        top_layout.addWidget(self.mode_combo)
+        self.dept_combo = QComboBox()
+        self.dept_combo.addItem("全部部门", "")
+        try:
+            for department in self.store.get_departments():
+                self.dept_combo.addItem(department, department)
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法加载部门:\n{str(e)}")
+        top_layout.addWidget(QLabel("部门:"))
+        top_layout.addWidget(self.dept_combo)
+        refresh_btn = QPushButton("刷新")
+        refresh_btn.clicked.connect(self.load_timeline)
+        top_layout.addWidget(refresh_btn)
+        top_layout.addStretch()
+        self.info_label = QLabel()
+        top_layout.addWidget(self.info_label)
+        layout.addLayout(top_layout)
+
+        self.view = TimelineView(self.brush_for)
+        self.view.availability = parent.availability_index()
+        self.view.recordActivated.connect(self.edit_record)
+        layout.addWidget(self.view)
+        layout.addWidget(QLabel("Ctrl+滚轮缩放，双击班次编辑；虚线框为没有时间段的班次，红色斜线为请假/不可用时段"))
+
+        self.load_timeline()
+        self.date_edit.dateChanged.connect(self.load_timeline)
+        self.mode_combo.currentIndexChanged.connect(self.load_timeline)
+        self.dept_combo.currentIndexChanged.connect(self.load_timeline)
+
+    def range_start(self):
+        """日模式为所选日期，周模式为所在周的周一"""
+        day = self.date_edit.date().toPyDate()
+        if self.mode_combo.currentText() == "周":
+            day -= timedelta(days=day.weekday())
+        return day
+
+    def step(self, direction):
+        self.date_edit.setDate(self.date_edit.date().addDays(direction * (7 if self.mode_combo.currentText() == "周" else 1)))
+
+    def load_timeline(self):
+        mode = self.mode_combo.currentText()
+        try:
+            data = TimelineData(self.store, self.range_start(), 7 if mode == "周" else 1, self.dept_combo.currentData())
+            missing = [name for name in data.employees if name not in self.manager.employee_colors]
+            if missing:
+                self.manager.employee_colors.update(self.store.employee_colors(len(self.manager.COLOR_LIST), missing))
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法加载时间轴:\n{str(e)}")
+            return
+        self.view.set_data(data, self.HOUR_WIDTHS[mode])
+        # 日视图从早上6点开始显示，周视图从周一零点开始
+        self.view.horizontalScrollBar().setValue(int(6 * 60 * self.view.minute_width) if mode == "日" else 0)
+        self.info_label.setText(f"共 {len(data.employees)} 名员工")
+
+    def brush_for(self, name):
+        return self.manager.color_brushes[self.manager.employee_colors.get(name, 0)]
+
+    def edit_record(self, record_id):
+        self.manager.edit_calendar_record(record_id)
+        self.view.data.invalidate()
+        self.view.viewport().update()
+
+
+class TemplateDialog(QDialog):
+    """排班模板：把来源范围的排班平移复制到目标范围，或保存为命名模板以后重复使用"""
+
+    def __init__(self, parent, target_date=None):
+        super().__init__(parent)
+        self.setWindowTitle("排班模板")
+        self.setWindowIcon(QIcon('icon.ico'))
+        self.resize(460, 560)
+        self.manager = parent
+        self.store = parent.store
+
+        layout = QFormLayout(self)
+
+        # 来源默认为当前月份第一天所在的一周
+        first = QDate(parent.current_date.year(), parent.current_date.month(), 1)
+        source_start = first.addDays(1 - first.dayOfWeek())
+        self.source_start = QDateEdit(source_start)
+        self.source_start.setCalendarPopup(True)
+        layout.addRow("来源开始日期:", self.source_start)
+        self.source_end = QDateEdit(source_start.addDays(6))
+        self.source_end.setCalendarPopup(True)
+        layout.addRow("来源结束日期:", self.source_end)
+
+        self.department = QComboBox()
+        self.department.addItem("全部部门", "")
+        try:
+            for dept in self.store.get_used_departments():
+                self.department.addItem(dept, dept)
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法加载部门列表:\n{str(e)}")
+        layout.addRow("部门:", self.department)
+        self.employees = QLineEdit()
+        self.employees.setPlaceholderText("留空为全部员工，多个姓名用逗号或空格分隔")
+        layout.addRow("员工:", self.employees)
+
+        self.target_start = QDateEdit(target_date or source_start.addDays(7))
+        self.target_start.setCalendarPopup(True)
+        layout.addRow("目标开始日期:", self.target_start)
+        self.target_end = QDateEdit()
+        self.target_end.setCalendarPopup(True)
+        layout.addRow("目标结束日期:", self.target_end)
+        self.update_target_end()
+        for edit in (self.source_start, self.source_end, self.target_start):
+            edit.dateChanged.connect(self.update_target_end)
+        self.replace_check = QCheckBox("先清除目标范围内（同部门/员工）的排班")
+        layout.addRow("", self.replace_check)
+
+        copy_layout = QHBoxLayout()
+        copy_btn = QPushButton("复制到目标范围")
+        copy_btn.clicked.connect(self.copy_range)
+        copy_layout.addWidget(copy_btn)
+        save_btn = QPushButton("保存为模板...")
+        save_btn.clicked.connect(self.save_template)
+        copy_layout.addWidget(save_btn)
+        layout.addRow(copy_layout)
+
+        # 已保存的模板
+        self.template_list = QListWidget()
+        layout.addRow("已保存的模板:", self.template_list)
+        template_layout = QHBoxLayout()
+        apply_btn = QPushButton("应用到目标范围")
+        apply_btn.clicked.connect(self.apply_template)
+        template_layout.addWidget(apply_btn)
+        delete_btn = QPushButton("删除模板")
+        delete_btn.clicked.connect(self.delete_template)
+        template_layout.addWidget(delete_btn)
+        layout.addRow(template_layout)
+        self.load_templates()
+
+        close_box = QDialogButtonBox(QDialogButtonBox.Close)
+        close_box.button(QDialogButtonBox.Close).setText("关闭")
+        close_box.rejected.connect(self.reject)
+        layout.addRow(close_box)
+
+    def update_target_end(self):
+        """目标结束日期默认与来源范围等长；改长后按来源周期重复"""
+        period = self.source_start.date().daysTo(self.source_end.date())
+        self.target_end.setDate(self.target_start.date().addDays(max(0, period)))
+
+    def selected_employees(self):
+        return self.employees.text().replace("，", ",").replace(",", " ").split()
+
+    def load_templates(self):
+        self.template_list.clear()
+        try:
+            for name, period_days, row_count, _ in self.store.list_templates():
+                item = QListWidgetItem(f"{name}（{period_days}天，{row_count}条）")
+                item.setData(Qt.UserRole, name)
+                self.template_list.addItem(item)
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法加载模板列表:\n{str(e)}")
+
+    def selected_template(self):
+        item = self.template_list.currentItem()
+        if item is None:
+            QMessageBox.warning(self, "警告", "请先选择一个模板")
+            return None
+        return item.data(Qt.UserRole)
+
+    def finish_write(self, added, action):
+        self.manager.refresh_view()
+        self.manager.statusBar().showMessage(f"{action}：添加 {added} 条排班")
+
+    def copy_range(self):
+        try:
+            added = self.store.copy_schedules(
+                self.source_start.date().toString("yyyy-MM-dd"), self.source_end.date().toString("yyyy-MM-dd"),
+                self.target_start.date().toString("yyyy-MM-dd"), self.target_end.date().toString("yyyy-MM-dd"),
+                self.department.currentData(), self.selected_employees(), self.replace_check.isChecked()
+            )
+        except ValueError as e:
+            QMessageBox.warning(self, "警告", str(e))
+            return
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法复制排班:\n{str(e)}")
+            return
+        self.finish_write(added, "复制排班")
+
+    def save_template(self):
+        name, ok = QInputDialog.getText(self, "保存为模板", "模板名称:")
+        name = name.strip()
+        if not ok or not name:
+            return
+        try:
+            row_count = self.store.save_template(
+                name, self.source_start.date().toString("yyyy-MM-dd"), self.source_end.date().toString("yyyy-MM-dd"),
+                self.department.currentData(), self.selected_employees()
+            )
+        except ValueError as e:
+            QMessageBox.warning(self, "警告", str(e))
+            return
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法保存模板:\n{str(e)}")
+            return
+        self.load_templates()
+        self.manager.statusBar().showMessage(f"模板 {name} 已保存（{row_count} 条排班）")
+
+    def apply_template(self):
+        name = self.selected_template()
+        if name is None:
+            return
+        try:
+            added = self.store.apply_template(
+                name, self.target_start.date().toString("yyyy-MM-dd"), self.target_end.date().toString("yyyy-MM-dd"),
+                self.replace_check.isChecked()
+            )
+        except (KeyError, ValueError) as e:
+            QMessageBox.warning(self, "警告", f"无法应用模板: {str(e)}")
+            self.load_templates()
+            return
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法应用模板:\n{str(e)}")
+            return
+        self.finish_write(added, f"应用模板 {name}")
+
+    def delete_template(self):
+        name = self.selected_template()
+        if name is None:
+            return
+        reply = QMessageBox.question(
+            self, "确认删除",
+            f"确定要删除模板 {name} 吗?",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
+        try:
+            self.store.delete_template(name)
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法删除模板:\n{str(e)}")
+            return
+        self.load_templates()
+
+
+class AvailabilityDialog(QDialog):
+    """请假、不可用和偏好时段：按员工和日期范围查看，整天或指定时间段添加"""
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setWindowTitle("请假/可用性")
+        self.setWindowIcon(QIcon('icon.ico'))
+        self.resize(760, 560)
+        self.manager = parent
+        self.store = parent.store
+
+        layout = QVBoxLayout(self)
+        filter_layout = QHBoxLayout()
+        first = QDate(parent.current_date.year(), parent.current_date.month(), 1)
+        self.filter_name = QLineEdit()
+        self.filter_name.setPlaceholderText("全部员工")
+        self.filter_start = QDateEdit(first)
+        self.filter_start.setCalendarPopup(True)
+        self.filter_end = QDateEdit(first.addDays(first.daysInMonth() - 1))
+        self.filter_end.setCalendarPopup(True)
+        filter_layout.addWidget(QLabel("员工:"))
+        filter_layout.addWidget(self.filter_name)
+        filter_layout.addWidget(QLabel("日期:"))
+        filter_layout.addWidget(self.filter_start)
+        filter_layout.addWidget(QLabel("至"))
+        filter_layout.addWidget(self.filter_end)
+        search_btn = QPushButton("查询")
+        search_btn.clicked.connect(self.load_entries)
+        filter_layout.addWidget(search_btn)
+        layout.addLayout(filter_layout)
+
+        self.entry_table = QTableWidget()
+        self.entry_table.setColumnCount(5)
+        self.entry_table.setHorizontalHeaderLabels(["员工", "类型", "开始", "结束", "说明"])
+        self.entry_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.entry_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.entry_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(self.entry_table)
+
+        form = QFormLayout()
+        self.employee = QComboBox()
+        self.employee.setEditable(True)
+        try:
+            self.employee.addItems(self.store.get_employee_names())
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法加载员工列表:\n{str(e)}")
+        self.employee.setCurrentText("")
+        form.addRow("员工:", self.employee)
+        self.kind = QComboBox()
+        self.kind.addItems(KINDS)
+        form.addRow("类型:", self.kind)
+        self.all_day = QCheckBox("整天")
+        self.all_day.setChecked(True)
+        form.addRow("", self.all_day)
+        self.start_at = QDateTimeEdit(QDateTime(first, QTime(0, 0)))
+        self.end_at = QDateTimeEdit(QDateTime(first, QTime(23, 59)))
+        for edit in (self.start_at, self.end_at):
+            edit.setCalendarPopup(True)
+        self.all_day.toggled.connect(self.update_time_format)
+        self.update_time_format(True)
+        form.addRow("开始:", self.start_at)
+        form.addRow("结束:", self.end_at)
+        self.note = QLineEdit()
+        form.addRow("说明:", self.note)
+        layout.addLayout(form)
+
+        button_layout = QHBoxLayout()
+        add_btn = QPushButton("添加")
+        add_btn.clicked.connect(self.add_entry)
+        button_layout.addWidget(add_btn)
+        delete_btn = QPushButton("删除所选")
+        delete_btn.clicked.connect(self.delete_entries)
+        button_layout.addWidget(delete_btn)
+        button_layout.addStretch()
+        close_btn = QPushButton("关闭")
+        close_btn.clicked.connect(self.accept)
+        button_layout.addWidget(close_btn)
+        layout.addLayout(button_layout)
+
+        self.load_entries()
+
+    def update_time_format(self, all_day):
+        """整天时只选日期，结束日期包含在内"""
+        for edit in (self.start_at, self.end_at):
+            edit.setDisplayFormat("yyyy-MM-dd" if all_day else "yyyy-MM-dd HH:mm")
+
+    def load_entries(self):
+        start = self.filter_start.date().toString("yyyy-MM-dd")
+        end = self.filter_end.date().addDays(1).toString("yyyy-MM-dd")
+        try:
+            entries = self.store.list_availability(f"{start} 00:00", f"{end} 00:00", self.filter_name.text().strip())
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法加载请假数据:\n{str(e)}")
+            return
+        self.entry_table.setRowCount(len(entries))
+        for row, (entry_id, name, kind, start_at, end_at, note) in enumerate(entries):
+            for col, value in enumerate((name, kind, start_at, end_at, note)):
+                item = QTableWidgetItem(value)
+                item.setData(Qt.UserRole, entry_id)
+                if kind != KINDS[-1]:
+                    item.setForeground(QColor(198, 40, 40))
+                self.entry_table.setItem(row, col, item)
+
+    def add_entry(self):
+        name = self.employee.currentText().strip()
+        if not name:
+            QMessageBox.warning(self, "警告", "请输入员工姓名")
+            return
+        if self.all_day.isChecked():
+            start_at = self.start_at.date().toString("yyyy-MM-dd") + " 00:00"
+            end_at = self.end_at.date().addDays(1).toString("yyyy-MM-dd") + " 00:00"
+        else:
+            start_at = self.start_at.dateTime().toString("yyyy-MM-dd HH:mm")
+            end_at = self.end_at.dateTime().toString("yyyy-MM-dd HH:mm")
+        if end_at <= start_at:
+            QMessageBox.warning(self, "警告", "结束时间必须晚于开始时间")
+            return
+        try:
+            self.store.add_availability(name, self.kind.currentText(), start_at, end_at, self.note.text().strip())
+            index = self.manager.availability_index()
+            conflicts = []
+            if index is not None and self.kind.currentText() != KINDS[-1]:
+                # 提示该时段内已有的排班
+                rows = [row[1:] for row in self.store.list_schedules(start_at[:10], end_at[:10], name) if row[1] == name]
+                conflicts = [row for row, _ in index.conflicts(rows)]
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法添加请假:\n{str(e)}")
+            return
+        self.note.clear()
+        self.load_entries()
+        if conflicts:
+            QMessageBox.warning(self, "已有排班", f"{name} 在该时段内已有 {len(conflicts)} 条排班:\n" +
+                                "\n".join(f"{row[3]} {row[4]}" for row in conflicts[:10]))
+
+    def delete_entries(self):
+        entry_ids = {self.entry_table.item(index.row(), 0).data(Qt.UserRole)
+                     for index in self.entry_table.selectionModel().selectedRows()}
+        if not entry_ids:
+            return
+        try:
+            for entry_id in entry_ids:
+                self.store.delete_availability(entry_id)
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法删除请假:\n{str(e)}")
+        self.load_entries()
+
+
+class ReminderDialog(QDialog):
+    """班次提醒设置：是否开启、提前分钟数、只提醒某部门；下方预览接下来24小时的提醒"""
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setWindowTitle("班次提醒")
+        self.setWindowIcon(QIcon('icon.ico'))
+        self.resize(620, 480)
+        self.store = parent.store
+        state = parent.view_state
+
+        layout = QVBoxLayout(self)
+        form = QFormLayout()
+        self.enabled = QCheckBox("在班次开始前提醒")
+        self.enabled.setChecked(state.get("reminders", "on") == "on")
+        form.addRow("", self.enabled)
+        self.lead = QSpinBox()
+        self.lead.setRange(0, 24 * 60)
+        self.lead.setSuffix(" 分钟")
+        self.lead.setValue(parent.reminders.lead_minutes if parent.reminders else parent.REMINDER_LEAD)
+        form.addRow("提前:", self.lead)
+        self.department = QComboBox()
+        self.department.addItem("全部部门", "")
+        try:
+            for department in self.store.get_departments():
+                self.department.addItem(department, department)
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法加载部门:\n{str(e)}")
+        index = self.department.findData(state.get("reminder_department", ""))
+        self.department.setCurrentIndex(max(0, index))
+        form.addRow("部门:", self.department)
+        layout.addLayout(form)
+
+        self.summary = QLabel()
+        layout.addWidget(self.summary)
+        self.upcoming_table = QTableWidget()
+        self.upcoming_table.setColumnCount(5)
+        self.upcoming_table.setHorizontalHeaderLabels(["提醒时间", "开始时间", "员工", "部门", "班次"])
+        self.upcoming_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.upcoming_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(self.upcoming_table)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        button_box.button(QDialogButtonBox.Ok).setText("保存")
+        button_box.button(QDialogButtonBox.Cancel).setText("取消")
+        button_box.accepted.connect(self.accept)
+        button_box.rejected.connect(self.reject)
+        layout.addWidget(button_box)
+
+        self.lead.valueChanged.connect(self.load_upcoming)
+        self.department.currentIndexChanged.connect(self.load_upcoming)
+        self.load_upcoming()
+
+    def load_upcoming(self):
+        """按对话框中的设置预览接下来24小时的提醒"""
+        try:
+            queue = ReminderQueue(self.store, self.lead.value(), self.department.currentData() or "")
+            queue.reload()
+            reminders = queue.upcoming(24)
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法加载班次提醒:\n{str(e)}")
+            return
+        self.summary.setText(f"接下来24小时内 {len(reminders)} 个班次")
+        self.upcoming_table.setRowCount(len(reminders))
+        for row, reminder in enumerate(reminders):
+            values = (minute_text(reminder.fire)[5:], minute_text(reminder.start)[5:],
+                      reminder.employee_name, reminder.department, reminder.shift_type)
+            for col, value in enumerate(values):
+                self.upcoming_table.setItem(row, col, QTableWidgetItem(value))
+
+
+class SyncDialog(QDialog):
+    """离线同步：导出本库的变更集，导入其他电脑的变更集（先预览冲突，再确认写入）"""
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setWindowTitle("离线同步")
+        self.setWindowIcon(QIcon('icon.ico'))
+        self.resize(720, 520)
+        self.manager = parent
+        self.store = parent.store
+        self.changeset = None
+        self.imported = False
+
+        layout = QVBoxLayout(self)
+        self.site_label = QLabel()
+        layout.addWidget(self.site_label)
+        self.peer_table = QTableWidget()
+        self.peer_table.setColumnCount(4)
+        self.peer_table.setHorizontalHeaderLabels(["对方站点", "已导入对方的计数", "对方已确认的计数", "上次导入"])
+        self.peer_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.peer_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.peer_table.setMaximumHeight(120)
+        layout.addWidget(self.peer_table)
+
+        button_layout = QHBoxLayout()
+        export_btn = QPushButton("导出变更...")
+        export_btn.clicked.connect(self.export_changes)
+        button_layout.addWidget(export_btn)
+        import_btn = QPushButton("导入变更...")
+        import_btn.clicked.connect(self.open_changeset)
+        button_layout.addWidget(import_btn)
+        button_layout.addStretch()
+        layout.addLayout(button_layout)
+
+        self.preview_label = QLabel("导入前先预览：列出双方都修改过的排班（冲突）")
+        self.preview_label.setWordWrap(True)
+        layout.addWidget(self.preview_label)
+        self.conflict_table = QTableWidget()
+        self.conflict_table.setColumnCount(4)
+        self.conflict_table.setHorizontalHeaderLabels(["日期", "员工", "本地", "对方"])
+        self.conflict_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.conflict_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(self.conflict_table)
+
+        apply_layout = QHBoxLayout()
+        self.take_theirs = QCheckBox("冲突时使用对方的修改（默认保留本地）")
+        self.take_theirs.toggled.connect(self.preview)
+        apply_layout.addWidget(self.take_theirs)
+        apply_layout.addStretch()
+        self.apply_btn = QPushButton("导入")
+        self.apply_btn.setEnabled(False)
+        self.apply_btn.clicked.connect(self.apply_changeset)
+        apply_layout.addWidget(self.apply_btn)
+        close_btn = QPushButton("关闭")
+        close_btn.clicked.connect(self.accept)
+        apply_layout.addWidget(close_btn)
+        layout.addLayout(apply_layout)
+
+        self.load_status()
+
+    def load_status(self):
+        try:
+            site_id = self.store.sync_site()
+            counter = self.store.change_counter()
+            peers = self.store.list_sync_peers()
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法读取同步状态:\n{str(e)}")
+            return
+        self.site_label.setText(f"本库站点ID: {site_id}    变更计数: {counter}")
+        self.peer_table.setRowCount(len(peers))
+        for row, values in enumerate(peers):
+            for col, value in enumerate(values):
+                self.peer_table.setItem(row, col, QTableWidgetItem(str(value or "")))
+
+    def export_changes(self):
+        default_name = f"{self.manager.current_user}_{datetime.now().strftime('%Y%m%d_%H%M')}{SYNC_FILE_SUFFIX}"
+        path, _ = QFileDialog.getSaveFileName(self, "导出变更", default_name, f"变更集 (*{SYNC_FILE_SUFFIX})")
+        if not path:
+            return
+        try:
+            changeset = self.store.export_changes()
+            size = write_changeset(path, changeset)
+        except (OSError, Error) as e:
+            QMessageBox.critical(self, "导出失败", f"无法导出变更:\n{str(e)}")
+            return
+        QMessageBox.information(self, "导出完成",
+                                f"{describe_changeset(changeset)}\n\n已写入 {path}（{size / 1024:.1f} KB）")
+
+    def open_changeset(self):
+        path, _ = QFileDialog.getOpenFileName(self, "导入变更", "", f"变更集 (*{SYNC_FILE_SUFFIX});;所有文件 (*)")
+        if not path:
+            return
+        try:
+            self.changeset = read_changeset(path)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "导入失败", str(e))
+            self.changeset = None
+        self.preview()
+
+    def preview(self):
+        """按当前选项比较变更集，不写入"""
+        self.conflict_table.setRowCount(0)
+        self.apply_btn.setEnabled(False)
+        if self.changeset is None:
+            return
+        try:
+            result = self.store.apply_changes(self.changeset, self.take_theirs.isChecked(), dry_run=True)
+        except (ValueError, Error) as e:
+            QMessageBox.critical(self, "导入失败", str(e))
+            return
+        text = f"{describe_changeset(self.changeset)}\n将导入: {result.summary()}"
+        if result.gap:
+            text += "\n注意: 对方这次导出的起点晚于上次导入的位置，中间的变更可能缺失"
+        self.preview_label.setText(text)
+        self.conflict_table.setRowCount(len(result.conflicts))
+        for row, conflict in enumerate(result.conflicts):
+            record = conflict.local or conflict.incoming
+            values = (record[3], f"{record[0]}（{record[1]}）",
+                      "已删除" if conflict.local is None else f"{conflict.local[4]} {conflict.local[5] or ''}".strip(),
+                      "已删除" if conflict.incoming is None else f"{conflict.incoming[4]} {conflict.incoming[5] or ''}".strip())
+            for col, value in enumerate(values):
+                self.conflict_table.setItem(row, col, QTableWidgetItem(value))
+        self.apply_btn.setEnabled(True)
+
+    def apply_changeset(self):
+        try:
+            result = self.store.apply_changes(self.changeset, self.take_theirs.isChecked())
+        except (ValueError, Error) as e:
+            QMessageBox.critical(self, "导入失败", f"无法导入变更:\n{str(e)}")
+            return
+        self.changeset = None
+        self.imported = True
+        self.apply_btn.setEnabled(False)
+        self.conflict_table.setRowCount(0)
+        self.preview_label.setText(f"已导入: {result.summary()}（可以撤销）")
+        self.load_status()
+
+
+class DiffDialog(QDialog):
+    """比较本库和另一个数据库（备份或其他用户的库），勾选不同之处合并到本库"""
+    MAX_ROWS = 5000   # 表格中最多显示的格子数
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setWindowTitle("比较数据库")
+        self.setWindowIcon(QIcon('icon.ico'))
+        self.resize(900, 600)
+        self.store = parent.store
+        self.other_file = ""
+        self.result = None
+        self.merged = False
+
+        layout = QVBoxLayout(self)
+        file_layout = QHBoxLayout()
+        file_layout.addWidget(QLabel("对方数据库:"))
+        self.file_combo = QComboBox()
+        self.file_combo.setMinimumWidth(360)
+        # 本用户的备份（最新的在前）和其他没有密码的用户
+        name = os.path.splitext(os.path.basename(parent.user_db_file))[0]
+        if os.path.isdir("backups"):
+            for file_name in sorted(os.listdir("backups"), reverse=True):
+                if file_name.startswith(name + "_") and file_name.endswith(".db"):
+                    self.file_combo.addItem(f"备份 {file_name}", os.path.join("backups", file_name))
+        try:
+            for username, db_file, has_password in UserManager.list_user_files():
+                if username != parent.current_user and not has_password and os.path.exists(db_file):
+                    self.file_combo.addItem(f"用户 {username}", db_file)
+        except Error as e:
+            print(f"[DEBUG] 读取用户列表失败: {str(e)}")
+        file_layout.addWidget(self.file_combo)
+        browse_btn = QPushButton("浏览...")
+        browse_btn.clicked.connect(self.browse)
+        file_layout.addWidget(browse_btn)
+        compare_btn = QPushButton("比较")
+        compare_btn.clicked.connect(lambda: self.compare(self.file_combo.currentData()))
+        file_layout.addWidget(compare_btn)
+        layout.addLayout(file_layout)
+
+        self.summary_label = QLabel("按天比较内容哈希，只逐格比较哈希不同的日期；合并时把勾选的格子改为对方的内容")
+        self.summary_label.setWordWrap(True)
+        layout.addWidget(self.summary_label)
+
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("显示:"))
+        self.kind_combo = QComboBox()
+        self.kind_combo.addItem("全部", "")
+        for kind in DIFF_KINDS:
+            self.kind_combo.addItem(kind, kind)
+        self.kind_combo.currentIndexChanged.connect(self.populate)
+        filter_layout.addWidget(self.kind_combo)
+        filter_layout.addStretch()
+        for text, state in (("全选", Qt.Checked), ("全不选", Qt.Unchecked)):
+            button = QPushButton(text)
+            button.clicked.connect(lambda _, state=state: self.set_all_checked(state))
+            filter_layout.addWidget(button)
+        layout.addLayout(filter_layout)
+
+        self.table = QTableWidget()
+        self.table.setColumnCount(5)
+        self.table.setHorizontalHeaderLabels(["日期", "员工", "类型", "本库", "对方"])
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(self.table)
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        self.merge_btn = QPushButton("合并勾选的格子")
+        self.merge_btn.setEnabled(False)
+        self.merge_btn.clicked.connect(self.merge)
+        button_layout.addWidget(self.merge_btn)
+        close_btn = QPushButton("关闭")
+        close_btn.clicked.connect(self.accept)
+        button_layout.addWidget(close_btn)
+        layout.addLayout(button_layout)
+
+    def browse(self):
+        path, _ = QFileDialog.getOpenFileName(self, "选择要比较的数据库", "backups" if os.path.isdir("backups") else "",
+                                              "数据库 (*.db);;所有文件 (*)")
+        if path:
+            self.compare(path)
+
+    def compare(self, path):
+        if not path:
+            return
+        if os.path.exists(path) and os.path.samefile(path, self.store.db_file):
+            QMessageBox.warning(self, "警告", "不能和本数据库自身比较")
+            return
+        other = None
+        try:
+            other = ScheduleStore(path, read_only=True)
+            # 第一次比较或变更日志已裁剪时需要计算每天的哈希，大库可能需要十几秒
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+            try:
+                self.result = diff_databases(self.store, other)
+            finally:
+                QApplication.restoreOverrideCursor()
+        except Error as e:
+            QMessageBox.critical(self, "比较失败", f"无法读取数据库 {path}:\n{str(e)}")
+            return
+        finally:
+            if other is not None:
+                other.close()
+        self.other_file = path
+        self.summary_label.setText(f"{os.path.basename(path)}: {self.result.summary()}")
+        self.populate()
+
+    def populate(self):
+        self.table.setRowCount(0)
+        if self.result is None:
+            return
+        kind = self.kind_combo.currentData()
+        entries = [entry for entry in self.result.entries if not kind or entry.kind == kind]
+        if len(entries) > self.MAX_ROWS:
+            self.summary_label.setText(f"{os.path.basename(self.other_file)}: {self.result.summary()}\n"
+                                       f"只显示前 {self.MAX_ROWS} 处，合并其余的格子请使用命令行 diff --merge")
+            entries = entries[:self.MAX_ROWS]
+        self.table.setRowCount(len(entries))
+        for row, entry in enumerate(entries):
+            values = (entry.work_date, entry.employee_name, entry.kind,
+                      DiffEntry.cell_text(entry.local), DiffEntry.cell_text(entry.other))
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if col == 0:
+                    item.setData(Qt.UserRole, entry)
+                    item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+                    item.setCheckState(Qt.Unchecked)
+                self.table.setItem(row, col, item)
+        self.merge_btn.setEnabled(bool(entries))
+
+    def set_all_checked(self, state):
+        for row in range(self.table.rowCount()):
+            self.table.item(row, 0).setCheckState(state)
+
+    def merge(self):
+        entries = [self.table.item(row, 0).data(Qt.UserRole) for row in range(self.table.rowCount())
+                   if self.table.item(row, 0).checkState() == Qt.Checked]
+        if not entries:
+            QMessageBox.information(self, "提示", "请先勾选要合并的格子")
+            return
+        try:
+            added, updated, deleted, skipped = self.store.merge_cells(
+                entries, f"合并 {os.path.basename(self.other_file)} 的排班")
+        except ConcurrentEditError as e:
+            QMessageBox.warning(self, "需要重新比较", str(e))
+            return
+        except Error as e:
+            QMessageBox.critical(self, "合并失败", f"无法合并排班:\n{str(e)}")
+            return
+        self.merged = True
+        text = f"已合并 {len(entries) - skipped} 格：添加 {added}，修改 {updated}，删除 {deleted}（可以撤销）"
+        if skipped:
+            text += f"，已归档年份跳过 {skipped} 格"
+        self.compare(self.other_file)
+        self.summary_label.setText(text + "\n" + self.summary_label.text())
+
+
+class StaffingRulesDialog(QDialog):
+    """人数规则管理：某部门（某班次）在指定星期几至少/最多多少人次"""
+    WEEKDAY_NAMES = ("周一", "周二", "周三", "周四", "周五", "周六", "周日")
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setWindowTitle("人数规则")
+        self.setWindowIcon(QIcon('icon.ico'))
+        self.resize(720, 480)
+        self.manager = parent
+        self.store = parent.store
+
+        layout = QVBoxLayout(self)
+        self.rule_table = QTableWidget()
+        self.rule_table.setColumnCount(7)
+        self.rule_table.setHorizontalHeaderLabels(["部门", "班次", "星期", "日期类型", "最少", "最多", "说明"])
+        self.rule_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.rule_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.rule_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(self.rule_table)
+
+        form = QFormLayout()
+        self.department = QComboBox()
+        self.shift_name = QComboBox()
+        self.shift_name.addItem("全部班次", "")
+        try:
+            self.department.addItems(self.store.get_departments())
+            for name, _, _ in self.store.get_shifts():
+                self.shift_name.addItem(name, name)
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法加载部门和班次:\n{str(e)}")
+        # 请假等不在班次表中的名称也可以直接输入
+        self.shift_name.setEditable(True)
+        form.addRow("部门:", self.department)
+        form.addRow("班次:", self.shift_name)
+
+        weekday_layout = QHBoxLayout()
+        self.weekday_checks = []
+        for weekday, label in enumerate(self.WEEKDAY_NAMES):
+            check = QCheckBox(label)
+            check.setChecked(weekday < 5)
+            self.weekday_checks.append(check)
+            weekday_layout.addWidget(check)
+        form.addRow("星期:", weekday_layout)
+        # 按日期维度判断：调休上班日算工作日，法定节假日算休息日
+        self.day_type = QComboBox()
+        self.day_type.addItem("不限", "")
+        for day_type in DAY_TYPES:
+            self.day_type.addItem(day_type, day_type)
+        form.addRow("日期类型:", self.day_type)
+
+        count_layout = QHBoxLayout()
+        self.min_count = QSpinBox()
+        self.max_count = QSpinBox()
+        for spin in (self.min_count, self.max_count):
+            # 最小值 -1 显示为"不限"
+            spin.setRange(-1, 9999)
+            spin.setSpecialValueText("不限")
+            spin.setValue(-1)
+        count_layout.addWidget(QLabel("至少"))
+        count_layout.addWidget(self.min_count)
+        count_layout.addWidget(QLabel("最多"))
+        count_layout.addWidget(self.max_count)
+        count_layout.addWidget(QLabel("人次"))
+        count_layout.addStretch()
+        form.addRow("人数:", count_layout)
+        self.note = QLineEdit()
+        form.addRow("说明:", self.note)
+        layout.addLayout(form)
+
+        button_layout = QHBoxLayout()
+        add_btn = QPushButton("添加规则")
+        add_btn.clicked.connect(self.add_rule)
+        button_layout.addWidget(add_btn)
+        delete_btn = QPushButton("删除所选")
+        delete_btn.clicked.connect(self.delete_rules)
+        button_layout.addWidget(delete_btn)
+        year_btn = QPushButton("检查全年")
+        year_btn.clicked.connect(self.check_year)
+        button_layout.addWidget(year_btn)
+        button_layout.addStretch()
+        close_btn = QPushButton("关闭")
+        close_btn.clicked.connect(self.accept)
+        button_layout.addWidget(close_btn)
+        layout.addLayout(button_layout)
+
+        self.load_rules()
+
+    def load_rules(self):
+        try:
+            rules = self.store.get_staffing_rules()
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法加载人数规则:\n{str(e)}")
+            return
+        self.rule_table.setRowCount(len(rules))
+        for row, (rule_id, department, shift_name, weekdays, min_count, max_count, note, day_type) in enumerate(rules):
+            values = (department, shift_name or "全部班次", weekdays_text(weekdays), day_type or "不限",
+                      "不限" if min_count is None else str(min_count),
+                      "不限" if max_count is None else str(max_count), note)
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                item.setData(Qt.UserRole, rule_id)
+                self.rule_table.setItem(row, col, item)
+
+    def add_rule(self):
+        department = self.department.currentText().strip()
+        weekdays = "".join(str(weekday) for weekday, check in enumerate(self.weekday_checks) if check.isChecked())
+        min_count = self.min_count.value() if self.min_count.value() >= 0 else None
+        max_count = self.max_count.value() if self.max_count.value() >= 0 else None
+        if not department or not weekdays:
+            QMessageBox.warning(self, "警告", "请选择部门和至少一个星期")
+            return
+        if min_count is None and max_count is None:
+            QMessageBox.warning(self, "警告", "请设置最少或最多人次")
+            return
+        if min_count is not None and max_count is not None and min_count > max_count:
+            QMessageBox.warning(self, "警告", "最少人次不能大于最多人次")
+            return
+        shift_name = self.shift_name.currentText().strip()
+        if shift_name == "全部班次":
+            shift_name = ""
+        try:
+            self.store.add_staffing_rule(department, shift_name, weekdays, min_count, max_count, self.note.text().strip(),
+                                         self.day_type.currentData())
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法添加人数规则:\n{str(e)}")
+            return
+        self.note.clear()
+        self.load_rules()
+
+    def delete_rules(self):
+        rule_ids = {self.rule_table.item(index.row(), 0).data(Qt.UserRole)
+                    for index in self.rule_table.selectionModel().selectedRows()}
+        if not rule_ids:
+            return
+        try:
+            for rule_id in rule_ids:
+                self.store.delete_staffing_rule(rule_id)
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法删除人数规则:\n{str(e)}")
+        self.load_rules()
+
+    def check_year(self):
+        """按当前规则检查当前年份的每一天"""
+        year = self.manager.current_date.year()
+        started = time.perf_counter()
+        try:
+            checker = StaffingChecker(self.store)
+            violations = checker.check(f"{year:04d}-01-01", f"{year:04d}-12-31")
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法检查人数规则:\n{str(e)}")
+            return
+        elapsed = (time.perf_counter() - started) * 1000
+        count = sum(len(day_violations) for day_violations in violations.values())
+        QMessageBox.information(self, "检查全年",
+                                f"{year}年 {len(checker.rules)} 条规则：{len(violations)} 天共 {count} 处不满足"
+                                f"（用时 {elapsed:.0f} 毫秒）")
+
+
+class ReportDialog(QDialog):
+    """月度报表参数：月份范围、部门、进程数和输出目录"""
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setWindowTitle("月度报表")
+        self.setWindowIcon(QIcon('icon.ico'))
+        self.resize(420, 420)
+        self.db_file = parent.user_db_file
+
+        layout = QFormLayout(self)
+        month = QDate(parent.current_date.year(), parent.current_date.month(), 1)
+        self.start_month = QDateEdit(month)
+        self.start_month.setDisplayFormat("yyyy-MM")
+        layout.addRow("开始月份:", self.start_month)
+        self.end_month = QDateEdit(month)
+        self.end_month.setDisplayFormat("yyyy-MM")
+        layout.addRow("结束月份:", self.end_month)
+
+        # 部门（默认全选）
+        self.dept_list = QListWidget()
+        try:
+            for dept in parent.store.get_used_departments():
+                item = QListWidgetItem(dept)
+                item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+                item.setCheckState(Qt.Checked)
+                self.dept_list.addItem(item)
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法加载部门列表:\n{str(e)}")
+        layout.addRow("部门:", self.dept_list)
+
+        self.workers = QSpinBox()
+        self.workers.setRange(1, 64)
+        self.workers.setValue(os.cpu_count() or 1)
+        layout.addRow("进程数:", self.workers)
+
+        output_layout = QHBoxLayout()
+        self.output_dir = QLineEdit(os.path.abspath("reports"))
+        output_layout.addWidget(self.output_dir)
+        browse_btn = QPushButton("浏览...")
+        browse_btn.clicked.connect(self.choose_output_dir)
+        output_layout.addWidget(browse_btn)
+        layout.addRow("输出目录:", output_layout)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        button_box.button(QDialogButtonBox.Ok).setText("生成")
+        button_box.button(QDialogButtonBox.Cancel).setText("取消")
+        button_box.accepted.connect(self.validate_and_accept)
+        button_box.rejected.connect(self.reject)
+        layout.addRow(button_box)
+
+    def choose_output_dir(self):
+        path = QFileDialog.getExistingDirectory(self, "选择输出目录", self.output_dir.text())
+        if path:
+            self.output_dir.setText(path)
+
+    def selected_departments(self):
+        return [self.dept_list.item(i).text() for i in range(self.dept_list.count())
+                if self.dept_list.item(i).checkState() == Qt.Checked]
+
+    def validate_and_accept(self):
+        if self.end_month.date() < self.start_month.date():
+            QMessageBox.warning(self, "警告", "结束月份不能早于开始月份")
+            return
+        if not self.selected_departments():
+            QMessageBox.warning(self, "警告", "请至少选择一个部门")
+            return
+        self.accept()
+
+    def make_batch(self):
+        months = month_range(self.start_month.date().toString("yyyy-MM"), self.end_month.date().toString("yyyy-MM"))
+        return ReportBatch(self.db_file, months, self.output_dir.text().strip() or "reports",
+                           self.selected_departments(), self.workers.value())
+
+
+class CalendarExportDialog(QDialog):
+    """导出月历参数：月份范围、部门、格式、线程数和输出位置"""
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setWindowTitle("导出月历")
+        self.setWindowIcon(QIcon('icon.ico'))
+        self.resize(420, 460)
+        self.db_file = parent.user_db_file
+        self.store = parent.store
+        self.palette = parent.COLOR_LIST
+
+        layout = QFormLayout(self)
+        month = QDate(parent.current_date.year(), parent.current_date.month(), 1)
+        self.start_month = QDateEdit(month)
+        self.start_month.setDisplayFormat("yyyy-MM")
+        layout.addRow("开始月份:", self.start_month)
+        self.end_month = QDateEdit(month)
+        self.end_month.setDisplayFormat("yyyy-MM")
+        layout.addRow("结束月份:", self.end_month)
+
+        self.scope = QComboBox()
+        self.scope.addItem("全部部门（每月一页）", False)
+        self.scope.addItem("按部门分页", True)
+        self.scope.currentIndexChanged.connect(self.update_dept_list)
+        layout.addRow("范围:", self.scope)
+
+        self.dept_list = QListWidget()
+        try:
+            for dept in self.store.get_used_departments():
+                item = QListWidgetItem(dept)
+                item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+                item.setCheckState(Qt.Checked)
+                self.dept_list.addItem(item)
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法加载部门列表:\n{str(e)}")
+        layout.addRow("部门:", self.dept_list)
+        self.update_dept_list()
+
+        self.format_combo = QComboBox()
+        self.format_combo.addItem("PDF（一个文件）", "pdf")
+        self.format_combo.addItem("PNG（每页一张图片）", "png")
+        self.format_combo.currentIndexChanged.connect(self.update_output_path)
+        layout.addRow("格式:", self.format_combo)
+
+        self.workers = QSpinBox()
+        self.workers.setRange(1, 64)
+        self.workers.setValue(os.cpu_count() or 1)
+        layout.addRow("绘制线程数:", self.workers)
+
+        output_layout = QHBoxLayout()
+        self.output_path = QLineEdit(os.path.abspath("排班月历.pdf"))
+        output_layout.addWidget(self.output_path)
+        browse_btn = QPushButton("浏览...")
+        browse_btn.clicked.connect(self.choose_output)
+        output_layout.addWidget(browse_btn)
+        layout.addRow("输出:", output_layout)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        button_box.button(QDialogButtonBox.Ok).setText("导出")
+        button_box.button(QDialogButtonBox.Cancel).setText("取消")
+        button_box.accepted.connect(self.validate_and_accept)
+        button_box.rejected.connect(self.reject)
+        layout.addRow(button_box)
+
+    def update_dept_list(self):
+        self.dept_list.setEnabled(self.scope.currentData())
+
+    def update_output_path(self):
+        """切换格式时 PDF 使用文件名，PNG 使用目录"""
+        path = self.output_path.text().strip()
+        if self.format_combo.currentData() == "png" and path.lower().endswith(".pdf"):
+            self.output_path.setText(os.path.splitext(path)[0])
+        elif self.format_combo.currentData() == "pdf" and not path.lower().endswith(".pdf"):
+            self.output_path.setText(path.rstrip("/\\") + ".pdf")
+
+    def choose_output(self):
+        if self.format_combo.currentData() == "png":
+            path = QFileDialog.getExistingDirectory(self, "选择输出目录", self.output_path.text())
+        else:
+            path, _ = QFileDialog.getSaveFileName(self, "导出月历", self.output_path.text(), "PDF文件 (*.pdf)")
+        if path:
+            self.output_path.setText(path)
+
+    def selected_departments(self):
+        if not self.scope.currentData():
+            return []
+        return [self.dept_list.item(i).text() for i in range(self.dept_list.count())
+                if self.dept_list.item(i).checkState() == Qt.Checked]
+
+    def validate_and_accept(self):
+        if self.end_month.date() < self.start_month.date():
+            QMessageBox.warning(self, "警告", "结束月份不能早于开始月份")
+            return
+        if self.scope.currentData() and not self.selected_departments():
+            QMessageBox.warning(self, "警告", "请至少选择一个部门")
+            return
+        if not self.output_path.text().strip():
+            QMessageBox.warning(self, "警告", "请选择输出位置")
+            return
+        self.accept()
+
+    def make_export(self):
+        months = month_range(self.start_month.date().toString("yyyy-MM"), self.end_month.date().toString("yyyy-MM"))
+        # 员工颜色在界面线程中读取（同时为新员工分配），导出线程只使用结果
+        colors = self.store.employee_colors(len(self.palette))
+        return CalendarExport(self.db_file, months, self.output_path.text().strip(),
+                              self.format_combo.currentData(), self.selected_departments(), colors,
+                              self.palette, self.workers.value())
+
+
+class FederatedDialog(QDialog):
+    """汇总查询：同时查看多个用户的排班（只读），结果标明来源用户"""
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setWindowTitle("汇总查询")
+        self.setWindowIcon(QIcon('icon.ico'))
+        self.resize(1000, 650)
+        self.unlocked = {parent.current_user}  # 已验证过密码的用户
+
+        layout = QHBoxLayout(self)
+
+        # 左侧：参与汇总的用户（有密码的用户勾选时需要输入密码）
+        user_layout = QVBoxLayout()
+        layout.addLayout(user_layout)
+        user_layout.addWidget(QLabel("汇总的用户:"))
+        self.user_list = QListWidget()
+        self.user_list.setMaximumWidth(200)
+        for username, db_file, has_password in UserManager.list_user_files():
+            item = QListWidgetItem(f"{username}（有密码）" if has_password else username)
+            item.setData(Qt.UserRole, (username, db_file, has_password))
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked if username == parent.current_user else Qt.Unchecked)
+            self.user_list.addItem(item)
+        self.user_list.itemChanged.connect(self.handle_user_checked)
+        user_layout.addWidget(self.user_list)
+
+        main_layout = QVBoxLayout()
+        layout.addLayout(main_layout)
+
+        # 过滤条件（默认为主窗口当前月份）
+        filter_layout = QHBoxLayout()
+        main_layout.addLayout(filter_layout)
+        month = QDate(parent.current_date.year(), parent.current_date.month(), 1)
+        filter_layout.addWidget(QLabel("日期:"))
+        self.start_date_edit = QDateEdit(month)
+        self.start_date_edit.setCalendarPopup(True)
+        filter_layout.addWidget(self.start_date_edit)
+        filter_layout.addWidget(QLabel("至"))
+        self.end_date_edit = QDateEdit(month.addMonths(1).addDays(-1))
+        self.end_date_edit.setCalendarPopup(True)
+        filter_layout.addWidget(self.end_date_edit)
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("搜索员工姓名或部门...")
+        self.search_input.returnPressed.connect(self.run_query)
+        filter_layout.addWidget(self.search_input)
+        self.dept_filter = QComboBox()
+        self.dept_filter.addItem("所有部门", "")
+        filter_layout.addWidget(self.dept_filter)
+        self.query_btn = QPushButton("查询")
+        # run_query 带计时装饰器，clicked(bool) 的参数会传入，需用 lambda 连接
+        self.query_btn.clicked.connect(lambda: self.run_query())
+        filter_layout.addWidget(self.query_btn)
+
+        # 结果：列表、月历（开始日期所在月份每天的人次）、统计
+        self.tabs = QTabWidget()
+        main_layout.addWidget(self.tabs)
+        self.model = FederatedTableModel(self)
+        self.table_view = QTableView()
+        self.table_view.setModel(self.model)
+        self.table_view.setSelectionBehavior(QTableView.SelectRows)
+        self.table_view.setEditTriggers(QTableView.NoEditTriggers)
+        self.table_view.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.table_view.horizontalHeader().setStretchLastSection(True)
+        self.tabs.addTab(self.table_view, "列表")
+        self.calendar_table = QTableWidget(6, 7)
+        self.calendar_table.setHorizontalHeaderLabels(["周一", "周二", "周三", "周四", "周五", "周六", "周日"])
+        self.calendar_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.calendar_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.tabs.addTab(self.calendar_table, "月历")
+        self.stats_text = QTextEdit()
+        self.stats_text.setReadOnly(True)
+        self.tabs.addTab(self.stats_text, "统计")
+
+        self.run_query()
+
+    def handle_user_checked(self, item):
+        """勾选有密码的用户时验证密码"""
+        username, _, has_password = item.data(Qt.UserRole)
+        if item.checkState() != Qt.Checked or not has_password or username in self.unlocked:
+            return
+        password, ok = QInputDialog.getText(self, "验证密码", f"请输入用户 {username} 的密码:", QLineEdit.Password)
+        try:
+            verified = ok and UserManager.get_password(username) == password
+        except Exception as e:
+            QMessageBox.critical(self, "错误", str(e))
+            verified = False
+        if verified:
+            self.unlocked.add(username)
+            return
+        if ok:
+            QMessageBox.warning(self, "错误", "密码错误")
+        self.user_list.blockSignals(True)
+        item.setCheckState(Qt.Unchecked)
+        self.user_list.blockSignals(False)
+
+    def selected_sources(self):
+        sources = []
+        for index in range(self.user_list.count()):
+            item = self.user_list.item(index)
+            if item.checkState() == Qt.Checked:
+                username, db_file, _ = item.data(Qt.UserRole)
+                sources.append((username, db_file))
+        return sources
+
+    @monitor.timed("federated_query")
+    def run_query(self):
+        """一次挂载所选用户库，查询列表、月历和统计"""
+        sources = self.selected_sources()
+        if not sources:
+            QMessageBox.warning(self, "警告", "请至少选择一个用户")
+            return
+        start_date = self.start_date_edit.date()
+        month_start = QDate(start_date.year(), start_date.month(), 1)
+        store = FederatedStore(sources)
+        try:
+            rows = store.list_schedules(start_date.toString("yyyy-MM-dd"),
+                                        self.end_date_edit.date().toString("yyyy-MM-dd"),
+                                        self.search_input.text().strip(), self.dept_filter.currentData())
+            stats = store.get_statistics(start_date.toString("yyyy-MM-dd"),
+                                         self.end_date_edit.date().toString("yyyy-MM-dd"))
+            days = store.get_day_counts(month_start.toString("yyyy-MM-dd"),
+                                        month_start.addMonths(1).addDays(-1).toString("yyyy-MM-dd"))
+            departments = store.get_used_departments()
+        except Error as e:
+            QMessageBox.critical(self, "数据库错误", f"无法查询排班数据:\n{str(e)}")
+            return
+        finally:
+            store.close()
+
+        self.model.set_rows(rows)
+        self.update_departments(departments)
+        self.update_calendar(month_start, days)
+        self.update_stats(stats, len(sources), store.missing)
+
+    def update_departments(self, departments):
+        current = self.dept_filter.currentData()
+        self.dept_filter.blockSignals(True)
+        self.dept_filter.clear()
+        self.dept_filter.addItem("所有部门", "")
+        for dept in departments:
+            self.dept_filter.addItem(dept, dept)
+        index = self.dept_filter.findData(current)
+        self.dept_filter.setCurrentIndex(max(index, 0))
+        self.dept_filter.blockSignals(False)
+
+    def update_calendar(self, month_start, days):
+        """月历每格显示当天总人次和各来源人次"""
+        self.calendar_table.clearContents()
+        offset = month_start.dayOfWeek() - 1
+        for day in range(month_start.daysInMonth()):
+            date = month_start.addDays(day)
+            counts = days.get(date.toString("yyyy-MM-dd"))
+            lines = [str(day + 1)]
+            if counts:
+                lines.append(f"共 {sum(counts.values())} 人次")
+                lines.extend(f"{label}: {count}" for label, count in sorted(counts.items()))
+            item = QTableWidgetItem("\n".join(lines))
+            item.setTextAlignment(Qt.AlignLeft | Qt.AlignTop)
+            self.calendar_table.setItem((offset + day) // 7, (offset + day) % 7, item)
+        self.calendar_table.resizeRowsToContents()
+
+    def update_stats(self, stats, source_count, missing):
+        lines = [
+            f"汇总用户: {source_count}",
+            f"排班记录: {stats['total']}",
+            f"日期范围: {stats['first_date'] or '-'} ~ {stats['last_date'] or '-'}",
+            f"员工人数: {stats['employees']}",
+        ]
+        for title, key in (("按来源", "by_source"), ("按部门", "by_department"), ("按班次", "by_shift")):
+            lines.append(f"\n{title}:")
+            lines.extend(f"  {name}: {count}" for name, count in stats[key])
+        if missing:
+            lines.append("\n以下用户的数据库不存在（尚未登录过）:")
+            lines.extend(f"  {db_file}" for db_file in missing)
+        self.stats_text.setPlainText("\n".join(lines))
+
+
 if __name__ == "__main__":
+    # 打包后的程序启动报表工作进程时需要
+    from multiprocessing import freeze_support
+    freeze_support()
     app = QApplication(sys.argv)
     
     # 设置中文字体
@@ -0,0 +1,132 @@
+"""员工×日期班次矩阵的数据和写回队列（不依赖 PyQt）
+
+矩阵编辑时每个单元格的修改先进入 CellWriteQueue，同一单元格的多次修改只保留最后一次，
+由界面定时（或关闭、切换月份时）合并为一个事务提交，而不是每个单元格提交一次。
+"""
+import calendar
+from datetime import date
+
+from Schedule_Reports import shift_name
+
+
+class ShiftCodes:
+    """单元格输入的班次代码：完整班次、班次名、首字（多个班次同首字时取最短的名称）或序号"""
+
+    def __init__(self, labels):
+        self.labels = list(labels)
+        self.codes = {}
+        for number, label in enumerate(self.labels, start=1):
+            name = shift_name(label)
+            self.codes[label] = label
+            self.codes.setdefault(name, label)
+            self.codes[str(number)] = label
+        for label in sorted(self.labels, key=lambda label: len(shift_name(label))):
+            self.codes.setdefault(shift_name(label)[:1], label)
+
+    def resolve(self, text):
+        """输入文本对应的班次；空文本返回 ""（清除），无法识别返回 None"""
+        text = text.strip()
+        if not text:
+            return ""
+        return self.codes.get(text)
+
+    def legend(self):
+        """代码说明，例如 1=早班 2=中班"""
+        return "  ".join(f"{number}={shift_name(label)}" for number, label in enumerate(self.labels, start=1))
+
+
+class ShiftMatrix:
+    """某部门某月的班次矩阵：行为员工（本月或上月在该部门排过班的员工），列为当月每一天"""
+
+    def __init__(self, year, month, department):
+        self.year = year
+        self.month = month
+        self.department = department
+        self.day_count = calendar.monthrange(year, month)[1]
+        self.employees = []
+        self.rows = {}        # 姓名 -> 行号
+        self.positions = {}   # 姓名 -> 最近一次排班的职位，新增排班时使用
+        self.cells = {}       # (行号, 日期下标) -> [班次]
+
+    @classmethod
+    def load(cls, store, year, month, department):
+        matrix = cls(year, month, department)
+        prev_year, prev_month = (year - 1, 12) if month == 1 else (year, month - 1)
+        month_prefix = f"{year:04d}-{month:02d}-"
+        # 按日期排序读取，职位取最后一次排班的值
+        for _, name, _, position, work_date, shift_type, _ in store.iter_schedules(
+                f"{prev_year:04d}-{prev_month:02d}-01", f"{month_prefix}31", department=department):
+            matrix.add_employee(name)
+            matrix.positions[name] = position
+            if work_date.startswith(month_prefix):
+                try:
+                    day = int(work_date[8:10]) - 1
+                except ValueError:
+                    continue
+                matrix.cells.setdefault((matrix.rows[name], day), []).append(shift_type)
+        matrix.sort_employees()
+        return matrix
+
+    def add_employee(self, name, position=""):
+        """添加一行（已存在时返回原行号）"""
+        row = self.rows.get(name)
+        if row is None:
+            row = self.rows[name] = len(self.employees)
+            self.employees.append(name)
+            self.positions.setdefault(name, position)
+        return row
+
+    def sort_employees(self):
+        order = sorted(range(len(self.employees)), key=lambda row: self.employees[row])
+        new_row = {old: new for new, old in enumerate(order)}
+        self.employees = [self.employees[row] for row in order]
+        self.rows = {name: row for row, name in enumerate(self.employees)}
+        self.cells = {(new_row[row], day): shifts for (row, day), shifts in self.cells.items()}
+
+    def date_str(self, day):
+        return f"{self.year:04d}-{self.month:02d}-{day + 1:02d}"
+
+    def weekday(self, day):
+        """0=周一"""
+        return date(self.year, self.month, day + 1).weekday()
+
+    def shifts(self, row, day):
+        return self.cells.get((row, day), [])
+
+    def text(self, row, day):
+        return "/".join(shift_name(shift_type) for shift_type in self.shifts(row, day))
+
+    def set(self, row, day, shift_type):
+        """设置单元格（空字符串表示清除）"""
+        if shift_type:
+            self.cells[(row, day)] = [shift_type]
+        else:
+            self.cells.pop((row, day), None)
+
+
+class CellWriteQueue:
+    """矩阵编辑的写回队列：按 (姓名, 日期) 合并修改，flush 时在一个事务中提交"""
+
+    def __init__(self, store, department):
+        self.store = store
+        self.department = department
+        self.pending = {}   # (姓名, 日期) -> (班次, 职位)
+
+    def put(self, name, work_date, shift_type, position=""):
+        self.pending[(name, work_date)] = (shift_type, position)
+
+    def is_pending(self, name, work_date):
+        return (name, work_date) in self.pending
+
+    def __len__(self):
+        return len(self.pending)
+
+    def flush(self):
+        """提交全部待写入的修改（一个可撤销操作），返回 (添加, 修改, 删除)；失败时修改保留在队列中"""
+        if not self.pending:
+            return 0, 0, 0
+        cells = [(name, work_date, shift_type, position)
+                 for (name, work_date), (shift_type, position) in self.pending.items()]
+        result = self.store.set_cell_shifts(self.department, cells, f"矩阵编辑 {len(cells)} 个单元格")
+        self.pending.clear()
+        return result
@@ -0,0 +1,271 @@
+"""性能监控：SQL 跟踪、逐条语句计时、热点路径计时和慢操作环形缓冲（不依赖 PyQt）
+
+设置环境变量 SCHEDULE_PERF=1 可在启动时就开启 SQL 跟踪。
+"""
+import os
+import time
+import sqlite3
+import threading
+from collections import deque
+from functools import wraps
+
+
+class PerfMonitor:
+    """收集计时数据；计时区段始终记录，SQL 跟踪需要开启"""
+    SLOW_SQL_MS = 20       # 超过该耗时的SQL记入慢操作
+    SLOW_SPAN_MS = 100     # 超过该耗时的区段记入慢操作
+    RING_SIZE = 200        # 慢操作环形缓冲大小
+    RECENT_SQL_SIZE = 500  # 最近执行的SQL数量
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sql_enabled = os.environ.get("SCHEDULE_PERF", "") not in ("", "0")
+        self.slow_ops = deque(maxlen=self.RING_SIZE)
+        self.recent_sql = deque(maxlen=self.RECENT_SQL_SIZE)
+        self.span_stats = {}    # 名称 -> [次数, 总耗时, 最大耗时, 最近耗时]
+        self.sql_stats = {}     # 语句 -> [次数, 总耗时, 最大耗时]
+        self.traced = 0         # trace 回调看到的语句数（包括触发器内的语句）
+        self.collectors = []    # 正在收集语句的列表（见 collect_statements）
+
+    # ---------- 区段计时 ----------
+
+    def record_span(self, name, ms):
+        with self.lock:
+            stats = self.span_stats.setdefault(name, [0, 0.0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += ms
+            stats[2] = max(stats[2], ms)
+            stats[3] = ms
+            if ms >= self.SLOW_SPAN_MS:
+                self.slow_ops.append({"time": time.strftime("%H:%M:%S"), "kind": "span",
+                                      "name": name, "ms": round(ms, 3)})
+
+    def span(self, name):
+        """上下文管理器：with monitor.span("名称"): ..."""
+        return _Span(self, name)
+
+    def timed(self, name):
+        """装饰器：记录函数每次调用的耗时"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record_span(name, (time.perf_counter() - started) * 1000)
+            return wrapper
+        return decorator
+
+    def last_span_ms(self, name):
+        stats = self.span_stats.get(name)
+        return stats[3] if stats else None
+
+    # ---------- SQL 跟踪 ----------
+
+    def set_sql_enabled(self, enabled, connections=()):
+        """开启/关闭 SQL 计时，并为给定连接设置 trace 回调"""
+        self.sql_enabled = enabled
+        for conn in connections:
+            self.attach(conn)
+
+    def attach(self, conn):
+        """按当前开关为连接设置或清除 sqlite3 trace 回调"""
+        conn.set_trace_callback(self._trace if self.sql_enabled else None)
+
+    def _trace(self, statement):
+        with self.lock:
+            self.traced += 1
+            for collector in self.collectors:
+                collector.append(statement)
+
+    def record_sql(self, statement, ms, new_call=True, total_ms=None):
+        """记录一条语句的耗时；new_call=False 表示追加同一次执行读取结果的耗时"""
+        key = " ".join(statement.split())
+        total_ms = ms if total_ms is None else total_ms
+        with self.lock:
+            stats = self.sql_stats.setdefault(key, [0, 0.0, 0.0])
+            if new_call:
+                stats[0] += 1
+                self.recent_sql.append((time.strftime("%H:%M:%S"), key, round(ms, 3)))
+            stats[1] += ms
+            stats[2] = max(stats[2], total_ms)
+            if total_ms >= self.SLOW_SQL_MS and (new_call or total_ms - ms < self.SLOW_SQL_MS):
+                self.slow_ops.append({"time": time.strftime("%H:%M:%S"), "kind": "sql",
+                                      "name": key, "ms": round(total_ms, 3)})
+
+    def collect_statements(self):
+        """返回一个列表，之后 trace 到的所有语句都会追加进去；用 stop_collecting 结束"""
+        statements = []
+        with self.lock:
+            self.collectors.append(statements)
+        return statements
+
+    def stop_collecting(self, statements):
+        with self.lock:
+            if statements in self.collectors:
+                self.collectors.remove(statements)
+
+    # ---------- 汇总与导出 ----------
+
+    def summary(self):
+        """状态栏显示用的简短汇总"""
+        with self.lock:
+            sql_count = sum(stats[0] for stats in self.sql_stats.values())
+            sql_ms = sum(stats[1] for stats in self.sql_stats.values())
+            slow = len(self.slow_ops)
+        return {"sql_count": sql_count, "sql_ms": sql_ms, "slow": slow}
+
+    def report(self, extra=None):
+        """生成用于问题反馈的完整报告"""
+        with self.lock:
+            spans = {
+                name: {"count": count, "total_ms": round(total, 3), "max_ms": round(peak, 3),
+                       "avg_ms": round(total / count, 3), "last_ms": round(last, 3)}
+                for name, (count, total, peak, last) in self.span_stats.items()
+            }
+            statements = sorted(self.sql_stats.items(), key=lambda item: item[1][1], reverse=True)
+            report = {
+                "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "sqlite_version": sqlite3.sqlite_version,
+                "sql_tracing": self.sql_enabled,
+                "traced_statements": self.traced,
+                "spans": spans,
+                "sql": [
+                    {"sql": sql, "count": count, "total_ms": round(total, 3), "max_ms": round(peak, 3)}
+                    for sql, (count, total, peak) in statements[:100]
+                ],
+                "slow_operations": list(self.slow_ops),
+                "recent_sql": [{"time": t, "sql": sql, "ms": ms} for t, sql, ms in self.recent_sql],
+            }
+        if extra:
+            report.update(extra)
+        return report
+
+    def dump(self, path, extra=None):
+        """将报告写入JSON文件"""
+        import json
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(extra), f, ensure_ascii=False, indent=2)
+        return path
+
+    def reset(self):
+        with self.lock:
+            self.slow_ops.clear()
+            self.recent_sql.clear()
+            self.span_stats.clear()
+            self.sql_stats.clear()
+            self.traced = 0
+
+
+class _Span:
+    def __init__(self, monitor, name):
+        self.monitor = monitor
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.monitor.record_span(self.name, (time.perf_counter() - self.started) * 1000)
+        return False
+
+
+# 进程内共享的监控实例
+monitor = PerfMonitor()
+
+
+class TimedCursor(sqlite3.Cursor):
+    """开启 SQL 跟踪时记录每条语句的执行和读取耗时（fetchone/fetchmany/fetchall 和逐行迭代都计入）"""
+
+    def execute(self, sql, parameters=()):
+        if not monitor.sql_enabled:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._timed_sql = sql
+            self._timed_ms = (time.perf_counter() - started) * 1000
+            monitor.record_sql(sql, self._timed_ms)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not monitor.sql_enabled:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._timed_sql = None
+            monitor.record_sql(sql, (time.perf_counter() - started) * 1000)
+
+    def _record_fetch(self, fetch_ms, finished):
+        """读取结果集的耗时记到对应语句上（SELECT 的大部分工作发生在这里）"""
+        sql = getattr(self, "_timed_sql", None)
+        if sql is None:
+            return
+        self._timed_ms += fetch_ms
+        monitor.record_sql(sql, fetch_ms, new_call=False, total_ms=self._timed_ms)
+        if finished:
+            self._timed_sql = None
+
+    def fetchall(self):
+        if not monitor.sql_enabled:
+            return super().fetchall()
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._record_fetch((time.perf_counter() - started) * 1000, True)
+        return rows
+
+    def fetchone(self):
+        if not monitor.sql_enabled:
+            return super().fetchone()
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._record_fetch((time.perf_counter() - started) * 1000, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        if not monitor.sql_enabled:
+            return super().fetchmany(self.arraysize if size is None else size)
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._record_fetch((time.perf_counter() - started) * 1000, not rows)
+        return rows
+
+    def __iter__(self):
+        # 未开启跟踪时直接用 C 实现的逐行迭代，不增加每行的开销
+        if not monitor.sql_enabled or getattr(self, "_timed_sql", None) is None:
+            return self
+        return self._timed_rows()
+
+    def _timed_rows(self):
+        """逐行迭代，读取耗时累计后在迭代结束（或提前停止）时一次记入"""
+        fetch_ms = 0.0
+        finished = False
+        try:
+            while True:
+                started = time.perf_counter()
+                row = sqlite3.Cursor.fetchone(self)
+                fetch_ms += (time.perf_counter() - started) * 1000
+                if row is None:
+                    finished = True
+                    return
+                yield row
+        finally:
+            self._record_fetch(fetch_ms, finished)
+
+
+class TimedConnection(sqlite3.Connection):
+    """cursor() 返回 TimedCursor 的连接，用作 sqlite3.connect 的 factory；
+    conn.execute/executemany 快捷方式也经过 TimedCursor，同样被跟踪"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -0,0 +1,263 @@
+"""查询计划检查：收集界面和用户管理实际执行的SQL，在大型合成数据库上执行 EXPLAIN QUERY PLAN
+
+用法:
+    python Schedule_QueryPlan.py [--rows 200k] [--work-dir bench_data] [--output query_plans.json]
+
+逐个场景无界面驱动 ScheduleManager、ScheduleDialog 和 UserManager，通过 SQL 跟踪收集语句，
+报告每条语句使用的索引。热点场景（单日、日期范围、部门过滤、右键菜单等）中的语句
+如果全表扫描 schedules，返回码为1，可放在持续集成中防止索引失效。
+"""
+import os
+import re
+import sys
+import json
+import sqlite3
+import argparse
+
+from Schedule_Perf import monitor
+from Schedule_Store import UserManager, ScheduleStore
+from Schedule_Bench import parse_size, size_label, prepare_database
+
+# 热点场景中不允许全表扫描的表
+GUARDED_TABLES = ("schedules",)
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\w+)")
+INDEX_RE = re.compile(r"USING (?:COVERING )?INDEX (\w+)|USING (INTEGER PRIMARY KEY)")
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+
+def normalize(sql):
+    """把字面量替换为 ?，合并空白，用于语句去重"""
+    return " ".join(LITERAL_RE.sub("?", sql).split())
+
+
+def explain(conn, sql):
+    """返回 (计划明细列表, 使用的索引, 全表扫描的表)"""
+    rows = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+    details = [row[3] for row in rows]
+    indexes = []
+    scans = []
+    for detail in details:
+        match = INDEX_RE.search(detail)
+        if match:
+            index = match.group(1) or match.group(2)
+            if index not in indexes:
+                indexes.append(index)
+        match = SCAN_RE.match(detail)
+        if match and match.group(1) not in scans:
+            scans.append(match.group(1))
+    return details, indexes, scans
+
+
+def collect_scenarios(username, db_file, meta):
+    """无界面运行各个场景，返回 [(场景名, 是否热点, [已执行的SQL])]"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication, QMenu, QDialog
+    from PyQt5.QtCore import Qt, QDate
+    import Schedule_Manager
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    # 菜单和对话框不弹出，直接返回
+    QMenu.exec_ = lambda self, *args: None
+    QDialog.exec_ = lambda self: QDialog.Rejected
+    monitor.set_sql_enabled(True)
+    sample = QDate.fromString(meta["sample_date"], "yyyy-MM-dd")
+    scenarios = []
+    state = {}
+
+    def run(name, hot, func):
+        statements = monitor.collect_statements()
+        try:
+            func()
+            app.processEvents()
+        finally:
+            monitor.stop_collecting(statements)
+        scenarios.append((name, hot, statements))
+
+    def login():
+        UserManager.init_users_db()
+        UserManager.list_users()
+        UserManager.get_password(username)
+        UserManager.authenticate(username)
+        UserManager.get_db_file(username)
+
+    def open_window():
+        window = Schedule_Manager.ScheduleManager(username, db_file)
+        window.change_timer.stop()
+        window.current_date = sample
+        # 窗口不显示，直接完成启动后的首次加载
+        window.render_initial_view()
+        state["window"] = window
+
+    def sample_cell_center():
+        table = state["window"].calendar_table
+        for row in range(table.rowCount()):
+            for col in range(table.columnCount()):
+                item = table.item(row, col)
+                if item and item.data(Qt.UserRole) == sample:
+                    return table, table.model().index(row, col), table.visualRect(table.model().index(row, col)).center()
+        raise RuntimeError(f"月历中找不到 {meta['sample_date']}")
+
+    def context_menu():
+        table, _, pos = sample_cell_center()
+        table.customContextMenuRequested.emit(pos)
+
+    def double_click():
+        table, index, _ = sample_cell_center()
+        table.doubleClicked.emit(index)
+
+    def list_view():
+        window = state["window"]
+        window.toggle_view()
+        for widget in (window.search_input, window.start_date_edit, window.end_date_edit, window.dept_filter):
+            widget.blockSignals(True)
+        window.start_date_edit.setDate(QDate(sample.year(), sample.month(), 1))
+        window.end_date_edit.setDate(QDate(sample.year(), sample.month(), sample.daysInMonth()))
+        window.load_data()
+
+    def list_search():
+        window = state["window"]
+        window.search_input.setText(meta["search_text"])
+        window.load_data()
+        window.search_input.setText("")
+
+    def list_department():
+        window = state["window"]
+        window.dept_filter.setCurrentIndex(1)
+        window.load_data()
+
+    def external_changes():
+        window = state["window"]
+        other = ScheduleStore(db_file)
+        try:
+            record_id = other.add_schedule(("查询计划检查", window.dept_filter.currentData(), "专员",
+                                            meta["sample_date"], "早班 (08:00-16:00)", ""))
+            window.check_external_changes()
+            other.delete_schedule(record_id)
+            state["ops"] = state.get("ops", 0) + 2
+            window.toggle_view()
+            window.check_external_changes()
+        finally:
+            other.close()
+
+    def writes():
+        store = state["window"].store
+        record_id = store.add_schedule(("查询计划检查", "技术部", "专员", meta["sample_date"], "早班 (08:00-16:00)", ""))
+        record = store.get_schedule(record_id)
+        store.update_schedule(record_id, ("查询计划检查", "技术部", "主管", meta["sample_date"],
+                                          "晚班 (00:00-08:00)", ""), expected_version=record[7])
+        store.delete_schedule(record_id)
+        state["ops"] = state.get("ops", 0) + 3
+
+    def undo_redo():
+        window = state["window"]
+        # 撤销本次检查写入的全部操作，数据库恢复原样
+        for _ in range(state.pop("ops", 0)):
+            window.undo_change()
+        window.redo_change()
+        window.undo_change()
+
+    run("登录 UserManager", False, login)
+    run("主窗口初始化", True, open_window)
+    run("月历 update_calendar_view", True, lambda: state["window"].update_calendar_view())
+    run("单日 load_day_schedules", True,
+        lambda: state["window"].load_day_schedules(state["window"].calendar_table, 0, 0, sample))
+    run("右键菜单", True, context_menu)
+    run("双击编辑/ScheduleDialog", True, double_click)
+    run("排班对话框 ScheduleDialog", True, lambda: Schedule_Manager.ScheduleDialog(state["window"]).deleteLater())
+    run("列表 日期范围", True, list_view)
+    run("列表 搜索", True, list_search)
+    run("列表 部门过滤", True, list_department)
+    run("列表 部门下拉框", True, lambda: state["window"].load_departments())
+    run("多窗口变更检测", True, external_changes)
+    run("添加/修改/删除", True, writes)
+    run("撤销/重做", False, undo_redo)
+
+    window = state["window"]
+    window.sessions.close_all()
+    window.deleteLater()
+    app.processEvents()
+    monitor.set_sql_enabled(False)
+    return scenarios
+
+
+def check_plans(scenarios, db_file):
+    """对收集到的语句去重后执行 EXPLAIN QUERY PLAN，返回报告条目"""
+    conns = {db_file: sqlite3.connect(db_file), UserManager.USERS_DB: sqlite3.connect(UserManager.USERS_DB)}
+    entries = {}
+    try:
+        for name, hot, statements in scenarios:
+            for sql in statements:
+                stripped = sql.lstrip()
+                # 触发器内的语句以 "-- TRIGGER" 形式出现，建表等语句无需检查
+                if not stripped.upper().startswith(EXPLAINABLE):
+                    continue
+                key = normalize(sql)
+                entry = entries.get(key)
+                if entry is None:
+                    target = UserManager.USERS_DB if re.search(r"\busers\b", key) else db_file
+                    entry = entries[key] = {"sql": key, "scenarios": [], "hot": False}
+                    try:
+                        entry["plan"], entry["indexes"], entry["scans"] = explain(conns[target], sql)
+                    except sqlite3.Error as e:
+                        entry["plan"], entry["indexes"], entry["scans"] = [], [], []
+                        entry["error"] = str(e)
+                if name not in entry["scenarios"]:
+                    entry["scenarios"].append(name)
+                entry["hot"] = entry["hot"] or hot
+    finally:
+        for conn in conns.values():
+            conn.close()
+
+    for entry in entries.values():
+        guarded = [table for table in entry["scans"] if table in GUARDED_TABLES]
+        if entry.get("error"):
+            entry["status"] = "ERROR"
+        elif guarded and entry["hot"]:
+            entry["status"] = "FAIL"
+        elif entry["scans"]:
+            entry["status"] = "SCAN"
+        else:
+            entry["status"] = "OK"
+    return list(entries.values())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="检查界面和用户管理执行的SQL是否使用索引")
+    parser.add_argument("--rows", default="200k", help="合成数据库规模，例如 100k、1m")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--work-dir", default="bench_data", help="测试数据库和用户库所在目录")
+    parser.add_argument("--output", help="JSON报告文件（相对于工作目录）")
+    parser.add_argument("--regenerate", action="store_true", help="重新生成测试数据库")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    os.chdir(args.work_dir)
+    rows = parse_size(args.rows)
+    username, db_file, meta = prepare_database(rows, args.seed, args.regenerate)
+    scenarios = collect_scenarios(username, db_file, meta)
+    entries = check_plans(scenarios, db_file)
+
+    for entry in sorted(entries, key=lambda entry: (entry["status"] == "OK", entry["sql"])):
+        indexes = ", ".join(entry["indexes"]) or "-"
+        print(f"[{entry['status']:<5}] {'热点' if entry['hot'] else '    '} 索引: {indexes}")
+        print(f"        {entry['sql'][:160]}")
+        for detail in entry["plan"]:
+            print(f"          {detail}")
+        if entry.get("error"):
+            print(f"          {entry['error']}")
+        print(f"        场景: {', '.join(entry['scenarios'])}")
+
+    failures = [entry for entry in entries if entry["status"] in ("FAIL", "ERROR")]
+    print(f"\n[{size_label(rows)}] 共检查 {len(entries)} 条语句，"
+          f"全表扫描 {sum(1 for entry in entries if entry['scans'])} 条，热点失败 {len(failures)} 条")
+    if args.output:
+        report = {"rows": rows, "sqlite": sqlite3.sqlite_version, "statements": entries}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已写入 {os.path.join(args.work_dir, args.output)}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
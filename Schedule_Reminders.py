@@ -0,0 +1,222 @@
+"""班次开始前的提醒队列（不依赖 PyQt）
+
+只加载从今天起 HORIZON_DAYS 天内有时间段的班次，按提醒时间（班次开始前 lead_minutes 分钟）放入最小堆；
+时间推进时再加载后面的日期，因此未来几十万条排班不会一次读入。排班修改后按变更日志只重新读取
+改动过的记录：堆中的旧项不删除，弹出时与当前记录的版本号不符即丢弃（惰性删除）。
+界面只需在 next_fire() 返回的时间唤醒一次，空闲时不轮询。
+"""
+import heapq
+from datetime import datetime, timedelta
+
+from Schedule_Reports import shift_name, shift_span
+
+DAY_MINUTES = 1440
+
+
+def minute_of(moment):
+    """datetime -> 分钟数（date.toordinal() * 1440 + 当天分钟），与请假索引一致"""
+    return moment.toordinal() * DAY_MINUTES + moment.hour * 60 + moment.minute
+
+
+class Reminder:
+    """一条班次提醒；start/fire 为班次开始和提醒的分钟数"""
+    __slots__ = ("record_id", "employee_name", "department", "work_date", "shift_type", "start", "fire")
+
+    def __init__(self, record_id, employee_name, department, work_date, shift_type, start, fire):
+        self.record_id = record_id
+        self.employee_name = employee_name
+        self.department = department
+        self.work_date = work_date
+        self.shift_type = shift_type
+        self.start = start
+        self.fire = fire
+
+    @property
+    def start_time(self):
+        minute = self.start % DAY_MINUTES
+        return f"{minute // 60:02d}:{minute % 60:02d}"
+
+    def describe(self):
+        return f"{self.work_date} {self.start_time} {self.employee_name}（{self.department}）{shift_name(self.shift_type)}"
+
+
+class ReminderQueue:
+    """按提醒时间排序的班次；department 非空时只提醒该部门"""
+    HORIZON_DAYS = 2   # 预先加载的天数
+
+    def __init__(self, store, lead_minutes=15, department=""):
+        self.store = store
+        self.lead_minutes = lead_minutes
+        self.department = department
+        self.listeners = []
+        self.heap = []        # (提醒分钟, 版本号, 记录ID)
+        self.entries = {}     # 记录ID -> (版本号, Reminder)
+        self.version = 0
+        self.shifts = {}
+        self.seq = None
+        self.loaded_from = None   # 已加载的日期范围 [loaded_from, loaded_until)
+        self.loaded_until = None
+        self.fired_until = None   # 已处理到的分钟数，此前开始的班次不再提醒
+        self.fired = {}           # 已提醒的记录ID -> 班次开始分钟，修改其他字段或重新加载时不重复提醒
+
+    def add_listener(self, callback):
+        """callback(reminders)：同一分钟到期的提醒一起回调"""
+        self.listeners.append(callback)
+
+    def reload(self, now=None):
+        """重新读取班次时间并加载今天起的排班"""
+        now = now or datetime.now()
+        self.seq = self.store.change_counter()
+        self.shifts = {name: (start, end) for name, start, end in self.store.get_shifts()}
+        self.heap = []
+        self.entries = {}
+        if self.fired_until is None:
+            self.fired_until = minute_of(now)
+        self.loaded_from = now.date()
+        self.loaded_until = self.loaded_from
+        self.extend(now)
+
+    def extend(self, now):
+        """加载到 now 之后 HORIZON_DAYS 天"""
+        until = now.date() + timedelta(days=self.HORIZON_DAYS)
+        if until <= self.loaded_until:
+            return
+        rows = self.store.iter_schedules(self.loaded_until.isoformat(), (until - timedelta(days=1)).isoformat(),
+                                         department=self.department)
+        for record_id, name, department, _, work_date, shift_type, _ in rows:
+            self.put(record_id, name, department, work_date, shift_type)
+        self.loaded_until = until
+
+    def reminder_for(self, record_id, name, department, work_date, shift_type):
+        """排班对应的提醒；没有时间段的班次（休息、请假等）不提醒"""
+        if self.department and department != self.department:
+            return None
+        span = shift_span(shift_type, self.shifts)
+        if span is None:
+            return None
+        try:
+            day = datetime.strptime(work_date, "%Y-%m-%d").toordinal()
+        except ValueError:
+            return None
+        start = day * DAY_MINUTES + span[0]
+        return Reminder(record_id, name, department, work_date, shift_type, start, start - self.lead_minutes)
+
+    def put(self, record_id, name, department, work_date, shift_type):
+        reminder = self.reminder_for(record_id, name, department, work_date, shift_type)
+        if reminder is None or reminder.start <= self.fired_until or self.fired.get(record_id) == reminder.start:
+            self.entries.pop(record_id, None)
+            return
+        self.version += 1
+        self.entries[record_id] = (self.version, reminder)
+        heapq.heappush(self.heap, (reminder.fire, self.version, record_id))
+
+    def in_window(self, date_str):
+        return bool(date_str) and self.loaded_from.isoformat() <= date_str < self.loaded_until.isoformat()
+
+    def sync(self, now=None):
+        """按变更日志更新修改过的排班，班次时间设置变化或日志已裁剪时重新加载；返回更新的记录数"""
+        now = now or datetime.now()
+        if self.seq is None:
+            self.reload(now)
+            return None
+        shifts = {name: (start, end) for name, start, end in self.store.get_shifts()}
+        counter, changes = self.store.changes_since(self.seq)
+        if changes is None or shifts != self.shifts:
+            self.reload(now)
+            return None
+        self.seq = counter
+        self.extend(now)
+        row_ids = {row_id for row_id, new_date, old_date in changes
+                   if self.in_window(new_date) or self.in_window(old_date)}
+        if not row_ids:
+            return 0
+        for row_id in row_ids:
+            self.entries.pop(row_id, None)
+        row_ids = sorted(row_ids)
+        for start in range(0, len(row_ids), 500):
+            for record_id, name, department, _, work_date, shift_type, _ in self.store.list_schedules(
+                    self.loaded_from.isoformat(), (self.loaded_until - timedelta(days=1)).isoformat(),
+                    department=self.department, row_ids=row_ids[start:start + 500]):
+                self.put(record_id, name, department, work_date, shift_type)
+        return len(row_ids)
+
+    def set_lead_minutes(self, lead_minutes, now=None):
+        if lead_minutes != self.lead_minutes:
+            self.lead_minutes = lead_minutes
+            self.reload(now)
+
+    def set_department(self, department, now=None):
+        if department != self.department:
+            self.department = department
+            self.reload(now)
+
+    def _discard_stale(self):
+        while self.heap:
+            _, version, record_id = self.heap[0]
+            entry = self.entries.get(record_id)
+            if entry is not None and entry[0] == version:
+                return
+            heapq.heappop(self.heap)
+
+    def next_fire(self):
+        """下一条提醒的分钟数，没有时返回 None"""
+        self._discard_stale()
+        return self.heap[0][0] if self.heap else None
+
+    def due(self, now=None):
+        """弹出 now 之前到期的提醒（班次已开始的不再提醒），并通知监听者"""
+        now = now or datetime.now()
+        now_minute = minute_of(now)
+        # 先加载到新的日期范围（休眠唤醒等情况下可能跨过了几天）
+        if now.date() > self.loaded_from:
+            self.loaded_from = now.date()
+        self.extend(now)
+        reminders = []
+        while self.next_fire() is not None and self.heap[0][0] <= now_minute:
+            _, _, record_id = heapq.heappop(self.heap)
+            _, reminder = self.entries.pop(record_id)
+            if reminder.start > now_minute:
+                reminders.append(reminder)
+                self.fired[record_id] = reminder.start
+        self.fired_until = max(self.fired_until, now_minute)
+        self.fired = {record_id: start for record_id, start in self.fired.items() if start > now_minute}
+        if reminders:
+            reminders.sort(key=lambda reminder: (reminder.start, reminder.department, reminder.employee_name))
+            for callback in self.listeners:
+                try:
+                    callback(reminders)
+                except Exception as e:
+                    print(f"[DEBUG] 提醒回调失败: {str(e)}")
+        return reminders
+
+    def seconds_until_next(self, now=None, limit=1800):
+        """距下一条提醒的秒数，最多 limit 秒（到时加载后面的日期、校正系统时间变化）"""
+        now = now or datetime.now()
+        next_fire = self.next_fire()
+        if next_fire is None:
+            return limit
+        seconds = (next_fire - minute_of(now)) * 60 - now.second
+        return max(0, min(limit, seconds))
+
+    def upcoming(self, hours=24, now=None):
+        """now 起 hours 小时内开始的班次提醒，按开始时间排序"""
+        now_minute = minute_of(now or datetime.now())
+        return sorted((reminder for _, reminder in self.entries.values()
+                       if reminder.start <= now_minute + hours * 60),
+                      key=lambda reminder: (reminder.start, reminder.department, reminder.employee_name))
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def group_text(reminders, limit=8):
+    """通知正文：按开始时间和班次分组，每组列出前几名员工"""
+    groups = {}
+    for reminder in reminders:
+        groups.setdefault((reminder.work_date, reminder.start_time, shift_name(reminder.shift_type)), []).append(reminder)
+    lines = []
+    for (work_date, start_time, name), members in groups.items():
+        names = "、".join(reminder.employee_name for reminder in members[:limit])
+        more = f" 等 {len(members)} 人" if len(members) > limit else ""
+        lines.append(f"{start_time} {name}：{names}{more}")
+    return "\n".join(lines)
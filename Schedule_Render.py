@@ -0,0 +1,412 @@
+"""月历离屏渲染：用 QPainter 把任意月份范围、任意部门的月历画成 PDF 或 PNG
+
+用法:
+    python Schedule_Render.py --user 用户名 --start 2025-01 [--end 2025-06]
+                              [--department 技术部 ... | --per-department]
+                              [--format pdf|png] [--dpi 150] [--workers 4] -o 输出
+
+不使用界面上的月历表格。后台线程用自己的只读连接逐页读取排班（CalendarPage，不含 Qt 对象），
+读出一页就交给线程池绘制，读库和绘制交替进行：PNG 每页画到各自的 QImage 并在工作线程中保存；
+PDF 每页先录制为 QPicture（矢量），再按页序回放到同一个 QPdfWriter。
+Qt 允许在非界面线程中对 QImage、QPicture 和 QPdfWriter 使用 QPainter，
+PyQt 调用 Qt 时会释放 GIL，绘制和 PNG 压缩可以在多个线程中同时进行。
+"""
+import os
+import sys
+import time
+import zlib
+import calendar
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import Qt, QRectF, QMarginsF
+from PyQt5.QtGui import (QColor, QFont, QFontMetrics, QImage, QPainter, QPageLayout, QPageSize,
+                         QPdfWriter, QPicture)
+
+from Schedule_Store import ScheduleStore
+from Schedule_Reports import month_range, shift_name, UNSAFE_FILE_CHARS
+
+WEEKDAY_LABELS = ("周日", "周一", "周二", "周三", "周四", "周五", "周六")
+
+
+class CalendarPage:
+    """一页月历的数据：days[i] 为第 i+1 天的 [(姓名, 部门, 班次, 颜色下标)]"""
+    __slots__ = ("year", "month", "department", "days")
+
+    def __init__(self, year, month, department=""):
+        self.year = year
+        self.month = month
+        self.department = department
+        self.days = [[] for _ in range(calendar.monthrange(year, month)[1])]
+
+    @classmethod
+    def load(cls, store, year, month, department="", colors=None, palette_size=1):
+        """读取一个月（一个部门）的排班；colors 为 {姓名: 颜色下标}，未登记的姓名按 crc32 取色"""
+        page = cls(year, month, department)
+        colors = colors or {}
+        prefix = f"{year:04d}-{month:02d}-"
+        for _, name, dept, _, work_date, shift_type, _ in store.iter_schedules(
+                prefix + "01", prefix + "31", department=department):
+            try:
+                day = int(work_date[8:10]) - 1
+            except ValueError:
+                continue
+            if not 0 <= day < len(page.days):
+                continue
+            color = colors.get(name)
+            if color is None or not 0 <= color < palette_size:
+                color = zlib.crc32(name.encode("utf-8")) % palette_size
+            page.days[day].append((name, dept, shift_name(shift_type), color))
+        return page
+
+    @property
+    def title(self):
+        return f"{self.year}年{self.month}月 排班表 · {self.department or '全部部门'}"
+
+    @property
+    def file_stem(self):
+        return f"月历_{UNSAFE_FILE_CHARS.sub('_', self.department or '全部部门')}_{self.year:04d}-{self.month:02d}"
+
+    def shift_count(self):
+        return sum(len(entries) for entries in self.days)
+
+
+class CalendarPainter:
+    """在逻辑坐标（A4 横向，单位为磅）中绘制一页月历；可同时在多个线程中使用"""
+    PAGE_WIDTH = 842
+    PAGE_HEIGHT = 595
+    MARGIN = 24
+    TITLE_HEIGHT = 30
+    HEADER_HEIGHT = 20
+    LINE_HEIGHT = 10
+    GRID_COLOR = QColor(224, 224, 224)
+    HEADER_COLOR = QColor(245, 245, 245)
+    WEEKEND_COLOR = QColor(255, 0, 0)
+
+    def __init__(self, palette):
+        self.palette = [QColor(color) for color in palette]
+
+    @staticmethod
+    def font(pixel_size, bold=False):
+        # 使用像素大小，字号不随目标设备的 DPI 变化，缩放统一由 painter 的变换完成
+        font = QFont()
+        font.setPixelSize(pixel_size)
+        font.setBold(bold)
+        return font
+
+    def paint(self, painter, page):
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setRenderHint(QPainter.TextAntialiasing)
+        painter.fillRect(QRectF(0, 0, self.PAGE_WIDTH, self.PAGE_HEIGHT), Qt.white)
+        left, top = self.MARGIN, self.MARGIN
+        width = self.PAGE_WIDTH - 2 * self.MARGIN
+
+        painter.setPen(Qt.black)
+        painter.setFont(self.font(16, bold=True))
+        title_rect = QRectF(left, top, width, self.TITLE_HEIGHT)
+        painter.drawText(title_rect, Qt.AlignLeft | Qt.AlignVCenter, page.title)
+        painter.setFont(self.font(9))
+        painter.drawText(title_rect, Qt.AlignRight | Qt.AlignVCenter, f"共 {page.shift_count()} 个班次")
+        top += self.TITLE_HEIGHT
+
+        # 与界面月历相同，周日为第一列
+        start_day = (calendar.weekday(page.year, page.month, 1) + 1) % 7
+        rows = (start_day + len(page.days) + 6) // 7
+        cell_width = width / 7
+        cell_height = (self.PAGE_HEIGHT - self.MARGIN - top - self.HEADER_HEIGHT) / rows
+
+        painter.setFont(self.font(10, bold=True))
+        for col, label in enumerate(WEEKDAY_LABELS):
+            rect = QRectF(left + col * cell_width, top, cell_width, self.HEADER_HEIGHT)
+            painter.fillRect(rect, self.HEADER_COLOR)
+            painter.setPen(self.GRID_COLOR)
+            painter.drawRect(rect)
+            painter.setPen(Qt.black)
+            painter.drawText(rect, Qt.AlignCenter, label)
+        top += self.HEADER_HEIGHT
+
+        painter.setPen(self.GRID_COLOR)
+        for row in range(rows):
+            for col in range(7):
+                painter.drawRect(QRectF(left + col * cell_width, top + row * cell_height, cell_width, cell_height))
+
+        day_font = self.font(10, bold=True)
+        entry_font = self.font(8)
+        entry_metrics = QFontMetrics(entry_font)
+        show_department = not page.department
+        for day, entries in enumerate(page.days):
+            col = (start_day + day) % 7
+            row = (start_day + day) // 7
+            cell = QRectF(left + col * cell_width, top + row * cell_height, cell_width, cell_height)
+            painter.setFont(day_font)
+            painter.setPen(self.WEEKEND_COLOR if col in (0, 6) else Qt.black)
+            painter.drawText(cell.adjusted(4, 2, -4, 0), Qt.AlignLeft | Qt.AlignTop, str(day + 1))
+            if entries:
+                self.paint_entries(painter, cell.adjusted(4, 15, -4, -2), entries, entry_font, entry_metrics,
+                                   show_department)
+
+    def paint_entries(self, painter, rect, entries, font, metrics, show_department):
+        """每行一个班次：员工颜色色块 + 姓名（合并部门时带部门）+ 班次，放不下时最后一行显示剩余数量"""
+        painter.setFont(font)
+        capacity = max(1, int(rect.height() // self.LINE_HEIGHT))
+        shown = entries if len(entries) <= capacity else entries[:capacity - 1]
+        y = rect.top()
+        text_width = int(rect.width() - 10)
+        for name, department, shift, color in shown:
+            painter.fillRect(QRectF(rect.left(), y + 2, 6, self.LINE_HEIGHT - 4), self.palette[color])
+            text = f"{name}({department}) {shift}" if show_department else f"{name} {shift}"
+            painter.setPen(Qt.black)
+            painter.drawText(QRectF(rect.left() + 9, y, rect.width() - 9, self.LINE_HEIGHT),
+                             Qt.AlignLeft | Qt.AlignVCenter, metrics.elidedText(text, Qt.ElideRight, text_width))
+            y += self.LINE_HEIGHT
+        if len(shown) < len(entries):
+            painter.setPen(QColor(120, 120, 120))
+            painter.drawText(QRectF(rect.left(), y, rect.width(), self.LINE_HEIGHT),
+                             Qt.AlignLeft | Qt.AlignVCenter, f"… 另有 {len(entries) - len(shown)} 个班次")
+
+    def record(self, page):
+        """把一页录制为 QPicture（矢量），供 PDF 按页序回放"""
+        picture = QPicture()
+        painter = QPainter(picture)
+        try:
+            self.paint(painter, page)
+        finally:
+            painter.end()
+        return picture
+
+    def save_image(self, page, path, dpi=150):
+        """把一页画到 QImage 并保存为 PNG"""
+        scale = dpi / 72
+        image = QImage(round(self.PAGE_WIDTH * scale), round(self.PAGE_HEIGHT * scale), QImage.Format_RGB32)
+        image.setDotsPerMeterX(round(dpi / 0.0254))
+        image.setDotsPerMeterY(round(dpi / 0.0254))
+        painter = QPainter(image)
+        try:
+            painter.scale(scale, scale)
+            self.paint(painter, page)
+        finally:
+            painter.end()
+        if not image.save(path, "PNG"):
+            raise OSError(f"无法保存图片: {path}")
+        return path
+
+
+class CalendarExport:
+    """把月份范围内的月历导出为一个 PDF 或一组 PNG
+
+    departments 为空时每月一页、包含全部部门，否则每个部门每月一页（按部门、月份排序）。
+    界面使用 start / progress / cancel / finish 轮询进度，脚本使用 run。
+    """
+    PDF_RESOLUTION = 300
+
+    def __init__(self, db_file, months, output, fmt="pdf", departments=None, colors=None, palette=(),
+                 workers=None, dpi=150):
+        self.db_file = db_file
+        self.months = list(months)
+        self.output = output
+        self.fmt = fmt
+        self.departments = list(departments or [])
+        self.colors = colors or {}
+        self.painter = CalendarPainter(palette)
+        self.workers = workers or os.cpu_count() or 1
+        self.dpi = dpi
+        self.cancelled = False
+        self.done = 0
+        self.files = []
+        self.error = None
+        self.thread = None
+
+    def pages(self):
+        """[(年, 月, 部门)]"""
+        if not self.departments:
+            return [(year, month, "") for year, month in self.months]
+        return [(year, month, department) for department in self.departments for year, month in self.months]
+
+    def start(self):
+        """在后台线程开始导出，返回页数"""
+        if self.fmt == "png":
+            os.makedirs(self.output, exist_ok=True)
+        elif os.path.dirname(self.output):
+            os.makedirs(os.path.dirname(self.output), exist_ok=True)
+        self.tasks = self.pages()
+        self.started = time.perf_counter()
+        self.pool_size = max(1, min(self.workers, len(self.tasks)))
+        self.thread = threading.Thread(target=self._run, name="calendar-export", daemon=True)
+        self.thread.start()
+        return len(self.tasks)
+
+    def progress(self):
+        """(已完成页数, 总页数)"""
+        return self.done, len(self.tasks)
+
+    def cancel(self):
+        """停止读取和绘制后续页面；PDF 不保留未完成的文件，已保存的 PNG 保留"""
+        self.cancelled = True
+
+    def run(self, progress=None):
+        """导出并等待完成，progress(已完成, 总数) 在每页完成时调用"""
+        total = self.start()
+        reported = 0
+        try:
+            while self.thread.is_alive():
+                self.thread.join(0.1)
+                if progress and self.done != reported:
+                    reported = self.done
+                    progress(reported, total)
+        except BaseException:
+            self.cancel()
+            raise
+        return self.finish()
+
+    def finish(self):
+        """等待后台线程结束，返回结果信息；导出失败时抛出原异常"""
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return {
+            "pages": self.done,
+            "workers": self.pool_size,
+            "seconds": round(time.perf_counter() - self.started, 3),
+            "files": self.files,
+        }
+
+    def _run(self):
+        store = None
+        try:
+            store = ScheduleStore(self.db_file, read_only=True)
+            with ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="calendar-page") as executor:
+                if self.fmt == "pdf":
+                    self._write_pdf(store, executor)
+                else:
+                    self._write_png(store, executor)
+        except Exception as e:
+            self.error = e
+        finally:
+            if store is not None:
+                store.close()
+
+    def _submit_pages(self, store, executor, render, consume):
+        """逐页读取并提交绘制，最多同时有 2 倍线程数的页面在处理中，按页序把结果交给 consume"""
+        palette_size = len(self.painter.palette) or 1
+        pending = deque()
+        for year, month, department in self.tasks:
+            if self.cancelled:
+                break
+            page = CalendarPage.load(store, year, month, department, self.colors, palette_size)
+            pending.append(executor.submit(render, page))
+            while len(pending) >= self.pool_size * 2:
+                consume(pending.popleft().result())
+        while pending and not self.cancelled:
+            consume(pending.popleft().result())
+        for future in pending:
+            future.cancel()
+
+    def _write_png(self, store, executor):
+        def render(page):
+            return self.painter.save_image(page, os.path.join(self.output, page.file_stem + ".png"), self.dpi)
+
+        def consume(path):
+            self.files.append(path)
+            self.done += 1
+
+        self._submit_pages(store, executor, render, consume)
+
+    def _write_pdf(self, store, executor):
+        temp_path = self.output + ".part"
+        writer = QPdfWriter(temp_path)
+        writer.setResolution(self.PDF_RESOLUTION)
+        writer.setPageLayout(QPageLayout(QPageSize(QPageSize.A4), QPageLayout.Landscape, QMarginsF(0, 0, 0, 0)))
+        writer.setTitle("排班表")
+        painter = QPainter(writer)
+        # 逻辑坐标铺满整页
+        scale = writer.width() / CalendarPainter.PAGE_WIDTH
+        painter.scale(scale, scale)
+
+        def consume(picture):
+            if self.done:
+                writer.newPage()
+            painter.drawPicture(0, 0, picture)
+            self.done += 1
+
+        try:
+            self._submit_pages(store, executor, self.painter.record, consume)
+        finally:
+            painter.end()
+        if self.cancelled:
+            os.remove(temp_path)
+            return
+        os.replace(temp_path, self.output)
+        self.files.append(self.output)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="把月历导出为PDF或PNG（离屏渲染）")
+    parser.add_argument("--user", help="用户名")
+    parser.add_argument("--password", default="", help="密码")
+    parser.add_argument("--db", help="直接指定数据库文件")
+    parser.add_argument("--start", required=True, help="开始月份 yyyy-MM")
+    parser.add_argument("--end", help="结束月份 yyyy-MM，默认与开始月份相同")
+    parser.add_argument("--department", action="append", help="只导出该部门，每个部门单独成页（可重复）")
+    parser.add_argument("--per-department", action="store_true", help="期间出现过的每个部门单独成页")
+    parser.add_argument("--format", choices=("pdf", "png"), help="默认按输出文件扩展名判断")
+    parser.add_argument("--dpi", type=int, default=150, help="PNG 分辨率")
+    parser.add_argument("--workers", type=int, help="绘制线程数，默认为CPU核数")
+    parser.add_argument("-o", "--output", required=True, help="PDF 文件或 PNG 输出目录")
+    parser.add_argument("--quiet", action="store_true", help="不显示进度")
+    args = parser.parse_args(argv)
+    fmt = args.format or ("pdf" if args.output.lower().endswith(".pdf") else "png")
+
+    # 无显示环境（如服务器上的定时任务）时使用 offscreen 平台
+    if sys.platform.startswith("linux") and not os.environ.get("DISPLAY"):
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtGui import QGuiApplication
+    from Schedule_Store import UserManager
+    from Schedule_Manager import ScheduleManager
+
+    app = QGuiApplication.instance() or QGuiApplication(sys.argv[:1])
+    font = app.font()
+    font.setFamily("Microsoft YaHei")
+    app.setFont(font)
+
+    db_file = args.db
+    if not db_file:
+        if not args.user:
+            parser.error("请使用 --user 或 --db 指定数据库")
+        UserManager.init_users_db()
+        db_file = UserManager.authenticate(args.user, args.password)
+        if not db_file:
+            print("错误: 用户名或密码错误", file=sys.stderr)
+            return 2
+
+    months = month_range(args.start, args.end or args.start)
+    store = ScheduleStore(db_file)
+    try:
+        store.ensure_schema()
+        colors = store.employee_colors(len(ScheduleManager.COLOR_LIST))
+        departments = args.department
+        if args.per_department and not departments:
+            last_year, last_month = months[-1]
+            departments = store.get_range_departments(
+                f"{months[0][0]:04d}-{months[0][1]:02d}-01",
+                f"{last_year:04d}-{last_month:02d}-{calendar.monthrange(last_year, last_month)[1]:02d}")
+    finally:
+        store.close()
+
+    export = CalendarExport(db_file, months, args.output, fmt, departments, colors, ScheduleManager.COLOR_LIST,
+                            args.workers, args.dpi)
+
+    def progress(done, total):
+        print(f"\r已完成 {done}/{total} 页", end="", file=sys.stderr, flush=True)
+
+    result = export.run(None if args.quiet else progress)
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(f"已导出 {result['pages']} 页（{result['workers']} 个线程，用时 {result['seconds']} 秒）: "
+          f"{os.path.abspath(args.output)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
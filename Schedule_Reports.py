@@ -0,0 +1,240 @@
+"""月度报表批量生成：按部门×月份拆分任务，用进程池并行计算（不依赖 PyQt）
+
+每个任务在工作进程中用该进程的只读连接读取一个部门一个月的排班，计算工时和每日在岗人数，
+并直接写出该部门该月的排班表CSV；主进程只合并汇总、工时明细和每日在岗人数。
+"""
+import os
+import re
+import csv
+import time
+import calendar
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from Schedule_Store import ScheduleStore
+
+TIME_RANGE_RE = re.compile(r"(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})")
+UNSAFE_FILE_CHARS = re.compile(r'[\\/:*?"<>|]')
+
+# 工作进程内的只读连接和班次表（由 _init_worker 打开，进程结束时释放）
+_worker_store = None
+_worker_shifts = {}
+
+
+def month_range(start_month, end_month):
+    """'2025-01', '2025-03' -> [(2025, 1), (2025, 2), (2025, 3)]"""
+    year, month = (int(part) for part in start_month.split("-")[:2])
+    end_year, end_month_no = (int(part) for part in end_month.split("-")[:2])
+    months = []
+    while (year, month) <= (end_year, end_month_no):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def shift_name(shift_type):
+    """'早班 (08:00-16:00)' -> '早班'"""
+    return shift_type.split(" (")[0].strip()
+
+
+def shift_span(shift_type, shifts):
+    """班次在当天的起止分钟 (开始, 结束)，跨零点的班次结束分钟大于1440；没有时间段的班次返回 None"""
+    match = TIME_RANGE_RE.search(shift_type)
+    if not match:
+        times = shifts.get(shift_name(shift_type))
+        match = TIME_RANGE_RE.search("-".join(times)) if times else None
+    if not match:
+        return None
+    start_hour, start_minute, end_hour, end_minute = (int(value) for value in match.groups())
+    start = start_hour * 60 + start_minute
+    minutes = (end_hour * 60 + end_minute - start) % 1440 or 1440
+    return start, start + minutes
+
+
+def shift_hours(shift_type, shifts):
+    """班次时长（小时），跨零点的班次按次日结束计算；没有时间段的班次返回 None"""
+    span = shift_span(shift_type, shifts)
+    if span is None:
+        return None
+    return (span[1] - span[0]) / 60
+
+
+def _init_worker(db_file):
+    global _worker_store, _worker_shifts
+    _worker_store = ScheduleStore(db_file, read_only=True)
+    _worker_shifts = {name: (start, end) for name, start, end in _worker_store.get_shifts()}
+
+
+def build_report(department, year, month, output_dir):
+    """工作进程：生成一个部门一个月的报表，写出排班表CSV，返回汇总、工时和每日在岗人数"""
+    started = time.perf_counter()
+    days = calendar.monthrange(year, month)[1]
+    label = f"{year:04d}-{month:02d}"
+    rows = _worker_store.list_schedules(f"{label}-01", f"{label}-{days:02d}", department=department)
+
+    employees = {}   # 姓名 -> [职位, 每天的班次列表, 班次数, 工时, 无时间段的班次数]
+    on_duty = [set() for _ in range(days)]
+    for _, name, _, position, work_date, shift_type, _ in rows:
+        try:
+            day = int(work_date[8:10]) - 1
+        except ValueError:
+            continue
+        if not 0 <= day < days:
+            continue
+        entry = employees.get(name)
+        if entry is None:
+            entry = employees[name] = [position, [[] for _ in range(days)], 0, 0.0, 0]
+        entry[1][day].append(shift_name(shift_type))
+        entry[2] += 1
+        hours = shift_hours(shift_type, _worker_shifts)
+        if hours is None:
+            entry[4] += 1
+        else:
+            entry[3] += hours
+        on_duty[day].add(name)
+
+    roster_file = None
+    if employees:
+        roster_file = os.path.join(output_dir, f"排班表_{UNSAFE_FILE_CHARS.sub('_', department)}_{label}.csv")
+        with open(roster_file, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["员工姓名", "职位"] + [str(day + 1) for day in range(days)] + ["班次数", "工时"])
+            for name in sorted(employees):
+                position, cells, shifts, hours, _ = employees[name]
+                writer.writerow([name, position] + ["/".join(cell) for cell in cells] + [shifts, round(hours, 2)])
+
+    headcount = [len(names) for names in on_duty]
+    summary = {
+        "department": department,
+        "month": label,
+        "shifts": sum(entry[2] for entry in employees.values()),
+        "employees": len(employees),
+        "hours": round(sum(entry[3] for entry in employees.values()), 2),
+        "unknown_hours_shifts": sum(entry[4] for entry in employees.values()),
+        "uncovered_days": headcount.count(0),
+        "min_headcount": min(headcount),
+        "avg_headcount": round(sum(headcount) / days, 2),
+        "max_headcount": max(headcount),
+    }
+    hours_rows = [(department, label, name, entry[0], entry[2], round(entry[3], 2), entry[4])
+                  for name, entry in sorted(employees.items())]
+    coverage = [(department, f"{label}-{day + 1:02d}", count) for day, count in enumerate(headcount)]
+    return {
+        "summary": summary,
+        "hours": hours_rows,
+        "coverage": coverage,
+        "roster_file": roster_file,
+        "pid": os.getpid(),
+        "ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+
+
+class ReportBatch:
+    """按部门×月份并行生成报表
+
+    界面使用 start / progress / cancel / finish 轮询进度，命令行使用 run。
+    """
+    SUMMARY_COLUMNS = ("department", "month", "shifts", "employees", "hours", "unknown_hours_shifts",
+                       "uncovered_days", "min_headcount", "avg_headcount", "max_headcount")
+    SUMMARY_HEADERS = ("部门", "月份", "班次数", "员工数", "总工时", "无时间段班次",
+                       "无人在岗天数", "最少在岗", "平均在岗", "最多在岗")
+
+    def __init__(self, db_file, months, output_dir, departments=None, workers=None):
+        self.db_file = db_file
+        self.months = list(months)
+        self.output_dir = output_dir
+        self.departments = departments
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = None
+        self.futures = []
+        self.cancelled = False
+
+    def tasks(self):
+        """[(部门, 年, 月)]；未指定部门时使用这段时间内出现过的全部部门"""
+        departments = self.departments
+        if not departments:
+            first_year, first_month = self.months[0]
+            last_year, last_month = self.months[-1]
+            store = ScheduleStore(self.db_file, read_only=True)
+            try:
+                departments = store.get_range_departments(
+                    f"{first_year:04d}-{first_month:02d}-01",
+                    f"{last_year:04d}-{last_month:02d}-{calendar.monthrange(last_year, last_month)[1]:02d}")
+            finally:
+                store.close()
+        return [(department, year, month) for year, month in self.months for department in departments]
+
+    def start(self):
+        """提交全部任务，返回任务数"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        tasks = self.tasks()
+        self.started = time.perf_counter()
+        # 各平台统一使用 spawn：工作进程不继承界面进程的 Qt 状态和数据库连接
+        self.pool_size = max(1, min(self.workers, len(tasks)))
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.pool_size,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker, initargs=(self.db_file,)
+        )
+        self.futures = [self.executor.submit(build_report, department, year, month, self.output_dir)
+                        for department, year, month in tasks]
+        return len(self.futures)
+
+    def progress(self):
+        """(已完成任务数, 任务总数)"""
+        return sum(future.done() for future in self.futures), len(self.futures)
+
+    def cancel(self):
+        """取消尚未开始的任务（正在执行的任务会执行完）"""
+        self.cancelled = True
+        # 逐个取消而不用 shutdown(cancel_futures=True)，后者需要 Python 3.9
+        for future in self.futures:
+            future.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+    def run(self, progress=None):
+        """提交并等待全部任务，progress(已完成, 总数) 在每个任务完成时调用"""
+        total = self.start()
+        try:
+            for done, _ in enumerate(as_completed(self.futures), start=1):
+                if progress:
+                    progress(done, total)
+        except BaseException:
+            self.cancel()
+            raise
+        return self.finish()
+
+    def finish(self):
+        """等待全部任务，合并汇总、工时和每日在岗人数，返回结果信息"""
+        try:
+            results = [future.result() for future in self.futures]
+        finally:
+            self.executor.shutdown()
+        results.sort(key=lambda result: (result["summary"]["month"], result["summary"]["department"]))
+        files = []
+        merged = (
+            ("汇总.csv", self.SUMMARY_HEADERS,
+             [tuple(result["summary"][column] for column in self.SUMMARY_COLUMNS) for result in results]),
+            ("工时.csv", ("部门", "月份", "员工姓名", "职位", "班次数", "工时", "无时间段班次"),
+             [row for result in results for row in result["hours"]]),
+            ("每日在岗人数.csv", ("部门", "日期", "在岗人数"),
+             [row for result in results for row in result["coverage"]]),
+        )
+        for file_name, headers, rows in merged:
+            path = os.path.join(self.output_dir, file_name)
+            with open(path, "w", encoding="utf-8-sig", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(headers)
+                writer.writerows(rows)
+            files.append(path)
+        files.extend(result["roster_file"] for result in results if result["roster_file"])
+        return {
+            "tasks": len(results),
+            "workers": self.pool_size,
+            "processes": len({result["pid"] for result in results}),
+            "seconds": round(time.perf_counter() - self.started, 3),
+            "task_ms": round(sum(result["ms"] for result in results), 3),
+            "files": files,
+            "summary": [result["summary"] for result in results],
+        }
@@ -0,0 +1,120 @@
+"""排班人数规则检查（不依赖 PyQt）
+
+规则形如"技术部 早班 周一至周五 至少3人次"、"客服部 请假 最多2人次"或"技术部 节假日 至少1人次"；
+星期几和日期类型（工作日/休息日/节假日）按日期维度表判断，调休上班日算作工作日。检查不扫描 schedules，
+而是读取触发器增量维护的 staffing_counts（日期×部门×班次的人次），因此任何写入路径
+（界面、命令行、导入、撤销）之后的检查结果都是最新的；一年的全部规则检查只需一次计数查询。
+已归档的年份按归档库的排班现场统计人次。
+"""
+from datetime import date
+
+from Schedule_Reports import shift_name
+
+WEEKDAY_NAMES = ("一", "二", "三", "四", "五", "六", "日")
+
+
+def weekdays_text(weekdays):
+    """'01234' -> '周一至周五'，'0123456' -> '每天'"""
+    days = sorted({int(day) for day in weekdays if day.isdigit() and int(day) < 7})
+    if len(days) == 7:
+        return "每天"
+    if not days:
+        return "从不"
+    if len(days) > 2 and days == list(range(days[0], days[-1] + 1)):
+        return f"周{WEEKDAY_NAMES[days[0]]}至周{WEEKDAY_NAMES[days[-1]]}"
+    return "、".join(f"周{WEEKDAY_NAMES[day]}" for day in days)
+
+
+class StaffingRule:
+    """某部门（某班次）在指定星期几、日期类型的人次范围；min_count/max_count 为 None、day_type 为空表示不限"""
+    __slots__ = ("id", "department", "shift_name", "weekdays", "min_count", "max_count", "note", "day_type")
+
+    def __init__(self, rule_id, department, shift_name="", weekdays="0123456", min_count=None, max_count=None, note="",
+                 day_type=""):
+        self.id = rule_id
+        self.department = department
+        self.shift_name = shift_name
+        self.weekdays = frozenset(int(day) for day in weekdays if day.isdigit())
+        self.min_count = min_count
+        self.max_count = max_count
+        self.note = note
+        self.day_type = day_type or ""
+
+    @property
+    def target(self):
+        return f"{self.department} {self.shift_name or '全部班次'}"
+
+    def describe(self):
+        limits = []
+        if self.min_count is not None:
+            limits.append(f"至少 {self.min_count}")
+        if self.max_count is not None:
+            limits.append(f"最多 {self.max_count}")
+        weekdays = "".join(str(day) for day in sorted(self.weekdays))
+        days = weekdays_text(weekdays) + (f" {self.day_type}" if self.day_type else "")
+        return f"{self.target} {days} {'、'.join(limits) or '不限'} 人次"
+
+    def applies(self, info):
+        """规则是否适用于某天（DayInfo）"""
+        return info.weekday in self.weekdays and info.matches(self.day_type)
+
+    def check(self, count):
+        """人次不满足规则时返回说明，满足时返回 None"""
+        if self.min_count is not None and count < self.min_count:
+            return f"{self.target} {count} 人次，至少需要 {self.min_count}"
+        if self.max_count is not None and count > self.max_count:
+            return f"{self.target} {count} 人次，最多 {self.max_count}"
+        return None
+
+
+class Violation:
+    __slots__ = ("work_date", "rule", "count", "message")
+
+    def __init__(self, work_date, rule, count, message):
+        self.work_date = work_date
+        self.rule = rule
+        self.count = count
+        self.message = message
+
+
+class StaffingChecker:
+    """按人次计数器检查人数规则；规则修改后调用 reload_rules"""
+
+    def __init__(self, store):
+        self.store = store
+        self.rules = []
+        self.reload_rules()
+
+    def reload_rules(self):
+        self.rules = [StaffingRule(*row) for row in self.store.get_staffing_rules()]
+
+    def check(self, start_date, end_date):
+        """检查 [start_date, end_date]（yyyy-MM-dd）的每一天，返回 {日期: [Violation]}（已归档的年份按归档库统计）"""
+        if not self.rules:
+            return {}
+        counts = {}
+        for work_date, department, shift_type, headcount in self.store.staffing_counts(start_date, end_date):
+            for key in ((work_date, department, shift_name(shift_type)), (work_date, department, "")):
+                counts[key] = counts.get(key, 0) + headcount
+        violations = {}
+        for info in self.store.get_date_dim(start_date, end_date):
+            date_str = info.work_date
+            for rule in self.rules:
+                if not rule.applies(info):
+                    continue
+                count = counts.get((date_str, rule.department, rule.shift_name), 0)
+                message = rule.check(count)
+                if message:
+                    violations.setdefault(date_str, []).append(Violation(date_str, rule, count, message))
+        return violations
+
+    def check_dates(self, date_strs):
+        """只检查给定的日期（增量刷新用），返回 {日期: [Violation]}，没有违规的日期对应空列表"""
+        violations = {}
+        for date_str in date_strs:
+            try:
+                date.fromisoformat(date_str)
+            except (TypeError, ValueError):
+                continue
+            violations[date_str] = self.check(date_str, date_str).get(date_str, [])
+        return violations
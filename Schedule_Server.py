@@ -0,0 +1,396 @@
+"""排班表本地服务模式（无界面，JSON API）
+
+用法:
+    python Schedule_Server.py serve --user 用户名 [--password 密码] [--port 8765] [--readers 4]
+    python Schedule_Server.py bench [--port 8765] [--requests 5000] [--concurrency 32]
+
+读请求由只读连接池并发处理，写请求由唯一的写连接串行执行。
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from sqlite3 import Error
+
+from Schedule_Store import UserManager, ScheduleStore, ConcurrentEditError
+
+
+class ApiError(Exception):
+    """带HTTP状态码的接口错误"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+HTTP_REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+                405: "Method Not Allowed", 409: "Conflict", 500: "Internal Server Error"}
+
+
+def parse_head(head):
+    """请求行和请求头 -> (方法, 目标, 版本, {小写的头名: 值}, 请求体长度)，格式错误时抛出 ApiError(400)"""
+    lines = head.decode("latin-1").split("\r\n")
+    request_line = lines[0].split(" ")
+    if len(request_line) != 3 or not all(request_line):
+        raise ApiError(400, "请求行格式错误")
+    method, target, version = request_line
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            key, value = line.split(":", 1)
+            headers[key.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise ApiError(400, "Content-Length 格式错误")
+    if length < 0:
+        raise ApiError(400, "Content-Length 格式错误")
+    return method, target, version, headers, length
+
+
+async def send_response(writer, status, payload, keep_alive):
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    writer.write(
+        f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+        f"Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(data)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data
+    )
+    await writer.drain()
+
+
+class ReadPool:
+    """只读连接池：每个连接固定在线程池中使用，读请求可并发执行"""
+
+    def __init__(self, db_file, size=4):
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="reader")
+        self.connections = [ScheduleStore(db_file, read_only=True, check_same_thread=False) for _ in range(size)]
+        # 空闲连接队列在服务的事件循环中创建（Python 3.8/3.9 的 asyncio.Queue 绑定创建时的事件循环）
+        self.stores = None
+
+    def start(self):
+        self.stores = asyncio.Queue()
+        for store in self.connections:
+            self.stores.put_nowait(store)
+
+    async def run(self, func, *args):
+        store = await self.stores.get()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, store, *args)
+        finally:
+            self.stores.put_nowait(store)
+
+    def close(self):
+        # 等正在执行的读请求结束再关闭连接
+        self.executor.shutdown(wait=True)
+        for store in self.connections:
+            store.close()
+        self.connections = []
+
+
+class Writer:
+    """唯一写连接：所有写操作排队在单线程中串行执行"""
+
+    def __init__(self, db_file):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer")
+        self.store = ScheduleStore(db_file, check_same_thread=False)
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, self.store, *args)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.store.close()
+
+
+def schedule_to_dict(row):
+    """排班记录元组转为JSON对象"""
+    return dict(zip(("id",) + ScheduleStore.COLUMNS + ("row_version",), row))
+
+
+def schedule_from_body(body):
+    """从请求体读取排班字段，返回 (姓名, 部门, 职位, 日期, 班次, 备注)"""
+    data = tuple(str(body.get(column, "") or "").strip() for column in ScheduleStore.COLUMNS)
+    if not data[0] or not data[1] or not data[3] or not data[4]:
+        raise ApiError(400, "employee_name、department、work_date、shift_type 不能为空")
+    return data
+
+
+class ScheduleServer:
+    """基于 asyncio 的最小 HTTP/1.1 JSON 服务"""
+
+    def __init__(self, db_file, readers=4):
+        # 写连接先打开并完成建表，再打开只读连接
+        self.writer = Writer(db_file)
+        self.writer.store.init_db()
+        # WAL 模式下读写互不阻塞
+        self.writer.store.conn.execute("PRAGMA journal_mode=WAL")
+        self.reads = ReadPool(db_file, readers)
+        self.routes = [
+            ("GET", ("schedules",), self.list_schedules),
+            ("POST", ("schedules",), self.add_schedule),
+            ("GET", ("schedules", None), self.get_schedule),
+            ("PUT", ("schedules", None), self.update_schedule),
+            ("DELETE", ("schedules", None), self.delete_schedule),
+            ("GET", ("days", None), self.get_day),
+            ("GET", ("departments",), self.list_departments),
+            ("POST", ("departments",), self.add_department),
+            ("GET", ("shifts",), self.list_shifts),
+            ("POST", ("shifts",), self.save_shift),
+            ("GET", ("users",), self.list_users),
+            ("POST", ("users",), self.create_user),
+            ("POST", ("undo",), self.undo),
+            ("POST", ("redo",), self.redo),
+        ]
+
+    # ---------- 接口 ----------
+
+    async def list_schedules(self, query, body):
+        start = query.get("start", "0000-01-01")
+        end = query.get("end", "9999-12-31")
+        rows = await self.reads.run(ScheduleStore.list_schedules, start, end,
+                                    query.get("search", ""), query.get("department", ""))
+        return 200, [schedule_to_dict(row) for row in rows]
+
+    async def get_schedule(self, query, body, record_id):
+        row = await self.reads.run(ScheduleStore.get_schedule, int(record_id))
+        if not row:
+            raise ApiError(404, "排班记录不存在")
+        return 200, schedule_to_dict(row)
+
+    async def get_day(self, query, body, date_str):
+        rows = await self.reads.run(ScheduleStore.get_day_schedules, date_str)
+        return 200, [dict(zip(("id", "employee_name", "department", "shift_type"), row)) for row in rows]
+
+    async def add_schedule(self, query, body):
+        record_id = await self.writer.run(ScheduleStore.add_schedule, schedule_from_body(body))
+        return 201, {"id": record_id}
+
+    async def update_schedule(self, query, body, record_id):
+        # 请求体带 row_version 时启用乐观锁，版本不一致返回 409
+        expected_version = body.get("row_version")
+        try:
+            found = await self.writer.run(ScheduleStore.update_schedule, int(record_id), schedule_from_body(body),
+                                          int(expected_version) if expected_version is not None else None)
+        except ConcurrentEditError as e:
+            raise ApiError(409, str(e))
+        if not found:
+            raise ApiError(404, "排班记录不存在")
+        return 200, {"id": int(record_id)}
+
+    async def delete_schedule(self, query, body, record_id):
+        if not await self.writer.run(ScheduleStore.delete_schedule, int(record_id)):
+            raise ApiError(404, "排班记录不存在")
+        return 200, {"id": int(record_id)}
+
+    async def list_departments(self, query, body):
+        return 200, await self.reads.run(ScheduleStore.get_departments)
+
+    async def add_department(self, query, body):
+        name = str(body.get("name", "")).strip()
+        if not name:
+            raise ApiError(400, "部门名称不能为空")
+        await self.writer.run(ScheduleStore.add_department, name)
+        return 201, {"name": name}
+
+    async def list_shifts(self, query, body):
+        rows = await self.reads.run(ScheduleStore.get_shifts)
+        return 200, [dict(zip(("shift_name", "start_time", "end_time"), row)) for row in rows]
+
+    async def save_shift(self, query, body):
+        shift_name = str(body.get("shift_name", "")).strip()
+        if not shift_name:
+            raise ApiError(400, "班次名称不能为空")
+        await self.writer.run(ScheduleStore.save_shift, shift_name,
+                              str(body.get("start_time", "")), str(body.get("end_time", "")))
+        return 201, {"shift_name": shift_name}
+
+    async def list_users(self, query, body):
+        return 200, await self.writer.run(lambda store: UserManager.list_users())
+
+    async def create_user(self, query, body):
+        username = str(body.get("username", "")).strip()
+        if not username:
+            raise ApiError(400, "用户名不能为空")
+        try:
+            await self.writer.run(lambda store: UserManager.create_user(username, str(body.get("password", ""))))
+        except Exception as e:
+            raise ApiError(409, str(e))
+        return 201, {"username": username}
+
+    async def undo(self, query, body):
+        return 200, {"label": await self.writer.run(lambda store: store.journal.undo())}
+
+    async def redo(self, query, body):
+        return 200, {"label": await self.writer.run(lambda store: store.journal.redo())}
+
+    # ---------- HTTP ----------
+
+    async def dispatch(self, method, path, query, body):
+        parts = tuple(part for part in path.split("/") if part)
+        if not parts or parts[0] != "api":
+            raise ApiError(404, "接口不存在")
+        parts = parts[1:]
+        path_matched = False
+        for route_method, pattern, handler in self.routes:
+            if len(pattern) != len(parts):
+                continue
+            if any(p is not None and p != part for p, part in zip(pattern, parts)):
+                continue
+            path_matched = True
+            if route_method == method:
+                args = [part for p, part in zip(pattern, parts) if p is None]
+                return await handler(query, body, *args)
+        raise ApiError(405 if path_matched else 404, "接口不存在")
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                try:
+                    method, target, version, headers, length = parse_head(head)
+                except ApiError as e:
+                    # 请求头无法解析时不知道请求体在哪里结束，回复错误后关闭连接
+                    await send_response(writer, e.status, {"error": e.message}, False)
+                    break
+                try:
+                    raw_body = await reader.readexactly(length) if length else b""
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                try:
+                    url = urlsplit(target)
+                    query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                    body = json.loads(raw_body.decode("utf-8")) if raw_body else {}
+                    if not isinstance(body, dict):
+                        raise ApiError(400, "请求体必须是JSON对象")
+                    status, payload = await self.dispatch(method.upper(), url.path, query, body)
+                except ApiError as e:
+                    status, payload = e.status, {"error": e.message}
+                except (ValueError, KeyError) as e:
+                    status, payload = 400, {"error": f"请求格式错误: {str(e)}"}
+                except Error as e:
+                    print(f"[DEBUG] 数据库错误: {str(e)}")
+                    status, payload = 500, {"error": f"数据库错误: {str(e)}"}
+                except Exception as e:
+                    # 处理函数中未预料的错误只影响这一个请求，连接继续可用
+                    print(f"[DEBUG] 处理请求失败: {method} {target}: {e!r}")
+                    status, payload = 500, {"error": f"服务器内部错误: {str(e)}"}
+
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                await send_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        self.reads.start()
+        server = await asyncio.start_server(self.handle_client, host, port)
+        print(f"排班服务已启动: http://{host}:{port}/api/")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.reads.close()
+        self.writer.close()
+
+
+# ---------- 本地压测 ----------
+
+async def _bench_worker(host, port, paths, counter, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while counter:
+            path = paths[counter.pop() % len(paths)]
+            start = time.perf_counter()
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode("latin-1"))
+            await writer.drain()
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.decode("latin-1").split("\r\n"):
+                if line.lower().startswith("content-length:"):
+                    length = int(line.split(":", 1)[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run_bench(host, port, total, concurrency, paths):
+    """并发发送 GET 请求，返回吞吐量和延迟分位数"""
+    counter = list(range(total))
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(_bench_worker(host, port, paths, counter, latencies) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 3)
+
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="排班表本地服务模式")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = sub.add_parser("serve", help="启动JSON服务")
+    serve_parser.add_argument("--user", required=True, help="用户名")
+    serve_parser.add_argument("--password", default="", help="密码")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--readers", type=int, default=4, help="只读连接数")
+
+    bench_parser = sub.add_parser("bench", help="对运行中的服务做本地压测")
+    bench_parser.add_argument("--host", default="127.0.0.1")
+    bench_parser.add_argument("--port", type=int, default=8765)
+    bench_parser.add_argument("--requests", type=int, default=5000)
+    bench_parser.add_argument("--concurrency", type=int, default=32)
+    bench_parser.add_argument("--start", default="2025-01-01", help="列表查询开始日期")
+    bench_parser.add_argument("--end", default="2025-01-31", help="列表查询结束日期")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        paths = [f"/api/schedules?start={args.start}&end={args.end}", f"/api/days/{args.start}",
+                 "/api/departments", "/api/shifts"]
+        result = asyncio.run(run_bench(args.host, args.port, args.requests, args.concurrency, paths))
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return 0
+
+    UserManager.init_users_db()
+    db_file = UserManager.authenticate(args.user, args.password)
+    if not db_file:
+        print("用户名或密码错误", file=sys.stderr)
+        return 1
+    server = ScheduleServer(db_file, args.readers)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2527 @@
+"""排班数据访问层（不依赖 PyQt，可供界面、命令行和服务模式共用）"""
+import os
+import glob
+import stat
+import json
+import uuid
+import zlib
+import sqlite3
+import platform
+from bisect import bisect_left
+from sqlite3 import Error
+from datetime import datetime, date, timedelta
+from contextlib import contextmanager
+from collections import OrderedDict, Counter
+from urllib.parse import quote
+
+from Schedule_Perf import monitor, TimedConnection
+from Schedule_Calendar import (DATE_DIM_COLUMNS, FIRST_YEAR, LAST_YEAR, HOLIDAY, ADJUSTED_WORKDAY, WORKDAY, DayInfo,
+                               load_holidays, date_dim_rows, day_type_condition)
+from Schedule_Sync import FORMAT, FORMAT_VERSION, SyncConflict, SyncResult
+from Schedule_Diff import ROW_TEXT_SQL, day_hash
+
+
+class UserManager:
+    """用户管理类"""
+    USERS_DB = 'users.db'
+    CONFIG_FILE = 'user_config.ini'
+
+    @classmethod
+    def _connect(cls):
+        """打开用户数据库（与排班库一样接入性能监控）"""
+        conn = sqlite3.connect(cls.USERS_DB, factory=TimedConnection)
+        monitor.attach(conn)
+        return conn
+    
+    @classmethod
+    def init_users_db(cls):
+        """初始化用户数据库"""
+        try:
+            conn = cls._connect()
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT NOT NULL UNIQUE,
+                    password TEXT DEFAULT '',
+                    db_file TEXT NOT NULL UNIQUE,
+                    last_login TEXT,
+                    has_password BOOLEAN DEFAULT FALSE
+                )
+            ''')
+            conn.commit()
+            conn.close()
+        except Error as e:
+            print(f"[DEBUG] 无法初始化用户数据库: {str(e)}")
+            raise Exception(f"无法初始化用户数据库: {str(e)}")
+
+    @classmethod
+    def create_user(cls, username, password=''):
+        """创建新用户"""
+        try:
+            db_file = f"user_{username}.db"
+            conn = sqlite3.connect(db_file)
+            conn.close()
+            
+            conn = cls._connect()
+            cursor = conn.cursor()
+            has_password = bool(password)  # 判断是否有密码
+            cursor.execute(
+                "INSERT INTO users (username, password, db_file, has_password) VALUES (?, ?, ?, ?)",
+                (username, password, db_file, has_password)
+            )
+            conn.commit()
+            return True
+        except Error as e:
+            raise Exception(f"无法创建用户: {str(e)}")
+        finally:
+            if 'conn' in locals():
+                conn.close()
+
+    @classmethod
+    def list_users(cls):
+        """返回已注册用户名列表"""
+        try:
+            conn = cls._connect()
+            cursor = conn.cursor()
+            cursor.execute("SELECT username FROM users ORDER BY username")
+            return [row[0] for row in cursor.fetchall()]
+        except Error as e:
+            raise Exception(f"无法加载用户列表: {str(e)}")
+        finally:
+            if 'conn' in locals():
+                conn.close()
+
+    @classmethod
+    def list_user_files(cls):
+        """返回 [(用户名, 数据库文件, 是否有密码)]"""
+        try:
+            conn = cls._connect()
+            cursor = conn.cursor()
+            cursor.execute("SELECT username, db_file, has_password FROM users ORDER BY username")
+            return [(username, db_file, bool(has_password)) for username, db_file, has_password in cursor.fetchall()]
+        except Error as e:
+            raise Exception(f"无法加载用户列表: {str(e)}")
+        finally:
+            if 'conn' in locals():
+                conn.close()
+
+    @classmethod
+    def get_db_file(cls, username):
+        """返回用户的数据库文件，用户不存在时返回 None"""
+        try:
+            conn = cls._connect()
+            cursor = conn.cursor()
+            cursor.execute("SELECT db_file FROM users WHERE username=?", (username,))
+            result = cursor.fetchone()
+            return result[0] if result else None
+        except Error as e:
+            raise Exception(f"无法读取用户信息: {str(e)}")
+        finally:
+            if 'conn' in locals():
+                conn.close()
+
+    @classmethod
+    def get_password(cls, username):
+        """返回用户保存的密码，用户不存在时返回 None"""
+        try:
+            conn = cls._connect()
+            cursor = conn.cursor()
+            cursor.execute("SELECT password FROM users WHERE username=?", (username,))
+            result = cursor.fetchone()
+            return (result[0] or '') if result else None
+        except Error as e:
+            raise Exception(f"无法读取用户信息: {str(e)}")
+        finally:
+            if 'conn' in locals():
+                conn.close()
+
+    @classmethod
+    def authenticate(cls, username, password=''):
+        """验证用户登录"""
+        try:
+            conn = cls._connect()
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT db_file, has_password, password FROM users WHERE username=?",
+                (username,)
+            )
+            result = cursor.fetchone()
+            
+            if not result:
+                return None
+                
+            db_file, has_password, stored_password = result
+            
+            # 如果有密码但未提供密码，或密码不匹配
+            if has_password and (not password or stored_password != password):
+                return None
+                
+            # 更新最后登录时间
+            cursor.execute(
+                "UPDATE users SET last_login=? WHERE username=?",
+                (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), username)
+            )
+            conn.commit()
+            return db_file  # 返回数据库文件路径
+            
+        except Error as e:
+            raise Exception(f"认证失败: {str(e)}")
+        finally:
+            if 'conn' in locals():
+                conn.close()
+
+    @classmethod
+    def delete_user(cls, username):
+        """删除用户及其数据库文件"""
+        try:
+            # 先获取用户的数据库文件路径
+            conn = cls._connect()
+            cursor = conn.cursor()
+            cursor.execute("SELECT db_file FROM users WHERE username=?", (username,))
+            result = cursor.fetchone()
+            
+            if not result:
+                return False
+                
+            db_file = result[0]
+            
+            # 从用户表中删除记录
+            cursor.execute("DELETE FROM users WHERE username=?", (username,))
+            conn.commit()
+            
+            # 删除用户数据库文件、站点标记文件及其归档库
+            for path in (db_file, db_file + ".site"):
+                if os.path.exists(path):
+                    os.remove(path)
+            for path in YearArchives.files_of(db_file):
+                os.chmod(path, stat.S_IREAD | stat.S_IWRITE)
+                os.remove(path)
+                
+            return True
+        except Error as e:
+            raise Exception(f"无法删除用户: {str(e)}")
+        finally:
+            if 'conn' in locals():
+                conn.close()
+
+    @classmethod
+    def _read_config(cls):
+        """读取配置文件（不做 % 插值，搜索词和密码可以包含 %）"""
+        import configparser
+        config = configparser.ConfigParser(interpolation=None)
+        if os.path.exists(cls.CONFIG_FILE):
+            try:
+                config.read(cls.CONFIG_FILE, encoding='utf-8')
+            except UnicodeDecodeError:
+                # 旧版本按系统默认编码写入
+                config.read(cls.CONFIG_FILE)
+        return config
+
+    @classmethod
+    def _write_config(cls, config):
+        with open(cls.CONFIG_FILE, 'w', encoding='utf-8') as configfile:
+            config.write(configfile)
+
+    @classmethod
+    def save_login_config(cls, username, password='', remember=False):
+        """保存登录配置"""
+        # 保留配置文件中各用户的视图状态
+        config = cls._read_config()
+        # 总是保存用户名
+        config['LOGIN'] = {
+            'username': username,
+            'password': password if remember else '',
+            'remember': 'True' if remember else 'False'
+        }
+        cls._write_config(config)
+    
+    @classmethod
+    def load_login_config(cls):
+        """读取登录配置"""
+        config = cls._read_config()
+        if 'LOGIN' in config:
+            return (
+                config['LOGIN'].get('username', ''),
+                config['LOGIN'].get('password', ''),
+                config['LOGIN'].getboolean('remember', False)
+            )
+        return None, None, False
+
+    @classmethod
+    def save_view_state(cls, username, state):
+        """保存用户的视图状态（月份、视图模式、筛选条件、滚动位置）"""
+        config = cls._read_config()
+        config[f'VIEW:{username}'] = {key: str(value) for key, value in state.items()}
+        cls._write_config(config)
+
+    @classmethod
+    def load_view_state(cls, username):
+        """读取用户的视图状态，没有保存过时返回空字典"""
+        config = cls._read_config()
+        section = f'VIEW:{username}'
+        return dict(config[section]) if section in config else {}
+
+
+class ChangeJournal:
+    """排班变更日志（触发器记录行级增量，按操作分组，支持多级撤销/重做）"""
+    MAX_OPS = 50          # 最多保留的可撤销操作数
+    MAX_ROWS = 200000     # 日志最多保留的行级增量数
+    COLUMNS = ("employee_name", "department", "position", "work_date", "shift_type", "remarks")
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def init_schema(self):
+        """创建日志表和 schedules 上的触发器"""
+        cursor = self.conn.cursor()
+        old_cols = ", ".join(f"old_{c} TEXT" for c in self.COLUMNS)
+        new_cols = ", ".join(f"new_{c} TEXT" for c in self.COLUMNS)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS change_ops (
+                op_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                label TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                row_count INTEGER NOT NULL DEFAULT 0,
+                undone INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS change_journal (
+                seq INTEGER PRIMARY KEY,
+                op_id INTEGER NOT NULL,
+                row_id INTEGER NOT NULL,
+                action TEXT NOT NULL,
+                {old_cols},
+                {new_cols}
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_change_journal_op ON change_journal (op_id, row_id, seq)")
+        # 当前操作ID；为 NULL 时触发器不记录（例如撤销/重做本身）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS journal_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                current_op INTEGER
+            )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO journal_state (id, current_op) VALUES (1, NULL)")
+
+        current_op = "(SELECT current_op FROM journal_state WHERE id = 1)"
+        old_names = ", ".join(f"old_{c}" for c in self.COLUMNS)
+        new_names = ", ".join(f"new_{c}" for c in self.COLUMNS)
+        old_values = ", ".join(f"OLD.{c}" for c in self.COLUMNS)
+        new_values = ", ".join(f"NEW.{c}" for c in self.COLUMNS)
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_journal_schedules_insert
+            AFTER INSERT ON schedules WHEN {current_op} IS NOT NULL
+            BEGIN
+                INSERT INTO change_journal (op_id, row_id, action, {new_names})
+                VALUES ({current_op}, NEW.id, 'I', {new_values});
+            END
+        ''')
+        # 只监听数据列，row_version 的自增不记入日志
+        cursor.execute("DROP TRIGGER IF EXISTS trg_journal_schedules_update")
+        cursor.execute(f'''
+            CREATE TRIGGER trg_journal_schedules_update
+            AFTER UPDATE OF {", ".join(self.COLUMNS)} ON schedules WHEN {current_op} IS NOT NULL
+            BEGIN
+                INSERT INTO change_journal (op_id, row_id, action, {old_names}, {new_names})
+                VALUES ({current_op}, OLD.id, 'U', {old_values}, {new_values});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_journal_schedules_delete
+            AFTER DELETE ON schedules WHEN {current_op} IS NOT NULL
+            BEGIN
+                INSERT INTO change_journal (op_id, row_id, action, {old_names})
+                VALUES ({current_op}, OLD.id, 'D', {old_values});
+            END
+        ''')
+
+    @contextmanager
+    def operation(self, label):
+        """将代码块内对 schedules 的所有修改记为一个可撤销操作，并在结束时统一提交"""
+        cursor = self.conn.cursor()
+        try:
+            # 开始新操作后，已撤销的操作不再可重做
+            cursor.execute("DELETE FROM change_journal WHERE op_id IN (SELECT op_id FROM change_ops WHERE undone = 1)")
+            cursor.execute("DELETE FROM change_ops WHERE undone = 1")
+            cursor.execute(
+                "INSERT INTO change_ops (label, created_at) VALUES (?, ?)",
+                (label, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+            op_id = cursor.lastrowid
+            cursor.execute("UPDATE journal_state SET current_op = ? WHERE id = 1", (op_id,))
+            yield op_id
+            cursor.execute("UPDATE journal_state SET current_op = NULL WHERE id = 1")
+            self._finish_op(cursor, op_id)
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def _finish_op(self, cursor, op_id):
+        """压缩刚结束的操作，删除空操作，并执行容量限制"""
+        self._squash(cursor, op_id)
+        cursor.execute("SELECT COUNT(*) FROM change_journal WHERE op_id = ?", (op_id,))
+        row_count = cursor.fetchone()[0]
+        if row_count == 0:
+            cursor.execute("DELETE FROM change_ops WHERE op_id = ?", (op_id,))
+        else:
+            cursor.execute("UPDATE change_ops SET row_count = ? WHERE op_id = ?", (row_count, op_id))
+        self._enforce_limits(cursor)
+
+    def _squash(self, cursor, op_id=None):
+        """同一操作内同一行的多次修改只保留首条和末条（撤销用首条旧值，重做用末条新值）"""
+        op_filter = "WHERE op_id = ?" if op_id is not None else ""
+        params = (op_id, op_id, op_id) if op_id is not None else ()
+        cursor.execute(f'''
+            DELETE FROM change_journal
+            WHERE {"op_id = ? AND" if op_id is not None else ""} seq NOT IN (
+                SELECT MIN(seq) FROM change_journal {op_filter} GROUP BY op_id, row_id
+                UNION ALL
+                SELECT MAX(seq) FROM change_journal {op_filter} GROUP BY op_id, row_id
+            )
+        ''', params)
+
+    def _enforce_limits(self, cursor):
+        """超出操作数或行数上限时，从最旧的操作开始丢弃"""
+        cursor.execute("SELECT op_id, row_count FROM change_ops ORDER BY op_id DESC")
+        kept_rows = 0
+        drop_from = None
+        for index, (op_id, row_count) in enumerate(cursor.fetchall()):
+            kept_rows += row_count
+            # 最新的操作即使超出行数上限也保留，保证刚做的批量操作可撤销
+            if index > 0 and (index >= self.MAX_OPS or kept_rows > self.MAX_ROWS):
+                drop_from = op_id
+                break
+        if drop_from is not None:
+            cursor.execute("DELETE FROM change_journal WHERE op_id <= ?", (drop_from,))
+            cursor.execute("DELETE FROM change_ops WHERE op_id <= ?", (drop_from,))
+
+    def compact(self):
+        """压缩整个日志并执行容量限制"""
+        cursor = self.conn.cursor()
+        self._squash(cursor)
+        cursor.execute('''
+            UPDATE change_ops SET row_count = (
+                SELECT COUNT(*) FROM change_journal WHERE change_journal.op_id = change_ops.op_id
+            )
+        ''')
+        cursor.execute("DELETE FROM change_ops WHERE row_count = 0")
+        self._enforce_limits(cursor)
+        self.conn.commit()
+
+    def undo_label(self):
+        """返回可撤销的操作名称，没有则返回 None"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT label FROM change_ops WHERE undone = 0 ORDER BY op_id DESC LIMIT 1")
+        result = cursor.fetchone()
+        return result[0] if result else None
+
+    def redo_label(self):
+        """返回可重做的操作名称，没有则返回 None"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT label FROM change_ops WHERE undone = 1 ORDER BY op_id LIMIT 1")
+        result = cursor.fetchone()
+        return result[0] if result else None
+
+    def undo(self):
+        """撤销最近一次操作（整批在一个事务内完成），返回操作名称"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT op_id, label FROM change_ops WHERE undone = 0 ORDER BY op_id DESC LIMIT 1")
+        result = cursor.fetchone()
+        if not result:
+            return None
+        op_id, label = result
+        try:
+            self._apply(cursor, op_id, "MIN", "old", "I")
+            cursor.execute("UPDATE change_ops SET undone = 1 WHERE op_id = ?", (op_id,))
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        return label
+
+    def redo(self):
+        """重做最早一次被撤销的操作，返回操作名称"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT op_id, label FROM change_ops WHERE undone = 1 ORDER BY op_id LIMIT 1")
+        result = cursor.fetchone()
+        if not result:
+            return None
+        op_id, label = result
+        try:
+            self._apply(cursor, op_id, "MAX", "new", "D")
+            cursor.execute("UPDATE change_ops SET undone = 0 WHERE op_id = ?", (op_id,))
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        return label
+
+    def _apply(self, cursor, op_id, pick, side, remove_action):
+        """按每行的首条(撤销)或末条(重做)增量，用集合操作恢复 schedules"""
+        entries = f'''
+            SELECT * FROM change_journal
+            WHERE seq IN (SELECT {pick}(seq) FROM change_journal WHERE op_id = ? GROUP BY row_id)
+        '''
+        columns = ", ".join(self.COLUMNS)
+        values = ", ".join(f"{side}_{c}" for c in self.COLUMNS)
+        # 撤销插入 / 重做删除：直接删除对应行
+        cursor.execute(f'''
+            DELETE FROM schedules
+            WHERE id IN (SELECT row_id FROM ({entries}) WHERE action = ?)
+        ''', (op_id, remove_action))
+        # 其余行：已存在则更新，不存在则按原ID重新插入
+        cursor.execute(f'''
+            UPDATE schedules SET ({columns}) = (
+                SELECT {values} FROM change_journal j
+                WHERE j.op_id = ? AND j.row_id = schedules.id
+                ORDER BY j.seq {"ASC" if pick == "MIN" else "DESC"} LIMIT 1
+            )
+            WHERE id IN (SELECT row_id FROM ({entries}) WHERE action != ?)
+        ''', (op_id, op_id, remove_action))
+        # 重新插入的行不能回到旧的行版本，否则持有旧版本的编辑会通过乐观锁检查（ABA）。
+        # 行版本不超过变更计数 + 1（每次修改两者都加一，删除也使计数加一），取当前计数 + 1 必然大于该行用过的版本
+        cursor.execute(f'''
+            INSERT INTO schedules (id, {columns}, row_version)
+            SELECT row_id, {values}, (SELECT value FROM change_counter WHERE id = 1) + 1 FROM ({entries})
+            WHERE action != ? AND row_id NOT IN (SELECT id FROM schedules)
+        ''', (op_id, remove_action))
+
+
+def read_only_uri(path):
+    """以只读方式打开数据库文件的 URI（路径中的 ?、#、% 和非 ASCII 字符按 URI 规则转义）
+
+    用于 connect 或 ATTACH 时连接必须以 uri=True 打开，否则 SQLite 未开启 SQLITE_USE_URI 时会把它当作文件名。
+    """
+    path = os.path.abspath(path).replace("\\", "/")
+    if not path.startswith("/"):
+        path = "/" + path   # Windows 盘符路径: file:///C:/...
+    return "file://" + quote(path, safe="/:") + "?mode=ro"
+
+
+def _year_of(date_str, default):
+    try:
+        return int(date_str[:4])
+    except (TypeError, ValueError):
+        return default
+
+
+class YearArchives:
+    """按年归档：已结束年份的排班移到用户库旁的只读归档库，查询时只挂载日期范围涉及的归档"""
+    MAX_ATTACHED = 8   # 同时挂载的归档数（SQLite 默认最多挂载10个库，留出归档时使用的名额）
+    ARCHIVE_ATTEMPTS = 3   # 生成归档期间这一年被其他窗口修改时重新生成的次数
+    TABLE = '''
+        CREATE TABLE {schema}.schedules (
+            id INTEGER PRIMARY KEY,
+            employee_name TEXT NOT NULL,
+            department TEXT NOT NULL,
+            position TEXT NOT NULL,
+            work_date TEXT NOT NULL,
+            shift_type TEXT NOT NULL,
+            remarks TEXT,
+            row_version INTEGER NOT NULL DEFAULT 1
+        )
+    '''
+    COLUMNS = "id, employee_name, department, position, work_date, shift_type, remarks, row_version"
+
+    def __init__(self, conn, db_file):
+        self.conn = conn
+        self.db_file = db_file
+        self.attached = OrderedDict()   # 年份 -> (挂载名, 归档时间)，按最近使用排序
+
+    def init_schema(self):
+        self.conn.cursor().execute('''
+            CREATE TABLE IF NOT EXISTS archives (
+                year INTEGER PRIMARY KEY,
+                file_name TEXT NOT NULL,
+                row_count INTEGER NOT NULL,
+                archived_at TEXT NOT NULL
+            )
+        ''')
+
+    @staticmethod
+    def files_of(db_file):
+        """某个用户库的全部归档文件"""
+        return glob.glob(glob.escape(os.path.splitext(db_file)[0]) + "_archive_*.db")
+
+    def path(self, file_name):
+        """归档文件与用户库放在同一目录"""
+        return os.path.join(os.path.dirname(os.path.abspath(self.db_file)), file_name)
+
+    def list(self):
+        """已归档的年份: [(年份, 文件名, 记录数, 归档时间)]"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT year, file_name, row_count, archived_at FROM archives ORDER BY year")
+        return cursor.fetchall()
+
+    def segments(self, start_date, end_date):
+        """按日期范围挂载涉及的归档，逐段返回 (开始日期, 结束日期, [挂载名])
+
+        归档超过 MAX_ATTACHED 个时按年份分段，每段只挂载该段的归档；各段日期依次递增，
+        按日期排序的结果直接拼接即可。没有归档时只有主库一段。
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT year, file_name, archived_at FROM archives WHERE year BETWEEN ? AND ? ORDER BY year",
+            (_year_of(start_date, 0), _year_of(end_date, 9999))
+        )
+        archives = cursor.fetchall()
+        if not archives:
+            yield start_date, end_date, []
+            return
+        segment_start = start_date
+        for offset in range(0, len(archives), self.MAX_ATTACHED):
+            batch = archives[offset:offset + self.MAX_ATTACHED]
+            if offset + self.MAX_ATTACHED >= len(archives):
+                yield segment_start, end_date, self.attach(batch)
+            else:
+                last_year = batch[-1][0]
+                yield segment_start, f"{last_year:04d}-12-31", self.attach(batch)
+                segment_start = f"{last_year + 1:04d}-01-01"
+
+    def attach(self, archives):
+        """只读挂载给定的归档 [(年份, 文件名, 归档时间)]，返回挂载名列表"""
+        cursor = self.conn.cursor()
+        aliases = []
+        for year, file_name, archived_at in archives:
+            alias, attached_at = self.attached.pop(year, (None, None))
+            if alias is not None and attached_at != archived_at:
+                # 其他连接重新归档了这一年，重新挂载新文件
+                cursor.execute(f"DETACH DATABASE {alias}")
+                alias = None
+            if alias is None:
+                while len(self.attached) >= self.MAX_ATTACHED:
+                    _, (oldest, _) = self.attached.popitem(last=False)
+                    cursor.execute(f"DETACH DATABASE {oldest}")
+                path = self.path(file_name)
+                if not os.path.exists(path):
+                    raise sqlite3.OperationalError(f"找不到 {year} 年的归档文件: {path}")
+                alias = f"archive_{year}"
+                cursor.execute(f"ATTACH DATABASE ? AS {alias}", (read_only_uri(path),))
+            self.attached[year] = (alias, archived_at)
+            aliases.append(alias)
+        return aliases
+
+    def detach_all(self):
+        cursor = self.conn.cursor()
+        while self.attached:
+            _, (alias, _) = self.attached.popitem()
+            cursor.execute(f"DETACH DATABASE {alias}")
+
+    def find_record(self, record_id, work_date=None):
+        """在挂载的归档中查找记录（给出日期时先挂载该日期的归档），返回所在年份，找不到时返回 None"""
+        if work_date:
+            for _ in self.segments(work_date, work_date):
+                pass
+        cursor = self.conn.cursor()
+        for year, (alias, _) in self.attached.items():
+            cursor.execute(f"SELECT 1 FROM {alias}.schedules WHERE id = ?", (record_id,))
+            if cursor.fetchone():
+                return year
+        return None
+
+    def candidate_years(self, before_year):
+        """主库中有排班、且早于 before_year 的年份"""
+        # 沿日期索引每年只读取一条索引项；work_date > day 保证格式错误的日期也不会重复访问
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            WITH RECURSIVE years(day) AS (
+                SELECT MIN(work_date) FROM schedules
+                UNION ALL
+                SELECT (SELECT MIN(work_date) FROM schedules
+                        WHERE work_date > years.day
+                          AND work_date >= printf('%04d-01-01', CAST(substr(years.day, 1, 4) AS INTEGER) + 1))
+                FROM years WHERE years.day IS NOT NULL
+            )
+            SELECT DISTINCT substr(day, 1, 4) FROM years WHERE day IS NOT NULL
+        ''')
+        years = [int(text) for (text,) in cursor.fetchall() if text.isdigit() and len(text) == 4]
+        return [year for year in years if year < before_year]
+
+    def archive(self, year):
+        """把某一年的排班移到归档库（已有归档时合并），返回移出主库的记录数
+
+        归档库先在内存中生成，再用 VACUUM INTO 写成紧凑的文件并设为只读（VACUUM 不能在事务中执行）；
+        之后取得写锁，按变更日志确认生成期间这一年没有被其他窗口修改，再在同一事务中替换归档文件、
+        登记归档和从主库删除，中途失败或并发修改不会出现重复或丢失的记录（被修改时重新生成）。
+        归档后清空撤销历史（其中的增量可能指向已归档的记录）。
+        """
+        if year >= date.today().year:
+            raise ValueError(f"{year} 年尚未结束，只能归档已结束的年份")
+        start_date, end_date = f"{year:04d}-01-01", f"{year:04d}-12-31"
+        cursor = self.conn.cursor()
+        self.conn.commit()
+        cursor.execute("SELECT COUNT(*) FROM schedules WHERE work_date BETWEEN ? AND ?", (start_date, end_date))
+        if cursor.fetchone()[0] == 0:
+            return 0
+        self.detach_all()
+        file_name = f"{os.path.splitext(os.path.basename(self.db_file))[0]}_archive_{year}.db"
+        path = self.path(file_name)
+        new_path = path + ".new"
+        for _ in range(self.ARCHIVE_ATTEMPTS):
+            row_count, seq = self._build(year, start_date, end_date, new_path)
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                if self._changed_since(seq, start_date, end_date):
+                    self.conn.rollback()
+                    continue
+                if os.path.exists(path):
+                    os.chmod(path, stat.S_IREAD | stat.S_IWRITE)
+                os.replace(new_path, path)
+                os.chmod(path, stat.S_IREAD)
+                cursor.execute("SELECT value FROM change_counter WHERE id = 1")
+                seq = cursor.fetchone()[0]
+                cursor.execute("DELETE FROM schedules WHERE work_date BETWEEN ? AND ?", (start_date, end_date))
+                moved = cursor.rowcount
+                # 归档不是删除，不作为删除同步给其他站点
+                cursor.execute("DELETE FROM sync_tombstones WHERE seq > ?", (seq,))
+                cursor.execute(
+                    "INSERT OR REPLACE INTO archives (year, file_name, row_count, archived_at) VALUES (?, ?, ?, ?)",
+                    (year, file_name, row_count, datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f"))
+                )
+                cursor.execute("DELETE FROM change_journal")
+                cursor.execute("DELETE FROM change_ops")
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+            return moved
+        if os.path.exists(new_path):
+            os.remove(new_path)
+        raise sqlite3.OperationalError(f"归档期间 {year} 年的排班一直被其他窗口修改，请稍后重试")
+
+    def _build(self, year, start_date, end_date, new_path):
+        """生成归档文件 new_path（合并已有的归档），返回 (记录数, 读取主库时的变更计数)"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT file_name FROM archives WHERE year = ?", (year,))
+        existing = cursor.fetchone()
+        if os.path.exists(new_path):
+            os.remove(new_path)
+        cursor.execute("ATTACH DATABASE ':memory:' AS archive_build")
+        try:
+            cursor.execute(self.TABLE.format(schema="archive_build"))
+            if existing:
+                cursor.execute("ATTACH DATABASE ? AS archive_old", (read_only_uri(self.path(existing[0])),))
+                try:
+                    cursor.execute(f"INSERT INTO archive_build.schedules SELECT {self.COLUMNS} FROM archive_old.schedules")
+                    self.conn.commit()
+                finally:
+                    cursor.execute("DETACH DATABASE archive_old")
+            cursor.execute(f'''
+                INSERT INTO archive_build.schedules SELECT {self.COLUMNS} FROM main.schedules
+                WHERE work_date BETWEEN ? AND ?
+            ''', (start_date, end_date))
+            # 与复制的行来自同一读事务（同一快照）
+            cursor.execute("SELECT value FROM change_counter WHERE id = 1")
+            seq = cursor.fetchone()[0]
+            # 与主库相同的查询索引
+            cursor.execute("CREATE INDEX archive_build.idx_schedules_date "
+                           "ON schedules (work_date, department, employee_name)")
+            cursor.execute("CREATE INDEX archive_build.idx_schedules_department ON schedules (department, work_date)")
+            self.conn.commit()
+            cursor.execute("SELECT COUNT(*) FROM archive_build.schedules")
+            row_count = cursor.fetchone()[0]
+            cursor.execute("VACUUM archive_build INTO ?", (new_path,))
+        finally:
+            self.conn.rollback()
+            cursor.execute("DETACH DATABASE archive_build")
+        return row_count, seq
+
+    def _changed_since(self, seq, start_date, end_date):
+        """变更计数 seq 之后日期范围内的排班是否被修改（变更日志已裁剪无法判断时视为修改过）"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT value FROM change_counter WHERE id = 1")
+        if cursor.fetchone()[0] == seq:
+            return False
+        cursor.execute("SELECT MIN(seq) FROM change_log")
+        oldest = cursor.fetchone()[0]
+        if oldest is None or oldest > seq + 1:
+            return True
+        cursor.execute('''
+            SELECT 1 FROM change_log
+            WHERE seq > ? AND (work_date BETWEEN ? AND ? OR old_work_date BETWEEN ? AND ?) LIMIT 1
+        ''', (seq, start_date, end_date, start_date, end_date))
+        return cursor.fetchone() is not None
+
+    def restore(self, year):
+        """把归档的一年移回主库并删除归档文件，返回恢复的记录数"""
+        cursor = self.conn.cursor()
+        self.conn.commit()
+        cursor.execute("SELECT file_name FROM archives WHERE year = ?", (year,))
+        result = cursor.fetchone()
+        if not result:
+            return 0
+        self.detach_all()
+        path = self.path(result[0])
+        cursor.execute("ATTACH DATABASE ? AS archive_restore", (read_only_uri(path),))
+        try:
+            cursor.execute(f'''
+                INSERT INTO schedules ({self.COLUMNS})
+                SELECT {self.COLUMNS} FROM archive_restore.schedules
+            ''')
+            restored = cursor.rowcount
+            cursor.execute("DELETE FROM archives WHERE year = ?", (year,))
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.execute("DETACH DATABASE archive_restore")
+        try:
+            os.chmod(path, stat.S_IREAD | stat.S_IWRITE)
+            os.remove(path)
+        except OSError as e:
+            # 文件仍被其他程序打开（Windows）；未登记的归档文件不会被查询，下次归档时覆盖
+            print(f"[DEBUG] 无法删除归档文件 {path}: {str(e)}")
+        return restored
+
+
+def bulk_schedule_rows(employees, start_date, end_date, weekdays, department, position, shift_type, remarks="",
+                       dates=None):
+    """批量排班的行：每个员工在 [start_date, end_date] 中星期几属于 weekdays（0=周一）的每一天排同一个班次
+
+    日期为 date 或 yyyy-MM-dd 文本，返回按日期、姓名排序的 (姓名, 部门, 职位, 日期, 班次, 备注) 列表。
+    dates 为日期文本集合（例如工作日历中的工作日）时按它选择日期，不再看 weekdays。
+    """
+    if isinstance(start_date, str):
+        start_date = date.fromisoformat(start_date)
+    if isinstance(end_date, str):
+        end_date = date.fromisoformat(end_date)
+    weekdays = set(weekdays)
+    names = sorted(set(employees))
+    rows = []
+    for day in range(start_date.toordinal(), end_date.toordinal() + 1):
+        work_date = date.fromordinal(day)
+        date_str = work_date.isoformat()
+        if (date_str in dates) if dates is not None else (work_date.weekday() in weekdays):
+            rows.extend((name, department, position, date_str, shift_type, remarks) for name in names)
+    return rows
+
+
+class ConcurrentEditError(Exception):
+    """记录在读取后已被其他连接修改（乐观锁冲突）"""
+
+
+class ScheduleStore:
+    """单个用户排班数据库的访问接口"""
+    DEFAULT_DEPARTMENTS = ["销售部", "技术部", "人事部", "财务部", "市场部", "客服部"]
+    DEFAULT_SHIFTS = [
+        ("早班", "08:00", "16:00"),
+        ("中班", "16:00", "24:00"),
+        ("晚班", "00:00", "08:00"),
+        ("全天班", "08:00", "20:00"),
+        ("早班(模糊)", "", ""),
+        ("晚班(模糊)", "", "")
+    ]
+    COLUMNS = ChangeJournal.COLUMNS
+    CHANGE_LOG_KEEP = 50000   # 变更通知日志保留的条数
+    NAME_BATCH = 500          # 按姓名列表查询时每条语句的姓名个数
+    SCHEMA_VERSION = 10        # 表结构版本，保存在 PRAGMA user_version（2: schedules 索引，3: 员工颜色表，4: 归档表，5: 排班模板，6: 人数规则，7: 请假和可用性，8: 日期维度，9: 离线同步，10: 按天内容哈希）
+
+    def __init__(self, db_file, read_only=False, check_same_thread=True):
+        self.db_file = db_file
+        self.read_only = read_only
+        self.date_dim_years = None   # 日期维度已覆盖的年份范围，第一次需要时读取
+        if read_only:
+            # 只读连接：用于并发读取，不会意外写入
+            self.conn = sqlite3.connect(read_only_uri(db_file), uri=True, check_same_thread=check_same_thread,
+                                        factory=TimedConnection)
+        else:
+            # uri=True：挂载归档库时使用只读 URI（普通文件路径不受影响）
+            self.conn = sqlite3.connect(db_file, uri=True, check_same_thread=check_same_thread,
+                                        factory=TimedConnection)
+        # 开启性能监控时记录每条SQL
+        monitor.attach(self.conn)
+        self.cursor = self.conn.cursor()
+        self.journal = ChangeJournal(self.conn)
+        self.archives = YearArchives(self.conn, db_file)
+
+    def close(self):
+        """关闭数据库连接"""
+        self.conn.close()
+
+    def init_db(self):
+        """创建表结构并插入默认部门和班次"""
+        cursor = self.cursor
+        # 创建部门表
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS departments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE
+            )
+        ''')
+        for dept in self.DEFAULT_DEPARTMENTS:
+            cursor.execute("INSERT OR IGNORE INTO departments (name) VALUES (?)", (dept,))
+
+        # 创建排班表
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schedules (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                employee_name TEXT NOT NULL,
+                department TEXT NOT NULL,
+                position TEXT NOT NULL,
+                work_date TEXT NOT NULL,
+                shift_type TEXT NOT NULL,
+                remarks TEXT,
+                row_version INTEGER NOT NULL DEFAULT 1,
+                FOREIGN KEY(department) REFERENCES departments(name)
+            )
+        ''')
+        # 旧数据库补充行版本列
+        cursor.execute("PRAGMA table_info(schedules)")
+        if "row_version" not in [column[1] for column in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE schedules ADD COLUMN row_version INTEGER NOT NULL DEFAULT 1")
+        # 按日期查询（月历、单日、右键菜单、列表日期范围），包含排序列避免再排序
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_schedules_date ON schedules (work_date, department, employee_name)")
+        # 按部门过滤和部门下拉框
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_schedules_department ON schedules (department, work_date)")
+
+        # 创建自定义班次表
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS custom_shifts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                shift_name TEXT NOT NULL,
+                start_time TEXT NOT NULL,
+                end_time TEXT NOT NULL,
+                UNIQUE(shift_name)
+            )
+        ''')
+        for shift in self.DEFAULT_SHIFTS:
+            cursor.execute("INSERT OR IGNORE INTO custom_shifts (shift_name, start_time, end_time) VALUES (?, ?, ?)", shift)
+
+        self.init_employee_colors()
+        self.archives.init_schema()
+        self.init_templates()
+        self.init_staffing()
+        self.init_availability()
+        self.init_date_dim()
+        self.init_sync()
+        self.init_day_hashes()
+
+        # 变更日志（撤销/重做）
+        self.journal.init_schema()
+        self.init_change_tracking()
+        cursor.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self.conn.commit()
+
+    def init_employee_colors(self):
+        """员工颜色表：新出现的员工由触发器登记（color_index = -1），登录时再按哈希分配颜色"""
+        cursor = self.cursor
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'employee_colors'")
+        created = cursor.fetchone() is None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS employee_colors (
+                employee_name TEXT PRIMARY KEY,
+                color_index INTEGER NOT NULL
+            )
+        ''')
+        if created:
+            # 升级旧数据库时登记已有员工
+            cursor.execute(
+                "INSERT OR IGNORE INTO employee_colors (employee_name, color_index) "
+                "SELECT DISTINCT employee_name, -1 FROM schedules"
+            )
+        register = "INSERT OR IGNORE INTO employee_colors (employee_name, color_index) VALUES (NEW.employee_name, -1);"
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_employee_colors_insert
+            AFTER INSERT ON schedules
+            BEGIN
+                {register}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_employee_colors_update
+            AFTER UPDATE OF employee_name ON schedules
+            BEGIN
+                {register}
+            END
+        ''')
+
+    def init_templates(self):
+        """排班模板：模板行按相对开始日期的天数保存，应用时整体平移到目标日期"""
+        cursor = self.cursor
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schedule_templates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                period_days INTEGER NOT NULL,
+                row_count INTEGER NOT NULL,
+                created_at TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS template_rows (
+                template_id INTEGER NOT NULL,
+                day_offset INTEGER NOT NULL,
+                employee_name TEXT NOT NULL,
+                department TEXT NOT NULL,
+                position TEXT NOT NULL,
+                shift_type TEXT NOT NULL,
+                remarks TEXT
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_template_rows ON template_rows (template_id, day_offset)")
+
+    def init_staffing(self):
+        """人数规则和按 日期×部门×班次 的人次计数器；计数器由触发器随每次插入、修改、删除增量维护"""
+        cursor = self.cursor
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS staffing_rules (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                department TEXT NOT NULL,
+                shift_name TEXT NOT NULL DEFAULT '',
+                weekdays TEXT NOT NULL DEFAULT '0123456',
+                min_count INTEGER,
+                max_count INTEGER,
+                note TEXT NOT NULL DEFAULT '',
+                day_type TEXT NOT NULL DEFAULT ''
+            )
+        ''')
+        # 旧数据库补充日期类型列（工作日/休息日/节假日，空为不限）
+        cursor.execute("PRAGMA table_info(staffing_rules)")
+        if "day_type" not in [column[1] for column in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE staffing_rules ADD COLUMN day_type TEXT NOT NULL DEFAULT ''")
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'staffing_counts'")
+        created = cursor.fetchone() is None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS staffing_counts (
+                work_date TEXT NOT NULL,
+                department TEXT NOT NULL,
+                shift_type TEXT NOT NULL,
+                headcount INTEGER NOT NULL,
+                PRIMARY KEY (work_date, department, shift_type)
+            ) WITHOUT ROWID
+        ''')
+        if created:
+            # 升级旧数据库时统计已有排班
+            self.rebuild_staffing_counts()
+        increment = '''
+            INSERT INTO staffing_counts (work_date, department, shift_type, headcount)
+            VALUES (NEW.work_date, NEW.department, NEW.shift_type, 1)
+            ON CONFLICT (work_date, department, shift_type) DO UPDATE SET headcount = headcount + 1;'''
+        decrement = '''
+            UPDATE staffing_counts SET headcount = headcount - 1
+            WHERE work_date = OLD.work_date AND department = OLD.department AND shift_type = OLD.shift_type;
+            DELETE FROM staffing_counts
+            WHERE work_date = OLD.work_date AND department = OLD.department AND shift_type = OLD.shift_type
+            AND headcount <= 0;'''
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_staffing_insert
+            AFTER INSERT ON schedules
+            BEGIN {increment}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_staffing_update
+            AFTER UPDATE OF work_date, department, shift_type ON schedules
+            BEGIN {decrement}{increment}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_staffing_delete
+            AFTER DELETE ON schedules
+            BEGIN {decrement}
+            END
+        ''')
+
+    def rebuild_staffing_counts(self):
+        """按 schedules 重新统计人次计数器（绕过触发器批量写入后使用）"""
+        self.cursor.execute("DELETE FROM staffing_counts")
+        self.cursor.execute('''
+            INSERT INTO staffing_counts (work_date, department, shift_type, headcount)
+            SELECT work_date, department, shift_type, COUNT(*) FROM schedules
+            GROUP BY work_date, department, shift_type
+        ''')
+
+    def init_availability(self):
+        """请假、不可用和偏好时段；时间为 yyyy-MM-dd HH:MM 文本，结束时间不含"""
+        cursor = self.cursor
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS employee_availability (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                employee_name TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                start_at TEXT NOT NULL,
+                end_at TEXT NOT NULL,
+                note TEXT NOT NULL DEFAULT ''
+            )
+        ''')
+        # 按开始时间范围加载某个月的时段；列表按员工查询
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_availability_start ON employee_availability (start_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_availability_name ON employee_availability (employee_name, start_at)")
+        # 修改计数：内存中的可用性索引据此判断是否需要重新加载（包括其他窗口和命令行的修改）；
+        # max_days 为最长时段的天数（只增不减），按月加载时据此确定开始时间的下限
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS availability_counter (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                value INTEGER NOT NULL,
+                max_days REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO availability_counter (id, value) VALUES (1, 0)")
+        bump = "UPDATE availability_counter SET value = value + 1 WHERE id = 1;"
+        widen = '''
+            UPDATE availability_counter
+            SET max_days = max(max_days, ifnull(julianday(NEW.end_at) - julianday(NEW.start_at), 0)) WHERE id = 1;'''
+        for event, body in (("INSERT", bump + widen), ("UPDATE", bump + widen), ("DELETE", bump)):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_availability_{event.lower()}
+                AFTER {event} ON employee_availability
+                BEGIN
+                    {body}
+                END
+            ''')
+
+    def init_date_dim(self):
+        """日期维度表：初始覆盖已有排班的年份和今年前后几年，之后按需扩展（见 ensure_date_dim）"""
+        cursor = self.cursor
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS date_dim (
+                work_date TEXT PRIMARY KEY,
+                day_number INTEGER NOT NULL,
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                day INTEGER NOT NULL,
+                weekday INTEGER NOT NULL,
+                iso_year INTEGER NOT NULL,
+                iso_week INTEGER NOT NULL,
+                is_weekend INTEGER NOT NULL,
+                is_holiday INTEGER NOT NULL,
+                is_adjusted_workday INTEGER NOT NULL,
+                is_workday INTEGER NOT NULL,
+                holiday_name TEXT NOT NULL DEFAULT ''
+            ) WITHOUT ROWID
+        ''')
+        # 节假日数据的来源（空为随程序发布的文件）和校验值，文件变化时刷新标记
+        cursor.execute("CREATE TABLE IF NOT EXISTS date_dim_info (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        cursor.execute("SELECT MIN(work_date), MAX(work_date) FROM schedules")
+        first_date, last_date = cursor.fetchone()
+        this_year = date.today().year
+        first_year = min(_year_of(first_date, this_year), this_year - 1)
+        last_year = max(_year_of(last_date, this_year), this_year + 5)
+        self.ensure_date_dim(f"{first_year}-01-01", f"{last_year}-12-31")
+        self.sync_holidays()
+
+    def holiday_data(self):
+        """当前来源的节假日: ({日期: (类型, 名称)}, 校验值, 来源)"""
+        self.cursor.execute("SELECT value FROM date_dim_info WHERE key = 'holiday_source'")
+        row = self.cursor.fetchone()
+        source = row[0] if row and os.path.exists(row[0]) else ""
+        holidays, crc = load_holidays(source or None)
+        return holidays, crc, source
+
+    def ensure_date_dim(self, start_date, end_date):
+        """日期维度覆盖 [start_date, end_date] 涉及的整年，缺少时补充（只读连接不扩展），返回是否补充"""
+        if self.read_only:
+            return False
+        first = max(FIRST_YEAR, _year_of(start_date, FIRST_YEAR))
+        last = min(LAST_YEAR, _year_of(end_date, LAST_YEAR))
+        if self.date_dim_years is None:
+            self.cursor.execute("SELECT MIN(year), MAX(year) FROM date_dim")
+            low, high = self.cursor.fetchone()
+            self.date_dim_years = (low, high) if low is not None else None
+        if self.date_dim_years is None:
+            missing = [(first, last)]
+        else:
+            low, high = self.date_dim_years
+            missing = [span for span in ((first, low - 1), (high + 1, last)) if span[0] <= span[1]]
+            first, last = min(first, low), max(last, high)
+        if not missing:
+            return False
+        holidays = self.holiday_data()[0]
+        placeholders = ", ".join("?" * len(DATE_DIM_COLUMNS))
+        for low, high in missing:
+            self.cursor.executemany(
+                f"INSERT OR IGNORE INTO date_dim ({', '.join(DATE_DIM_COLUMNS)}) VALUES ({placeholders})",
+                date_dim_rows(low, high, holidays))
+        self.conn.commit()
+        self.date_dim_years = (first, last)
+        return True
+
+    def sync_holidays(self, path=None, bundled=False):
+        """节假日文件有更新、指定了新文件（path）或恢复随程序发布的文件（bundled）时刷新日期维度中的节假日标记，
+        返回刷新的天数（未变化时为 None）"""
+        if self.read_only:
+            return None
+        if path:
+            if not os.path.exists(path):
+                raise ValueError(f"找不到节假日文件: {path}")
+            path = os.path.abspath(path)
+            holidays, crc = load_holidays(path)
+            source = path
+        elif bundled:
+            holidays, crc = load_holidays()
+            source = ""
+        else:
+            holidays, crc, source = self.holiday_data()
+            self.cursor.execute("SELECT value FROM date_dim_info WHERE key = 'holiday_crc'")
+            row = self.cursor.fetchone()
+            if row and row[0] == crc:
+                return None
+        cursor = self.cursor
+        cursor.execute('''
+            UPDATE date_dim SET is_holiday = 0, is_adjusted_workday = 0, is_workday = 1 - is_weekend, holiday_name = ''
+            WHERE is_holiday = 1 OR is_adjusted_workday = 1
+        ''')
+        cursor.executemany('''
+            UPDATE date_dim SET is_holiday = ?, is_adjusted_workday = ?, is_workday = ?, holiday_name = ?
+            WHERE work_date = ?
+        ''', [(int(kind == HOLIDAY), int(kind == ADJUSTED_WORKDAY), int(kind == ADJUSTED_WORKDAY), name, work_date)
+              for work_date, (kind, name) in holidays.items()])
+        cursor.executemany("INSERT OR REPLACE INTO date_dim_info (key, value) VALUES (?, ?)",
+                           [("holiday_source", source), ("holiday_crc", crc)])
+        self.conn.commit()
+        return len(holidays)
+
+    def get_date_dim(self, start_date, end_date):
+        """[start_date, end_date] 每一天的 DayInfo，按日期排序"""
+        self.ensure_date_dim(start_date, end_date)
+        self.cursor.execute('''
+            SELECT work_date, weekday, iso_week, is_holiday, is_adjusted_workday, is_workday, holiday_name
+            FROM date_dim WHERE work_date BETWEEN ? AND ? ORDER BY work_date
+        ''', (start_date, end_date))
+        return [DayInfo(*row) for row in self.cursor.fetchall()]
+
+    def get_workdays(self, start_date, end_date, day_type=WORKDAY):
+        """日期范围内属于日期类型（工作日/休息日/节假日）的日期文本"""
+        self.ensure_date_dim(start_date, end_date)
+        self.cursor.execute(f'''
+            SELECT work_date FROM date_dim
+            WHERE work_date BETWEEN ? AND ? AND {day_type_condition(day_type) or "1"} ORDER BY work_date
+        ''', (start_date, end_date))
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def init_sync(self):
+        """离线同步：站点ID、从其他站点导入的行的全局ID、删除墓碑、对方站点的水位线和导入写入的变更范围"""
+        cursor = self.cursor
+        # 站点ID；数据库被复制后分出新站点，旧站点记下使用到的最大行ID和当时的变更计数（两份数据库共同的历史），
+        # 当前站点的 last_row_id 为 NULL
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_sites (
+                site_id TEXT PRIMARY KEY,
+                last_row_id INTEGER,
+                last_seq INTEGER
+            )
+        ''')
+        cursor.execute("CREATE TABLE IF NOT EXISTS sync_info (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        # 从其他站点导入的行：本地ID -> 对方的全局ID（行删除后保留，撤销删除时ID不变）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_uids (
+                row_id INTEGER PRIMARY KEY,
+                row_uid TEXT NOT NULL UNIQUE
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_tombstones (
+                seq INTEGER PRIMARY KEY,
+                row_id INTEGER NOT NULL,
+                work_date TEXT
+            )
+        ''')
+        # received_seq: 已导入对方的变更计数；acked_seq: 对方确认已导入本库的变更计数；
+        # local_seq: 上次导入后本库的变更计数（此后本地修改过的行与对方的修改冲突）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_peers (
+                site_id TEXT PRIMARY KEY,
+                received_seq INTEGER NOT NULL DEFAULT 0,
+                acked_seq INTEGER NOT NULL DEFAULT 0,
+                local_seq INTEGER,
+                synced_at TEXT
+            )
+        ''')
+        # 导入写入的变更计数范围，导出时不再发回，也不算本地修改
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_imports (
+                first_seq INTEGER PRIMARY KEY,
+                last_seq INTEGER NOT NULL
+            )
+        ''')
+        self.sync_site()
+
+    def init_day_hashes(self):
+        """按天的内容哈希缓存（比较两个数据库时使用），seq 为缓存对应的变更计数，为 NULL 时尚未计算"""
+        cursor = self.cursor
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS day_hashes (
+                work_date TEXT PRIMARY KEY,
+                row_count INTEGER NOT NULL,
+                hash INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS day_hash_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                seq INTEGER
+            )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO day_hash_state (id, seq) VALUES (1, NULL)")
+
+    def schema_version(self):
+        """数据库当前的表结构版本（旧版本程序创建的数据库为0）"""
+        self.cursor.execute("PRAGMA user_version")
+        return self.cursor.fetchone()[0]
+
+    def ensure_schema(self):
+        """表结构不是当前版本时才执行建表/升级，返回是否执行了升级"""
+        if self.schema_version() == self.SCHEMA_VERSION:
+            # 随程序发布的节假日文件更新后刷新标记（未变化时只比较校验值）
+            self.sync_holidays()
+            self.sync_site()
+            return False
+        self.init_db()
+        return True
+
+    def migrate(self):
+        """升级表结构到当前版本，返回 (升级前版本, 当前版本)"""
+        old_version = self.schema_version()
+        self.init_db()
+        return old_version, self.SCHEMA_VERSION
+
+    def init_change_tracking(self):
+        """变更计数器、变更通知日志和行版本触发器（对所有写入路径生效）"""
+        cursor = self.cursor
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS change_counter (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                value INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO change_counter (id, value) VALUES (1, 0)")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS change_log (
+                seq INTEGER PRIMARY KEY,
+                row_id INTEGER NOT NULL,
+                work_date TEXT,
+                old_work_date TEXT
+            )
+        ''')
+        columns = ", ".join(self.COLUMNS)
+        bump = "UPDATE change_counter SET value = value + 1 WHERE id = 1;"
+        seq = "(SELECT value FROM change_counter WHERE id = 1)"
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_change_schedules_insert
+            AFTER INSERT ON schedules
+            BEGIN
+                {bump}
+                INSERT INTO change_log (seq, row_id, work_date) VALUES ({seq}, NEW.id, NEW.work_date);
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_change_schedules_update
+            AFTER UPDATE OF {columns} ON schedules
+            BEGIN
+                {bump}
+                INSERT INTO change_log (seq, row_id, work_date, old_work_date)
+                VALUES ({seq}, NEW.id, NEW.work_date, OLD.work_date);
+            END
+        ''')
+        # 删除同时记入同步墓碑（变更通知日志会被裁剪，墓碑保留到全部对方站点确认收到，见 apply_changes）
+        cursor.execute("DROP TRIGGER IF EXISTS trg_change_schedules_delete")
+        cursor.execute(f'''
+            CREATE TRIGGER trg_change_schedules_delete
+            AFTER DELETE ON schedules
+            BEGIN
+                {bump}
+                INSERT INTO change_log (seq, row_id, old_work_date) VALUES ({seq}, OLD.id, OLD.work_date);
+                INSERT INTO sync_tombstones (seq, row_id, work_date) VALUES ({seq}, OLD.id, OLD.work_date);
+            END
+        ''')
+        # 任何修改数据列的 UPDATE 都使行版本加一（乐观锁）
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_schedules_row_version
+            AFTER UPDATE OF {columns} ON schedules
+            WHEN NEW.row_version = OLD.row_version
+            BEGIN
+                UPDATE schedules SET row_version = OLD.row_version + 1 WHERE id = NEW.id;
+            END
+        ''')
+        self.trim_change_log()
+
+    def trim_change_log(self):
+        """只保留最近 CHANGE_LOG_KEEP 条变更通知"""
+        self.cursor.execute(
+            "DELETE FROM change_log WHERE seq <= (SELECT value FROM change_counter WHERE id = 1) - ?",
+            (self.CHANGE_LOG_KEEP,)
+        )
+
+    # ---------- 变更检测 ----------
+
+    def data_version(self):
+        """PRAGMA data_version：其他连接提交后才会变化，查询代价极低"""
+        self.cursor.execute("PRAGMA data_version")
+        return self.cursor.fetchone()[0]
+
+    def change_counter(self):
+        """当前变更计数"""
+        self.cursor.execute("SELECT value FROM change_counter WHERE id = 1")
+        return self.cursor.fetchone()[0]
+
+    def changes_since(self, seq):
+        """返回 (最新计数, [(行ID, 新日期, 旧日期)])；日志已被裁剪无法增量时变更列表为 None"""
+        counter = self.change_counter()
+        if counter == seq:
+            return counter, []
+        self.cursor.execute("SELECT MIN(seq) FROM change_log")
+        oldest = self.cursor.fetchone()[0]
+        if oldest is None or oldest > seq + 1:
+            return counter, None
+        self.cursor.execute(
+            "SELECT row_id, work_date, old_work_date FROM change_log WHERE seq > ? ORDER BY seq",
+            (seq,)
+        )
+        return counter, self.cursor.fetchall()
+
+    # ---------- 查询（日期范围涉及已归档年份时自动合并归档库） ----------
+
+    @staticmethod
+    def _union(columns, where, params, archives, order_by=""):
+        """同一查询在主库和各归档库上执行并 UNION ALL 合并，返回 (SQL, 参数)"""
+        tables = ["schedules"] + [f"{alias}.schedules" for alias in archives]
+        query = "\n UNION ALL ".join(f"SELECT {columns} FROM {table} WHERE {where}" for table in tables)
+        if order_by:
+            query += f" ORDER BY {order_by}"
+        return query, list(params) * len(tables)
+
+    def get_day_schedules(self, date_str):
+        """某一天的排班: (id, 姓名, 部门, 班次)"""
+        rows = []
+        for _, _, archives in self.archives.segments(date_str, date_str):
+            self.cursor.execute(*self._union("id, employee_name, department, shift_type", "work_date = ?",
+                                             (date_str,), archives, "department, employee_name"))
+            rows.extend(self.cursor.fetchall())
+        return rows
+
+    def get_range_employees(self, start_date, end_date, department=""):
+        """日期范围内出现过的员工姓名（可限定部门）"""
+        where = "work_date BETWEEN ? AND ?" + (" AND department = ?" if department else "")
+        names = set()
+        for start, end, archives in self.archives.segments(start_date, end_date):
+            params = [start, end] + ([department] if department else [])
+            self.cursor.execute(*self._union("DISTINCT employee_name", where, params, archives))
+            names.update(row[0] for row in self.cursor.fetchall())
+        return sorted(names)
+
+    def get_employee_shifts(self, start_date, end_date, names, department=""):
+        """指定员工在日期范围内的排班: (id, 姓名, 部门, 日期, 班次)，时间轴只查询可见的员工和日期"""
+        where = "work_date BETWEEN ? AND ? AND employee_name IN (SELECT value FROM json_each(?))"
+        if department:
+            where += " AND department = ?"
+        rows = []
+        for start, end, archives in self.archives.segments(start_date, end_date):
+            params = [start, end, json.dumps(list(names))] + ([department] if department else [])
+            self.cursor.execute(*self._union("id, employee_name, department, work_date, shift_type",
+                                             where, params, archives))
+            rows.extend(self.cursor.fetchall())
+        return rows
+
+    def get_range_departments(self, start_date, end_date):
+        """日期范围内出现过的部门（包括已归档的年份）"""
+        departments = set()
+        for start, end, archives in self.archives.segments(start_date, end_date):
+            self.cursor.execute(*self._union("DISTINCT department", "work_date BETWEEN ? AND ?",
+                                             (start, end), archives))
+            departments.update(row[0] for row in self.cursor.fetchall())
+        return sorted(departments)
+
+    def _schedule_query(self, start_date, end_date, search_text="", department="", row_ids=None, archives=(),
+                        day_type=""):
+        """列表查询的SQL和参数；archives 为已挂载的归档库，day_type 为工作日/休息日/节假日（按日期维度筛选）"""
+        where = "work_date BETWEEN ? AND ?"
+        params = [start_date, end_date]
+
+        # 添加搜索条件
+        if search_text:
+            where += " AND (employee_name LIKE ? OR department LIKE ?)"
+            params.extend([f"%{search_text}%", f"%{search_text}%"])
+
+        # 添加部门过滤
+        if department:
+            where += " AND department = ?"
+            params.append(department)
+
+        if row_ids is not None:
+            where += f" AND id IN ({', '.join('?' * len(row_ids))})"
+            params.extend(row_ids)
+
+        condition = day_type_condition(day_type, "main.date_dim")
+        if condition:
+            where += f''' AND work_date IN (
+                SELECT work_date FROM main.date_dim WHERE work_date BETWEEN ? AND ? AND {condition})'''
+            params.extend([start_date, end_date])
+
+        return self._union("id, employee_name, department, position, work_date, shift_type, remarks",
+                           where, params, archives, "work_date, department, employee_name")
+
+    def list_schedules(self, start_date, end_date, search_text="", department="", row_ids=None, day_type=""):
+        """按日期范围、关键字、部门和日期类型查询排班(列表视图)，row_ids 可限定只查部分记录"""
+        rows = []
+        if day_type:
+            self.ensure_date_dim(start_date, end_date)
+        for start, end, archives in self.archives.segments(start_date, end_date):
+            self.cursor.execute(*self._schedule_query(start, end, search_text, department, row_ids, archives, day_type))
+            rows.extend(self.cursor.fetchall())
+        return rows
+
+    def iter_schedules(self, start_date, end_date, search_text="", department="", day_type=""):
+        """与 list_schedules 相同，但逐行返回，不在内存中生成整个结果列表"""
+        if day_type:
+            self.ensure_date_dim(start_date, end_date)
+        for start, end, archives in self.archives.segments(start_date, end_date):
+            yield from self.conn.cursor().execute(
+                *self._schedule_query(start, end, search_text, department, archives=archives, day_type=day_type))
+
+    def get_schedule(self, record_id):
+        """按ID读取一条排班: (id, 姓名, 部门, 职位, 日期, 班次, 备注, 行版本)"""
+        self.cursor.execute('''
+            SELECT id, employee_name, department, position, work_date, shift_type, remarks, row_version
+            FROM schedules WHERE id = ?
+        ''', (record_id,))
+        return self.cursor.fetchone()
+
+    def get_departments(self):
+        """部门表中的全部部门"""
+        self.cursor.execute("SELECT name FROM departments ORDER BY name")
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def get_used_departments(self):
+        """排班记录中实际出现的部门"""
+        # 沿部门索引逐个跳到下一个部门，只读取每个部门的一条索引项，而不是扫描全部排班
+        self.cursor.execute('''
+            WITH RECURSIVE used(name) AS (
+                SELECT MIN(department) FROM schedules
+                UNION ALL
+                SELECT (SELECT MIN(department) FROM schedules WHERE department > used.name)
+                FROM used WHERE used.name IS NOT NULL
+            )
+            SELECT name FROM used WHERE name IS NOT NULL
+        ''')
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def get_shifts(self):
+        """全部班次: (名称, 开始时间, 结束时间)"""
+        self.cursor.execute("SELECT shift_name, start_time, end_time FROM custom_shifts ORDER BY shift_name")
+        return self.cursor.fetchall()
+
+    def get_shift_labels(self):
+        """班次下拉框显示文本，例如 早班 (08:00-16:00)"""
+        self.cursor.execute("SELECT shift_name || ' (' || start_time || '-' || end_time || ')' FROM custom_shifts ORDER BY shift_name")
+        return [row[0] for row in self.cursor.fetchall()]
+
+    # ---------- 写入（均记入变更日志，可撤销） ----------
+
+    def add_schedule(self, data):
+        """添加排班，data 为 (姓名, 部门, 职位, 日期, 班次, 备注)，返回新记录ID"""
+        with self.journal.operation(f"添加 {data[0]} 在 {data[3]} 的排班"):
+            self.cursor.execute('''
+                INSERT INTO schedules 
+                (employee_name, department, position, work_date, shift_type, remarks)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', tuple(data))
+            return self.cursor.lastrowid
+
+    def update_schedule(self, record_id, data, expected_version=None):
+        """更新排班，返回是否找到该记录
+
+        指定 expected_version 时启用乐观锁：记录已被其他连接修改则抛出 ConcurrentEditError。
+        """
+        with self.journal.operation(f"编辑 {data[0]} 在 {data[3]} 的排班"):
+            query = '''
+                UPDATE schedules 
+                SET employee_name=?, department=?, position=?, work_date=?, shift_type=?, remarks=?
+                WHERE id=?
+            '''
+            params = tuple(data) + (record_id,)
+            if expected_version is not None:
+                query += " AND row_version=?"
+                params += (expected_version,)
+            self.cursor.execute(query, params)
+            if self.cursor.rowcount > 0:
+                return True
+            if expected_version is not None:
+                self.cursor.execute("SELECT 1 FROM schedules WHERE id = ?", (record_id,))
+                if self.cursor.fetchone():
+                    raise ConcurrentEditError("该排班记录已被其他用户修改")
+            return False
+
+    def delete_schedule(self, record_id):
+        """删除排班，返回是否找到该记录"""
+        self.cursor.execute("SELECT employee_name, work_date FROM schedules WHERE id = ?", (record_id,))
+        record = self.cursor.fetchone()
+        if not record:
+            return False
+        with self.journal.operation(f"删除 {record[0]} 在 {record[1]} 的排班"):
+            self.cursor.execute("DELETE FROM schedules WHERE id = ?", (record_id,))
+        return True
+
+    def add_schedules(self, rows, label, skip_existing=False):
+        """批量添加排班（一个事务、一个可撤销操作），并补充缺少的部门，返回添加的行数
+
+        skip_existing 为 True 时跳过姓名、日期和班次都相同的已有排班（与 validate 的"重复排班"一致）。
+        """
+        rows = [tuple(row) for row in rows]
+        with self.journal.operation(label):
+            if skip_existing and rows:
+                existing = self.existing_schedule_keys(min(row[3] for row in rows), max(row[3] for row in rows),
+                                                       {row[0] for row in rows})
+                rows = [row for row in rows if (row[0], row[3], row[4]) not in existing]
+            self.cursor.executemany('''
+                INSERT INTO schedules 
+                (employee_name, department, position, work_date, shift_type, remarks)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            self.cursor.executemany(
+                "INSERT OR IGNORE INTO departments (name) VALUES (?)",
+                [(dept,) for dept in {row[1] for row in rows}]
+            )
+        return len(rows)
+
+    def set_cell_shifts(self, department, cells, label):
+        """按 (姓名, 日期) 设置某部门的班次（矩阵编辑），一个事务、一个可撤销操作
+
+        cells 为 [(姓名, 日期, 班次, 职位)]，班次为空表示清除该员工当天在该部门的排班。
+        已有排班时只修改第一条的班次（保留职位和备注）并删除其余的；没有时按给定职位新增。
+        返回 (添加, 修改, 删除) 的行数。
+        """
+        cells = list(cells)
+        if not cells:
+            return 0, 0, 0
+        with self.journal.operation(label):
+            self.cursor.execute('''
+                SELECT id, employee_name, work_date, shift_type FROM schedules
+                WHERE department = ? AND work_date BETWEEN ? AND ?
+                  AND employee_name IN (SELECT value FROM json_each(?))
+                ORDER BY id
+            ''', (department, min(cell[1] for cell in cells), max(cell[1] for cell in cells),
+                  json.dumps(sorted({cell[0] for cell in cells}), ensure_ascii=False)))
+            existing = {}
+            for record_id, name, work_date, shift_type in self.cursor.fetchall():
+                existing.setdefault((name, work_date), []).append((record_id, shift_type))
+            inserts, updates, deletes = [], [], []
+            for name, work_date, shift_type, position in cells:
+                records = existing.get((name, work_date), [])
+                if not shift_type:
+                    deletes.extend((record_id,) for record_id, _ in records)
+                elif records:
+                    record_id, old_shift = records[0]
+                    if old_shift != shift_type:
+                        updates.append((shift_type, record_id))
+                    deletes.extend((record_id,) for record_id, _ in records[1:])
+                else:
+                    inserts.append((name, department, position, work_date, shift_type, ""))
+            self.cursor.executemany("DELETE FROM schedules WHERE id = ?", deletes)
+            self.cursor.executemany("UPDATE schedules SET shift_type = ? WHERE id = ?", updates)
+            self.cursor.executemany('''
+                INSERT INTO schedules 
+                (employee_name, department, position, work_date, shift_type, remarks)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', inserts)
+            if inserts:
+                self.cursor.execute("INSERT OR IGNORE INTO departments (name) VALUES (?)", (department,))
+        return len(inserts), len(updates), len(deletes)
+
+    def existing_schedule_keys(self, start_date, end_date, names):
+        """日期范围内这些员工已有排班的 {(姓名, 日期, 班次)}
+
+        按 idx_schedules_date 做日期范围查找，姓名在索引中过滤，只为匹配的行读取班次。
+        """
+        names = sorted(names)
+        keys = set()
+        for i in range(0, len(names), self.NAME_BATCH):
+            batch = names[i:i + self.NAME_BATCH]
+            self.cursor.execute(f'''
+                SELECT employee_name, work_date, shift_type FROM schedules
+                WHERE work_date BETWEEN ? AND ? AND employee_name IN ({", ".join("?" * len(batch))})
+            ''', [start_date, end_date] + batch)
+            keys.update(self.cursor.fetchall())
+        return keys
+
+    def get_employee_names(self):
+        """所有排过班的员工姓名（员工颜色表中登记的全部姓名）"""
+        self.cursor.execute("SELECT employee_name FROM employee_colors ORDER BY employee_name")
+        return [row[0] for row in self.cursor.fetchall()]
+
+    @staticmethod
+    def _source_filter(department="", employees=None):
+        """模板来源的部门/员工过滤条件；员工列表以 JSON 传入，不受SQL参数个数限制"""
+        where = ""
+        params = []
+        if department:
+            where += " AND department = ?"
+            params.append(department)
+        if employees:
+            where += " AND employee_name IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(sorted(set(employees)), ensure_ascii=False))
+        return where, params
+
+    def _check_not_archived(self, start_date, end_date, label="来源范围"):
+        archived = [year for year, *_ in self.archives.list()
+                    if _year_of(start_date, 0) <= year <= _year_of(end_date, 9999)]
+        if archived:
+            raise ValueError(f"{label}包含已归档的年份 {', '.join(map(str, archived))}，请先恢复归档")
+
+    def _insert_shifted(self, source_sql, source_params, period_days, target_start, target_end,
+                        department="", employees=None, replace=False):
+        """把来源行（day_offset 为相对来源开始日期的天数）平移到目标范围，一条 INSERT ... SELECT 完成
+
+        目标范围长于来源周期时按周期重复；replace 为 True 时先删除目标范围内同部门/员工的排班，
+        否则跳过姓名、日期和班次都相同的已有排班。返回添加的行数。
+        """
+        target_end = target_end or (date.fromisoformat(target_start) + timedelta(days=period_days - 1)).isoformat()
+        span = (date.fromisoformat(target_end) - date.fromisoformat(target_start)).days + 1
+        if span <= 0:
+            raise ValueError("目标结束日期不能早于开始日期")
+        # 已归档的年份是只读的，与编辑和导入一样不能写入
+        self._check_not_archived(target_start, target_end, "目标范围")
+        repeats = -(-span // period_days)
+        where, params = self._source_filter(department, employees)
+        if replace:
+            # 来源与目标范围可能重叠（例如把 3-03..3-16 复制到 3-10..3-23），先把来源行读到临时表再删除目标范围
+            self.cursor.execute("DROP TABLE IF EXISTS temp.shift_source")
+            self.cursor.execute(f"CREATE TEMP TABLE shift_source AS {source_sql}", list(source_params))
+            source_sql, source_params = "SELECT * FROM temp.shift_source", []
+            self.cursor.execute(f"DELETE FROM schedules WHERE work_date BETWEEN ? AND ?{where}",
+                                [target_start, target_end] + params)
+        # 目标范围内已有排班时才需要去重：已有排班的键一次性查出（SQLite 为 NOT IN 子查询建立临时索引）
+        self.cursor.execute("SELECT 1 FROM schedules WHERE work_date BETWEEN ? AND ? LIMIT 1", (target_start, target_end))
+        dedupe_sql, dedupe_params = "", []
+        if self.cursor.fetchone():
+            dedupe_sql = '''
+              AND (employee_name, work_date, shift_type) NOT IN (
+                  SELECT employee_name, work_date, shift_type FROM schedules WHERE work_date BETWEEN ? AND ?)'''
+            dedupe_params = [target_start, target_end]
+        self.cursor.execute(f'''
+            INSERT INTO schedules (employee_name, department, position, work_date, shift_type, remarks)
+            WITH RECURSIVE repeats(k) AS (
+                SELECT 0 UNION ALL SELECT k + 1 FROM repeats WHERE k + 1 < ?
+            ),
+            source AS ({source_sql}),
+            shifted AS (
+                SELECT employee_name, department, position,
+                       date(julianday(?) + day_offset + k * ?) AS work_date, shift_type, remarks
+                FROM source JOIN repeats
+            )
+            SELECT employee_name, department, position, work_date, shift_type, remarks FROM shifted
+            WHERE work_date <= ?{dedupe_sql}
+            ORDER BY work_date, department, employee_name
+        ''', [repeats] + list(source_params) + [target_start, period_days, target_end] + dedupe_params)
+        inserted = self.cursor.rowcount
+        if replace:
+            self.cursor.execute("DROP TABLE temp.shift_source")
+        self.cursor.execute('''
+            INSERT OR IGNORE INTO departments (name)
+            SELECT DISTINCT department FROM schedules WHERE work_date BETWEEN ? AND ?
+        ''', (target_start, target_end))
+        return inserted
+
+    def copy_schedules(self, source_start, source_end, target_start, target_end=None, department="",
+                       employees=None, replace=False):
+        """把来源范围的排班（可按部门、员工过滤）平移复制到目标范围，一个可撤销操作，返回添加的行数
+
+        target_end 默认与来源范围等长；更长时来源范围按周期重复（例如把一周复制到整个月）。
+        """
+        self._check_not_archived(source_start, source_end)
+        period_days = (date.fromisoformat(source_end) - date.fromisoformat(source_start)).days + 1
+        if period_days <= 0:
+            raise ValueError("来源结束日期不能早于开始日期")
+        where, params = self._source_filter(department, employees)
+        source_sql = f'''
+            SELECT employee_name, department, position, shift_type, remarks,
+                   CAST(julianday(work_date) - julianday(?) AS INTEGER) AS day_offset
+            FROM schedules WHERE work_date BETWEEN ? AND ?{where}
+        '''
+        with self.journal.operation(f"复制 {source_start}~{source_end} 的排班到 {target_start}"):
+            return self._insert_shifted(source_sql, [source_start, source_start, source_end] + params, period_days,
+                                        target_start, target_end, department, employees, replace)
+
+    def save_template(self, name, source_start, source_end, department="", employees=None):
+        """把来源范围的排班保存为命名模板（同名模板被覆盖），返回模板行数"""
+        self._check_not_archived(source_start, source_end)
+        period_days = (date.fromisoformat(source_end) - date.fromisoformat(source_start)).days + 1
+        if period_days <= 0:
+            raise ValueError("来源结束日期不能早于开始日期")
+        where, params = self._source_filter(department, employees)
+        try:
+            self.cursor.execute("DELETE FROM template_rows WHERE template_id = "
+                                "(SELECT id FROM schedule_templates WHERE name = ?)", (name,))
+            self.cursor.execute("DELETE FROM schedule_templates WHERE name = ?", (name,))
+            self.cursor.execute(
+                "INSERT INTO schedule_templates (name, period_days, row_count, created_at) VALUES (?, ?, 0, ?)",
+                (name, period_days, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+            template_id = self.cursor.lastrowid
+            self.cursor.execute(f'''
+                INSERT INTO template_rows
+                (template_id, day_offset, employee_name, department, position, shift_type, remarks)
+                SELECT ?, CAST(julianday(work_date) - julianday(?) AS INTEGER),
+                       employee_name, department, position, shift_type, remarks
+                FROM schedules WHERE work_date BETWEEN ? AND ?{where}
+            ''', [template_id, source_start, source_start, source_end] + params)
+            row_count = self.cursor.rowcount
+            self.cursor.execute("UPDATE schedule_templates SET row_count = ? WHERE id = ?", (row_count, template_id))
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        return row_count
+
+    def list_templates(self):
+        """已保存的模板: [(名称, 周期天数, 行数, 创建时间)]"""
+        self.cursor.execute("SELECT name, period_days, row_count, created_at FROM schedule_templates ORDER BY name")
+        return self.cursor.fetchall()
+
+    def delete_template(self, name):
+        """删除模板，返回是否存在"""
+        self.cursor.execute("DELETE FROM template_rows WHERE template_id = "
+                            "(SELECT id FROM schedule_templates WHERE name = ?)", (name,))
+        self.cursor.execute("DELETE FROM schedule_templates WHERE name = ?", (name,))
+        deleted = self.cursor.rowcount > 0
+        self.conn.commit()
+        return deleted
+
+    def apply_template(self, name, target_start, target_end=None, replace=False):
+        """把模板平移到目标范围（一个可撤销操作），返回添加的行数；模板不存在时抛出 KeyError
+
+        replace 为 True 时先删除目标范围内模板涉及的员工的排班。
+        """
+        self.cursor.execute("SELECT id, period_days FROM schedule_templates WHERE name = ?", (name,))
+        row = self.cursor.fetchone()
+        if row is None:
+            raise KeyError(name)
+        template_id, period_days = row
+        source_sql = '''
+            SELECT employee_name, department, position, shift_type, remarks, day_offset
+            FROM template_rows WHERE template_id = ?
+        '''
+        employees = None
+        if replace:
+            self.cursor.execute("SELECT DISTINCT employee_name FROM template_rows WHERE template_id = ?", (template_id,))
+            employees = [row[0] for row in self.cursor.fetchall()]
+            if not employees:
+                return 0
+        with self.journal.operation(f"应用模板 {name} 到 {target_start}"):
+            return self._insert_shifted(source_sql, [template_id], period_days, target_start, target_end,
+                                        employees=employees, replace=replace)
+
+    def add_department(self, name):
+        """添加部门（已存在则忽略）"""
+        self.cursor.execute("INSERT OR IGNORE INTO departments (name) VALUES (?)", (name,))
+        self.conn.commit()
+
+    def save_shift(self, shift_name, start_time, end_time):
+        """添加或覆盖自定义班次"""
+        self.cursor.execute(
+            "INSERT OR REPLACE INTO custom_shifts (shift_name, start_time, end_time) VALUES (?, ?, ?)",
+            (shift_name, start_time, end_time)
+        )
+        self.conn.commit()
+
+    def get_staffing_rules(self):
+        """人数规则: [(id, 部门, 班次名, 星期几, 最少人次, 最多人次, 说明, 日期类型)]，星期几为 '0'-'6' 组成的文本（0=周一），
+        日期类型为空表示不限"""
+        self.cursor.execute('''
+            SELECT id, department, shift_name, weekdays, min_count, max_count, note, day_type
+            FROM staffing_rules ORDER BY department, shift_name, id
+        ''')
+        return self.cursor.fetchall()
+
+    def add_staffing_rule(self, department, shift_name="", weekdays="0123456", min_count=None, max_count=None, note="",
+                          day_type=""):
+        """添加人数规则（班次名为空时统计该部门全部班次，日期类型为空时不限），返回规则ID"""
+        self.cursor.execute('''
+            INSERT INTO staffing_rules (department, shift_name, weekdays, min_count, max_count, note, day_type)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (department, shift_name, weekdays, min_count, max_count, note, day_type))
+        self.conn.commit()
+        return self.cursor.lastrowid
+
+    def delete_staffing_rule(self, rule_id):
+        """删除人数规则，返回是否存在"""
+        self.cursor.execute("DELETE FROM staffing_rules WHERE id = ?", (rule_id,))
+        deleted = self.cursor.rowcount > 0
+        self.conn.commit()
+        return deleted
+
+    def staffing_counts(self, start_date, end_date):
+        """日期范围内的人次计数: [(日期, 部门, 班次, 人次)]
+
+        主库读取计数器；已归档的年份没有计数器，按归档库的排班现场统计（归档只读，不会再变化）。
+        """
+        rows = []
+        for start, end, archives in self.archives.segments(start_date, end_date):
+            query = ["SELECT work_date, department, shift_type, headcount FROM staffing_counts "
+                     "WHERE work_date BETWEEN ? AND ?"]
+            query.extend(f"SELECT work_date, department, shift_type, COUNT(*) FROM {alias}.schedules "
+                         f"WHERE work_date BETWEEN ? AND ? GROUP BY work_date, department, shift_type"
+                         for alias in archives)
+            self.cursor.execute("\n UNION ALL ".join(query), [start, end] * len(query))
+            rows.extend(self.cursor.fetchall())
+        return rows
+
+    def add_availability(self, employee_name, kind, start_at, end_at, note=""):
+        """添加请假/不可用/偏好时段（start_at、end_at 为 yyyy-MM-dd HH:MM，结束时间不含），返回ID"""
+        self.cursor.execute('''
+            INSERT INTO employee_availability (employee_name, kind, start_at, end_at, note)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (employee_name, kind, start_at, end_at, note))
+        self.conn.commit()
+        return self.cursor.lastrowid
+
+    def delete_availability(self, entry_id):
+        """删除时段，返回是否存在"""
+        self.cursor.execute("DELETE FROM employee_availability WHERE id = ?", (entry_id,))
+        deleted = self.cursor.rowcount > 0
+        self.conn.commit()
+        return deleted
+
+    def list_availability(self, start_at, end_at, employee_name=""):
+        """与 [start_at, end_at) 相交的时段: [(id, 姓名, 类型, 开始, 结束, 说明)]"""
+        where = "end_at > ? AND start_at < ?"
+        params = [start_at, end_at]
+        if employee_name:
+            where += " AND employee_name = ?"
+            params.append(employee_name)
+        self.cursor.execute(f'''
+            SELECT id, employee_name, kind, start_at, end_at, note FROM employee_availability
+            WHERE {where} ORDER BY start_at, employee_name
+        ''', params)
+        return self.cursor.fetchall()
+
+    def availability_intervals(self, start_at, end_at):
+        """与 [start_at, end_at) 相交的时段: [(姓名, 类型, 开始, 结束)]，按员工和开始时间排序"""
+        self.cursor.execute("SELECT max_days FROM availability_counter WHERE id = 1")
+        max_days = self.cursor.fetchone()[0]
+        # 开始时间不早于 start_at 减去最长时段，走开始时间索引而不是扫描全部历史
+        self.cursor.execute('''
+            SELECT employee_name, kind, start_at, end_at FROM employee_availability
+            WHERE start_at < ? AND start_at >= strftime('%Y-%m-%d %H:%M', julianday(?) - ? - 1)
+            AND end_at > ?
+            ORDER BY employee_name, start_at
+        ''', (end_at, start_at, max_days, start_at))
+        return self.cursor.fetchall()
+
+    def availability_counter(self):
+        self.cursor.execute("SELECT value FROM availability_counter WHERE id = 1")
+        return self.cursor.fetchone()[0]
+
+    # ---------- 比较和合并两个数据库（比较逻辑见 Schedule_Diff） ----------
+
+    def _compute_day_hashes(self, dates=None):
+        """从排班计算 {日期: (排班数, 哈希)}；dates 为 None 时计算全部日期"""
+        query = f"SELECT work_date, COUNT(*), group_concat({ROW_TEXT_SQL}, char(30)) FROM schedules"
+        if dates is None:
+            self.cursor.execute(query + " GROUP BY work_date")
+            return {work_date: (count, day_hash(text)) for work_date, count, text in self.cursor}
+        hashes = {}
+        dates = sorted(dates)
+        for i in range(0, len(dates), self.NAME_BATCH):
+            batch = dates[i:i + self.NAME_BATCH]
+            self.cursor.execute(query + f" WHERE work_date IN ({', '.join('?' * len(batch))}) GROUP BY work_date",
+                                batch)
+            hashes.update((work_date, (count, day_hash(text))) for work_date, count, text in self.cursor.fetchall())
+        return hashes
+
+    def day_hashes(self):
+        """每天的 (排班数, 内容哈希)；按变更日志只重新计算缓存之后修改过的日期，可写连接同时更新缓存
+
+        没有缓存（旧版本的库）或变更日志已裁剪时重新计算全部日期，500 万行约需十几秒，此后只需增量更新。
+        """
+        try:
+            counter = self.change_counter()
+            self.cursor.execute("SELECT seq FROM day_hash_state WHERE id = 1")
+            seq = self.cursor.fetchone()[0]
+        except Error:
+            counter = seq = None   # 只读打开的旧版本数据库（没有变更计数或哈希缓存）
+        changes = None
+        if seq is not None:
+            _, changes = self.changes_since(seq)
+        if changes is None:
+            hashes, dirty = self._compute_day_hashes(), None
+        else:
+            self.cursor.execute("SELECT work_date, row_count, hash FROM day_hashes")
+            hashes = {work_date: (count, value) for work_date, count, value in self.cursor.fetchall()}
+            dirty = {day for _, new_date, old_date in changes for day in (new_date, old_date) if day}
+            for day in dirty:
+                hashes.pop(day, None)
+            hashes.update(self._compute_day_hashes(dirty))
+        if not self.read_only and seq != counter:
+            if dirty is None:
+                self.cursor.execute("DELETE FROM day_hashes")
+                days = hashes
+            else:
+                self.cursor.executemany("DELETE FROM day_hashes WHERE work_date = ?", [(day,) for day in dirty])
+                days = {day: hashes[day] for day in dirty if day in hashes}
+            self.cursor.executemany("INSERT INTO day_hashes (work_date, row_count, hash) VALUES (?, ?, ?)",
+                                    [(day, count, value) for day, (count, value) in days.items()])
+            self.cursor.execute("UPDATE day_hash_state SET seq = ? WHERE id = 1", (counter,))
+            self.conn.commit()
+        return hashes
+
+    def rows_on_dates(self, dates):
+        """这些日期的全部排班 [(id, 姓名, 部门, 职位, 日期, 班次, 备注)]"""
+        rows = []
+        dates = sorted(dates)
+        for i in range(0, len(dates), self.NAME_BATCH):
+            batch = dates[i:i + self.NAME_BATCH]
+            self.cursor.execute(f'''
+                SELECT id, {", ".join(self.COLUMNS)} FROM schedules WHERE work_date IN ({", ".join("?" * len(batch))})
+            ''', batch)
+            rows.extend(self.cursor.fetchall())
+        return rows
+
+    def merge_cells(self, entries, label="合并其他数据库的排班"):
+        """把选中的格子（Schedule_Diff.DiffEntry）改为对方的内容，一个事务、一个可撤销操作
+
+        内容相同的行保留，其余按顺序改写、新增或删除。本库的格子在比较之后又被修改过时抛出
+        ConcurrentEditError（需要重新比较）；日期在已归档年份的格子不合并。返回 (添加, 修改, 删除, 跳过的格子数)。
+        """
+        archived_years = {row[0] for row in self.archives.list()}
+        inserts, updates, deletes = [], [], []
+        skipped = 0
+        with self.journal.operation(label):
+            for entry in entries:
+                if _year_of(entry.work_date, 0) in archived_years:
+                    skipped += 1
+                    continue
+                self.cursor.execute('''
+                    SELECT id, department, position, shift_type, remarks FROM schedules
+                    WHERE work_date = ? AND employee_name = ? ORDER BY id
+                ''', (entry.work_date, entry.employee_name))
+                current = [(row[0], (row[1], row[2], row[3], row[4] or "")) for row in self.cursor.fetchall()]
+                if sorted(content for _, content in current) != list(entry.local):
+                    raise ConcurrentEditError(f"{entry.employee_name} 在 {entry.work_date} 的排班在比较之后已被修改，请重新比较")
+                wanted = list(entry.other)
+                leftover = []
+                for record_id, content in current:
+                    if content in wanted:
+                        wanted.remove(content)
+                    else:
+                        leftover.append(record_id)
+                for record_id, content in zip(leftover, wanted):
+                    updates.append(content + (record_id,))
+                deletes.extend((record_id,) for record_id in leftover[len(wanted):])
+                inserts.extend((entry.employee_name, department, position, entry.work_date, shift_type, remarks)
+                               for department, position, shift_type, remarks in wanted[len(leftover):])
+            self.cursor.executemany(
+                "UPDATE schedules SET department=?, position=?, shift_type=?, remarks=? WHERE id=?", updates)
+            self.cursor.executemany("DELETE FROM schedules WHERE id = ?", deletes)
+            self.cursor.executemany('''
+                INSERT INTO schedules 
+                (employee_name, department, position, work_date, shift_type, remarks)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', inserts)
+            self.cursor.executemany(
+                "INSERT OR IGNORE INTO departments (name) VALUES (?)",
+                [(department,) for department in {row[0] for row in updates} | {row[1] for row in inserts}]
+            )
+        return len(inserts), len(updates), len(deletes), skipped
+
+    # ---------- 离线同步（变更集文件格式见 Schedule_Sync） ----------
+
+    def sync_site(self):
+        """当前站点ID（保存在数据库中，只生成一次）；检测到数据库文件被复制时分出新的站点ID
+
+        数据库旁的 .site 文件记下与库中相同的标记：多台电脑打开共享盘上的同一个文件时标记一致，不分出新站点；
+        只复制了数据库文件（旁边没有 .site 文件或标记不同）才视为副本。复制整个目录时可用 fork_sync_site 手动分出。
+        """
+        cursor = self.cursor
+        cursor.execute("SELECT site_id FROM sync_sites WHERE last_row_id IS NULL")
+        row = cursor.fetchone()
+        if self.read_only:
+            return row[0] if row else None
+        cursor.execute("SELECT key, value FROM sync_info WHERE key IN ('token', 'location')")
+        info = dict(cursor.fetchall())
+        if row and "token" in info:
+            # 标记为空表示 .site 文件不可写，无法判断副本
+            if not info["token"] or self._site_marker() == info["token"]:
+                return row[0]
+            return self.fork_sync_site()
+        if row:
+            # 旧版本按位置判断副本的数据库：位置未变时只补写标记，不分出新站点
+            if info.get("location", self._site_location()) == self._site_location():
+                return self._write_site_token(row[0])
+            return self.fork_sync_site()
+        site_id = uuid.uuid4().hex[:12]
+        cursor.execute("INSERT INTO sync_sites (site_id) VALUES (?)", (site_id,))
+        return self._write_site_token(site_id)
+
+    def _site_location(self):
+        return f"{platform.node()}|{os.path.normcase(os.path.realpath(self.db_file))}"
+
+    def _site_marker(self):
+        """数据库旁 .site 文件中的标记，没有时返回 None"""
+        try:
+            with open(self.db_file + ".site", encoding="utf-8") as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def _write_site_token(self, site_id):
+        """生成新标记，写入 .site 文件和数据库并提交；文件不可写时库中不保存标记，下次打开不会误判为副本"""
+        token = uuid.uuid4().hex
+        try:
+            with open(self.db_file + ".site", "w", encoding="utf-8") as f:
+                f.write(token)
+        except OSError as e:
+            print(f"[DEBUG] 无法写入站点标记文件: {str(e)}")
+            token = ""
+        self.cursor.execute("INSERT OR REPLACE INTO sync_info (key, value) VALUES ('token', ?)", (token,))
+        self.cursor.execute("DELETE FROM sync_info WHERE key = 'location'")
+        self.conn.commit()
+        return site_id
+
+    def fork_sync_site(self):
+        """分出新的站点ID（数据库被复制时）：复制前已有的行继续使用原站点ID，此后新增的行使用新站点ID，
+        两份数据库不会产生相同的全局ID；旧站点记下使用到的最大行ID和当时的变更计数（两份数据库共同的历史）"""
+        cursor = self.cursor
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'schedules'")
+        last = cursor.fetchone()
+        cursor.execute("UPDATE sync_sites SET last_row_id = ?, last_seq = ? WHERE last_row_id IS NULL",
+                       (last[0] if last else 0, self.change_counter()))
+        site_id = uuid.uuid4().hex[:12]
+        cursor.execute("INSERT INTO sync_sites (site_id) VALUES (?)", (site_id,))
+        return self._write_site_token(site_id)
+
+    def _sync_ranges(self):
+        """[(站点使用到的最大行ID, 站点ID)]，按行ID排序，当前站点在最后（最大行ID为 None）"""
+        self.cursor.execute(
+            "SELECT last_row_id, site_id FROM sync_sites ORDER BY last_row_id IS NULL, last_row_id, rowid")
+        return self.cursor.fetchall()
+
+    def _uid_function(self):
+        """本地新增的行的全局ID：行ID所在范围的站点ID + ':' + 行ID"""
+        ranges = self._sync_ranges()
+        bounds = [last for last, _ in ranges[:-1]]
+        return lambda row_id: f"{ranges[bisect_left(bounds, row_id)][1]}:{row_id}"
+
+    def _sync_forks(self):
+        """本库以前的站点ID -> 复制时的变更计数"""
+        self.cursor.execute("SELECT site_id, last_seq FROM sync_sites WHERE last_row_id IS NOT NULL")
+        return dict(self.cursor.fetchall())
+
+    def _resolve_uids(self, uids):
+        """全局ID -> 本地行ID（行可能已删除）；本库中从未有过的行不在结果中"""
+        spans = {}
+        low = 0
+        for last, site_id in self._sync_ranges():
+            spans[site_id] = (low, last)
+            if last is not None:
+                low = last
+        candidates, foreign = {}, []
+        for uid in uids:
+            site_id, _, number = uid.rpartition(":")
+            span = spans.get(site_id)
+            if span is not None and number.isdigit() and span[0] < int(number) and (
+                    span[1] is None or int(number) <= span[1]):
+                candidates[int(number)] = uid
+            else:
+                foreign.append(uid)
+        resolved = {}
+        row_ids = list(candidates)
+        for i in range(0, len(row_ids), self.NAME_BATCH):
+            batch = row_ids[i:i + self.NAME_BATCH]
+            # 分配给导入行的本地ID不代表本站点的行
+            self.cursor.execute(
+                f"SELECT row_id FROM sync_uids WHERE row_id IN ({', '.join('?' * len(batch))})", batch)
+            for (row_id,) in self.cursor.fetchall():
+                candidates.pop(row_id)
+        resolved.update((uid, row_id) for row_id, uid in candidates.items())
+        for i in range(0, len(foreign), self.NAME_BATCH):
+            batch = foreign[i:i + self.NAME_BATCH]
+            self.cursor.execute(
+                f"SELECT row_uid, row_id FROM sync_uids WHERE row_uid IN ({', '.join('?' * len(batch))})", batch)
+            resolved.update(self.cursor.fetchall())
+        return resolved
+
+    def _rows_by_id(self, row_ids):
+        """行ID -> (姓名, 部门, 职位, 日期, 班次, 备注)，只含主库中存在的行"""
+        rows = {}
+        row_ids = sorted(row_ids)
+        for i in range(0, len(row_ids), self.NAME_BATCH):
+            batch = row_ids[i:i + self.NAME_BATCH]
+            self.cursor.execute(f'''
+                SELECT id, {", ".join(self.COLUMNS)} FROM schedules WHERE id IN ({", ".join("?" * len(batch))})
+            ''', batch)
+            rows.update((row[0], tuple(row[1:])) for row in self.cursor.fetchall())
+        return rows
+
+    def _local_changes_since(self, seq):
+        """变更计数 seq 之后本地修改或删除过的行: {行ID: 最后一次修改的计数}（不含导入写入的）；
+        变更日志已裁剪无法判断时返回 None"""
+        if seq is None:
+            return None
+        if self.change_counter() == seq:
+            return {}
+        self.cursor.execute("SELECT MIN(seq) FROM change_log")
+        oldest = self.cursor.fetchone()[0]
+        if oldest is None or oldest > seq + 1:
+            return None
+        self.cursor.execute('''
+            SELECT row_id, MAX(seq) FROM change_log c
+            WHERE c.seq > ? AND NOT EXISTS (
+                SELECT 1 FROM sync_imports i WHERE i.first_seq <= c.seq AND i.last_seq >= c.seq)
+            GROUP BY row_id
+        ''', (seq,))
+        return dict(self.cursor.fetchall())
+
+    def list_sync_peers(self):
+        """已同步过的站点: [(站点ID, 已导入对方的计数, 对方已确认的本库计数, 上次导入时间)]"""
+        self.cursor.execute("SELECT site_id, received_seq, acked_seq, synced_at FROM sync_peers ORDER BY synced_at DESC")
+        return self.cursor.fetchall()
+
+    def export_changes(self, since=None):
+        """变更计数 since 之后本地新增、修改和删除的排班，返回变更集（写入文件见 Schedule_Sync.write_changeset）
+
+        每行为 [全局ID, 姓名, 部门, 职位, 日期, 班次, 备注, 最后修改的计数]，删除为 [全局ID, 日期, 计数]。
+        since 默认为各对方站点已确认导入的最小计数。变更通知日志已裁剪到 since 之后时导出全部排班（full，
+        计数为 None），对方按全局ID比较，内容相同的行不会重复写入。从其他站点导入的修改不再发回。
+        """
+        site_id = self.sync_site()
+        forks = self._sync_forks()
+        if since is None:
+            self.cursor.execute("SELECT MIN(acked_seq) FROM sync_peers")
+            since = self.cursor.fetchone()[0]
+            if since is None:
+                # 还没有导入过其他站点：导出全部历史（包括以前的站点ID下的修改）；
+                # 对方如果是复制前的同一份数据库，按 forks 中的复制位置跳过共同的历史
+                since = 0
+        counter = self.change_counter()
+        changed = self._local_changes_since(since)
+        columns = ", ".join(f"s.{column}" for column in self.COLUMNS)
+        query = f"SELECT s.id, u.row_uid, {columns} FROM schedules s LEFT JOIN sync_uids u ON u.row_id = s.id"
+        rows = []
+        if changed is None:
+            self.cursor.execute(query + " ORDER BY s.id")
+            rows = self.cursor.fetchall()
+        else:
+            row_ids = sorted(changed)
+            for i in range(0, len(row_ids), self.NAME_BATCH):
+                batch = row_ids[i:i + self.NAME_BATCH]
+                self.cursor.execute(query + f" WHERE s.id IN ({', '.join('?' * len(batch))})", batch)
+                rows.extend(self.cursor.fetchall())
+        # 删除后又恢复（撤销）的行仍在主库中，按修改导出
+        self.cursor.execute('''
+            SELECT t.row_id, u.row_uid, t.work_date, MAX(t.seq) FROM sync_tombstones t
+            LEFT JOIN sync_uids u ON u.row_id = t.row_id
+            WHERE t.seq > ?
+              AND NOT EXISTS (SELECT 1 FROM sync_imports i WHERE i.first_seq <= t.seq AND i.last_seq >= t.seq)
+              AND NOT EXISTS (SELECT 1 FROM schedules s WHERE s.id = t.row_id)
+            GROUP BY t.row_id
+        ''', (since,))
+        tombstones = self.cursor.fetchall()
+        self.cursor.execute("SELECT site_id, received_seq FROM sync_peers")
+        acks = dict(self.cursor.fetchall())
+        uid_of = self._uid_function()
+        return {
+            "format": FORMAT,
+            "version": FORMAT_VERSION,
+            "site": site_id,
+            "from_seq": since,
+            "to_seq": counter,
+            "full": changed is None,
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "columns": list(self.COLUMNS),
+            "rows": [[row_uid or uid_of(row_id)] + list(values) + [changed and changed[row_id]]
+                     for row_id, row_uid, *values in rows],
+            "deleted": [[row_uid or uid_of(row_id), work_date, seq] for row_id, row_uid, work_date, seq in tombstones],
+            "acks": acks,
+            "forks": forks,
+        }
+
+    def apply_changes(self, changeset, take_theirs=False, dry_run=False):
+        """导入变更集（一个事务、一个可撤销操作），返回 SyncResult；dry_run 为 True 时只比较不写入
+
+        按全局ID找到本地的行：对方新增的行插入，修改的行更新，删除的行删除。本地在上次从该站点导入之后
+        也修改或删除过、且内容不同的行为冲突，默认保留本地，take_theirs 为 True 时使用对方的内容。
+        日期在本地已归档年份的新行不导入。
+        """
+        site_id = self.sync_site()
+        peer = changeset["site"]
+        if peer == site_id:
+            raise ValueError("变更集来自本数据库（站点ID相同），不能导入；如果两份数据库是连同 .site 文件复制的，请先在其中一份上执行 sync fork")
+        result = SyncResult(peer, bool(changeset.get("full")), take_theirs)
+        # 第一次从某站点导入时，如果两边是同一数据库复制出来的，复制前的历史是共同的，只比较此后的修改
+        base = self._sync_forks().get(peer, changeset.get("forks", {}).get(site_id))
+        self.cursor.execute("SELECT received_seq, acked_seq, local_seq FROM sync_peers WHERE site_id = ?", (peer,))
+        received_seq, acked_seq, local_seq = self.cursor.fetchone() or (base or 0, base or 0, base)
+        result.gap = not result.full and changeset["from_seq"] > received_seq
+        modified = self._local_changes_since(local_seq)
+        archived_years = {row[0] for row in self.archives.list()}
+        width = len(self.COLUMNS)
+        # 最后修改的计数不超过已导入位置的行之前已经收到过（例如复制前的共同历史），不再比较
+        incoming = {row[0]: tuple(row[1:width + 1]) for row in changeset["rows"]
+                    if not (len(row) > width + 1 and row[width + 1] and row[width + 1] <= received_seq)}
+        deleted = [row[0] for row in changeset["deleted"] if row[0] not in incoming
+                   and not (len(row) > 2 and row[2] and row[2] <= received_seq)]
+        resolved = self._resolve_uids(list(incoming) + deleted)
+        current = self._rows_by_id(set(resolved.values()))
+
+        inserts, reinserts, updates, removals = [], [], [], []
+        for uid, data in incoming.items():
+            row_id = resolved.get(uid)
+            local = current.get(row_id)
+            if local is None and _year_of(data[3], 0) in archived_years:
+                result.archived += 1
+            elif row_id is None:
+                inserts.append((uid, data))
+            elif local is None:
+                # 本地已删除的行又被对方修改
+                result.conflicts.append(SyncConflict(uid, row_id, None, data))
+            elif local == data:
+                result.unchanged += 1
+            elif modified is None or row_id in modified:
+                result.conflicts.append(SyncConflict(uid, row_id, local, data))
+            else:
+                updates.append(data + (row_id,))
+        for uid in deleted:
+            row_id = resolved.get(uid)
+            local = current.get(row_id)
+            if local is None:
+                continue
+            if modified is None or row_id in modified:
+                result.conflicts.append(SyncConflict(uid, row_id, local, None))
+            else:
+                removals.append((row_id,))
+        if take_theirs:
+            for conflict in result.conflicts:
+                if conflict.incoming is None:
+                    removals.append((conflict.row_id,))
+                elif conflict.local is None:
+                    reinserts.append((conflict.row_id,) + conflict.incoming)
+                else:
+                    updates.append(conflict.incoming + (conflict.row_id,))
+        result.inserted = len(inserts) + len(reinserts)
+        result.updated = len(updates)
+        result.deleted = len(removals)
+        if dry_run:
+            return result
+
+        columns = ", ".join(self.COLUMNS)
+        with self.journal.operation(f"导入同步变更（站点 {peer}）"):
+            before = self.change_counter()
+            mapping = []
+            for uid, data in inserts:
+                self.cursor.execute(f"INSERT INTO schedules ({columns}) VALUES (?, ?, ?, ?, ?, ?)", data)
+                mapping.append((self.cursor.lastrowid, uid))
+            self.cursor.executemany("INSERT OR REPLACE INTO sync_uids (row_id, row_uid) VALUES (?, ?)", mapping)
+            self.cursor.executemany(f"INSERT INTO schedules (id, {columns}) VALUES (?, ?, ?, ?, ?, ?, ?)", reinserts)
+            self.cursor.executemany('''
+                UPDATE schedules SET employee_name=?, department=?, position=?, work_date=?, shift_type=?, remarks=?
+                WHERE id=?
+            ''', updates)
+            self.cursor.executemany("DELETE FROM schedules WHERE id = ?", removals)
+            self.cursor.executemany(
+                "INSERT OR IGNORE INTO departments (name) VALUES (?)",
+                [(department,) for department in {data[1] for _, data in inserts} | {row[2] for row in reinserts}
+                 | {row[1] for row in updates}]
+            )
+            after = self.change_counter()
+            if after > before:
+                self.cursor.execute("INSERT INTO sync_imports (first_seq, last_seq) VALUES (?, ?)", (before + 1, after))
+            self.cursor.execute("DELETE FROM sync_imports WHERE last_seq < (SELECT MIN(seq) FROM change_log)")
+            self.cursor.execute('''
+                INSERT OR REPLACE INTO sync_peers (site_id, received_seq, acked_seq, local_seq, synced_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (peer, max(received_seq, changeset["to_seq"]),
+                  max(acked_seq, changeset.get("acks", {}).get(site_id, 0)), after,
+                  datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            # 全部对方站点都已确认收到的删除不会再导出，墓碑可以删除
+            self.cursor.execute("DELETE FROM sync_tombstones WHERE seq <= (SELECT MIN(acked_seq) FROM sync_peers)")
+        result.applied = True
+        return result
+
+    def employee_colors(self, palette_size, names=None):
+        """员工颜色编号 {姓名: 编号}，names 为 None 时返回全部员工
+
+        未分配（或超出调色板）的员工按姓名的 crc32 选首选颜色，再从首选颜色起找使用最少的颜色，
+        分配结果保存到数据库，之后在所有会话中保持不变。
+        """
+        self.cursor.execute("SELECT employee_name, color_index FROM employee_colors")
+        colors = dict(self.cursor.fetchall())
+        usage = [0] * palette_size
+        for index in colors.values():
+            if 0 <= index < palette_size:
+                usage[index] += 1
+        wanted = colors.keys() if names is None else names
+        pending = sorted({name for name in wanted if not 0 <= colors.get(name, -1) < palette_size})
+        if pending:
+            assigned = []
+            for name in pending:
+                preferred = zlib.crc32(name.encode("utf-8")) % palette_size
+                slot = min(range(palette_size), key=lambda step: (usage[(preferred + step) % palette_size], step))
+                index = (preferred + slot) % palette_size
+                usage[index] += 1
+                colors[name] = index
+                assigned.append((name, index))
+            self.cursor.executemany(
+                "INSERT INTO employee_colors (employee_name, color_index) VALUES (?, ?) "
+                "ON CONFLICT(employee_name) DO UPDATE SET color_index = excluded.color_index",
+                assigned
+            )
+            self.conn.commit()
+        if names is None:
+            return colors
+        return {name: colors[name] for name in names}
+
+    # ---------- 统计、校验与备份 ----------
+
+    def get_statistics(self, start_date="0000-01-01", end_date="9999-12-31"):
+        """排班统计：总数、日期范围、员工数，以及按部门和班次的分布"""
+        total = 0
+        dates = []
+        employees = set()
+        counts = {"department": Counter(), "shift_type": Counter(), "day_type": Counter()}
+        # 按日期维度区分工作日、周末和节假日（调休上班日算工作日）
+        day_type = '''(SELECT CASE WHEN d.is_holiday THEN '节假日' WHEN d.is_workday THEN '工作日' ELSE '周末' END
+                      FROM main.date_dim d WHERE d.work_date = rows.work_date)'''
+        for start, end, archives in self.archives.segments(start_date, end_date):
+            rows, params = self._union("employee_name, department, work_date, shift_type",
+                                       "work_date BETWEEN ? AND ?", (start, end), archives)
+            self.cursor.execute(f"SELECT COUNT(*), MIN(work_date), MAX(work_date) FROM ({rows})", params)
+            count, first_date, last_date = self.cursor.fetchone()
+            if not count:
+                continue
+            total += count
+            dates.extend((first_date, last_date))
+            self.cursor.execute(f"SELECT DISTINCT employee_name FROM ({rows})", params)
+            employees.update(row[0] for row in self.cursor.fetchall())
+            self.ensure_date_dim(first_date, last_date)
+            for column, counter in counts.items():
+                expression = day_type if column == "day_type" else column
+                self.cursor.execute(f"SELECT {expression} AS {column}, COUNT(*) FROM ({rows}) AS rows GROUP BY {column}",
+                                    params)
+                counter.update({"未知" if key is None else key: count for key, count in self.cursor.fetchall()})
+        return {
+            "total": total,
+            "first_date": min(dates) if dates else None,
+            "last_date": max(dates) if dates else None,
+            "employees": len(employees),
+            "by_department": counts["department"].most_common(),
+            "by_shift": counts["shift_type"].most_common(),
+            "by_day_type": counts["day_type"].most_common(),
+        }
+
+    def validate(self, limit=20):
+        """检查数据问题，返回 [(问题类型, 数量, 示例列表)]"""
+        checks = [
+            ("无效日期", '''
+                SELECT id, work_date FROM schedules
+                WHERE work_date IS NULL OR date(work_date) IS NOT work_date
+            '''),
+            ("必填字段为空", '''
+                SELECT id, employee_name, department, shift_type FROM schedules
+                WHERE trim(employee_name) = '' OR trim(department) = '' OR trim(shift_type) = ''
+            '''),
+            ("部门不在部门表中", '''
+                SELECT DISTINCT department FROM schedules
+                WHERE department NOT IN (SELECT name FROM departments)
+            '''),
+            ("重复排班", '''
+                SELECT employee_name, work_date, shift_type, COUNT(*) FROM schedules
+                GROUP BY employee_name, work_date, shift_type HAVING COUNT(*) > 1
+            '''),
+            ("人次计数与排班不一致", '''
+                SELECT * FROM (
+                    SELECT work_date, department, shift_type, COUNT(*) FROM schedules
+                    GROUP BY work_date, department, shift_type
+                    EXCEPT SELECT work_date, department, shift_type, headcount FROM staffing_counts
+                )
+                UNION ALL
+                SELECT * FROM (
+                    SELECT work_date, department, shift_type, headcount FROM staffing_counts
+                    EXCEPT SELECT work_date, department, shift_type, COUNT(*) FROM schedules
+                    GROUP BY work_date, department, shift_type
+                )
+            '''),
+        ]
+        problems = []
+        self.cursor.execute("PRAGMA quick_check")
+        integrity = [row[0] for row in self.cursor.fetchall()]
+        if integrity != ["ok"]:
+            problems.append(("数据库文件损坏", len(integrity), integrity[:limit]))
+        for name, query in checks:
+            self.cursor.execute(query)
+            rows = self.cursor.fetchall()
+            if rows:
+                problems.append((name, len(rows), rows[:limit]))
+        # 请假检查需要按班次时间比较，用区间索引而不是SQL（避免循环导入，在这里导入）
+        from Schedule_Availability import availability_conflicts
+        conflicts = availability_conflicts(self)
+        if conflicts:
+            problems.append(("排班与请假/不可用冲突", len(conflicts), conflicts[:limit]))
+        return problems
+
+    def compact(self):
+        """整理数据库文件，释放已删除记录占用的空间（例如归档之后）"""
+        self.conn.commit()
+        self.cursor.execute("VACUUM")
+
+    def backup(self, backup_dir="backups", kind="manual"):
+        """使用 SQLite 在线备份接口备份到 backups 目录，返回备份文件路径"""
+        os.makedirs(backup_dir, exist_ok=True)
+        name = os.path.splitext(os.path.basename(self.db_file))[0]
+        path = os.path.join(backup_dir, f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{kind}.db")
+        target = sqlite3.connect(path)
+        try:
+            self.conn.backup(target)
+        finally:
+            target.close()
+        return path
+
+    @staticmethod
+    def prune_backups(db_file, backup_dir="backups", kind="auto", keep_days=30):
+        """删除超过保留天数的指定类型备份，返回删除的文件列表"""
+        if not os.path.isdir(backup_dir):
+            return []
+        name = os.path.splitext(os.path.basename(db_file))[0]
+        cutoff = datetime.now().timestamp() - keep_days * 86400
+        removed = []
+        for file_name in os.listdir(backup_dir):
+            path = os.path.join(backup_dir, file_name)
+            if (file_name.startswith(name + "_") and file_name.endswith(f"_{kind}.db")
+                    and os.path.getmtime(path) < cutoff):
+                os.remove(path)
+                removed.append(path)
+        return removed
+
+
+class SessionCache:
+    """按数据库文件缓存已打开的排班库连接（LRU），切换回最近用过的用户时无需重新连接和检查表结构"""
+    MAX_SESSIONS = 4
+
+    def __init__(self, max_sessions=None):
+        self.max_sessions = max_sessions or self.MAX_SESSIONS
+        self.stores = OrderedDict()
+
+    def open(self, db_file):
+        """返回该数据库的连接，缓存中没有时新建；超出上限时关闭最久未用的连接"""
+        key = os.path.abspath(db_file)
+        store = self.stores.pop(key, None)
+        if store is None:
+            store = ScheduleStore(db_file)
+            try:
+                # 表结构已是当前版本时不做任何建表和默认数据写入
+                store.ensure_schema()
+                store.trim_change_log()
+                store.conn.commit()
+            except Error:
+                store.close()
+                raise
+        self.stores[key] = store
+        while len(self.stores) > self.max_sessions:
+            _, oldest = self.stores.popitem(last=False)
+            oldest.close()
+        return store
+
+    def discard(self, db_file):
+        """关闭并移除某个数据库的连接（例如删除用户前）"""
+        store = self.stores.pop(os.path.abspath(db_file), None)
+        if store is not None:
+            store.close()
+
+    def close_all(self):
+        while self.stores:
+            _, store = self.stores.popitem()
+            store.close()
@@ -0,0 +1,98 @@
+"""离线同步：在不同电脑的排班库之间交换行级变更集（不依赖 PyQt）
+
+变更集是 gzip 压缩的 JSON，只包含某个水位线（导出方的变更计数）之后新增、修改和删除的排班，
+一天的修改通常只有几 KB。每条排班用全局ID（"站点ID:本地ID"，从其他站点导入的行保留对方的ID）标识，
+数据库文件被复制后（按旁边的 .site 标记文件判断）自动分出新的站点ID，复制前已有的行在两边仍是同一个ID。
+导入时如果本地在上次从对方导入之后也修改过同一行，且内容不同，则记为冲突，默认保留本地修改。
+"""
+import gzip
+import json
+import os
+
+FORMAT = "schedule-changeset"
+FORMAT_VERSION = 1
+FILE_SUFFIX = ".schedule-changes"
+
+
+class SyncConflict:
+    """双方都修改过的排班；local/incoming 为 (姓名, 部门, 职位, 日期, 班次, 备注)，已删除时为 None"""
+    __slots__ = ("row_uid", "row_id", "local", "incoming")
+
+    def __init__(self, row_uid, row_id, local, incoming):
+        self.row_uid = row_uid
+        self.row_id = row_id
+        self.local = local
+        self.incoming = incoming
+
+    @property
+    def kind(self):
+        if self.incoming is None:
+            return "对方删除、本地修改"
+        if self.local is None:
+            return "对方修改、本地删除"
+        return "双方修改"
+
+    def describe(self):
+        row = self.local or self.incoming
+        return f"{row[3]} {row[0]}（{row[1]}）{self.kind}"
+
+
+class SyncResult:
+    """导入（或预览）变更集的结果"""
+
+    def __init__(self, site_id, full=False, take_theirs=False):
+        self.site_id = site_id       # 变更集来源站点
+        self.full = full             # 是否为全量变更集（对方变更日志已裁剪）
+        self.take_theirs = take_theirs   # 冲突时是否使用对方的内容
+        self.inserted = 0
+        self.updated = 0
+        self.deleted = 0
+        self.unchanged = 0           # 本地已相同
+        self.archived = 0            # 日期在本地已归档的年份，未导入
+        self.conflicts = []          # [SyncConflict]
+        self.gap = False             # 对方这次导出的起点晚于上次导入的位置，中间的变更可能缺失
+        self.applied = False
+
+    def summary(self):
+        parts = [f"新增 {self.inserted}", f"修改 {self.updated}", f"删除 {self.deleted}"]
+        if self.unchanged:
+            parts.append(f"相同 {self.unchanged}")
+        if self.archived:
+            parts.append(f"已归档跳过 {self.archived}")
+        if self.conflicts:
+            parts.append(f"冲突 {len(self.conflicts)}（{'使用对方的修改' if self.take_theirs else '保留本地修改'}）")
+        return "，".join(parts)
+
+
+def write_changeset(path, changeset):
+    """写入变更集文件（先写临时文件再替换），返回文件字节数"""
+    temp_path = path + ".tmp"
+    data = json.dumps(changeset, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    with gzip.open(temp_path, "wb", compresslevel=9) as f:
+        f.write(data)
+    os.replace(temp_path, path)
+    return os.path.getsize(path)
+
+
+def read_changeset(path):
+    """读取并检查变更集文件，格式不对时抛出 ValueError"""
+    try:
+        with gzip.open(path, "rb") as f:
+            changeset = json.loads(f.read().decode("utf-8"))
+    except (OSError, EOFError, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"不是有效的变更集文件: {str(e)}")
+    if not isinstance(changeset, dict) or changeset.get("format") != FORMAT:
+        raise ValueError("不是有效的变更集文件")
+    if changeset.get("version", 0) > FORMAT_VERSION:
+        raise ValueError("变更集由更新版本的程序生成，请先升级程序")
+    for key in ("site", "from_seq", "to_seq", "rows", "deleted"):
+        if key not in changeset:
+            raise ValueError(f"变更集缺少字段: {key}")
+    return changeset
+
+
+def describe_changeset(changeset):
+    """变更集的简要说明"""
+    kind = "全量" if changeset.get("full") else "增量"
+    return (f"站点 {changeset['site']} 的{kind}变更（{changeset['from_seq']} → {changeset['to_seq']}），"
+            f"{len(changeset['rows'])} 条新增/修改，{len(changeset['deleted'])} 条删除，导出于 {changeset.get('created', '-')}")
@@ -0,0 +1,144 @@
+"""按小时显示的时间轴（甘特图）数据（不依赖 PyQt）
+
+行为员工，横轴为从开始日期零点起的分钟数。员工名单只查询一次姓名，班次按"员工块×日期"
+分块按需查询并缓存：绘制时只请求可见的员工行和可见的时间窗口，1000 名员工的一天滚动时
+每次最多补查几个块。跨零点的班次画在开始日期，结束分钟超过1440，因此窗口前一天的排班也会读取。
+"""
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from Schedule_Reports import shift_name, shift_span
+
+DAY_MINUTES = 1440
+
+
+class TimelineBar:
+    """时间轴上的一个班次；start/end 为相对时间轴开始日期零点的分钟数，没有时间段的班次 timed 为 False"""
+    __slots__ = ("record_id", "row", "department", "work_date", "shift_type", "start", "end", "timed")
+
+    def __init__(self, record_id, row, department, work_date, shift_type, start, end, timed):
+        self.record_id = record_id
+        self.row = row
+        self.department = department
+        self.work_date = work_date
+        self.shift_type = shift_type
+        self.start = start
+        self.end = end
+        self.timed = timed
+
+    @property
+    def name(self):
+        return shift_name(self.shift_type)
+
+
+class TimelineData:
+    """某部门（或全部）从 start_date 起 days 天的时间轴数据"""
+    ROW_BLOCK = 64        # 每次查询的员工行数
+    MAX_BLOCKS = 400      # 缓存的 (员工块, 日期) 数
+
+    def __init__(self, store, start_date, days=1, department=""):
+        self.store = store
+        self.start_date = start_date
+        self.days = days
+        self.department = department
+        self.shifts = {name: (start, end) for name, start, end in store.get_shifts()}
+        # 前一天开始的跨夜班次也会出现在窗口内
+        self.employees = store.get_range_employees(self.date_str(-1), self.date_str(days - 1), department)
+        self.rows = {name: row for row, name in enumerate(self.employees)}
+        self.blocks = OrderedDict()   # (块号, 日期下标) -> [TimelineBar]
+        self.queries = 0
+
+    @property
+    def total_minutes(self):
+        return self.days * DAY_MINUTES
+
+    def date_str(self, day):
+        """时间轴第 day 天（可为 -1）的日期文本"""
+        return (self.start_date + timedelta(days=day)).isoformat()
+
+    def day_window(self, start_minute, end_minute):
+        """与分钟窗口 [start, end) 相交的排班日期下标范围（含前一天的跨夜班次）"""
+        first = max(-1, start_minute // DAY_MINUTES - 1)
+        last = min(self.days - 1, max(start_minute, end_minute - 1) // DAY_MINUTES)
+        return range(first, last + 1)
+
+    def bars(self, first_row, last_row, start_minute=0, end_minute=None):
+        """员工行 [first_row, last_row) 中与分钟窗口相交的班次，缺少的块按需查询"""
+        if end_minute is None:
+            end_minute = self.total_minutes
+        last_row = min(last_row, len(self.employees))
+        if first_row >= last_row:
+            return []
+        days = self.day_window(start_minute, end_minute)
+        result = []
+        for block in range(first_row // self.ROW_BLOCK, (last_row - 1) // self.ROW_BLOCK + 1):
+            missing = [day for day in days if (block, day) not in self.blocks]
+            if missing:
+                self.load_block(block, missing[0], missing[-1])
+            for day in days:
+                self.blocks.move_to_end((block, day))
+                result.extend(bar for bar in self.blocks[(block, day)]
+                              if first_row <= bar.row < last_row and bar.end > start_minute and bar.start < end_minute)
+        while len(self.blocks) > self.MAX_BLOCKS:
+            self.blocks.popitem(last=False)
+        return result
+
+    def load_block(self, block, first_day, last_day):
+        """一次查询一个员工块连续几天的排班"""
+        names = self.employees[block * self.ROW_BLOCK:(block + 1) * self.ROW_BLOCK]
+        loaded = {day: [] for day in range(first_day, last_day + 1)}
+        self.queries += 1
+        for record_id, name, department, work_date, shift_type in self.store.get_employee_shifts(
+                self.date_str(first_day), self.date_str(last_day), names, self.department):
+            try:
+                day = (date.fromisoformat(work_date) - self.start_date).days
+            except ValueError:
+                continue
+            if day not in loaded:
+                continue
+            span = shift_span(shift_type, self.shifts)
+            timed = span is not None
+            start, end = span if timed else (0, DAY_MINUTES)
+            offset = day * DAY_MINUTES
+            loaded[day].append(TimelineBar(record_id, self.rows[name], department, work_date, shift_type,
+                                           offset + start, offset + end, timed))
+        for day, bars in loaded.items():
+            self.blocks[(block, day)] = bars
+
+    def invalidate(self, date_strs=None):
+        """丢弃受修改影响的日期（None 表示全部）；员工名单变化时需要重新创建"""
+        if date_strs is None:
+            self.blocks.clear()
+            return
+        days = set()
+        for date_str in date_strs:
+            try:
+                days.add((date.fromisoformat(date_str) - self.start_date).days)
+            except (TypeError, ValueError):
+                continue
+        for key in [key for key in self.blocks if key[1] in days]:
+            del self.blocks[key]
+
+
+def assign_lanes(bars):
+    """同一员工时间重叠的班次分到不同泳道，返回 {id(bar): (泳道, 泳道数)}"""
+    by_row = {}
+    for bar in bars:
+        by_row.setdefault(bar.row, []).append(bar)
+    lanes = {}
+    for row_bars in by_row.values():
+        row_bars.sort(key=lambda bar: (bar.start, bar.end))
+        lane_ends = []
+        placed = []
+        for bar in row_bars:
+            for lane, lane_end in enumerate(lane_ends):
+                if lane_end <= bar.start:
+                    lane_ends[lane] = bar.end
+                    break
+            else:
+                lane = len(lane_ends)
+                lane_ends.append(bar.end)
+            placed.append((bar, lane))
+        for bar, lane in placed:
+            lanes[id(bar)] = (lane, len(lane_ends))
+    return lanes